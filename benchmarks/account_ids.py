@@ -0,0 +1,85 @@
+"""Compare create_account and get_account with uuid string ids and 128-bit integer ids.
+
+Every layout runs in its own process, so its resident memory is measured from a clean start.
+
+Usage: python -m benchmarks.account_ids --accounts 10000000
+"""
+import multiprocessing
+import random
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from functools import partial
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.account_store import AccountStore
+from src.bank import Bank
+from src.repository import Repository
+
+LAYOUTS = {
+    'dict, string ids': (dict, False),
+    'store, string ids': (AccountStore, False),
+    'store, integer ids': (partial(AccountStore, integer_keys=True), True),
+}
+
+
+def resident_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * 4096
+
+
+def run(layout: str, accounts: int, lookups: int, results):
+    accounts_factory, integer_ids = LAYOUTS[layout]
+    repository = create_autospec(Repository)
+    repository.load_state.side_effect = lambda accounts: accounts
+    account_helper = AccountHelper(integer_ids=integer_ids)
+    bank = Bank(account_helper=account_helper, repository=repository, accounts_factory=accounts_factory)
+    balance = Decimal('1')
+    rss = resident_bytes()
+
+    start = time.perf_counter()
+    account_helper.preallocate(accounts)
+    preallocated = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(accounts):
+        bank.create_account('name', balance)
+    created = time.perf_counter() - start
+    memory = resident_bytes() - rss
+
+    account_ids = random.Random(0).sample(list(bank.accounts), lookups)
+    start = time.perf_counter()
+    for account_id in account_ids:
+        bank.get_account(account_id)
+    looked_up = time.perf_counter() - start
+    # As the ids arrive from the CLI, a script or the server
+    account_ids = list(map(str, account_ids))
+    start = time.perf_counter()
+    for account_id in account_ids:
+        bank.get_account(account_id)
+    looked_up_by_string = time.perf_counter() - start
+    results.put((preallocated / accounts, created / accounts, memory / accounts, looked_up / lookups,
+                 looked_up_by_string / lookups))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=10_000_000)
+    parser.add_argument('--lookups', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('fork')
+    print(f'{"layout":<20} {"id (us)":>8} {"create (us)":>12} {"RSS/account":>12} {"get (us)":>9} '
+          f'{"get str (us)":>13}')
+    for layout in LAYOUTS:
+        results = context.Queue()
+        process = context.Process(target=run, args=(layout, args.accounts, min(args.lookups, args.accounts), results))
+        process.start()
+        preallocate, create, memory, get, get_by_string = results.get()
+        process.join()
+        print(f'{layout:<20} {preallocate * 1e6:>8.2f} {create * 1e6:>12.2f} {memory:>12.0f} {get * 1e6:>9.2f} '
+              f'{get_by_string * 1e6:>13.2f}')
+
+
+if __name__ == '__main__':
+    main()
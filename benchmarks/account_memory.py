@@ -0,0 +1,42 @@
+"""Compare memory per account of a dict of Account objects and an AccountStore, with string or integer ids.
+
+Usage: python -m benchmarks.account_memory --accounts 1000000
+"""
+import tracemalloc
+from argparse import ArgumentParser
+from decimal import Decimal
+from functools import partial
+
+from src.account import Account
+from src.account_helper import AccountHelper
+from src.account_store import AccountStore
+
+
+def measure(accounts_factory, accounts: int, integer_ids: bool = False) -> float:
+    account_helper = AccountHelper(integer_ids=integer_ids)
+    tracemalloc.start()
+    store = accounts_factory()
+    for i in range(accounts):
+        account_id = account_helper.create_account_id()
+        # Names and balances are parsed from text, as they are when a state csv is loaded
+        store[account_id] = Account(account_id, f'name{i % 1000}', Decimal(f'{i % 100000}.{i % 100:02d}'))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memory / accounts
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f'{"layout":<26} {"bytes/account":>14}')
+    layouts = (('dict', dict, False),
+               ('AccountStore', AccountStore, False),
+               ('AccountStore, integer ids', partial(AccountStore, integer_keys=True), True))
+    for layout, accounts_factory, integer_ids in layouts:
+        print(f'{layout:<26} {measure(accounts_factory, args.accounts, integer_ids):>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Compare summary() and top_accounts() against a scan of all accounts, and what keeping them up to date
+costs a transfer.
+
+Usage: python -m benchmarks.aggregates --accounts 1000000
+"""
+import gc
+import heapq
+import random
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.repository import Repository
+
+TOP = 100
+
+
+def create_bank(accounts: int) -> Bank:
+    repository = create_autospec(Repository)
+    repository.load_state.return_value = {}
+    bank = Bank(account_helper=AccountHelper(), repository=repository)
+    rng = random.Random(0)
+    for _ in range(accounts):
+        bank.create_account('name', Decimal(rng.randint(0, 10 ** 8)) / 100)
+    return bank
+
+
+def timed(function, repeat: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def time_transfers(bank: Bank, transfers) -> float:
+    gc.disable()
+    elapsed = timed(lambda: [bank.transfer(from_account_id, to_account_id, Decimal('1'))
+                             for from_account_id, to_account_id in transfers])
+    gc.enable()
+    return elapsed / len(transfers)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    parser.add_argument('--operations', type=int, default=200_000)
+    args = parser.parse_args()
+
+    bank = create_bank(args.accounts)
+    rng = random.Random(1)
+    account_ids = list(bank.accounts)
+    transfers = [tuple(rng.sample(account_ids, 2)) for _ in range(args.operations)]
+
+    scan_total = timed(lambda: sum((account.balance for account in bank.accounts.values()), Decimal('0')))
+    scan_top = timed(lambda: heapq.nlargest(TOP, bank.accounts.values(), key=lambda account: account.balance))
+    without_aggregates = time_transfers(bank, transfers)
+    build = timed(lambda: bank.aggregates)
+    summary = timed(bank.summary, repeat=1000)
+    with_summary = time_transfers(bank, transfers)
+    build_ranking = timed(lambda: bank.top_accounts(TOP))
+    top = timed(lambda: bank.top_accounts(TOP), repeat=1000)
+    with_ranking = time_transfers(bank, transfers)
+
+    print(f'scan:     total {scan_total * 1000:.0f}ms, top {TOP} {scan_top * 1000:.0f}ms')
+    print(f'summary:  build {build * 1000:.0f}ms, query {summary * 1e6:.1f}us')
+    print(f'ranking:  build {build_ranking * 1000:.0f}ms, top {TOP} {top * 1e6:.1f}us')
+    print(f'transfer: {without_aggregates * 1e6:.2f}us without aggregates, {with_summary * 1e6:.2f}us with summary, '
+          f'{with_ranking * 1e6:.2f}us with ranking')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Compare applying transfers one by one through Bank.transfer with Bank.apply_batch.
+
+Usage: python -m benchmarks.batch --accounts 100000 --transfers 1000000
+"""
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from pathlib import Path
+from typing import Optional
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.exception import BankException
+from src.journal import Journal
+from src.repository import Repository
+
+
+def create_bank(accounts: int, journal_path: Optional[Path] = None) -> Bank:
+    repository = create_autospec(Repository)
+    repository.load_state.side_effect = lambda accounts=None: accounts if accounts is not None else {}
+    bank = Bank(account_helper=AccountHelper(), repository=repository)
+    if journal_path is not None:
+        # Journal only the measured operations, not the setup
+        bank.journal = Journal(journal_path, compact_every=None)
+    for _ in range(accounts):
+        bank.create_account('name', Decimal('1000'))
+    return bank
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=100_000)
+    parser.add_argument('--transfers', type=int, default=1_000_000)
+    parser.add_argument('--max-amount', type=int, default=50, help='Larger amounts cause more overdrafts')
+    parser.add_argument('--journal', action='store_true', help='Journal every change')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.journal:
+            run(args, Path(tmp_dir) / 'loop.journal', Path(tmp_dir) / 'batch.journal')
+        else:
+            run(args, None, None)
+
+
+def run(args, loop_journal_path: Optional[Path], batch_journal_path: Optional[Path]):
+    rng = random.Random(0)
+    bank = create_bank(args.accounts, loop_journal_path)
+    account_ids = list(bank.accounts)
+    operations = [('transfer', rng.choice(account_ids), rng.choice(account_ids),
+                   Decimal(rng.randint(1, args.max_amount)))
+                  for _ in range(args.transfers)]
+
+    start = time.perf_counter()
+    rejected = 0
+    for _, from_account_id, to_account_id, amount in operations:
+        try:
+            bank.transfer(from_account_id, to_account_id, amount)
+        except BankException:
+            rejected += 1
+    bank.close()
+    elapsed = time.perf_counter() - start
+    print(f'Bank.transfer loop:  {elapsed:.2f}s ({args.transfers / elapsed:,.0f} ops/s, {rejected} rejected)')
+
+    bank = create_bank(args.accounts, batch_journal_path)
+    # Same accounts and operations, re-keyed to the new bank's ids
+    id_map = dict(zip(account_ids, bank.accounts))
+    operations = [(kind, id_map[from_account_id], id_map[to_account_id], amount)
+                  for kind, from_account_id, to_account_id, amount in operations]
+    start = time.perf_counter()
+    result = bank.apply_batch(operations, atomic=False)
+    bank.close()
+    elapsed = time.perf_counter() - start
+    print(f'Bank.apply_batch:    {elapsed:.2f}s ({args.transfers / elapsed:,.0f} ops/s, '
+          f'{len(result.rejected_rows)} rejected)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Measure how long changes are held off by a save_state, blocking and with background checkpoints.
+
+A blocking save_state holds every lock while the state csv is written; a background checkpoint only
+while a read view is taken and the journal rotated.
+
+Usage: python -m benchmarks.checkpoint --accounts 1000000
+"""
+import tempfile
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from pathlib import Path
+
+from src.account_helper import AccountHelper
+from src.account_store import AccountStore
+from src.bank import Bank
+from src.checkpoint import Checkpointer
+from src.journal import Journal
+from src.repository import Repository
+
+LAYOUTS = {'dict': dict, 'store': AccountStore}
+
+
+def create_bank(directory: Path, accounts: int, accounts_factory) -> Bank:
+    bank = Bank(account_helper=AccountHelper(),
+                repository=Repository(csv_path=directory / 'state.csv'),
+                journal=Journal(directory / 'state.journal', sync_interval=None),
+                accounts_factory=accounts_factory)
+    for i in range(accounts):
+        bank.create_account(f'name{i % 1000}', Decimal('100.25'))
+    return bank
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f'{"layout":<8} {"blocking save (s)":>18} {"checkpoint pause (ms)":>22} {"checkpoint total (s)":>21}')
+    for name, accounts_factory in LAYOUTS.items():
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bank = create_bank(Path(tmp_dir), args.accounts, accounts_factory)
+            start = time.perf_counter()
+            bank.save_state()
+            blocking = time.perf_counter() - start
+
+            checkpointer = Checkpointer(bank)
+            bank.save_state()
+            checkpointer.wait()
+            report = checkpointer.last_report
+            bank.close()
+        print(f'{name:<8} {blocking:>18.2f} {report.pause * 1000:>22.1f} {report.duration:>21.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Measure transfer throughput of a concurrent Bank as the number of threads grows.
+
+Usage: python -m benchmarks.concurrency --threads 1,2,4,8
+
+Striped per-account locks are compared with a single global lock (one stripe). On a
+GIL build of CPython threads do not run Python code in parallel, so this mostly shows
+the locking overhead; the gap opens up on a free-threaded build.
+"""
+import random
+import threading
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.exception import BankException
+from src.locking import StripedLocks
+from src.repository import Repository
+
+
+def create_bank(accounts: int, stripes: int) -> Bank:
+    repository = create_autospec(Repository)
+    repository.load_state.return_value = {}
+    bank = Bank(account_helper=AccountHelper(), repository=repository, concurrent=True)
+    bank.locks = StripedLocks(stripes=stripes)
+    for _ in range(accounts):
+        bank.create_account('name', Decimal('1000'))
+    return bank
+
+
+def measure(bank: Bank, threads: int, transfers: int) -> float:
+    account_ids = list(bank.accounts)
+
+    def transfer_randomly(seed):
+        rng = random.Random(seed)
+        for _ in range(transfers // threads):
+            try:
+                bank.transfer(rng.choice(account_ids), rng.choice(account_ids), Decimal('1'))
+            except BankException:
+                pass
+
+    workers = [threading.Thread(target=transfer_randomly, args=(seed,)) for seed in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return transfers / (time.perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=10_000)
+    parser.add_argument('--transfers', type=int, default=400_000)
+    parser.add_argument('--threads', default='1,2,4,8')
+    args = parser.parse_args()
+
+    print(f'{"threads":>7} {"striped ops/s":>14} {"global lock ops/s":>18}')
+    for threads in (int(value) for value in args.threads.split(',')):
+        striped = measure(create_bank(args.accounts, stripes=1024), threads, args.transfers)
+        global_lock = measure(create_bank(args.accounts, stripes=1), threads, args.transfers)
+        print(f'{threads:>7} {striped:>14,.0f} {global_lock:>18,.0f}')
+
+
+if __name__ == '__main__':
+    main()
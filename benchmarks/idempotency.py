@@ -0,0 +1,84 @@
+"""Measure what idempotency keys cost a deposit and how fast a retried request is answered.
+
+Usage: python -m benchmarks.idempotency --accounts 10000 --operations 200000
+"""
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from decimal import Decimal
+from typing import Optional
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.idempotency import IdempotencyCache
+from src.repository import Repository
+
+
+def create_bank(accounts: int, idempotency: Optional[IdempotencyCache]) -> Bank:
+    repository = create_autospec(Repository)
+    repository.load_state.return_value = {}
+    bank = Bank(account_helper=AccountHelper(), repository=repository, idempotency=idempotency)
+    for _ in range(accounts):
+        bank.create_account('name', Decimal('1000000'))
+    return bank
+
+
+def time_deposits(bank: Bank, deposits) -> float:
+    gc.disable()
+    start = time.perf_counter()
+    for account_id, key in deposits:
+        bank.deposit(account_id, Decimal('1'), idempotency_key=key)
+    elapsed = time.perf_counter() - start
+    gc.enable()
+    return elapsed / len(deposits)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=10_000)
+    parser.add_argument('--operations', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    results = {'no key': [], 'new key': [], 'retried key': []}
+    for run in range(args.repeat):
+        plain_bank = create_bank(args.accounts, None)
+        account_ids = list(plain_bank.accounts)
+        results['no key'].append(time_deposits(plain_bank, [(rng.choice(account_ids), None)
+                                                            for _ in range(args.operations)]))
+
+        bank = create_bank(args.accounts, IdempotencyCache(max_entries=args.operations))
+        account_ids = list(bank.accounts)
+        deposits = [(rng.choice(account_ids), f'{run}-{i}') for i in range(args.operations)]
+        results['new key'].append(time_deposits(bank, deposits))
+        results['retried key'].append(time_deposits(bank, deposits))
+
+    no_key = statistics.median(results['no key'])
+    print(f'{"deposit":<12} {"latency (us)":>13} {"overhead (us)":>14}')
+    for name, timings in results.items():
+        median = statistics.median(timings)
+        print(f'{name:<12} {median * 1e6:>13.2f} {(median - no_key) * 1e6:>14.2f}')
+
+    cache = IdempotencyCache(max_entries=args.operations)
+    tracemalloc.start()
+    for i in range(args.operations):
+        cache.put(f'key-{i:024}', ('deposit', 'a' * 36, '1'), [AccountStub], 0.0)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{size / args.operations:.0f} bytes per cached deposit')
+
+
+class AccountStub:
+    # Stands in for an account, only its fields are kept
+    account_id = 'a' * 36
+    name = 'name'
+    balance = Decimal('1000001')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Compare statement queries through the ledger's per-account index with a scan of the whole history.
+
+Usage: python -m benchmarks.ledger --accounts 100000 --entries 5000000
+"""
+import random
+import resource
+import tempfile
+import time
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from src.ledger import DEPOSIT, Ledger
+
+
+def fill(ledger: Ledger, accounts: int, entries: int):
+    rng = random.Random(0)
+    account_ids = [f'{account:08d}' for account in range(accounts)]
+    for _ in range(entries):
+        ledger.record(rng.choice(account_ids), DEPOSIT, 100, 100)
+
+
+def scan(ledger: Ledger, account_id: str, since: datetime):
+    # What a statement costs without the index: every entry of every segment is looked at
+    entries = map(ledger._entry, range(ledger.first_sequence, ledger.next_sequence))
+    return [entry for entry in entries if entry.account_id == account_id and entry.timestamp >= since]
+
+
+def measure(query, queries) -> float:
+    start = time.perf_counter()
+    for query_args in queries:
+        query(*query_args)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=100_000)
+    parser.add_argument('--entries', type=int, default=5_000_000)
+    parser.add_argument('--queries', type=int, default=1000, help='Statements timed through the index')
+    parser.add_argument('--scans', type=int, default=2, help='Statements timed with a scan')
+    parser.add_argument('--segments-in-memory', type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as spill_path:
+        ledger = Ledger(max_segments_in_memory=args.segments_in_memory, spill_path=Path(spill_path))
+        start = time.perf_counter()
+        fill(ledger, args.accounts, args.entries)
+        elapsed = time.perf_counter() - start
+        # Kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        spilled = sum(path.stat().st_size for path in Path(spill_path).iterdir())
+        print(f'Recorded {args.entries} entries in {elapsed:.2f}s ({args.entries / elapsed:.0f} entries/sec), '
+              f'peak RSS {peak / 2 ** 20:.0f} MiB, spilled {spilled / 2 ** 20:.0f} MiB')
+
+        rng = random.Random(1)
+        since = datetime.now(timezone.utc) - timedelta(days=1)
+        queries = [(f'{rng.randrange(args.accounts):08d}', since) for _ in range(args.queries)]
+        indexed = measure(lambda account_id, since: ledger.statement(account_id, since=since), queries)
+        scanned = measure(lambda account_id, since: scan(ledger, account_id, since), queries[:args.scans])
+        print(f'{"statement":<10} {"index (us)":>12} {"scan (us)":>14}')
+        print(f'{"":<10} {indexed * 1e6:>12.1f} {scanned * 1e6:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
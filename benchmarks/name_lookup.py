@@ -0,0 +1,69 @@
+"""Compare account lookups by name through the name index with a linear scan of the accounts.
+
+Usage: python -m benchmarks.name_lookup --accounts 1000000 --names 100000
+"""
+import random
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.repository import Repository
+
+
+def create_bank(accounts: int, names: int) -> Bank:
+    repository = create_autospec(Repository)
+    repository.load_state.return_value = {}
+    bank = Bank(account_helper=AccountHelper(), repository=repository)
+    rng = random.Random(0)
+    for _ in range(accounts):
+        bank.create_account(f'name{rng.randrange(names):06d}', Decimal('1'))
+    return bank
+
+
+def scan_by_name(bank: Bank, name: str):
+    name = name.casefold()
+    return [account for account in bank.accounts.values() if account.name.casefold() == name]
+
+
+def scan_by_prefix(bank: Bank, prefix: str):
+    prefix = prefix.casefold()
+    return [account for account in bank.accounts.values() if account.name.casefold().startswith(prefix)]
+
+
+def measure(find, bank: Bank, queries) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        find(bank, query)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    parser.add_argument('--names', type=int, default=100_000, help='Distinct customer names')
+    parser.add_argument('--scans', type=int, default=5, help='Queries timed with a linear scan')
+    parser.add_argument('--lookups', type=int, default=10_000, help='Queries timed with the index')
+    args = parser.parse_args()
+
+    bank = create_bank(args.accounts, args.names)
+    rng = random.Random(1)
+    names = [f'name{rng.randrange(args.names):06d}' for _ in range(args.lookups)]
+    prefixes = [name[:-1] for name in names]
+
+    start = time.perf_counter()
+    bank.find_accounts_by_name('')
+    print(f'Built the name index over {args.accounts} accounts in {time.perf_counter() - start:.2f}s')
+    print(f'{"query":<8} {"index (us)":>12} {"scan (us)":>14}')
+    indexed = measure(Bank.find_accounts_by_name, bank, names)
+    scanned = measure(scan_by_name, bank, names[:args.scans])
+    print(f'{"name":<8} {indexed * 1e6:>12.1f} {scanned * 1e6:>14.0f}')
+    indexed = measure(Bank.find_accounts_by_name_prefix, bank, prefixes)
+    scanned = measure(scan_by_prefix, bank, prefixes[:args.scans])
+    print(f'{"prefix":<8} {indexed * 1e6:>12.1f} {scanned * 1e6:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Compare settling a window of transfers by netting with applying them one by one through Bank.transfer,
+on a few transfer graphs: balance writes, rejected transfers and time.
+
+Usage: python -m benchmarks.netting --accounts 100000 --transfers 100000
+"""
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from unittest.mock import create_autospec
+
+from benchmarks.suite import SequentialAccountHelper
+from src.account import InvalidAccountOperationException
+from src.bank import Bank
+from src.journal import Journal
+from src.repository import Repository
+
+
+def back_and_forth(rng: random.Random, account_ids: List[str], transfers: int) -> List[Tuple[str, str]]:
+    # Small groups of accounts paying each other, e.g. the accounts of one household or business
+    groups = [account_ids[start:start + 5] for start in range(0, len(account_ids), 5)]
+    pairs = []
+    for _ in range(transfers):
+        pairs.append(tuple(rng.sample(rng.choice(groups[:len(groups) // 10]), 2)))
+    return pairs
+
+
+def merchants(rng: random.Random, account_ids: List[str], transfers: int) -> List[Tuple[str, str]]:
+    # Customers paying a hundred merchants, which refund some payments and pay each other
+    shops, customers = account_ids[:100], account_ids[100:]
+    pairs = []
+    for _ in range(transfers):
+        draw = rng.random()
+        if draw < 0.8:
+            pairs.append((rng.choice(customers), rng.choice(shops)))
+        elif draw < 0.9:
+            pairs.append((rng.choice(shops), rng.choice(customers)))
+        else:
+            pairs.append(tuple(rng.sample(shops, 2)))
+    return pairs
+
+
+def uniform(rng: random.Random, account_ids: List[str], transfers: int) -> List[Tuple[str, str]]:
+    # Any account paying any other, the worst case for netting
+    return [tuple(rng.sample(account_ids, 2)) for _ in range(transfers)]
+
+
+GRAPHS: Dict[str, Callable] = {'back_and_forth': back_and_forth, 'merchants': merchants, 'uniform': uniform}
+
+
+def create_bank(accounts: int, journal_path: Path) -> Bank:
+    # Journaled, every balance write is also a journal write
+    repository = create_autospec(Repository)
+    repository.load_state.return_value = {}
+    bank = Bank(account_helper=SequentialAccountHelper(), repository=repository,
+                journal=Journal(journal_path, compact_every=None))
+    rng = random.Random(0)
+    for _ in range(accounts):
+        bank.create_account('name', Decimal(rng.randint(0, 10_000)) / 100)
+    return bank
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=100_000)
+    parser.add_argument('--transfers', type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f'{"graph":<15} {"writes one by one":>18} {"rejected":>9} {"time (s)":>9} '
+          f'{"writes netted":>14} {"rejected":>9} {"time (s)":>9}')
+    for name, graph in GRAPHS.items():
+        rng = random.Random(1)
+        tmp_dir = tempfile.TemporaryDirectory()
+        sequential = create_bank(args.accounts, Path(tmp_dir.name) / 'sequential.journal')
+        netted = create_bank(args.accounts, Path(tmp_dir.name) / 'netted.journal')
+        window = [(from_account_id, to_account_id, Decimal(rng.randint(1, 5_000)) / 100)
+                  for from_account_id, to_account_id in graph(rng, list(sequential.accounts), args.transfers)]
+
+        start = time.perf_counter()
+        rejected = 0
+        for from_account_id, to_account_id, amount in window:
+            try:
+                sequential.transfer(from_account_id, to_account_id, amount)
+            except InvalidAccountOperationException:
+                rejected += 1
+        sequential_time = time.perf_counter() - start
+
+        for transfer in window:
+            netted.queue_transfer(*transfer)
+        start = time.perf_counter()
+        result = netted.settle()
+        netted_time = time.perf_counter() - start
+        sequential.close()
+        netted.close()
+        tmp_dir.cleanup()
+        print(f'{name:<15} {2 * (len(window) - rejected):>18} {rejected:>9} {sequential_time:>9.2f} '
+              f'{result.balance_writes:>14} {result.rejected_rows.size:>9} {netted_time:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
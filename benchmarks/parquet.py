@@ -0,0 +1,75 @@
+"""Compare the csv and Parquet state files of the same accounts: file size, save and load time, peak RSS.
+
+Usage: python -m benchmarks.parquet --accounts 1000000
+
+Every load runs in a fresh interpreter, so module imports (pyarrow for Parquet) are part of the
+measurement. The balance sum reads only the balance column, as an analytics tool would.
+"""
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from benchmarks.repository_load import write_state
+from src.repository import Repository
+
+LOAD_SCRIPT = '''
+import json, resource, sys, time
+start = time.perf_counter()
+from pathlib import Path
+from src.repository import create_repository
+accounts = create_repository(Path(sys.argv[1])).load_state()
+load = time.perf_counter() - start
+peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+start = time.perf_counter()
+create_repository(Path(sys.argv[2])).save_state(accounts)
+save = time.perf_counter() - start
+print(json.dumps({"accounts": len(accounts), "load": load, "save": save, "peak_rss_mb": peak_rss_mb}))
+'''
+
+SUM_SCRIPTS = {
+    '.csv': 'import pandas as pd; from decimal import Decimal; '
+            'print(sum(map(Decimal, pd.read_csv(sys.argv[1], usecols=["balance"], dtype=str)["balance"])))',
+    '.parquet': 'import pyarrow.parquet as pq, pyarrow.compute as pc; '
+                'print(pc.sum(pq.read_table(sys.argv[1], columns=["balance"])["balance"]).as_py())',
+}
+
+
+def measure(state_path: Path, save_path: Path) -> dict:
+    output = subprocess.run([sys.executable, '-c', LOAD_SCRIPT, str(state_path), str(save_path)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def measure_sum(state_path: Path) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import sys; ' + SUM_SCRIPTS[state_path.suffix], str(state_path)],
+                   capture_output=True, text=True, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = Path(tmp_dir) / 'state.csv'
+        write_state(csv_path, args.accounts)
+        parquet_path = Path(tmp_dir) / 'state.parquet'
+        from src.parquet import ParquetRepository
+        ParquetRepository(parquet_path).save_state(Repository(csv_path).load_state())
+        print(f'{args.accounts} accounts')
+        print(f'{"format":<8} {"size (MB)":>10} {"load (s)":>9} {"save (s)":>9} {"peak RSS (MB)":>14} '
+              f'{"balance sum (s)":>16}')
+        for state_path in (csv_path, parquet_path):
+            result = measure(state_path, state_path.with_name('saved' + state_path.suffix))
+            print(f'{state_path.suffix[1:]:<8} {state_path.stat().st_size / 2 ** 20:>10.1f} {result["load"]:>9.2f} '
+                  f'{result["save"]:>9.2f} {result["peak_rss_mb"]:>14.0f} {measure_sum(state_path):>16.2f}')
+
+
+if __name__ == '__main__':
+    main()
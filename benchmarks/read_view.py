@@ -0,0 +1,70 @@
+"""Measure what a snapshot costs: the pause while it is opened, the extra time of a transfer while one
+is open and reading all accounts through it.
+
+Usage: python -m benchmarks.read_view --accounts 1000000
+"""
+import random
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.account_store import AccountStore
+from src.bank import Bank
+from src.repository import Repository
+
+LAYOUTS = {'dict': dict, 'store': AccountStore}
+TRANSFERS = 100_000
+
+
+def create_bank(accounts: int, accounts_factory) -> Bank:
+    repository = create_autospec(Repository)
+    repository.load_state.return_value = accounts_factory()
+    bank = Bank(account_helper=AccountHelper(), repository=repository, accounts_factory=accounts_factory,
+                concurrent=True)
+    for _ in range(accounts):
+        bank.create_account('name', Decimal('100.25'))
+    return bank
+
+
+def time_transfers(bank: Bank, pairs) -> float:
+    # Microseconds per transfer
+    start = time.perf_counter()
+    for from_account_id, to_account_id in pairs:
+        bank.transfer(from_account_id, to_account_id, Decimal('0.01'))
+    return (time.perf_counter() - start) / len(pairs) * 1e6
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f'{"layout":<8} {"open (ms)":>10} {"transfer (us)":>14} {"with view (us)":>15} {"kept":>8} '
+          f'{"read all (s)":>13}')
+    for name, accounts_factory in LAYOUTS.items():
+        bank = create_bank(args.accounts, accounts_factory)
+        account_ids = list(bank.accounts)
+        rng = random.Random(0)
+        pairs = [tuple(rng.sample(account_ids, 2)) for _ in range(TRANSFERS)]
+        without_view = time_transfers(bank, pairs)
+
+        start = time.perf_counter()
+        view = bank.snapshot()
+        opened = time.perf_counter() - start
+        # Every transfer keeps the old balances of both accounts the first time they change
+        with_view = time_transfers(bank, pairs)
+        kept = view.versions
+
+        start = time.perf_counter()
+        for account in view.values():
+            account.balance
+        read_all = time.perf_counter() - start
+        view.close()
+        print(f'{name:<8} {opened * 1000:>10.1f} {without_view:>14.1f} {with_view:>15.1f} {kept:>8} '
+              f'{read_all:>13.2f}')
+
+
+if __name__ == '__main__':
+    main()
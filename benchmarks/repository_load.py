@@ -0,0 +1,59 @@
+"""Compare startup time and peak RSS of loading a state csv with each Repository engine.
+
+Usage: python -m benchmarks.repository_load --accounts 1000000
+"""
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from uuid import uuid4
+
+from src.repository import ENGINES
+
+# Runs in a fresh interpreter so module imports are part of the measurement
+LOAD_SCRIPT = '''
+import json, resource, sys, time
+start = time.perf_counter()
+from pathlib import Path
+from src.repository import Repository
+accounts = Repository(Path(sys.argv[1]), engine=sys.argv[2]).load_state()
+elapsed = time.perf_counter() - start
+print(json.dumps({"accounts": len(accounts), "seconds": elapsed,
+                  "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+'''
+
+
+def write_state(csv_path: Path, accounts: int):
+    with open(csv_path, 'w') as f:
+        f.write('account_id,name,balance\n')
+        for i in range(accounts):
+            f.write(f'{uuid4()},name{i % 1000},{i % 100000}.{i % 100:02d}\n')
+
+
+def measure(csv_path: Path, engine: str) -> dict:
+    output = subprocess.run([sys.executable, '-c', LOAD_SCRIPT, str(csv_path), engine],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = Path(tmp_dir) / 'state.csv'
+        start = time.perf_counter()
+        write_state(csv_path, args.accounts)
+        print(f'Generated {args.accounts} accounts in {time.perf_counter() - start:.1f}s')
+        print(f'{"engine":<8} {"load+import (s)":>16} {"peak RSS (MB)":>14}')
+        for engine in ENGINES:
+            result = measure(csv_path, engine)
+            print(f'{engine:<8} {result["seconds"]:>16.2f} {result["peak_rss_mb"]:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
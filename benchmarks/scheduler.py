@@ -0,0 +1,70 @@
+"""Measure the cost of adding, releasing and cancelling scheduled transfers as the number pending grows.
+
+Usage: python -m benchmarks.scheduler --sizes 10000,100000,1000000,3000000
+
+For every size the scheduler is filled with transfers due at random times, then more are added and
+released one tick at a time. Costs per transfer should grow with log n, not n.
+"""
+import gc
+import math
+import random
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+
+from src.scheduler import TransferScheduler
+
+# Transfers measured at every size, on top of the ones already pending
+MEASURED = 100_000
+# Due transfers released per tick
+TICK = 1000
+
+
+def measure(size: int, rng: random.Random) -> dict:
+    scheduler = TransferScheduler(clock=lambda: 0.0)
+    amount = Decimal('1')
+    for _ in range(size):
+        scheduler.add('a', 'b', amount, rng.uniform(1.0, 2.0))
+
+    # Added among the pending ones, and all due before them
+    dues = [rng.uniform(0.0, 1.0) for _ in range(MEASURED)]
+    start = time.perf_counter()
+    for due in dues:
+        scheduler.add('a', 'b', amount, due)
+    add = time.perf_counter() - start
+
+    # Released in ticks of TICK due transfers
+    dues.sort()
+    start = time.perf_counter()
+    released = 0
+    for tick in range(TICK - 1, MEASURED, TICK):
+        released += len(scheduler.release_due(dues[tick])[0])
+    release = time.perf_counter() - start
+    assert released == MEASURED
+
+    # Cancelled ones stay in the heap until half of it is, then it is rebuilt
+    cancelled = rng.sample(scheduler.upcoming(), min(MEASURED, size // 2))
+    start = time.perf_counter()
+    for transfer in cancelled:
+        scheduler.cancel(transfer.schedule_id)
+    cancel = time.perf_counter() - start
+    return {'add': add / MEASURED * 1e6, 'release': release / MEASURED * 1e6,
+            'cancel': cancel / len(cancelled) * 1e6}
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000,3000000')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f'{"pending":>9} {"log2 n":>7} {"add (us)":>9} {"release (us)":>13} {"cancel (us)":>12}')
+    for size in map(int, args.sizes.split(',')):
+        result = measure(size, rng)
+        gc.collect()
+        print(f'{size:>9} {math.log2(size):>7.1f} {result["add"]:>9.2f} {result["release"]:>13.2f} '
+              f'{result["cancel"]:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
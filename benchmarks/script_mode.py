@@ -0,0 +1,73 @@
+"""Compare running a command script with the interactive command path.
+
+Usage: python -m benchmarks.script_mode --accounts 1000 --commands 1000000
+
+The interactive path parses every line with parse_command and prints the command output,
+the way main.py does at the prompt. Its output goes to /dev/null.
+"""
+import contextlib
+import io
+import os
+import random
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.commands import execute_command, parse_command
+from src.exception import BankException
+from src.repository import Repository
+from src.script import run_script
+
+
+def create_bank(accounts: int) -> Bank:
+    repository = create_autospec(Repository)
+    repository.load_state.return_value = {}
+    bank = Bank(account_helper=AccountHelper(), repository=repository)
+    for _ in range(accounts):
+        bank.create_account('name', Decimal('1000000'))
+    return bank
+
+
+def create_script(account_ids, commands: int):
+    rng = random.Random(0)
+    return [f'transfer {rng.choice(account_ids)} {rng.choice(account_ids)} {rng.randint(1, 10000) / 100}'
+            for _ in range(commands)]
+
+
+def run_interactively(bank: Bank, script):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for user_input in script:
+            try:
+                for line in execute_command(bank, *parse_command(user_input)):
+                    print(line)
+                print()
+            except BankException as e:
+                print(e)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--commands', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    runs = {
+        'interactive path': run_interactively,
+        'script': lambda bank, script: run_script(bank, script, continue_on_error=True),
+        'script with output': lambda bank, script: run_script(bank, script, output=io.StringIO(),
+                                                              continue_on_error=True),
+    }
+    for name, run in runs.items():
+        bank = create_bank(args.accounts)
+        script = create_script(list(bank.accounts), args.commands)
+        started = time.perf_counter()
+        run(bank, script)
+        elapsed = time.perf_counter() - started
+        print(f'{name}: {elapsed:.2f}s ({args.commands / elapsed:.0f} ops/sec)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Drive a pipelining load against the TCP front-end of the Banking CLI.
+
+Usage: python -m benchmarks.server_load --connections 8 --window 64 --requests 100000
+
+Unless --port is given, a server is started in a subprocess on a temporary state csv.
+Every connection keeps up to --window requests in flight and the report shows the
+throughput together with the latency percentiles of single requests.
+"""
+import asyncio
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import List
+
+ACCOUNT_ID = re.compile(r'account_id=([^,]+),')
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, line: str) -> str:
+    writer.write(f'{line}\n'.encode())
+    await writer.drain()
+    return (await reader.readline()).decode()
+
+
+async def create_accounts(host: str, port: int, accounts: int) -> List[str]:
+    reader, writer = await asyncio.open_connection(host, port)
+    account_ids = [ACCOUNT_ID.search(await request(reader, writer, 'create_account name 1000000')).group(1)
+                   for _ in range(accounts)]
+    writer.close()
+    return account_ids
+
+
+async def run_connection(host: str, port: int, account_ids: List[str], requests: int, window: int,
+                         latencies: List[float]):
+    reader, writer = await asyncio.open_connection(host, port)
+    rng = random.Random()
+    in_flight = asyncio.Semaphore(window)
+    sent_at = asyncio.Queue()
+
+    async def read_responses():
+        for _ in range(requests):
+            await reader.readline()
+            latencies.append(time.perf_counter() - await sent_at.get())
+            in_flight.release()
+
+    responses = asyncio.create_task(read_responses())
+    for _ in range(requests):
+        await in_flight.acquire()
+        sent_at.put_nowait(time.perf_counter())
+        writer.write(f'transfer {rng.choice(account_ids)} {rng.choice(account_ids)} 1\n'.encode())
+        if in_flight.locked():
+            await writer.drain()
+    await writer.drain()
+    await responses
+    writer.close()
+
+
+async def run(host: str, port: int, connections: int, window: int, requests: int, accounts: int):
+    account_ids = await create_accounts(host, port, accounts)
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(run_connection(host, port, account_ids, requests // connections, window, latencies)
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f'{len(latencies)} requests over {connections} connections (window {window}): '
+          f'{len(latencies) / elapsed:.0f} req/s, '
+          f'p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms')
+
+
+def start_server(csv_path: Path) -> (subprocess.Popen, int):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen([sys.executable, '-u', 'main.py', '-f', str(csv_path), '--serve', '--port', str(port)],
+                              stdout=subprocess.PIPE, text=True)
+    # The server announces itself once it is listening
+    for line in server.stdout:
+        if line.startswith('Serving'):
+            break
+    return server, port
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='Port of a running server, one is started when omitted')
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--window', type=int, default=64, help='Requests in flight per connection')
+    parser.add_argument('--requests', type=int, default=100_000)
+    parser.add_argument('--accounts', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.port is not None:
+        asyncio.run(run(args.host, args.port, args.connections, args.window, args.requests, args.accounts))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server, port = start_server(Path(tmp_dir) / 'state.csv')
+        try:
+            asyncio.run(run('127.0.0.1', port, args.connections, args.window, args.requests, args.accounts))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Measure how the throughput of a ShardedBank changes with the number of shards.
+
+Usage: python -m benchmarks.sharding --shards 1,2,4,8 --accounts 10000 --operations 200000
+
+Operations are sent with ShardedBank.run_many in batches, so every shard gets one message per
+batch and the shards work in parallel. Deposits and withdrawals stay on one shard; random
+transfers mostly cross shards and run as two-phase commit. Shards only run in parallel when
+the machine has a core for each of them (this machine has os.cpu_count() of them).
+"""
+import os
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from pathlib import Path
+
+from src.sharding import ShardedBank
+
+
+def measure(bank: ShardedBank, operations, batch_size: int) -> float:
+    start = time.perf_counter()
+    for batch_start in range(0, len(operations), batch_size):
+        bank.run_many(operations[batch_start:batch_start + batch_size])
+    return len(operations) / (time.perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--shards', default='1,2,4')
+    parser.add_argument('--accounts', type=int, default=10_000)
+    parser.add_argument('--operations', type=int, default=200_000)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} cores')
+    print(f'{"shards":>6} {"deposit/withdraw (ops/s)":>25} {"transfer (ops/s)":>17}')
+    for shards in (int(shards) for shards in args.shards.split(',')):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bank = ShardedBank(Path(tmp_dir) / 'state.csv', shards=shards)
+            account_ids = [bank.create_account('name', Decimal('1000000')).account_id
+                           for _ in range(args.accounts)]
+            rng = random.Random(0)
+            single_shard = [(rng.choice(('deposit', 'withdraw')), rng.choice(account_ids), Decimal('1'))
+                            for _ in range(args.operations)]
+            transfers = [('transfer', rng.choice(account_ids), rng.choice(account_ids), Decimal('1'))
+                         for _ in range(args.operations)]
+            single_shard_throughput = measure(bank, single_shard, args.batch_size)
+            transfer_throughput = measure(bank, transfers, args.batch_size)
+            bank.close()
+        print(f'{shards:>6} {single_shard_throughput:>25.0f} {transfer_throughput:>17.0f}')
+
+
+if __name__ == '__main__':
+    main()
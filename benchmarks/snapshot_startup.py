@@ -0,0 +1,66 @@
+"""Compare bank startup on a state csv and on a binary snapshot of the same accounts.
+
+Usage: python -m benchmarks.snapshot_startup --accounts 1000000
+
+Every measurement runs in a fresh interpreter: time until the Bank is constructed, time of
+random get_account lookups afterwards, and peak RSS.
+"""
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from benchmarks.repository_load import write_state
+from src.snapshot import csv_to_snapshot
+
+STARTUP_SCRIPT = '''
+import json, random, resource, sys, time
+start = time.perf_counter()
+from pathlib import Path
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.repository import create_repository
+bank = Bank(account_helper=AccountHelper(), repository=create_repository(Path(sys.argv[1])))
+startup = time.perf_counter() - start
+account_ids = [line.split(',', 1)[0] for line in open(sys.argv[2]).read().splitlines()[1:]]
+lookups = random.Random(0).choices(account_ids, k=100000)
+start = time.perf_counter()
+for account_id in lookups:
+    bank.get_account(account_id).balance
+lookup = (time.perf_counter() - start) / len(lookups)
+print(json.dumps({"startup_seconds": startup, "lookup_us": lookup * 1e6,
+                  "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+'''
+
+
+def measure(state_path: Path, csv_path: Path) -> dict:
+    output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, str(state_path), str(csv_path)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = Path(tmp_dir) / 'state.csv'
+        snapshot_path = Path(tmp_dir) / 'state.bin'
+        write_state(csv_path, args.accounts)
+        start = time.perf_counter()
+        csv_to_snapshot(csv_path, snapshot_path)
+        print(f'Converted {args.accounts} accounts to a snapshot in {time.perf_counter() - start:.1f}s')
+        # Note that the lookup ids are read in both runs and count towards peak RSS
+        print(f'{"format":<8} {"startup (s)":>12} {"lookup (us)":>12} {"peak RSS (MB)":>14}')
+        for name, state_path in (('csv', csv_path), ('binary', snapshot_path)):
+            result = measure(state_path, csv_path)
+            print(f'{name:<8} {result["startup_seconds"]:>12.3f} {result["lookup_us"]:>12.2f} '
+                  f'{result["peak_rss_mb"]:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
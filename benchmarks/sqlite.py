@@ -0,0 +1,72 @@
+"""Compare a csv state file and a SQLite database of the same accounts as the number of changed accounts grows.
+
+Usage: python -m benchmarks.sqlite --accounts 1000000 --changed 0,100,10000,100000,1000000
+
+For every number of changed accounts a bank is started on each state, deposits into that many random
+accounts and saves. The csv state is read whole at startup and written whole by every save; the SQLite
+database reads an account on its first access, and a save writes only the accounts changed.
+"""
+import gc
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from pathlib import Path
+from typing import List
+
+from benchmarks.repository_load import write_state
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.repository import Repository, create_repository
+from src.sqlite import SqliteRepository
+
+
+def measure(state_path: Path, account_ids: List[str]) -> dict:
+    repository = create_repository(state_path)
+    start = time.perf_counter()
+    bank = Bank(account_helper=AccountHelper(), repository=repository)
+    load = time.perf_counter() - start
+
+    amount = Decimal('1')
+    start = time.perf_counter()
+    for account_id in account_ids:
+        bank.deposit(account_id, amount)
+    change = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bank.save_state()
+    save = time.perf_counter() - start
+    bank.close()
+    return {'load': load, 'change': change, 'save': save}
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    parser.add_argument('--changed', default='0,100,10000,100000,1000000')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = Path(tmp_dir) / 'state.csv'
+        write_state(csv_path, args.accounts)
+        db_path = Path(tmp_dir) / 'state.db'
+        accounts = Repository(csv_path).load_state()
+        SqliteRepository(db_path).save_state(accounts)
+        all_account_ids = list(accounts)
+        del accounts
+
+        print(f'{args.accounts} accounts')
+        print(f'{"changed":>9} {"format":<7} {"load (s)":>9} {"change (s)":>11} {"save (s)":>9}')
+        for changed in map(int, args.changed.split(',')):
+            account_ids = rng.sample(all_account_ids, min(changed, len(all_account_ids)))
+            for state_path in (csv_path, db_path):
+                result = measure(state_path, account_ids)
+                gc.collect()
+                print(f'{changed:>9} {state_path.suffix[1:]:<7} {result["load"]:>9.3f} {result["change"]:>11.3f} '
+                      f'{result["save"]:>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
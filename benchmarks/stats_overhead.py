@@ -0,0 +1,69 @@
+"""Measure what stats cost per bank operation, with stats disabled and enabled.
+
+A bank without stats runs its methods unwrapped, so the disabled overhead should be within noise.
+
+Usage: python -m benchmarks.stats_overhead --accounts 10000 --operations 200000
+"""
+import gc
+import random
+import statistics
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from typing import Optional
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.bank import INSTRUMENTED_METHODS, Bank
+from src.repository import Repository
+from src.stats import Stats
+
+
+def create_bank(accounts: int, stats: Optional[Stats]) -> Bank:
+    repository = create_autospec(Repository)
+    repository.load_state.return_value = {}
+    bank = Bank(account_helper=AccountHelper(), repository=repository, stats=stats)
+    for _ in range(accounts):
+        bank.create_account('name', Decimal('1000000'))
+    return bank
+
+
+def time_transfers(bank: Bank, transfers) -> float:
+    gc.disable()
+    start = time.perf_counter()
+    for from_account_id, to_account_id in transfers:
+        bank.transfer(from_account_id, to_account_id, Decimal('1'))
+    elapsed = time.perf_counter() - start
+    gc.enable()
+    return elapsed / len(transfers)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=10_000)
+    parser.add_argument('--operations', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    banks = {'disabled': create_bank(args.accounts, None), 'enabled': create_bank(args.accounts, Stats())}
+    # Nothing is wrapped on a bank without stats
+    assert not set(INSTRUMENTED_METHODS) & set(vars(banks['disabled']))
+    rng = random.Random(0)
+    results = {name: [] for name in banks}
+    for _ in range(args.repeat):
+        # Interleaved, so drifts of the machine hit both
+        for name, bank in banks.items():
+            account_ids = list(bank.accounts)
+            transfers = [tuple(rng.sample(account_ids, 2)) for _ in range(args.operations)]
+            results[name].append(time_transfers(bank, transfers))
+
+    disabled = statistics.median(results['disabled'])
+    print(f'{"stats":<10} {"transfer (us)":>14} {"overhead":>10}')
+    for name, timings in results.items():
+        median = statistics.median(timings)
+        print(f'{name:<10} {median * 1e6:>14.2f} {(median - disabled) * 1e9:>8.0f}ns')
+    print(banks['enabled'].get_stats().format()[-1])
+
+
+if __name__ == '__main__':
+    main()
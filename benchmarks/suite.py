@@ -0,0 +1,197 @@
+"""Benchmark suite for the Bank and Repository hot paths, with results written as JSON.
+
+Usage: python -m benchmarks --sizes 10000,100000 --output results.json
+       python -m benchmarks --sizes 10000,100000 --baseline baseline.json --threshold 0.15
+
+For every account count the suite measures
+- latency percentiles and throughput of create_account, deposit, withdraw and transfer
+- save_state and load_state of a state csv with that many accounts
+- peak RSS of a fresh interpreter loading that state csv
+
+Inputs are generated from a fixed seed and timings are the median over --repeat runs after a
+warm-up run, with garbage collection paused while operations are timed. With
+--baseline every metric is compared with the stored run and the exit code is 1 when one got
+worse by more than --threshold.
+"""
+import contextlib
+import gc
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, List
+from unittest.mock import create_autospec
+
+from benchmarks.repository_load import measure as measure_load_rss
+from src.account_helper import AccountHelper
+from src.account_store import AccountStore
+from src.bank import Bank
+from src.exception import BankException
+from src.repository import Repository
+
+SEED = 0
+PERCENTILES = (50, 90, 99)
+# Metrics where a higher value is better, everything else is a duration or a size
+HIGHER_IS_BETTER = ('ops_per_sec',)
+
+
+class SequentialAccountHelper(AccountHelper):
+    # uuid4 would make the generated ids, and so the csv sizes, differ between runs
+    def __init__(self):
+        super().__init__()
+        self.next_id = 0
+
+    def create_account_id(self) -> str:
+        self.next_id += 1
+        return f'{self.next_id:032x}'
+
+
+def create_bank(accounts_factory) -> Bank:
+    repository = create_autospec(Repository)
+    repository.load_state.return_value = accounts_factory()
+    return Bank(account_helper=SequentialAccountHelper(), repository=repository, accounts_factory=accounts_factory)
+
+
+def time_calls(call: Callable, arguments: List[tuple]) -> Dict[str, float]:
+    latencies = [0] * len(arguments)
+    perf_counter_ns = time.perf_counter_ns
+    # Like timeit, keep garbage collection pauses out of the timings
+    gc.collect()
+    gc.disable()
+    try:
+        started = perf_counter_ns()
+        for i, args in enumerate(arguments):
+            call_started = perf_counter_ns()
+            try:
+                call(*args)
+            except BankException:
+                pass
+            latencies[i] = perf_counter_ns() - call_started
+        elapsed = (perf_counter_ns() - started) / 1e9
+    finally:
+        gc.enable()
+    latencies.sort()
+    result = {'ops_per_sec': len(latencies) / elapsed}
+    for percentile in PERCENTILES:
+        result[f'p{percentile}_us'] = latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)] / 1000
+    return result
+
+
+def bench_bank(accounts: int, operations: int, accounts_factory) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(SEED)
+    bank = create_bank(accounts_factory)
+
+    def amounts(high: int = 10 ** 4):
+        return Decimal(rng.randint(1, high)) / 100
+
+    results = {'create_account': time_calls(bank.create_account, [('name', amounts(10 ** 6)) for _ in range(accounts)])}
+    account_ids = list(bank.accounts)
+
+    results['deposit'] = time_calls(bank.deposit, [(rng.choice(account_ids), amounts()) for _ in range(operations)])
+    results['withdraw'] = time_calls(bank.withdraw, [(rng.choice(account_ids), amounts()) for _ in range(operations)])
+    results['transfer'] = time_calls(bank.transfer, [(rng.choice(account_ids), rng.choice(account_ids), amounts())
+                                                     for _ in range(operations)])
+    return results
+
+
+def bench_repository(accounts: int, csv_path: Path, accounts_factory) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(SEED)
+    bank = create_bank(accounts_factory)
+    for _ in range(accounts):
+        bank.create_account(f'name{rng.randrange(1000)}', Decimal(rng.randint(0, 10 ** 6)) / 100)
+    repository = Repository(csv_path)
+
+    started = time.perf_counter()
+    repository.save_state(bank.accounts)
+    results = {'save_state': {'seconds': time.perf_counter() - started}}
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        repository.load_state(accounts_factory())
+    results['load_state'] = {'seconds': time.perf_counter() - started}
+    # A fresh interpreter, so the accounts built above do not count
+    results['load_state_memory'] = {'peak_rss_mb': measure_load_rss(csv_path, 'csv')['peak_rss_mb']}
+    return results
+
+
+def median_of_runs(run: Callable[[], Dict[str, Dict[str, float]]], repeat: int) -> Dict[str, Dict[str, float]]:
+    # The first run warms up caches and the allocator and is not counted
+    run()
+    runs = [run() for _ in range(repeat)]
+    return {name: {metric: statistics.median(result[name][metric] for result in runs) for metric in runs[0][name]}
+            for name in runs[0]}
+
+
+def run_suite(sizes: List[int], operations: int, repeat: int, accounts_factory) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = Path(tmp_dir) / 'state.csv'
+        for size in sizes:
+            print(f'Benchmarking {size} accounts...', file=sys.stderr)
+            size_results = median_of_runs(lambda: bench_bank(size, operations, accounts_factory), repeat)
+            size_results.update(median_of_runs(lambda: bench_repository(size, csv_path, accounts_factory), repeat))
+            results.update({f'{name}[{size}]': metrics for name, metrics in size_results.items()})
+    return {'environment': environment(), 'results': results}
+
+
+def environment() -> dict:
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    return {'commit': commit or None,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'platform': platform.platform()}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    # Returns one line per metric that got worse than the baseline by more than the threshold
+    regressions = []
+    for name, metrics in results['results'].items():
+        for metric, value in metrics.items():
+            base = baseline['results'].get(name, {}).get(metric)
+            if not base:
+                continue
+            change = (base - value) / base if metric in HIGHER_IS_BETTER else (value - base) / base
+            if change > threshold:
+                regressions.append(f'{name} {metric}: {base:.2f} -> {value:.2f} ({change:+.0%} worse)')
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--sizes', default='10000,100000',
+                        help='Comma separated account counts, e.g. 10000,100000,1000000,10000000')
+    parser.add_argument('--operations', type=int, default=100_000,
+                        help='Deposits, withdrawals and transfers measured at every size')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--compact-store', action='store_true', help='Keep accounts in an AccountStore')
+    parser.add_argument('--output', help='Write the results as JSON to this file instead of stdout')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative change flagged as a regression')
+    args = parser.parse_args()
+
+    results = run_suite([int(size) for size in args.sizes.split(',')], args.operations, args.repeat,
+                        AccountStore if args.compact_store else dict)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions beyond {args.threshold:.0%} against {args.baseline}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Generate a seeded synthetic workload with Zipf-skewed hot accounts, and stream it into a Bank or write it out.
+
+Usage: python -m benchmarks.workload --accounts 100000 --operations 5000000 --zipf 1.1
+       python -m benchmarks.workload --accounts 100000 --operations 5000000 --threads 8 --concurrent
+       python -m benchmarks.workload --accounts 1000 --operations 100000 --state state.csv --script ops.txt
+       python main.py -f state.csv --script ops.txt --continue-on-error
+
+Deposits and transfers go to accounts drawn from a Zipf distribution: the k-th hottest account is
+drawn with weight 1 / k ** zipf, so a few accounts receive most of them, as merchants do. A zipf of 0
+is uniform. Withdrawals and the sources of transfers are drawn uniformly. --overdraft-rate of the
+withdrawals and transfers ask for more than any balance and are rejected, the others are rejected
+when their account has run dry. The same --seed gives the same operations, in the rows Bank.apply_batch
+takes and in main.py command syntax.
+"""
+import threading
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence
+from unittest.mock import create_autospec
+
+import numpy as np
+
+from benchmarks.suite import SequentialAccountHelper
+from src.account import Account
+from src.account_store import AccountStore
+from src.bank import Bank
+from src.batch import DEPOSIT, TRANSFER, WITHDRAW
+from src.exception import BankException
+from src.money import from_minor_units
+from src.repository import Repository
+
+DEFAULT_MIX = {DEPOSIT: 0.3, WITHDRAW: 0.2, TRANSFER: 0.5}
+# Asked for by the operations meant to overdraw, more than any balance gets to
+OVERDRAFT_AMOUNT = Decimal('1000000000000')
+# Operations generated at a time, as numpy columns
+CHUNK_SIZE = 65536
+DEPOSIT_CODE = 0
+WITHDRAW_CODE = 1
+TRANSFER_CODE = 2
+KIND_CODES = {DEPOSIT: DEPOSIT_CODE, WITHDRAW: WITHDRAW_CODE, TRANSFER: TRANSFER_CODE}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    # e.g. deposit=0.3,withdraw=0.2,transfer=0.5
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in DEFAULT_MIX:
+            raise ValueError(f'Unknown operation {kind}, expected one of {", ".join(DEFAULT_MIX)}')
+        mix[kind] = float(weight)
+    return mix
+
+
+class Workload(NamedTuple):
+    account_ids: Sequence[str]
+    mix: Dict[str, float] = DEFAULT_MIX
+    zipf: float = 1.0
+    overdraft_rate: float = 0.0
+    # Amounts are drawn uniformly from 0.01 up to this
+    max_amount: Decimal = Decimal('100')
+    seed: int = 0
+
+    def hot_accounts(self) -> np.ndarray:
+        # Account positions from hottest to coldest, so the hot ones are not simply the first created
+        return np.random.default_rng(self.seed).permutation(len(self.account_ids))
+
+    def target_cdf(self) -> np.ndarray:
+        weights = 1.0 / np.arange(1, len(self.account_ids) + 1, dtype=np.float64) ** self.zipf
+        cdf = np.cumsum(weights)
+        return cdf / cdf[-1]
+
+    def operations(self, count: int, stream: int = 0) -> Iterator[List[tuple]]:
+        # Chunks of (kind, account_id, amount) and (kind, from_account_id, to_account_id, amount) rows.
+        # Every stream is an independent sequence of the same workload, e.g. one per thread.
+        rng = np.random.default_rng([self.seed, stream])
+        kinds = list(self.mix)
+        weights = np.array([self.mix[kind] for kind in kinds], dtype=np.float64)
+        codes = np.array([KIND_CODES[kind] for kind in kinds])
+        hot, cdf = self.hot_accounts(), self.target_cdf()
+        account_ids = self.account_ids
+        # Every amount as a Decimal once, looked up by its minor units. 0 stands for an overdraft.
+        amounts = [OVERDRAFT_AMOUNT] + [from_minor_units(units) for units in range(1, int(self.max_amount * 100) + 1)]
+        for start in range(0, count, CHUNK_SIZE):
+            size = min(CHUNK_SIZE, count - start)
+            row_kinds = codes[rng.choice(len(kinds), size=size, p=weights / weights.sum())]
+            targets = hot[np.minimum(np.searchsorted(cdf, rng.random(size)), len(cdf) - 1)]
+            sources = rng.integers(len(account_ids), size=size)
+            units = rng.integers(1, len(amounts), size=size)
+            units[(rng.random(size) < self.overdraft_rate) & (row_kinds != DEPOSIT_CODE)] = 0
+            # Columns first, then a single pass to put the rows together
+            yield [(TRANSFER, source, target, amount) if kind == TRANSFER_CODE
+                   else (DEPOSIT, target, amount) if kind == DEPOSIT_CODE
+                   else (WITHDRAW, source, amount)
+                   for kind, source, target, amount in zip(row_kinds.tolist(),
+                                                           map(account_ids.__getitem__, sources.tolist()),
+                                                           map(account_ids.__getitem__, targets.tolist()),
+                                                           map(amounts.__getitem__, units.tolist()))]
+
+    def hot_share(self, hottest: int = 10) -> float:
+        # Share of deposits and transfers that go to the hottest accounts
+        cdf = self.target_cdf()
+        return float(cdf[min(hottest, len(cdf)) - 1])
+
+
+def to_command(row: tuple) -> str:
+    return ' '.join(map(str, row))
+
+
+def create_bank(accounts: int, balance: Decimal, compact_store: bool = False, concurrent: bool = False) -> Bank:
+    account_helper = SequentialAccountHelper()
+    state = AccountStore() if compact_store else {}
+    for _ in range(accounts):
+        account_id = account_helper.create_account_id()
+        state[account_id] = Account(account_id, 'name', balance)
+    repository = create_autospec(Repository)
+    repository.load_state.return_value = state
+    return Bank(account_helper=account_helper, repository=repository, concurrent=concurrent)
+
+
+class ThroughputSample(NamedTuple):
+    # Seconds since the start of the run, at the end of the interval
+    elapsed: float
+    operations: int
+    rejected: int
+    ops_per_second: float
+
+
+def stream(bank: Bank,
+           workload: Workload,
+           operations: int,
+           threads: int = 1,
+           batch_size: Optional[int] = None,
+           interval: float = 1.0,
+           report=print) -> List[ThroughputSample]:
+    # Runs the operations against the bank from `threads` threads, each with its own stream of the
+    # workload, and samples the throughput every interval seconds. With batch_size the operations go
+    # through apply_batch, batch_size at a time.
+    methods = {DEPOSIT: bank.deposit, WITHDRAW: bank.withdraw, TRANSFER: bank.transfer}
+    # Per thread, so the counters are not shared between threads
+    done = [0] * threads
+    rejected = [0] * threads
+
+    def run(thread: int, count: int):
+        for chunk in workload.operations(count, stream=thread):
+            if batch_size:
+                for start in range(0, len(chunk), batch_size):
+                    result = bank.apply_batch(chunk[start:start + batch_size], atomic=False)
+                    rejected[thread] += len(result.rejected_rows)
+                    done[thread] += len(result.statuses)
+                continue
+            for row in chunk:
+                try:
+                    methods[row[0]](*row[1:])
+                except BankException:
+                    rejected[thread] += 1
+                done[thread] += 1
+
+    workers = [threading.Thread(target=run, args=(thread, operations // threads + (thread < operations % threads)))
+               for thread in range(threads)]
+    samples = []
+    started = last = time.perf_counter()
+    last_done = 0
+    for worker in workers:
+        worker.start()
+    while True:
+        alive = [worker for worker in workers if worker.is_alive()]
+        if not alive:
+            break
+        # Returns early when the worker is done, the last sample covers a shorter interval
+        alive[0].join(interval)
+        now = time.perf_counter()
+        total = sum(done)
+        sample = ThroughputSample(elapsed=now - started, operations=total, rejected=sum(rejected),
+                                  ops_per_second=(total - last_done) / (now - last))
+        samples.append(sample)
+        report(f'{sample.elapsed:>8.1f} {sample.operations:>12} {sample.rejected:>10} {sample.ops_per_second:>10.0f}')
+        last, last_done = now, total
+    for worker in workers:
+        worker.join()
+    return samples
+
+
+def write_files(workload: Workload, operations: int, balance: Decimal, state_path: Optional[Path],
+                script_path: Optional[Path]):
+    if state_path is not None:
+        Repository(state_path).save_state({account_id: Account(account_id, 'name', balance)
+                                           for account_id in workload.account_ids})
+    if script_path is not None:
+        with open(script_path, 'w') as f:
+            for chunk in workload.operations(operations):
+                f.write('\n'.join(map(to_command, chunk)) + '\n')
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=100_000)
+    parser.add_argument('--operations', type=int, default=1_000_000)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Weights of the operations, e.g. deposit=0.3,withdraw=0.2,transfer=0.5')
+    parser.add_argument('--zipf', type=float, default=1.0, help='Skew of the accounts receiving money, 0 is uniform')
+    parser.add_argument('--overdraft-rate', type=float, default=0.0,
+                        help='Share of withdrawals and transfers that ask for more than any balance')
+    parser.add_argument('--balance', type=Decimal, default=Decimal('1000'), help='Starting balance of every account')
+    parser.add_argument('--max-amount', type=Decimal, default=Decimal('100'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--concurrent', action='store_true', help='Use a concurrent bank, needed with --threads')
+    parser.add_argument('--compact-store', action='store_true')
+    parser.add_argument('--batch-size', type=int, help='Apply the operations with apply_batch, this many at a time')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between throughput samples')
+    parser.add_argument('--state', type=Path, help='Write the accounts to this state csv instead of running')
+    parser.add_argument('--script', type=Path, help='Write the operations as main.py commands instead of running')
+    args = parser.parse_args()
+    if args.operations < 1 or args.threads < 1:
+        parser.error('--operations and --threads must be positive')
+    if args.threads > 1 and not args.concurrent:
+        parser.error('--threads needs --concurrent')
+
+    account_helper = SequentialAccountHelper()
+    account_ids = [account_helper.create_account_id() for _ in range(args.accounts)]
+    workload = Workload(account_ids, mix=args.mix, zipf=args.zipf, overdraft_rate=args.overdraft_rate,
+                        max_amount=args.max_amount, seed=args.seed)
+    print(f'The 10 hottest of {args.accounts} accounts receive {workload.hot_share():.0%} of deposits and transfers')
+    if args.state is not None or args.script is not None:
+        write_files(workload, args.operations, args.balance, args.state, args.script)
+        return
+
+    bank = create_bank(args.accounts, args.balance, compact_store=args.compact_store, concurrent=args.concurrent)
+    print(f'{"time (s)":>8} {"operations":>12} {"rejected":>10} {"ops/sec":>10}')
+    samples = stream(bank, workload, args.operations, threads=args.threads, batch_size=args.batch_size,
+                     interval=args.interval)
+    last = samples[-1]
+    print(f'{last.operations} operations in {last.elapsed:.1f}s ({last.operations / last.elapsed:.0f} ops/sec), '
+          f'{last.rejected / last.operations:.1%} rejected')
+
+
+if __name__ == '__main__':
+    main()
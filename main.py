@@ -1,134 +1,187 @@
+import sys
 from argparse import ArgumentParser
+from functools import partial
 from pathlib import Path
 
-from decimal import Decimal, InvalidOperation
 from src.account_helper import AccountHelper
+from src.account_store import AccountStore
 from src.bank import Bank
+from src.commands import InvalidCommandException, commands, execute_command, parse_command
 from src.exception import BankException
-from src.repository import Repository
+from src.journal import Journal
+from src.ledger import Ledger
+from src.repository import create_repository
+from src.scheduler import MISFIRE_ONCE, MISFIRES, ScheduleTicker, TransferScheduler
+from src.snapshot import SNAPSHOT_SUFFIX
+from src.stats import Stats
 
 
 parser = ArgumentParser()
-parser.add_argument('-f', dest='csv_path', help='Path of state csv file to be loaded from and saved to', required=True)
+parser.add_argument('-f', dest='csv_path', required=True,
+                    help='Path of state csv file to be loaded from and saved to, a .bin path keeps a binary snapshot, '
+                         'a .parquet path a Parquet file, a .db or .sqlite path a SQLite database read on demand')
+parser.add_argument('-j', dest='journal_path',
+                    help='Path of write-ahead journal file. When given, every change is journaled and replayed on start')
+parser.add_argument('--compact-store', action='store_true',
+                    help='Keep accounts in a compact columnar store with balances in cents')
+parser.add_argument('--integer-ids', action='store_true',
+                    help='Keep account ids as 128-bit integers in a compact store, they still show as uuid strings')
+parser.add_argument('--serve', action='store_true',
+                    help='Serve the commands over TCP instead of the interactive CLI')
+parser.add_argument('--host', default='127.0.0.1', help='Host to serve on')
+parser.add_argument('--port', type=int, default=8765, help='Port to serve on')
+parser.add_argument('--max-queue', type=int, default=1024,
+                    help='Requests queued across all connections before the server stops reading')
+parser.add_argument('--script', metavar='FILE',
+                    help='Run the commands of FILE, one per line, instead of the interactive CLI. - reads stdin')
+parser.add_argument('--output', metavar='FILE', help='Write the output of script commands to FILE, - for stdout')
+parser.add_argument('--continue-on-error', action='store_true', help='Keep running a script after a failed command')
+parser.add_argument('--checkpoint-every', type=int, metavar='N', help='Save the bank state every N script commands')
+parser.add_argument('--ledger', action='store_true',
+                    help='Record every balance change for account statements')
+parser.add_argument('--ledger-spill', metavar='DIR',
+                    help='Spill old ledger segments to DIR instead of dropping them')
+parser.add_argument('--stats', action='store_true',
+                    help='Time the bank operations and count their errors, shown by the stats command')
+parser.add_argument('--stats-file', metavar='FILE',
+                    help='Write the stats as JSON to FILE on exit, implies --stats')
+parser.add_argument('--background-checkpoints', action='store_true',
+                    help='Write the state file on a background thread, changes only wait while a snapshot is taken')
+parser.add_argument('--checkpoint-ops', type=int, metavar='N',
+                    help='Save the state in the background every N changes, implies --background-checkpoints')
+parser.add_argument('--checkpoint-seconds', type=float, metavar='T',
+                    help='Save the state in the background at most every T seconds, implies --background-checkpoints')
+parser.add_argument('--shards', type=int, metavar='N',
+                    help='Partition the accounts over N worker processes, each with its own state file and journal')
+parser.add_argument('--schedules', action='store_true',
+                    help='Enable scheduled transfers, saved with the state in a .schedules file next to it')
+parser.add_argument('--tick-seconds', type=float, default=1.0, metavar='T',
+                    help='Run the scheduled transfers that are due every T seconds')
+parser.add_argument('--misfire', choices=MISFIRES, default=MISFIRE_ONCE,
+                    help='Runs of a recurring transfer missed while the bank was down: run once for all of them, '
+                         'or run all of them')
 init_args = parser.parse_args()
 csv_path = init_args.csv_path
+journal_path = init_args.journal_path
+if init_args.integer_ids and (init_args.shards or Path(csv_path).suffix == SNAPSHOT_SUFFIX):
+    parser.error('--integer-ids only works with a csv state file and without --shards')
+if (init_args.ledger or init_args.ledger_spill) and init_args.shards:
+    parser.error('--ledger does not work with --shards')
+if (init_args.stats or init_args.stats_file) and init_args.shards:
+    parser.error('--stats does not work with --shards')
+if init_args.schedules and init_args.shards:
+    parser.error('--schedules does not work with --shards')
+background_checkpoints = init_args.background_checkpoints or init_args.checkpoint_ops or init_args.checkpoint_seconds
+if background_checkpoints and init_args.shards:
+    parser.error('--background-checkpoints does not work with --shards')
 
 
 # Create an instance of the BankingSystem
-bank = Bank(account_helper=AccountHelper(),
-            repository=Repository(csv_path=Path(csv_path)))
-
-# Define the available commands and their arguments
-commands = {
-    'create_account': {
-        'args': ['name', 'balance'],
-        'help': 'Create a new account',
-        'numeric_args': ['balance']
-    },
-    'deposit': {
-        'args': ['account_id', 'amount'],
-        'help': 'Deposit into an account',
-        'numeric_args': ['amount']
-    },
-    'withdraw': {
-        'args': ['account_id', 'amount'],
-        'help': 'Withdraw from an account',
-        'numeric_args': ['amount']
-    },
-    'transfer': {
-        'args': ['from_account_id', 'to_account_id', 'amount'],
-        'help': 'Transfer between accounts',
-        'numeric_args': ['amount']
-    },
-    'save_state': {
-        'args': [],
-        'help': 'Save bank state to a csv file',
-    },
-    'exit': {
-        'args': [],
-        'help': 'Exit the program',
-    },
-}
+if init_args.shards:
+    from src.sharding import ShardedBank
+
+    # Every shard keeps a journal next to its state file, -j does not apply
+    bank = ShardedBank(Path(csv_path), shards=init_args.shards)
+else:
+    if init_args.integer_ids:
+        accounts_factory = partial(AccountStore, integer_keys=True)
+    else:
+        accounts_factory = AccountStore if init_args.compact_store else dict
+    bank = Bank(account_helper=AccountHelper(integer_ids=init_args.integer_ids),
+                repository=create_repository(Path(csv_path)),
+                journal=Journal(journal_path=Path(journal_path)) if journal_path else None,
+                accounts_factory=accounts_factory,
+                # The schedule ticker changes balances from its own thread
+                concurrent=init_args.schedules,
+                ledger=Ledger(spill_path=Path(init_args.ledger_spill) if init_args.ledger_spill else None)
+                if init_args.ledger or init_args.ledger_spill else None,
+                stats=Stats() if init_args.stats or init_args.stats_file else None,
+                scheduler=TransferScheduler(path=Path(csv_path).with_name(Path(csv_path).name + '.schedules'),
+                                            misfire=init_args.misfire) if init_args.schedules else None)
+    if background_checkpoints:
+        from src.checkpoint import Checkpointer
+
+        Checkpointer(bank, every_operations=init_args.checkpoint_ops, every_seconds=init_args.checkpoint_seconds)
+ticker = ScheduleTicker(bank.run_due_transfers, interval=init_args.tick_seconds) if init_args.schedules else None
+
+
+def close_bank():
+    if ticker is not None:
+        ticker.close()
+    if init_args.stats_file:
+        bank.get_stats().dump(Path(init_args.stats_file))
+    bank.close()
 
 
 # Print the available commands and their usage
 def print_command_usage():
     print('Available commands:')
     for command, details in commands.items():
-        args = ', '.join(details['args'])
+        args = ', '.join(details['args'] + [f'[{arg}]' for arg in details.get('optional_args', [])])
         print(f'- {command}\n\tParameters (in order): {args}\n\tUsage: {details["help"]}')
     print()
 
 
 # Process the user's input
 def process_input(user_input):
-    parts = user_input.split()
-    command = parts[0]
-    args = parts[1:]
-
-    if command == 'exit':
+    if user_input.split()[:1] == ['exit']:
         print('Exiting the program...')
         return False
 
-    if command not in commands:
-        print('Invalid command. Please try again.')
-        return True
-
-    if len(args) != len(commands[command]['args']):
-        print('Invalid number of arguments. Please try again.')
+    try:
+        command, command_args = parse_command(user_input)
+    except InvalidCommandException as e:
+        print(e)
         return True
 
-    command_args = {}
-    for i, arg in enumerate(commands[command]['args']):
-        if arg in commands[command]['numeric_args']:
-            try:
-                args[i] = Decimal(args[i])
-            except InvalidOperation:
-                print(f'{arg} should be in numerical format. Please try again.')
-        command_args[arg] = args[i]
-
-    if command == 'create_account':
-        account = bank.create_account(
-            name=command_args['name'],
-            balance=Decimal(command_args.get('balance', 0)),
-        )
-        print(f'Created new account: {account}')
-    elif command == 'deposit':
-        account = bank.deposit(account_id=command_args['account_id'],
-                               amount=command_args['amount'])
-        print(f'Deposited {command_args["amount"]} to account {command_args["account_id"]}')
-        print(f'Account state after deposit: {account}')
-    elif command == 'withdraw':
-        account = bank.withdraw(account_id=command_args['account_id'],
-                                amount=command_args['amount'])
-        print(f'Withdrawn {command_args["amount"]} from account {command_args["account_id"]}')
-        print(f'Account state after withdrawal: {account}')
-    elif command == 'transfer':
-        from_account, to_account = bank.transfer(from_account_id=command_args['from_account_id'],
-                                                 to_account_id=command_args['to_account_id'],
-                                                 amount=Decimal(command_args['amount']))
-        print(f'Transferred {command_args["amount"]} from account {command_args["from_account_id"]} '
-              f'to account {command_args["to_account_id"]}')
-        print(f'From account state after transfer: {from_account}')
-        print(f'To account state after transfer: {to_account}')
-    elif command == 'save_state':
-        bank.save_state()
-        print(f'Saved current bank state')
+    for line in execute_command(bank, command, command_args):
+        print(line)
     print()
     return True
 
 
-# Run the interactive CLI
-print('Welcome to the Banking CLI!')
-print_command_usage()
+if init_args.serve:
+    import asyncio
 
-running = True
-while running:
-    user_input = input('Enter a command: ')
-    try:
-        running = process_input(user_input)
-    except BankException as e:
-        # print business exception and continue application
-        print(e)
-        print()
+    from src.server import BankServer
 
+    server = BankServer(bank, host=init_args.host, port=init_args.port, max_queue=init_args.max_queue)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print('Stopping the server...')
+    close_bank()
+elif init_args.script:
+    from src.script import run_script
+
+    script = sys.stdin if init_args.script == '-' else open(init_args.script)
+    if init_args.output == '-':
+        output = sys.stdout
+    else:
+        output = open(init_args.output, 'w', buffering=1 << 20) if init_args.output else None
+    with script:
+        summary = run_script(bank, script, output=output,
+                             continue_on_error=init_args.continue_on_error,
+                             checkpoint_every=init_args.checkpoint_every)
+    if output is sys.stdout:
+        output.flush()
+    elif output is not None:
+        output.close()
+    print(summary)
+    close_bank()
+    sys.exit(1 if summary.failed else 0)
+else:
+    # Run the interactive CLI
+    print('Welcome to the Banking CLI!')
+    print_command_usage()
+
+    running = True
+    while running:
+        user_input = input('Enter a command: ')
+        try:
+            running = process_input(user_input)
+        except BankException as e:
+            # print business exception and continue application
+            print(e)
+            print()
+    close_bank()
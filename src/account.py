@@ -4,6 +4,8 @@ from src.exception import BankException
 
 
 class Account:
+    __slots__ = ('account_id', 'name', '_balance')
+
     def __init__(self, account_id: str, name: str, balance: Decimal):
         self.account_id = account_id
         self.name = name
@@ -1,8 +1,65 @@
+import os
+import re
+from itertools import repeat
+from typing import List, Union
 from uuid import uuid4
 
+# Applied to bytes 6 and 8 of 16 random bytes to make them a version 4 uuid
+_VERSION_BITS = bytes(byte & 0x0f | 0x40 for byte in range(256))
+_VARIANT_BITS = bytes(byte & 0x3f | 0x80 for byte in range(256))
+_CANONICAL_UUID = re.compile('[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+class AccountKey(int):
+    # A uuid account id kept as its 128-bit integer, 60 bytes instead of 85 for the string.
+    # It prints as the canonical uuid string, so csv files, the journal and the CLI never see the integer.
+    __slots__ = ()
+
+    def __str__(self) -> str:
+        digits = f'{int(self):032x}'
+        return f'{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}'
+
+    __repr__ = __str__
+
+
+def to_account_key(account_id: Union[str, AccountKey]) -> Union[str, AccountKey]:
+    # Canonical (lower case) uuid strings become keys, anything else is returned as it is
+    if type(account_id) is not str or _CANONICAL_UUID.fullmatch(account_id) is None:
+        return account_id
+    return AccountKey(int(account_id.replace('-', ''), 16))
+
 
 class AccountHelper:
 
-    @staticmethod
-    def create_account_id() -> str:
-        return str(uuid4())
+    def __init__(self, integer_ids: bool = False):
+        # Integer ids are AccountKeys, for an AccountStore with integer_keys
+        self.integer_ids = integer_ids
+        self._preallocated: List[Union[str, AccountKey]] = []
+
+    def create_account_id(self) -> Union[str, AccountKey]:
+        if self._preallocated:
+            try:
+                return self._preallocated.pop()
+            except IndexError:
+                # Taken by another thread in the meantime
+                pass
+        account_id = uuid4()
+        return AccountKey(account_id.int) if self.integer_ids else str(account_id)
+
+    def create_account_ids(self, count: int) -> List[Union[str, AccountKey]]:
+        # One read of the random source and C-level bit fiddling instead of a uuid4() call per id
+        random = bytearray(os.urandom(16 * count))
+        random[6::16] = random[6::16].translate(_VERSION_BITS)
+        random[8::16] = random[8::16].translate(_VARIANT_BITS)
+        if self.integer_ids:
+            view = memoryview(random)
+            return list(map(AccountKey.from_bytes, (view[start:start + 16] for start in range(0, 16 * count, 16)),
+                            repeat('big')))
+        digits = random.hex()
+        return [f'{digits[start:start + 8]}-{digits[start + 8:start + 12]}-{digits[start + 12:start + 16]}-'
+                f'{digits[start + 16:start + 20]}-{digits[start + 20:start + 32]}'
+                for start in range(0, 32 * count, 32)]
+
+    def preallocate(self, count: int):
+        # Ids for the next count create_account_id calls, e.g. before creating accounts in bulk
+        self._preallocated.extend(self.create_account_ids(count))
@@ -0,0 +1,110 @@
+import sys
+from array import array
+from collections.abc import MutableMapping
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional
+
+from src.account import Account, InvalidAccountOperationException
+from src.account_helper import AccountKey, to_account_key
+from src.money import MINOR_UNIT_SCALE, from_minor_units, to_minor_units
+
+
+class AccountStore(MutableMapping):
+    # Column-oriented alternative to a Dict[str, Account]: ids, names and integer minor-unit
+    # balances live in parallel arrays and Account objects are views created on demand.
+    # With integer_keys, uuid ids are kept as plain 128-bit ints, which take less memory than the
+    # strings or AccountKeys; uuid strings are converted on access and ids come out as AccountKeys.
+    def __init__(self, scale: int = MINOR_UNIT_SCALE, integer_keys: bool = False):
+        self.scale = scale
+        self.integer_keys = integer_keys
+        self._index: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._names: List[str] = []
+        self._balances = array('q')
+
+    def __getitem__(self, account_id: str) -> Account:
+        if self.integer_keys and type(account_id) is str:
+            account_id = to_account_key(account_id)
+        return StoredAccount(self, self._index[account_id])
+
+    def __setitem__(self, account_id: str, account: Account):
+        if self.integer_keys and type(account_id) is str:
+            account_id = to_account_key(account_id)
+        if type(account_id) is AccountKey:
+            account_id = int(account_id)
+        units = to_minor_units(account.balance, self.scale)
+        # Names repeat a lot across customers, share one string object per name
+        name = sys.intern(account.name)
+        row = self._index.get(account_id)
+        if row is None:
+            # The row is filled in before it is published in the index, so readers never see half of it
+            self._ids.append(account_id)
+            self._names.append(name)
+            self._balances.append(units)
+            self._index[account_id] = len(self._ids) - 1
+        else:
+            self._names[row] = name
+            self._balances[row] = units
+
+    def __delitem__(self, account_id: str):
+        # Rows are never reused, so views handed out earlier cannot end up pointing at another account
+        if self.integer_keys and type(account_id) is str:
+            account_id = to_account_key(account_id)
+        row = self._index.pop(account_id)
+        self._ids[row] = None
+        self._names[row] = ''
+        self._balances[row] = 0
+
+    def __contains__(self, account_id) -> bool:
+        if self.integer_keys and type(account_id) is str:
+            account_id = to_account_key(account_id)
+        return account_id in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        if self.integer_keys:
+            return map(_stored_to_account_id, self._index)
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def copy(self) -> 'AccountStore':
+        # A point-in-time copy made of column copies, cheap enough to take while writers wait
+        store = AccountStore(self.scale, self.integer_keys)
+        store._index = self._index.copy()
+        store._ids = self._ids.copy()
+        store._names = self._names.copy()
+        store._balances = array('q', self._balances)
+        return store
+
+    def get_balance(self, row: int) -> Decimal:
+        return from_minor_units(self._balances[row], self.scale)
+
+    def set_balance(self, row: int, value: Decimal):
+        self._balances[row] = to_minor_units(value, self.scale)
+
+
+def _stored_to_account_id(account_id):
+    # Integer keys are stored as plain ints
+    return AccountKey(account_id) if type(account_id) is int else account_id
+
+
+class StoredAccount(Account):
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store: AccountStore, row: int):
+        self._store = store
+        self._row = row
+        account_id = store._ids[row]
+        self.account_id = _stored_to_account_id(account_id) if store.integer_keys else account_id
+        self.name = store._names[row]
+
+    @property
+    def balance(self) -> Decimal:
+        return self._store.get_balance(self._row)
+
+    @balance.setter
+    def balance(self, value: Decimal):
+        if value < 0:
+            raise InvalidAccountOperationException('Insufficient balance')
+        self._store.set_balance(self._row, value)
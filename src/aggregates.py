@@ -0,0 +1,146 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# Lower bounds of the balance histogram buckets after the first one, which starts at 0
+BALANCE_BUCKET_BOUNDS = [Decimal(10) ** exponent for exponent in range(10)]
+# Keys per block of RankedBalances before it is split in two
+BLOCK_SIZE = 1024
+
+
+class BalanceSummary(NamedTuple):
+    accounts: int
+    total: Decimal
+    # (lower bound, number of accounts) per bucket: [0, 1), [1, 10), ... [10^9, infinity)
+    histogram: List[Tuple[Decimal, int]]
+
+    def __str__(self):
+        return f'{self.accounts} accounts holding {self.total} in total'
+
+
+class RankedBalances:
+    # (-balance, account_id) keys in sorted order, richest first and ties by account id. The keys are
+    # kept in sorted blocks of at most BLOCK_SIZE with the last key of every block, so adding or removing
+    # a key is a bisection over the blocks, a bisection in one block and a move of at most BLOCK_SIZE keys.
+    def __init__(self):
+        self._blocks: List[List[tuple]] = []
+        self._lasts: List[tuple] = []
+        self._len = 0
+
+    @classmethod
+    def build(cls, keys: Iterable[tuple]) -> 'RankedBalances':
+        # One sort instead of an insort per key
+        ranked = cls()
+        keys = sorted(keys)
+        half = BLOCK_SIZE // 2
+        ranked._blocks = [keys[start:start + half] for start in range(0, len(keys), half)]
+        ranked._lasts = [block[-1] for block in ranked._blocks]
+        ranked._len = len(keys)
+        return ranked
+
+    def add(self, key: tuple):
+        self._len += 1
+        if not self._blocks:
+            self._blocks.append([key])
+            self._lasts.append(key)
+            return
+        position = bisect_left(self._lasts, key)
+        if position == len(self._lasts):
+            # Past the last key, appended to the last block
+            position -= 1
+            self._blocks[position].append(key)
+            self._lasts[position] = key
+        else:
+            insort(self._blocks[position], key)
+        block = self._blocks[position]
+        if len(block) > BLOCK_SIZE:
+            half = len(block) // 2
+            self._blocks[position:position + 1] = [block[:half], block[half:]]
+            self._lasts.insert(position, block[half - 1])
+
+    def remove(self, key: tuple):
+        position = bisect_left(self._lasts, key)
+        if position == len(self._lasts):
+            raise KeyError(key)
+        block = self._blocks[position]
+        index = bisect_left(block, key)
+        if block[index] != key:
+            raise KeyError(key)
+        del block[index]
+        self._len -= 1
+        if not block:
+            del self._blocks[position]
+            del self._lasts[position]
+        elif index == len(block):
+            self._lasts[position] = block[-1]
+
+    def __iter__(self) -> Iterator[tuple]:
+        for block in self._blocks:
+            yield from block
+
+    def __len__(self) -> int:
+        return self._len
+
+
+class BalanceAggregates:
+    # Account count, total balance, balance histogram and balance ranking, updated with every balance
+    # change instead of recomputed from all accounts. Remembers the balance it last saw of every account,
+    # so a change is a subtraction and an addition whoever made it. The ranking costs several times more
+    # per change than the rest and is only built by the first top().
+    def __init__(self):
+        self.total = Decimal('0')
+        self._balances: Dict[str, Decimal] = {}
+        self._buckets = [0] * (len(BALANCE_BUCKET_BOUNDS) + 1)
+        self._ranked: Optional[RankedBalances] = None
+        # Changes of different accounts come from different threads in a concurrent bank
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, balances: Iterable[Tuple[str, Decimal]]) -> 'BalanceAggregates':
+        aggregates = cls()
+        aggregates._balances = dict(balances)
+        for balance in aggregates._balances.values():
+            aggregates.total += balance
+            aggregates._buckets[bisect_right(BALANCE_BUCKET_BOUNDS, balance)] += 1
+        return aggregates
+
+    def update(self, balances: Iterable[Tuple[str, Decimal]]):
+        # All balances of one change at once, so a summary never sees half of a transfer
+        with self._lock:
+            for account_id, balance in balances:
+                previous = self._balances.get(account_id)
+                if previous is not None:
+                    if previous == balance:
+                        continue
+                    self.total -= previous
+                    self._buckets[bisect_right(BALANCE_BUCKET_BOUNDS, previous)] -= 1
+                    if self._ranked is not None:
+                        self._ranked.remove((-previous, account_id))
+                self._balances[account_id] = balance
+                self.total += balance
+                self._buckets[bisect_right(BALANCE_BUCKET_BOUNDS, balance)] += 1
+                if self._ranked is not None:
+                    self._ranked.add((-balance, account_id))
+
+    def summary(self) -> BalanceSummary:
+        with self._lock:
+            return BalanceSummary(accounts=len(self._balances),
+                                  total=self.total,
+                                  histogram=list(zip([Decimal('0')] + BALANCE_BUCKET_BOUNDS, self._buckets)))
+
+    def top(self, n: int) -> List[Tuple[str, Decimal]]:
+        # (account_id, balance) of the n richest accounts, richest first
+        with self._lock:
+            if self._ranked is None:
+                self._ranked = RankedBalances.build((-balance, account_id)
+                                                    for account_id, balance in self._balances.items())
+            top = []
+            for negated_balance, account_id in self._ranked:
+                if len(top) == n:
+                    break
+                top.append((account_id, -negated_balance))
+            return top
+
+    def __len__(self) -> int:
+        return len(self._balances)
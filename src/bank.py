@@ -1,59 +1,546 @@
 import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Tuple
+from typing import Callable, Iterable, Iterator, List, MutableMapping, Optional, Sequence, Tuple
 
 from src.account import Account, AccountIdExistsException, AccountNotFoundException
 from src.account_helper import AccountHelper
+from src.aggregates import BalanceAggregates, BalanceSummary
+from src.idempotency import IdempotencyCache, IdempotencyNotEnabledException
+from src.journal import Journal
+from src.ledger import DEPOSIT, OPEN, TRANSFER_IN, TRANSFER_OUT, WITHDRAW, Ledger, LedgerEntry, \
+    LedgerNotEnabledException
+from src.locking import NoLocks, StripedLocks
+from src.money import MINOR_UNIT_SCALE, check_amount, to_minor_units
+from src.name_index import NameIndex
+from src.read_view import ReadView, ReadViews
 from src.repository import Repository
+from src.scheduler import ScheduledTransfer, ScheduleRun, SchedulerNotEnabledException, TransferScheduler
+from src.stats import Stats, StatsNotEnabledException
 
 logger = logging.getLogger(__name__)
 
+# Timed when the bank has stats. get_account is left out, every other operation calls it.
+INSTRUMENTED_METHODS = ('create_account', 'deposit', 'withdraw', 'transfer', 'apply_batch', 'queue_transfer',
+                        'settle', 'schedule_transfer', 'cancel_schedule', 'run_due_transfers', 'get_statement',
+                        'find_accounts_by_name', 'find_accounts_by_name_prefix', 'summary', 'top_accounts',
+                        'save_state', 'load_state')
+INSTRUMENTED_REPOSITORY_METHODS = ('save_state', 'load_state')
+
 
 class Bank:
     def __init__(self,
                  account_helper: AccountHelper,
-                 repository: Repository):
+                 repository: Repository,
+                 journal: Optional[Journal] = None,
+                 accounts_factory: Callable[[], MutableMapping[str, Account]] = dict,
+                 concurrent: bool = False,
+                 ledger: Optional[Ledger] = None,
+                 stats: Optional[Stats] = None,
+                 idempotency: Optional[IdempotencyCache] = None,
+                 scheduler: Optional[TransferScheduler] = None):
         self.account_helper = account_helper
         self.repository = repository
-        self.accounts = self.repository.load_state()
+        # Decimal places amounts may have. A binary snapshot or a Parquet file keeps balances in the minor units
+        # of its scale, a csv in cents like the ledger and an AccountStore.
+        self.scale = getattr(repository, 'scale', MINOR_UNIT_SCALE)
+        self.journal = journal
+        # e.g. AccountStore for a compact columnar layout instead of a dict of Account objects
+        self.accounts_factory = accounts_factory
+        # When the bank is shared between threads, every change holds the locks of the accounts it touches
+        self.concurrent = concurrent
+        self.locks = StripedLocks() if concurrent else NoLocks()
+        # History of every balance change since startup, for statements
+        self.ledger = ledger
+        # Results of the requests made with an idempotency key, saved with the state
+        self.idempotency = idempotency
+        # Future-dated and recurring transfers, saved with the state
+        self.scheduler = scheduler
+        self._compaction_lock = threading.Lock()
+        self._name_index: Optional[NameIndex] = None
+        self._aggregates: Optional[BalanceAggregates] = None
+        self._read_views = ReadViews()
+        # Transfers queued since the last settle(), as ('transfer', from_account_id, to_account_id, amount) rows
+        self._pending_transfers: List[Tuple[str, str, str, Decimal]] = []
+        self._pending_lock = threading.Lock()
+        # Set by a Checkpointer, which then takes over save_state and journal compaction
+        self.checkpointer = None
+        self.stats = stats
+        if stats is not None:
+            stats.instrument(self, INSTRUMENTED_METHODS, concurrent=concurrent)
+            stats.instrument(repository, INSTRUMENTED_REPOSITORY_METHODS, prefix='repository.', concurrent=concurrent)
+        self.load_state()
 
-    def create_account(self, name: str, balance: Decimal = Decimal('0')) -> Account:
+    def create_account(self,
+                       name: str,
+                       balance: Decimal = Decimal('0'),
+                       idempotency_key: Optional[str] = None) -> Account:
+        # Checked before anything is journaled, the state file could not be saved with this balance
+        to_minor_units(balance, self.scale)
         account_id = self.account_helper.create_account_id()
 
-        if account_id in self.accounts:
-            raise AccountIdExistsException(account_id)
+        # The stripe of the key is held too, so a retry waits for the request it repeats
+        with self.locks.hold_for_insert(account_id, idempotency_key):
+            idempotency = None
+            if idempotency_key is not None:
+                request = ('create_account', name, str(balance))
+                replayed = self._replayed(idempotency_key, request)
+                if replayed is not None:
+                    return replayed[0]
+                idempotency = (idempotency_key, self.idempotency.expiry(), request)
+            if account_id in self.accounts:
+                raise AccountIdExistsException(account_id)
+            balance_units = self._ledger_units(balance)
+            if self._read_views:
+                # Before the account shows up in the mapping, so the open views never see it
+                for view in self._read_views:
+                    view.keep_absent(account_id)
 
-        account = Account(account_id=account_id,
-                          name=name,
-                          balance=balance)
-        self.accounts[account_id] = account
+            account = Account(account_id=account_id,
+                              name=name,
+                              balance=balance)
+            self.accounts[account_id] = account
+            # The mapping may keep its own representation, return the account as stored
+            account = self.accounts[account_id]
+            if self.journal is not None:
+                self.journal.append_create(account, idempotency)
+            if self._name_index is not None:
+                self._name_index.add(account_id, name)
+            if idempotency is not None:
+                self._remember(idempotency, account)
+            self.balances_changed(account)
+            self._record(account, OPEN, balance_units)
+        self._compact_if_needed()
         logger.info(f'Created a new account for {name} (account_id: {account_id}) '
                     f'with a balance {balance}')
         return account
 
     def get_account(self, account_id: str) -> Account:
-        if account_id not in self.accounts:
-            raise AccountNotFoundException(account_id)
-        return self.accounts[account_id]
+        # One lookup instead of a membership test and a lookup, the mapping may convert the id for each
+        try:
+            return self.accounts[account_id]
+        except KeyError:
+            raise AccountNotFoundException(account_id) from None
+
+    def find_accounts_by_name(self, name: str) -> List[Account]:
+        # Names match case-insensitively
+        return [self.accounts[account_id] for account_id in self.name_index.find(name)]
+
+    def find_accounts_by_name_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Account]:
+        return [self.accounts[account_id] for account_id in self.name_index.find_prefix(prefix, limit)]
+
+    @property
+    def name_index(self) -> NameIndex:
+        # Built on the first search rather than on load, so a mapped snapshot still starts instantly.
+        # From then on create_account keeps it up to date.
+        if self._name_index is None:
+            with self.locks.hold_all():
+                if self._name_index is None:
+                    self._name_index = NameIndex.build((account.account_id, account.name)
+                                                       for account in self.accounts.values())
+        return self._name_index
+
+    @property
+    def aggregates(self) -> BalanceAggregates:
+        # Built on the first query like the name index, then kept up to date by every balance change
+        if self._aggregates is None:
+            with self.locks.hold_all():
+                if self._aggregates is None:
+                    self._aggregates = BalanceAggregates.build((account.account_id, account.balance)
+                                                               for account in self.accounts.values())
+        return self._aggregates
 
-    def deposit(self, account_id: str, amount: Decimal) -> Account:
-        account = self.get_account(account_id)
-        account.deposit(amount)
+    def summary(self) -> BalanceSummary:
+        return self.aggregates.summary()
+
+    def top_accounts(self, n: int) -> List[Account]:
+        if n < 0:
+            raise ValueError(f'Invalid number of accounts {n}')
+        return [self.accounts[account_id] for account_id, _ in self.aggregates.top(n)]
+
+    def deposit(self, account_id: str, amount: Decimal, idempotency_key: Optional[str] = None) -> Account:
+        check_amount(amount, self.scale)
+        with self.locks.hold(account_id, idempotency_key):
+            idempotency = None
+            if idempotency_key is not None:
+                request = ('deposit', str(account_id), str(amount))
+                replayed = self._replayed(idempotency_key, request)
+                if replayed is not None:
+                    return replayed[0]
+                idempotency = (idempotency_key, self.idempotency.expiry(), request)
+            account = self.get_account(account_id)
+            amount_units = self._ledger_units(amount, account)
+            self.balances_changing(account)
+            account.deposit(amount)
+            self._journal_balances(account, idempotency=idempotency)
+            if idempotency is not None:
+                self._remember(idempotency, account)
+            self.balances_changed(account)
+            self._record(account, DEPOSIT, amount_units)
+        self._compact_if_needed()
         return account
 
-    def withdraw(self, account_id: str, amount: Decimal) -> Account:
-        account = self.get_account(account_id)
-        account.withdraw(amount)
+    def withdraw(self, account_id: str, amount: Decimal, idempotency_key: Optional[str] = None) -> Account:
+        check_amount(amount, self.scale)
+        with self.locks.hold(account_id, idempotency_key):
+            idempotency = None
+            if idempotency_key is not None:
+                request = ('withdraw', str(account_id), str(amount))
+                replayed = self._replayed(idempotency_key, request)
+                if replayed is not None:
+                    return replayed[0]
+                idempotency = (idempotency_key, self.idempotency.expiry(), request)
+            account = self.get_account(account_id)
+            amount_units = self._ledger_units(amount, account)
+            self.balances_changing(account)
+            account.withdraw(amount)
+            self._journal_balances(account, idempotency=idempotency)
+            if idempotency is not None:
+                self._remember(idempotency, account)
+            self.balances_changed(account)
+            self._record(account, WITHDRAW, amount_units, sign=-1)
+        self._compact_if_needed()
         return account
 
-    def transfer(self, from_account_id: str, to_account_id: str, amount: Decimal) -> Tuple[Account, Account]:
-        # Assumption: This application is not used with concurrency
-        from_account = self.withdraw(from_account_id, amount)
-        to_account = self.deposit(to_account_id, amount)
+    def transfer(self,
+                 from_account_id: str,
+                 to_account_id: str,
+                 amount: Decimal,
+                 idempotency_key: Optional[str] = None) -> Tuple[Account, Account]:
+        # Checked before the withdrawal, so a transfer never stops with only one side applied
+        check_amount(amount, self.scale)
+        with self.locks.hold(from_account_id, to_account_id, idempotency_key):
+            idempotency = None
+            if idempotency_key is not None:
+                request = ('transfer', str(from_account_id), str(to_account_id), str(amount))
+                replayed = self._replayed(idempotency_key, request)
+                if replayed is not None:
+                    return replayed[0], replayed[1]
+                idempotency = (idempotency_key, self.idempotency.expiry(), request)
+            from_account = self.get_account(from_account_id)
+            to_account = self.get_account(to_account_id)
+            amount_units = self._ledger_units(amount, from_account, to_account)
+            self.balances_changing(from_account, to_account)
+            from_account.withdraw(amount)
+            to_account.deposit(amount)
+            self._journal_balances(from_account, to_account, idempotency=idempotency)
+            if idempotency is not None:
+                self._remember(idempotency, from_account, to_account)
+            self.balances_changed(from_account, to_account)
+            self._record(from_account, TRANSFER_OUT, amount_units, sign=-1, counterparty=to_account.account_id)
+            self._record(to_account, TRANSFER_IN, amount_units, counterparty=from_account.account_id)
+        self._compact_if_needed()
         return from_account, to_account
 
+    def get_statement(self,
+                      account_id: str,
+                      since: Optional[datetime] = None,
+                      until: Optional[datetime] = None,
+                      limit: Optional[int] = None,
+                      newest_first: bool = False) -> List[LedgerEntry]:
+        if self.ledger is None:
+            raise LedgerNotEnabledException()
+        # The ledger knows the account by the id it is stored under
+        account_id = self.get_account(account_id).account_id
+        return self.ledger.statement(account_id, since=since, until=until, limit=limit, newest_first=newest_first)
+
+    def get_stats(self) -> Stats:
+        if self.stats is None:
+            raise StatsNotEnabledException()
+        return self.stats
+
+    def apply_batch(self, operations: Iterable[Sequence], atomic: bool = True):
+        # numpy is only needed for batches, keep it out of the CLI startup
+        from src.batch import apply_batch
+
+        if self.ledger is not None:
+            # Read twice, once to apply and once to record
+            operations = list(operations)
+        with self.locks.hold_all():
+            result, changed_accounts = apply_batch(self.accounts, operations, atomic=atomic,
+                                                   before_write=self.balances_changing)
+            if changed_accounts:
+                self._journal_balances(*changed_accounts)
+                self.balances_changed(*changed_accounts)
+                if self.ledger is not None:
+                    self._record_batch(operations, result.statuses)
+        self._compact_if_needed()
+        logger.info(f'Applied batch of {len(result.statuses)} operations '
+                    f'({len(result.rejected_rows)} rejected, committed: {result.committed})')
+        return result
+
+    def queue_transfer(self, from_account_id: str, to_account_id: str, amount: Decimal) -> int:
+        # Held until settle() applies the whole settlement window at once. Returns the position of the
+        # transfer in the window.
+        check_amount(amount, self.scale)
+        self.get_account(from_account_id)
+        self.get_account(to_account_id)
+        with self._pending_lock:
+            self._pending_transfers.append(('transfer', from_account_id, to_account_id, amount))
+            return len(self._pending_transfers) - 1
+
+    @property
+    def pending_transfers(self) -> int:
+        return len(self._pending_transfers)
+
+    def settle(self):
+        # numpy is only needed for netting, keep it out of the CLI startup
+        from src.netting import net_transfers
+
+        with self._pending_lock:
+            transfers, self._pending_transfers = self._pending_transfers, []
+        with self.locks.hold_all():
+            result, changed_accounts = net_transfers(self.accounts, transfers, before_write=self.balances_changing)
+            if changed_accounts:
+                self._journal_balances(*changed_accounts)
+                self.balances_changed(*changed_accounts)
+            if self.ledger is not None:
+                # Every covered transfer is recorded, also when the accounts netted to zero
+                self._record_batch(transfers, result.statuses)
+        self._compact_if_needed()
+        logger.info(result)
+        return result
+
+    def schedule_transfer(self,
+                          from_account_id: str,
+                          to_account_id: str,
+                          amount: Decimal,
+                          at: datetime,
+                          every: Optional[timedelta] = None) -> ScheduledTransfer:
+        # Runs at the first tick from `at` on, and then every `every` if given
+        if self.scheduler is None:
+            raise SchedulerNotEnabledException()
+        # Checked like a transfer now, a recurring run of an invalid amount would be rejected on every tick
+        check_amount(amount, self.scale)
+        self.get_account(from_account_id)
+        self.get_account(to_account_id)
+        with self.scheduler.lock:
+            transfer = self.scheduler.add(from_account_id, to_account_id, amount, at.timestamp(),
+                                          every.total_seconds() if every is not None else None)
+            if self.journal is not None:
+                self.journal.append_schedules([(transfer.schedule_id, transfer)])
+        self._compact_if_needed()
+        logger.info(f'Scheduled transfer {transfer}')
+        return transfer
+
+    def cancel_schedule(self, schedule_id: str) -> ScheduledTransfer:
+        if self.scheduler is None:
+            raise SchedulerNotEnabledException()
+        with self.scheduler.lock:
+            transfer = self.scheduler.cancel(schedule_id)
+            if self.journal is not None:
+                self.journal.append_schedules([(schedule_id, None)])
+        self._compact_if_needed()
+        logger.info(f'Cancelled scheduled transfer {transfer}')
+        return transfer
+
+    def get_schedules(self, limit: Optional[int] = None) -> List[ScheduledTransfer]:
+        # Soonest due first
+        if self.scheduler is None:
+            raise SchedulerNotEnabledException()
+        return self.scheduler.upcoming(limit)
+
+    def run_due_transfers(self, now: Optional[datetime] = None) -> ScheduleRun:
+        # One tick: every transfer due by now is applied in a single batch. Each run stands on its own,
+        # one that would overdraw its account is rejected and a recurring transfer still moves on.
+        if self.scheduler is None:
+            raise SchedulerNotEnabledException()
+        with self.scheduler.lock:
+            runs, released = self.scheduler.release_due(now.timestamp() if now is not None else None)
+            if not runs:
+                return ScheduleRun(transfers=[], statuses=[])
+            # numpy is only needed for batches, keep it out of the CLI startup
+            from src.batch import TRANSFER, apply_batch
+
+            operations = [(TRANSFER, run.from_account_id, run.to_account_id, run.amount) for run in runs]
+            with self.locks.hold_all():
+                result, changed_accounts = apply_batch(self.accounts, operations, atomic=False,
+                                                       before_write=self.balances_changing)
+                # The runs and the balances they set are one record, so a run is replayed with its balances
+                if self.journal is not None:
+                    self.journal.append_schedules(released, changed_accounts)
+                if changed_accounts:
+                    self.balances_changed(*changed_accounts)
+                    if self.ledger is not None:
+                        self._record_batch(operations, result.statuses)
+        self._compact_if_needed()
+        run = ScheduleRun(transfers=runs, statuses=result.statuses.tolist())
+        logger.info(run)
+        return run
+
     def save_state(self):
-        self.repository.save_state(self.accounts)
+        if self.checkpointer is not None:
+            # Written in the background
+            self.checkpointer.checkpoint()
+            return
+
+        if self.concurrent and self.journal is None:
+            # Take a read view while writers are held off, then write it without blocking them
+            with self.hold_for_save():
+                view = self.read_view()
+                idempotency = self.idempotency.copy() if self.idempotency is not None else None
+                scheduler = self.scheduler.copy() if self.scheduler is not None else None
+            with view:
+                self.repository.save_state(view)
+            if idempotency is not None:
+                idempotency.save()
+            if scheduler is not None:
+                scheduler.save()
+            return
+
+        # Nothing may be journaled between taking the snapshot and truncating the journal
+        with self.hold_for_save():
+            self.repository.save_state(self.accounts)
+            if self.idempotency is not None:
+                self.idempotency.save()
+            if self.scheduler is not None:
+                self.scheduler.save()
+            if self.journal is not None:
+                # The snapshot now holds everything the journal did
+                self.journal.reset()
+
+    @contextmanager
+    def hold_for_save(self) -> Iterator[None]:
+        # All account locks, and the scheduler so no schedule change is journaled either. The scheduler
+        # lock is taken first, as by run_due_transfers.
+        with self.scheduler.lock if self.scheduler is not None else nullcontext(), self.locks.hold_all():
+            yield
+
+    def snapshot(self) -> ReadView:
+        # A consistent view of all accounts as they are now, which writers do not wait for while it is
+        # read. Close it, or drop it, once done: until then every first change of an account keeps the
+        # old balance for it.
+        with self.locks.hold_all():
+            return self.read_view()
+
+    def read_view(self) -> ReadView:
+        # Callers hold all locks, so no change is half done
+        return self._read_views.open(self.accounts)
+
+    def balances_changing(self, *accounts: Account):
+        # Called with the account locks held before balances change, also by whoever changes balances
+        # outside these methods
+        if self._read_views:
+            for view in self._read_views:
+                view.keep(accounts)
+
+    def balances_changed(self, *accounts: Account):
+        # Called with the account locks held, also by whoever changes balances outside these methods
+        if self._aggregates is not None:
+            self._aggregates.update((account.account_id, account.balance) for account in accounts)
 
     def load_state(self):
-        self.accounts = self.repository.load_state()
+        self._name_index = None
+        self._aggregates = None
+        # Views taken before go on reading the accounts they were taken from, which nothing changes any more
+        self._read_views = ReadViews()
+        self.accounts = self.repository.load_state(self.accounts_factory())
+        if self.idempotency is not None:
+            self.idempotency.load()
+        if self.scheduler is not None:
+            self.scheduler.load()
+        if self.journal is not None:
+            self.journal.replay(self.accounts)
+            if self.scheduler is not None:
+                self.scheduler.replay(self.journal.schedule_changes)
+            if self.idempotency is not None:
+                # Requests since the saved keys, with the balances right after each
+                for key, expires_at, request, balances in self.journal.idempotent_requests:
+                    if expires_at > self.idempotency.clock():
+                        accounts = [Account(account_id, self.accounts[account_id].name, balance)
+                                    for account_id, balance in balances]
+                        self.idempotency.put(key, request, accounts, expires_at)
+
+    def close(self):
+        if self.checkpointer is not None:
+            self.checkpointer.close()
+        if self.journal is not None:
+            self.journal.close()
+        # e.g. the connections of a SQLite database
+        close_repository = getattr(self.repository, 'close', None)
+        if close_repository is not None:
+            close_repository()
+
+    def _ledger_units(self, amount: Decimal, *accounts: Account) -> Optional[int]:
+        # Checked before anything changes: the ledger keeps amounts and balances in minor units
+        if self.ledger is None:
+            return None
+        for account in accounts:
+            self.ledger.to_units(account.balance)
+        return self.ledger.to_units(amount)
+
+    def _record(self,
+                account: Account,
+                kind: str,
+                amount_units: Optional[int],
+                sign: int = 1,
+                counterparty: Optional[str] = None):
+        if self.ledger is not None:
+            self.ledger.record(account.account_id, kind, sign * amount_units, self.ledger.to_units(account.balance),
+                               counterparty)
+
+    def _record_batch(self, operations: List[Sequence], statuses):
+        from src.batch import DEPOSIT as BATCH_DEPOSIT, TRANSFER as BATCH_TRANSFER, BatchStatus
+
+        # (account id, signed amount, counterparty) of every applied row, in order, with the ids the
+        # accounts are stored under
+        stored_ids = {}
+        movements = []
+        for row in (statuses == BatchStatus.APPLIED).nonzero()[0].tolist():
+            operation = operations[row]
+            for account_id in operation[1:-1]:
+                if account_id not in stored_ids:
+                    stored_ids[account_id] = self.accounts[account_id].account_id
+            amount_units = self.ledger.to_units(Decimal(operation[-1]))
+            if operation[0] == BATCH_TRANSFER:
+                from_account_id, to_account_id = stored_ids[operation[1]], stored_ids[operation[2]]
+                movements.append((from_account_id, -amount_units, to_account_id))
+                movements.append((to_account_id, amount_units, from_account_id))
+            else:
+                sign = 1 if operation[0] == BATCH_DEPOSIT else -1
+                movements.append((stored_ids[operation[1]], sign * amount_units, None))
+
+        # Balances are only known after the batch, walk back to the ones before it
+        balances = {account_id: self.ledger.to_units(self.accounts[account_id].balance)
+                    for account_id in {movement[0] for movement in movements}}
+        for account_id, amount_units, _ in movements:
+            balances[account_id] -= amount_units
+        for account_id, amount_units, counterparty in movements:
+            balances[account_id] += amount_units
+            if counterparty is None:
+                kind = DEPOSIT if amount_units > 0 else WITHDRAW
+            else:
+                kind = TRANSFER_IN if amount_units > 0 else TRANSFER_OUT
+            self.ledger.record(account_id, kind, amount_units, balances[account_id], counterparty)
+
+    def _journal_balances(self, *accounts: Account, idempotency: Optional[Tuple[str, float, Tuple[str, ...]]] = None):
+        if self.journal is not None:
+            self.journal.append_balances(accounts, idempotency)
+
+    def _replayed(self, idempotency_key: str, request: Tuple[str, ...]) -> Optional[List[Account]]:
+        if self.idempotency is None:
+            raise IdempotencyNotEnabledException()
+        return self.idempotency.get(idempotency_key, request)
+
+    def _remember(self, idempotency: Tuple[str, float, Tuple[str, ...]], *accounts: Account):
+        key, expires_at, request = idempotency
+        self.idempotency.put(key, request, accounts, expires_at)
+
+    def _compact_if_needed(self):
+        # Called without holding any account lock after every change, compaction takes all of them
+        if self.checkpointer is not None:
+            self.checkpointer.operation_done()
+            return
+        if self.journal is None or not self.journal.needs_compaction:
+            return
+        # Threads that find the journal full at the same time leave the compaction to the first one
+        if not self._compaction_lock.acquire(blocking=False):
+            return
+        try:
+            if self.journal.needs_compaction:
+                logger.info('Compacting journal into a new snapshot')
+                self.save_state()
+        finally:
+            self._compaction_lock.release()
@@ -0,0 +1,210 @@
+import math
+from itertools import repeat
+from decimal import Decimal, InvalidOperation
+from enum import IntEnum
+from operator import itemgetter, ne
+from typing import Callable, Iterable, List, MutableMapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.account import Account, InvalidAccountOperationException
+from src.money import MINOR_UNIT_SCALE, from_minor_units, to_minor_units
+
+DEPOSIT = 'deposit'
+WITHDRAW = 'withdraw'
+TRANSFER = 'transfer'
+
+
+class BatchStatus(IntEnum):
+    APPLIED = 0
+    ACCOUNT_NOT_FOUND = 1
+    INSUFFICIENT_BALANCE = 2
+    INVALID_AMOUNT = 3
+    INVALID_OPERATION = 4
+    # A valid row that was not applied because its atomic batch was rejected
+    ABORTED = 5
+
+
+DEPOSIT_KIND = 0
+WITHDRAW_KIND = 1
+TRANSFER_KIND = 2
+INVALID_OPERATION = -1
+KINDS = {
+    DEPOSIT: DEPOSIT_KIND,
+    WITHDRAW: WITHDRAW_KIND,
+    TRANSFER: TRANSFER_KIND,
+}
+# Stands in for rows too short to take apart
+MALFORMED_OPERATION = (None, None, None)
+# Slot of the missing side of a deposit or withdrawal
+NO_ACCOUNT = -2
+
+
+class BatchResult(NamedTuple):
+    committed: bool
+    statuses: np.ndarray
+
+    @property
+    def rejected_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.statuses != BatchStatus.APPLIED)
+
+
+def apply_batch(accounts: MutableMapping[str, Account],
+                operations: Iterable[Sequence],
+                atomic: bool = True,
+                before_write: Optional[Callable[..., None]] = None) -> Tuple[BatchResult, List[Account]]:
+    # Operations are ('deposit', account_id, amount), ('withdraw', account_id, amount) or
+    # ('transfer', from_account_id, to_account_id, amount). Rows are validated as if they were
+    # applied one by one in order, but balances are only written once per account, with the
+    # net change of all applied rows. before_write is called with the accounts about to change.
+    scale = getattr(accounts, 'scale', MINOR_UNIT_SCALE)
+    operations = list(operations)
+    rows = len(operations)
+
+    # Rows are split into columns with map/itemgetter, which runs at C speed, and
+    # everything after that works on whole columns
+    lengths = np.fromiter(map(len, operations), dtype=np.int64, count=rows)
+    if rows and lengths.min() < 3:
+        operations = [operation if len(operation) >= 3 else MALFORMED_OPERATION for operation in operations]
+    names = list(map(itemgetter(0), operations))
+    kind_of_name = {name: KINDS.get(name, INVALID_OPERATION) for name in set(names)}
+    kinds = np.fromiter(map(kind_of_name.__getitem__, names), dtype=np.int8, count=rows)
+    kinds[lengths != np.where(kinds == TRANSFER_KIND, 4, 3)] = INVALID_OPERATION
+
+    first_ids = list(map(itemgetter(1), operations))
+    second_ids = list(map(itemgetter(2), operations))
+    if (kinds == TRANSFER_KIND).all():
+        debit_ids, credit_ids = first_ids, second_ids
+    else:
+        # Trailing None keeps numpy from treating equal-length id tuples as a 2-d array
+        first_ids = np.array(first_ids + [None], dtype=object)[:rows]
+        second_ids = np.array(second_ids + [None], dtype=object)[:rows]
+        debit_ids = np.where((kinds == TRANSFER_KIND) | (kinds == WITHDRAW_KIND), first_ids, None).tolist()
+        credit_ids = np.where(kinds == TRANSFER_KIND, second_ids,
+                              np.where(kinds == DEPOSIT_KIND, first_ids, None)).tolist()
+    amounts = _to_units(list(map(itemgetter(-1), operations)), scale)
+
+    # Accounts touched by the batch get a dense slot number, unknown ids get -1
+    slots = dict.fromkeys(set(debit_ids).union(credit_ids), -1)
+    account_ids = [account_id for account_id in slots if account_id is not None and account_id in accounts]
+    slots.update(zip(account_ids, range(len(account_ids))))
+    slots[None] = NO_ACCOUNT
+    debits = np.fromiter(map(slots.__getitem__, debit_ids), dtype=np.int64, count=rows)
+    credits = np.fromiter(map(slots.__getitem__, credit_ids), dtype=np.int64, count=rows)
+
+    statuses = np.zeros(rows, dtype=np.uint8)
+    statuses[amounts <= 0] = BatchStatus.INVALID_AMOUNT
+    statuses[(debits == -1) | (credits == -1)] = BatchStatus.ACCOUNT_NOT_FOUND
+    statuses[kinds == INVALID_OPERATION] = BatchStatus.INVALID_OPERATION
+
+    # Floor keeps the overdraft check exact for balances finer than the minor unit
+    balances = np.array([math.floor(accounts[account_id].balance.scaleb(scale)) for account_id in account_ids],
+                        dtype=np.int64)
+    valid = statuses == BatchStatus.APPLIED
+    overdrawn_rows = _find_overdrawn_rows(balances, debits, credits, amounts, valid)
+
+    if atomic and (overdrawn_rows.size or not valid.all()):
+        statuses[valid] = BatchStatus.ABORTED
+        statuses[overdrawn_rows] = BatchStatus.INSUFFICIENT_BALANCE
+        return BatchResult(committed=False, statuses=statuses), []
+
+    if overdrawn_rows.size:
+        # Rejecting a row changes what later rows see, replay the valid rows in order
+        _reject_overdrafts_in_order(balances, debits, credits, amounts, valid, statuses,
+                                    first_overdrawn_row=int(overdrawn_rows[0]))
+        valid = statuses == BatchStatus.APPLIED
+
+    deltas = np.zeros(len(account_ids), dtype=np.int64)
+    debited = valid & (debits >= 0)
+    credited = valid & (credits >= 0)
+    np.subtract.at(deltas, debits[debited], amounts[debited])
+    np.add.at(deltas, credits[credited], amounts[credited])
+
+    changed_slots = np.flatnonzero(deltas).tolist()
+    changed = [accounts[account_ids[slot]] for slot in changed_slots]
+    if before_write is not None:
+        before_write(*changed)
+    for slot, account in zip(changed_slots, changed):
+        account.balance = account.balance + from_minor_units(int(deltas[slot]), scale)
+    return BatchResult(committed=True, statuses=statuses), changed
+
+
+def _find_overdrawn_rows(balances: np.ndarray,
+                         debits: np.ndarray,
+                         credits: np.ndarray,
+                         amounts: np.ndarray,
+                         valid: np.ndarray) -> np.ndarray:
+    # Running balance of every account after each of its debits and credits, computed for
+    # all accounts at once by sorting the movements by (account, row) and summing per account
+    debited = np.flatnonzero(valid & (debits >= 0))
+    credited = np.flatnonzero(valid & (credits >= 0))
+    slots = np.concatenate([debits[debited], credits[credited]])
+    rows = np.concatenate([debited, credited])
+    # Within a transfer the withdrawal happens before the deposit
+    phases = np.concatenate([np.zeros(debited.size, dtype=np.int8), np.ones(credited.size, dtype=np.int8)])
+    movements = np.concatenate([-amounts[debited], amounts[credited]])
+    if not slots.size:
+        return rows
+
+    # One int64 sort key ordering by (account, row, phase)
+    order = np.argsort((slots * debits.size + rows) * 2 + phases)
+    slots, rows, movements = slots[order], rows[order], movements[order]
+    running = np.cumsum(movements)
+    group_starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, slots.size])
+    group_offsets = np.repeat(running[group_starts] - movements[group_starts], group_sizes)
+    running = balances[slots] + running - group_offsets
+    return np.unique(rows[(running < 0) & (movements < 0)])
+
+
+def _reject_overdrafts_in_order(balances: np.ndarray,
+                                debits: np.ndarray,
+                                credits: np.ndarray,
+                                amounts: np.ndarray,
+                                valid: np.ndarray,
+                                statuses: np.ndarray,
+                                first_overdrawn_row: int):
+    # Every row before the first overdraft succeeds, apply those in bulk
+    balances = balances.copy()
+    prefix = valid.copy()
+    prefix[first_overdrawn_row:] = False
+    np.subtract.at(balances, debits[prefix & (debits >= 0)], amounts[prefix & (debits >= 0)])
+    np.add.at(balances, credits[prefix & (credits >= 0)], amounts[prefix & (credits >= 0)])
+
+    balances = balances.tolist()
+    debits, credits, amounts = debits.tolist(), credits.tolist(), amounts.tolist()
+    rejected = []
+    for row in (np.flatnonzero(valid[first_overdrawn_row:]) + first_overdrawn_row).tolist():
+        debit, credit, amount = debits[row], credits[row], amounts[row]
+        if debit >= 0:
+            if balances[debit] < amount:
+                rejected.append(row)
+                continue
+            balances[debit] -= amount
+        if credit >= 0:
+            balances[credit] += amount
+    statuses[rejected] = BatchStatus.INSUFFICIENT_BALANCE
+
+
+def _to_units(amounts: List, scale: int) -> np.ndarray:
+    # Amounts that are not a whole number of minor units become 0
+    try:
+        scaled = list(map(Decimal.scaleb, amounts, repeat(scale)))
+        units = np.fromiter(map(int, scaled), dtype=np.int64, count=len(scaled))
+    except (TypeError, OverflowError, ValueError):
+        # Not all amounts are finite Decimals
+        return np.array([_amount_to_units(amount, scale) for amount in amounts], dtype=np.int64)
+    units[list(map(ne, units.tolist(), scaled))] = 0
+    return units
+
+
+def _amount_to_units(amount, scale: int) -> int:
+    if not isinstance(amount, Decimal):
+        try:
+            amount = Decimal(amount)
+        except (InvalidOperation, TypeError, ValueError):
+            return 0
+    try:
+        return to_minor_units(amount, scale)
+    except InvalidAccountOperationException:
+        return 0
@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from src.bank import Bank
+from src.idempotency import IdempotencyCache
+from src.read_view import ReadView
+from src.scheduler import TransferScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointReport(NamedTuple):
+    accounts: int
+    # Seconds writers were held off while the read view was taken and the journal rotated
+    pause: float
+    # Seconds from the start of the pause until the state file was in place
+    duration: float
+    # Changes that had to wait for the pause, only counted for a concurrent bank
+    blocked_operations: int
+
+    def __str__(self):
+        return (f'Checkpointed {self.accounts} accounts in {self.duration:.2f}s, writers paused for '
+                f'{self.pause * 1000:.1f}ms, {self.blocked_operations} operations blocked')
+
+
+class Checkpointer:
+    # Saves the bank state without making changes wait for the file to be written: a read view is
+    # taken and the journal rotated while all locks are held, then a thread writes the view and
+    # drops the rotated journal. Attaching a checkpointer makes Bank.save_state and journal
+    # compaction go through it. Checkpoints also start every_operations changes or every_seconds
+    # seconds, checked after each change.
+    def __init__(self, bank: Bank, every_operations: Optional[int] = None, every_seconds: Optional[float] = None):
+        self.bank = bank
+        self.every_operations = every_operations
+        self.every_seconds = every_seconds
+        # Approximate for a concurrent bank, it is only a trigger
+        self.operations_since_checkpoint = 0
+        self.last_started = time.monotonic()
+        self.last_report: Optional[CheckpointReport] = None
+        self.failures = 0
+        # Held from the start of a checkpoint until its file is written, by two different threads
+        self._in_progress = threading.Lock()
+        bank.checkpointer = self
+
+    def operation_done(self):
+        self.operations_since_checkpoint += 1
+        if self._is_due():
+            # A change never waits for a checkpoint that is already being written
+            self.checkpoint(wait=False)
+
+    def checkpoint(self, wait: bool = True) -> bool:
+        # With wait, a checkpoint being written is waited for and a new one started after it
+        if not self._in_progress.acquire(blocking=wait):
+            return False
+        try:
+            started = time.perf_counter()
+            contended = self.bank.locks.contended
+            with self.bank.hold_for_save():
+                view = self.bank.read_view()
+                idempotency = self.bank.idempotency.copy() if self.bank.idempotency is not None else None
+                scheduler = self.bank.scheduler.copy() if self.bank.scheduler is not None else None
+                if self.bank.journal is not None:
+                    self.bank.journal.rotate()
+                self.operations_since_checkpoint = 0
+                self.last_started = time.monotonic()
+            pause = time.perf_counter() - started
+            blocked_operations = self.bank.locks.contended - contended
+        except BaseException:
+            self._in_progress.release()
+            raise
+        # Not a daemon, so a checkpoint in progress is finished before the interpreter exits
+        threading.Thread(target=self._write, args=(view, idempotency, scheduler, started, pause, blocked_operations),
+                         name='checkpoint').start()
+        return True
+
+    def wait(self):
+        with self._in_progress:
+            pass
+
+    def close(self):
+        self.wait()
+
+    def _is_due(self) -> bool:
+        if self.every_operations is not None and self.operations_since_checkpoint >= self.every_operations:
+            return True
+        if self.every_seconds is not None and time.monotonic() - self.last_started >= self.every_seconds:
+            return True
+        return self.bank.journal is not None and self.bank.journal.needs_compaction
+
+    def _write(self,
+               view: ReadView,
+               idempotency: Optional[IdempotencyCache],
+               scheduler: Optional[TransferScheduler],
+               started: float,
+               pause: float,
+               blocked_operations: int):
+        try:
+            self.bank.repository.save_state(view)
+            if idempotency is not None:
+                idempotency.save()
+            if scheduler is not None:
+                scheduler.save()
+            if self.bank.journal is not None:
+                # The state file now holds everything the rotated records did
+                self.bank.journal.drop_rotated()
+            report = CheckpointReport(accounts=len(view), pause=pause, duration=time.perf_counter() - started,
+                                      blocked_operations=blocked_operations)
+            self.last_report = report
+            logger.info(report)
+            if self.bank.stats is not None:
+                self.bank.stats.observe('checkpoint', report.duration * 1e6)
+                self.bank.stats.observe('checkpoint.pause', report.pause * 1e6)
+        except Exception:
+            # The rotated journal is kept, the next checkpoint appends to it
+            self.failures += 1
+            logger.exception('Checkpoint failed')
+        finally:
+            view.close()
+            self._in_progress.release()
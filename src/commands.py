@@ -0,0 +1,266 @@
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Tuple
+
+from src.bank import Bank
+from src.exception import BankException
+
+# Accounts listed at most by find_account
+FIND_ACCOUNT_LIMIT = 100
+# Newest ledger entries listed by statement
+STATEMENT_LIMIT = 20
+# Soonest scheduled transfers listed by list_schedules
+SCHEDULE_LIMIT = 20
+# Durations such as 30s, 15m, 12h, 1d or 2w, also combined as in 1d12h
+DURATION_PART = re.compile(r'(\d+)([wdhms])')
+DURATION_UNITS = {'w': 'weeks', 'd': 'days', 'h': 'hours', 'm': 'minutes', 's': 'seconds'}
+
+# Define the available commands and their arguments
+commands = {
+    'create_account': {
+        'args': ['name', 'balance'],
+        'help': 'Create a new account',
+        'numeric_args': ['balance']
+    },
+    'deposit': {
+        'args': ['account_id', 'amount'],
+        'help': 'Deposit into an account',
+        'numeric_args': ['amount']
+    },
+    'withdraw': {
+        'args': ['account_id', 'amount'],
+        'help': 'Withdraw from an account',
+        'numeric_args': ['amount']
+    },
+    'transfer': {
+        'args': ['from_account_id', 'to_account_id', 'amount'],
+        'help': 'Transfer between accounts',
+        'numeric_args': ['amount']
+    },
+    'queue_transfer': {
+        'args': ['from_account_id', 'to_account_id', 'amount'],
+        'help': 'Queue a transfer for the next settle, which nets all queued transfers',
+        'numeric_args': ['amount']
+    },
+    'settle': {
+        'args': [],
+        'help': 'Apply the queued transfers with one balance change per account, by their net amounts',
+    },
+    'schedule_transfer': {
+        'args': ['from_account_id', 'to_account_id', 'amount', 'at'],
+        'optional_args': ['every'],
+        'help': 'Schedule a transfer at a date and time such as 2026-01-31T09:00, repeated every interval such as '
+                '1d or 2w when given',
+        'numeric_args': ['amount'],
+        'datetime_args': ['at'],
+        'duration_args': ['every']
+    },
+    'list_schedules': {
+        'args': [],
+        'help': f'Show the {SCHEDULE_LIMIT} scheduled transfers due soonest',
+    },
+    'cancel_schedule': {
+        'args': ['schedule_id'],
+        'help': 'Cancel a scheduled transfer',
+    },
+    'run_due': {
+        'args': [],
+        'help': 'Run the scheduled transfers that are due now, without waiting for the next tick',
+    },
+    'find_account': {
+        'args': ['name'],
+        'help': 'Find accounts by name, a trailing * finds names starting with it',
+    },
+    'statement': {
+        'args': ['account_id'],
+        'help': f'Show the latest {STATEMENT_LIMIT} balance changes of an account, newest first',
+    },
+    'summary': {
+        'args': [],
+        'help': 'Show the number of accounts, the total balance and how balances are distributed',
+    },
+    'top_accounts': {
+        'args': ['count'],
+        'help': 'Show the accounts with the highest balances, richest first',
+        'integer_args': ['count']
+    },
+    'stats': {
+        'args': [],
+        'help': 'Show call counts, errors and latencies of the bank operations',
+    },
+    'save_state': {
+        'args': [],
+        'help': 'Save bank state to a csv file',
+    },
+    'exit': {
+        'args': [],
+        'help': 'Exit the program',
+    },
+}
+
+
+class InvalidCommandException(BankException):
+    pass
+
+
+def parse_command(user_input: str) -> Tuple[str, Dict[str, Any]]:
+    parts = user_input.split()
+    if not parts or parts[0] not in commands:
+        raise InvalidCommandException('Invalid command. Please try again.')
+    return parts[0], parse_args(parts[0], parts[1:])
+
+
+def parse_args(command: str, args: List[str]) -> Dict[str, Any]:
+    # Optional arguments come last and are left out of the result when not given
+    details = commands[command]
+    optional_args = details.get('optional_args', [])
+    if not len(details['args']) <= len(args) <= len(details['args']) + len(optional_args):
+        raise InvalidCommandException('Invalid number of arguments. Please try again.')
+
+    command_args = {}
+    for arg, value in zip(details['args'] + optional_args, args):
+        if arg in details.get('numeric_args', []):
+            try:
+                value = Decimal(value)
+            except InvalidOperation:
+                raise InvalidCommandException(f'{arg} should be in numerical format. Please try again.')
+        if arg in details.get('integer_args', []):
+            if not value.isdigit() or int(value) == 0:
+                raise InvalidCommandException(f'{arg} should be a positive whole number. Please try again.')
+            value = int(value)
+        if arg in details.get('datetime_args', []):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                raise InvalidCommandException(f'{arg} should be a date and time such as 2026-01-31T09:00. '
+                                              f'Please try again.')
+        if arg in details.get('duration_args', []):
+            value = _parse_duration(arg, value)
+        command_args[arg] = value
+    return command_args
+
+
+def _parse_duration(arg: str, value: str) -> timedelta:
+    parts = DURATION_PART.findall(value)
+    if not parts or ''.join(number + unit for number, unit in parts) != value:
+        raise InvalidCommandException(f'{arg} should be a duration such as 30m, 12h, 1d or 2w. Please try again.')
+    duration = timedelta()
+    for number, unit in parts:
+        duration += timedelta(**{DURATION_UNITS[unit]: int(number)})
+    if not duration:
+        raise InvalidCommandException(f'{arg} should be longer than zero. Please try again.')
+    return duration
+
+
+# Run a parsed command against the bank and return the lines to show for it
+def execute_command(bank: Bank, command: str, command_args: Dict[str, Any]) -> List[str]:
+    if command == 'create_account':
+        account = bank.create_account(
+            name=command_args['name'],
+            balance=command_args['balance'],
+        )
+        return [f'Created new account: {account}']
+    elif command == 'deposit':
+        account = bank.deposit(account_id=command_args['account_id'],
+                               amount=command_args['amount'])
+        return [f'Deposited {command_args["amount"]} to account {command_args["account_id"]}',
+                f'Account state after deposit: {account}']
+    elif command == 'withdraw':
+        account = bank.withdraw(account_id=command_args['account_id'],
+                                amount=command_args['amount'])
+        return [f'Withdrawn {command_args["amount"]} from account {command_args["account_id"]}',
+                f'Account state after withdrawal: {account}']
+    elif command == 'transfer':
+        from_account, to_account = bank.transfer(from_account_id=command_args['from_account_id'],
+                                                 to_account_id=command_args['to_account_id'],
+                                                 amount=command_args['amount'])
+        return [f'Transferred {command_args["amount"]} from account {command_args["from_account_id"]} '
+                f'to account {command_args["to_account_id"]}',
+                f'From account state after transfer: {from_account}',
+                f'To account state after transfer: {to_account}']
+    elif command == 'queue_transfer':
+        position = bank.queue_transfer(from_account_id=command_args['from_account_id'],
+                                       to_account_id=command_args['to_account_id'],
+                                       amount=command_args['amount'])
+        return [f'Queued transfer #{position} of {command_args["amount"]} from account '
+                f'{command_args["from_account_id"]} to account {command_args["to_account_id"]}']
+    elif command == 'settle':
+        from src.batch import BatchStatus
+
+        result = bank.settle()
+        lines = [str(result)]
+        for row in result.rejected_rows.tolist():
+            _, from_account_id, to_account_id, amount = result.transfers[row]
+            reason = BatchStatus(result.statuses[row]).name.lower().replace('_', ' ')
+            lines.append(f'Transfer #{row} of {amount} from account {from_account_id} to account {to_account_id} '
+                         f'not settled: {reason}')
+        return lines
+    elif command == 'schedule_transfer':
+        transfer = bank.schedule_transfer(from_account_id=command_args['from_account_id'],
+                                          to_account_id=command_args['to_account_id'],
+                                          amount=command_args['amount'],
+                                          at=command_args['at'],
+                                          every=command_args.get('every'))
+        return [f'Scheduled transfer {transfer}']
+    elif command == 'list_schedules':
+        transfers = bank.get_schedules(limit=SCHEDULE_LIMIT)
+        if not transfers:
+            return ['No scheduled transfers']
+        return [f'Scheduled transfer {transfer}' for transfer in transfers]
+    elif command == 'cancel_schedule':
+        transfer = bank.cancel_schedule(command_args['schedule_id'])
+        return [f'Cancelled scheduled transfer {transfer}']
+    elif command == 'run_due':
+        from src.batch import BatchStatus
+
+        run = bank.run_due_transfers()
+        lines = [str(run)]
+        for row in run.rejected_rows:
+            transfer = run.transfers[row]
+            reason = BatchStatus(run.statuses[row]).name.lower().replace('_', ' ')
+            lines.append(f'Scheduled transfer {transfer.schedule_id} of {transfer.amount} from account '
+                         f'{transfer.from_account_id} to account {transfer.to_account_id} not run: {reason}')
+        return lines
+    elif command == 'find_account':
+        name = command_args['name']
+        if name.endswith('*'):
+            accounts = bank.find_accounts_by_name_prefix(name[:-1], limit=FIND_ACCOUNT_LIMIT + 1)
+        else:
+            accounts = bank.find_accounts_by_name(name)
+        if not accounts:
+            return [f'No account found for {name}']
+        lines = [f'Found account: {account}' for account in accounts[:FIND_ACCOUNT_LIMIT]]
+        if len(accounts) > FIND_ACCOUNT_LIMIT:
+            lines.append(f'Showing the first {FIND_ACCOUNT_LIMIT} accounts only')
+        return lines
+    elif command == 'statement':
+        entries = bank.get_statement(command_args['account_id'], limit=STATEMENT_LIMIT, newest_first=True)
+        if not entries:
+            return [f'No balance changes recorded for account {command_args["account_id"]}']
+        return [f'{entry.timestamp:%Y-%m-%d %H:%M:%S} #{entry.sequence} {entry.kind} {entry.amount} '
+                f'balance {entry.balance}' + (f' ({entry.counterparty})' if entry.counterparty else '')
+                for entry in entries]
+    elif command == 'summary':
+        summary = bank.summary()
+        lines = [str(summary)]
+        uppers = [bound for bound, _ in summary.histogram[1:]] + [None]
+        for (lower, count), upper in zip(summary.histogram, uppers):
+            if count:
+                lines.append(f'{lower} <= balance < {upper}: {count} accounts' if upper is not None
+                             else f'balance >= {lower}: {count} accounts')
+        return lines
+    elif command == 'top_accounts':
+        return [f'#{rank} {account}' for rank, account in enumerate(bank.top_accounts(command_args['count']), 1)]
+    elif command == 'stats':
+        return bank.get_stats().format()
+    elif command == 'save_state':
+        bank.save_state()
+        checkpointer = getattr(bank, 'checkpointer', None)
+        if checkpointer is None:
+            return ['Saved current bank state']
+        lines = ['Saving bank state in the background']
+        if checkpointer.last_report is not None:
+            lines.append(f'Last checkpoint: {checkpointer.last_report}')
+        return lines
+    return []
@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from src.account import Account
+from src.exception import BankException
+
+logger = logging.getLogger(__name__)
+
+# Remembered results of the idempotent requests of the last day, at most a million of them
+DEFAULT_MAX_ENTRIES = 1_000_000
+DEFAULT_TTL = 24 * 60 * 60.0
+
+
+class IdempotencyNotEnabledException(BankException):
+    def __str__(self):
+        return 'Idempotency keys are not enabled for this bank'
+
+
+class IdempotencyKeyReusedException(BankException):
+    def __init__(self, key: str):
+        self.key = key
+
+    def __str__(self):
+        return f'Idempotency key {self.key} was already used for a different request'
+
+
+class IdempotencyCache:
+    # Results of requests made with an idempotency key, so a retried request returns the first result
+    # instead of being applied again. Entries expire ttl seconds after the request and the least
+    # recently used ones are evicted beyond max_entries. Only successful requests are remembered: a
+    # failed one changed nothing and runs again when retried.
+    def __init__(self,
+                 path: Optional[Path] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float = DEFAULT_TTL,
+                 clock: Callable[[], float] = time.time):
+        # Saved with the bank state, changes since then are in the journal
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Wall clock time, expiry times outlive the process
+        self.clock = clock
+        # Plain tuples, cheaper to create than named ones on every request: the expiry time, the method
+        # and its arguments as strings and the (account_id, name, balance) of the accounts returned, as
+        # they were right after the request. A key replayed with other arguments is an error.
+        self._entries: 'OrderedDict[str, Tuple[float, Tuple[str, ...], Tuple[Tuple[str, str, Decimal], ...]]]' = \
+            OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, request: Sequence[str]) -> Optional[List[Account]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, cached_request, accounts = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            if cached_request != tuple(request):
+                raise IdempotencyKeyReusedException(key)
+            self._entries.move_to_end(key)
+        return [Account(account_id, name, balance) for account_id, name, balance in accounts]
+
+    def expiry(self) -> float:
+        return self.clock() + self.ttl
+
+    def put(self, key: str, request: Sequence[str], accounts: Sequence[Account], expires_at: float):
+        entry = (expires_at, tuple(request),
+                 tuple([(account.account_id, account.name, account.balance) for account in accounts]))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def copy(self) -> 'IdempotencyCache':
+        cache = IdempotencyCache(self.path, self.max_entries, self.ttl, self.clock)
+        with self._lock:
+            cache._entries = self._entries.copy()
+        return cache
+
+    def save(self):
+        if self.path is None:
+            return
+        now = self.clock()
+        with self._lock:
+            entries = [[key, expires_at, list(request),
+                        [[str(account_id), name, str(balance)] for account_id, name, balance in accounts]]
+                       for key, (expires_at, request, accounts) in self._entries.items() if expires_at > now]
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            # Least recently used first, so loading restores the order
+            json.dump(entries, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        with self._lock:
+            self._entries.clear()
+        if self.path is None or not self.path.is_file():
+            return
+        with open(self.path) as f:
+            entries = json.load(f)
+        now = self.clock()
+        for key, expires_at, request, accounts in entries:
+            if expires_at > now:
+                self.put(key, request, [Account(account_id, name, Decimal(balance))
+                                        for account_id, name, balance in accounts], expires_at)
+        logger.info(f'Loaded {len(self)} idempotency keys from {self.path}')
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,302 @@
+import csv
+import io
+import logging
+import os
+import shutil
+import threading
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.account import Account
+from src.scheduler import ScheduledTransfer
+
+logger = logging.getLogger(__name__)
+
+# Record types. Balance updates store the resulting balances rather than the deltas,
+# so replaying a journal over a snapshot that already contains some of its records
+# (e.g. a crash between writing a snapshot and truncating the journal) is harmless.
+CREATE_RECORD = 'C'
+UPDATE_RECORD = 'U'
+# A transaction state change together with the balances it sets, written as one record
+TRANSACTION_RECORD = 'T'
+# An idempotency key, its expiry time and request followed by the create or update record of the request
+IDEMPOTENT_RECORD = 'K'
+# Scheduled transfers as they were left, each in SCHEDULE_FIELDS fields, followed by the balances their
+# runs set. A transfer that is gone has only its id, its other fields are empty.
+SCHEDULE_RECORD = 'S'
+SCHEDULE_FIELDS = 6
+
+# Transaction states. Only prepared transactions are remembered, a transaction the journal
+# does not know is either finished or was never prepared.
+PREPARED = 'prepared'
+COMMITTED = 'committed'
+ABORTED = 'aborted'
+
+# Records moved aside by rotate() until the checkpoint that covers them is written
+ROTATED_SUFFIX = '.rotated'
+
+
+class Journal:
+    # Append-only write-ahead log of account changes. Records are fsync-ed in groups
+    # (group commit): once `sync_every` records are pending, or every `sync_interval` seconds.
+    def __init__(self,
+                 journal_path: Path,
+                 sync_every: int = 64,
+                 sync_interval: Optional[float] = 0.05,
+                 compact_every: Optional[int] = 100_000):
+        self.journal_path = journal_path
+        self.rotated_path = journal_path.with_name(journal_path.name + ROTATED_SUFFIX)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_every = compact_every
+        self.records_since_compaction = 0
+        # Details of the transactions prepared and not yet committed or aborted, by transaction id
+        self.transactions: Dict[str, List[str]] = {}
+        # (key, expiry time, request, [(account_id, balance)]) of the idempotent requests found by replay()
+        self.idempotent_requests: List[Tuple[str, float, List[str], List[Tuple[str, Decimal]]]] = []
+        # (schedule_id, transfer or None once it is gone) of the schedule changes found by replay(), in order
+        self.schedule_changes: List[Tuple[str, Optional[ScheduledTransfer]]] = []
+        self._file = None
+        self._writer = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stop_flusher = None
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.compact_every is not None and self.records_since_compaction >= self.compact_every
+
+    def append_create(self, account: Account, idempotency: Optional[Tuple[str, float, Sequence[str]]] = None):
+        self._append(self._idempotent([CREATE_RECORD, account.account_id, account.name, str(account.balance)],
+                                      idempotency))
+
+    def append_balances(self,
+                        accounts: Iterable[Account],
+                        idempotency: Optional[Tuple[str, float, Sequence[str]]] = None):
+        # A single record per operation, so a transfer is replayed either fully or not at all
+        row = [UPDATE_RECORD]
+        for account in accounts:
+            row.append(account.account_id)
+            row.append(str(account.balance))
+        self._append(self._idempotent(row, idempotency))
+
+    @staticmethod
+    def _idempotent(row: List[str], idempotency: Optional[Tuple[str, float, Sequence[str]]]) -> List[str]:
+        # The key goes in the same record as the change, so neither is replayed without the other
+        if idempotency is None:
+            return row
+        key, expires_at, request = idempotency
+        return [IDEMPOTENT_RECORD, key, repr(expires_at), str(len(request)), *request, *row]
+
+    def append_schedules(self,
+                         transfers: Sequence[Tuple[str, Optional[ScheduledTransfer]]],
+                         accounts: Iterable[Account] = ()):
+        # Transfers scheduled, cancelled or run, in the same record as the balances of the runs
+        row = [SCHEDULE_RECORD, str(len(transfers))]
+        for schedule_id, transfer in transfers:
+            row.extend(transfer.to_row() if transfer is not None else [schedule_id] + [''] * (SCHEDULE_FIELDS - 1))
+        for account in accounts:
+            row.append(account.account_id)
+            row.append(str(account.balance))
+        self._append(row)
+
+    def append_transaction(self,
+                           transaction_id: str,
+                           state: str,
+                           details: Sequence[str] = (),
+                           accounts: Iterable[Account] = ()):
+        # Used for two-phase commit: the details of a prepared transaction are kept until it is
+        # committed or aborted, and survive compaction
+        row = [TRANSACTION_RECORD, transaction_id, state, str(len(details)), *details]
+        for account in accounts:
+            row.append(account.account_id)
+            row.append(str(account.balance))
+        self._append(row)
+        self._track_transaction(transaction_id, state, list(details))
+
+    def _track_transaction(self, transaction_id: str, state: str, details: List[str]):
+        if state == PREPARED:
+            self.transactions[transaction_id] = details
+        else:
+            self.transactions.pop(transaction_id, None)
+
+    def _append(self, row: List[str]):
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._writer.writerow(row)
+            self._pending += 1
+            self.records_since_compaction += 1
+            if self._pending >= self.sync_every:
+                self._sync()
+
+    def _open(self):
+        self._file = open(self.journal_path, 'a', newline='')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        if self.sync_interval is not None:
+            # Records of an idle bank would otherwise wait for the group to fill up
+            self._stop_flusher = threading.Event()
+            threading.Thread(target=self._flush_periodically, args=(self._stop_flusher,), daemon=True).start()
+
+    def _flush_periodically(self, stop: threading.Event):
+        while not stop.wait(self.sync_interval):
+            self.sync()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        if self._file is None or self._pending == 0:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def replay(self, accounts: Dict[str, Account]) -> int:
+        # Records rotated aside by a checkpoint that never finished come first
+        replayed = 0
+        self.idempotent_requests = []
+        self.schedule_changes = []
+        for path in (self.rotated_path, self.journal_path):
+            if path.is_file():
+                replayed += self._replay_file(path, accounts)
+        self.records_since_compaction = replayed
+        return replayed
+
+    def _replay_file(self, path: Path, accounts: Dict[str, Account]) -> int:
+        with open(path, 'r', newline='') as f:
+            content = f.read()
+        # Parsed as a whole rather than line by line, a quoted name may contain line breaks
+        buffer = io.StringIO(content, newline='')
+        reader = csv.reader(buffer, strict=True)
+        rows = []
+        complete = 0
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error:
+                if buffer.tell() < len(content):
+                    logger.warning(f'Stopping journal replay at malformed record in {path}')
+                    break
+                # A quoted field still open at the end
+                row = None
+            end = buffer.tell()
+            if row is None or content[end - 1] != '\n':
+                # The last record was only partially written before a crash
+                logger.warning(f'Discarding incomplete journal record in {path}')
+                with open(path, 'r+', newline='') as f:
+                    f.truncate(len(content[:complete].encode()))
+                break
+            rows.append(row)
+            complete = end
+
+        replayed = 0
+        for row in rows:
+            try:
+                self._apply(row, accounts)
+            except (IndexError, ValueError, InvalidOperation):
+                logger.warning(f'Stopping journal replay at malformed record {row}')
+                break
+            replayed += 1
+        logger.info(f'Replayed {replayed} journal records from {path}')
+        return replayed
+
+    def _apply(self, row: List[str], accounts: Dict[str, Account]):
+        if row[0] == CREATE_RECORD:
+            account_id, name, balance = row[1], row[2], Decimal(row[3])
+            accounts[account_id] = Account(account_id=account_id, name=name, balance=balance)
+        elif row[0] == UPDATE_RECORD:
+            self._apply_balances(row[1:], accounts)
+        elif row[0] == TRANSACTION_RECORD:
+            transaction_id, state, details_end = row[1], row[2], 4 + int(row[3])
+            if len(row) < details_end:
+                raise IndexError(row)
+            self._apply_balances(row[details_end:], accounts)
+            self._track_transaction(transaction_id, state, row[4:details_end])
+        elif row[0] == IDEMPOTENT_RECORD:
+            key, expires_at, request_end = row[1], float(row[2]), 4 + int(row[3])
+            change = row[request_end:]
+            if not change or change[0] not in (CREATE_RECORD, UPDATE_RECORD):
+                raise IndexError(row)
+            self._apply(change, accounts)
+            fields = [change[1], change[3]] if change[0] == CREATE_RECORD else change[1:]
+            self.idempotent_requests.append((key, expires_at, row[4:request_end],
+                                             [(account_id, Decimal(balance))
+                                              for account_id, balance in zip(fields[::2], fields[1::2])]))
+        elif row[0] == SCHEDULE_RECORD:
+            changes_end = 2 + SCHEDULE_FIELDS * int(row[1])
+            if len(row) < changes_end:
+                raise IndexError(row)
+            changes = [(fields[0], ScheduledTransfer.from_row(fields) if fields[1] else None)
+                       for fields in (row[start:start + SCHEDULE_FIELDS]
+                                      for start in range(2, changes_end, SCHEDULE_FIELDS))]
+            self._apply_balances(row[changes_end:], accounts)
+            self.schedule_changes.extend(changes)
+        else:
+            raise IndexError(row)
+
+    @staticmethod
+    def _apply_balances(fields: List[str], accounts: Dict[str, Account]):
+        if len(fields) % 2:
+            raise IndexError(fields)
+        for account_id, balance in zip(fields[::2], fields[1::2]):
+            if account_id not in accounts:
+                logger.warning(f'Journal updates unknown account {account_id}, skipping')
+                continue
+            accounts[account_id].balance = Decimal(balance)
+
+    def reset(self):
+        with self._lock:
+            self._close_file()
+            self._start_new_file()
+            # The snapshot also holds what was rotated aside
+            self.rotated_path.unlink(missing_ok=True)
+
+    def rotate(self):
+        # Moves the records so far aside and starts a new journal, for a checkpoint that is written
+        # while changes go on. drop_rotated() deletes them once the checkpoint is on disk.
+        with self._lock:
+            self._close_file()
+            if self.journal_path.is_file():
+                if self.rotated_path.is_file():
+                    # The previous checkpoint did not finish, its records are still needed
+                    with open(self.journal_path, 'rb') as source, open(self.rotated_path, 'ab') as target:
+                        shutil.copyfileobj(source, target)
+                        target.flush()
+                        os.fsync(target.fileno())
+                else:
+                    os.replace(self.journal_path, self.rotated_path)
+            self._start_new_file()
+
+    def drop_rotated(self):
+        with self._lock:
+            self.rotated_path.unlink(missing_ok=True)
+
+    def _start_new_file(self):
+        with open(self.journal_path, 'w', newline='') as f:
+            # The snapshot holds the balances but not which transactions are still prepared
+            writer = csv.writer(f, lineterminator='\n')
+            for transaction_id, details in self.transactions.items():
+                writer.writerow([TRANSACTION_RECORD, transaction_id, PREPARED, str(len(details)), *details])
+            f.flush()
+            os.fsync(f.fileno())
+        self.records_since_compaction = len(self.transactions)
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        self._sync()
+        self._file.close()
+        self._file = None
+        self._writer = None
+        if self._stop_flusher is not None:
+            self._stop_flusher.set()
+            self._stop_flusher = None
@@ -0,0 +1,240 @@
+import logging
+import mmap
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from src.exception import BankException
+from src.money import MINOR_UNIT_SCALE, from_minor_units, to_minor_units
+
+logger = logging.getLogger(__name__)
+
+OPEN = 'open'
+DEPOSIT = 'deposit'
+WITHDRAW = 'withdraw'
+TRANSFER_IN = 'transfer_in'
+TRANSFER_OUT = 'transfer_out'
+KINDS = (OPEN, DEPOSIT, WITHDRAW, TRANSFER_IN, TRANSFER_OUT)
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+NO_COUNTERPARTY = -1
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class LedgerNotEnabledException(BankException):
+    def __str__(self):
+        return 'The ledger is not enabled for this bank'
+
+
+class LedgerEntry(NamedTuple):
+    sequence: int
+    timestamp: datetime
+    account_id: str
+    kind: str
+    # Signed change of the balance, negative for withdrawals and outgoing transfers
+    amount: Decimal
+    balance: Decimal
+    counterparty: Optional[str]
+
+
+class _Segment:
+    # A fixed number of consecutive entries in parallel typed arrays, about 41 bytes per entry
+    COLUMNS = ('accounts', 'counterparties', 'timestamps', 'amounts', 'balances', 'kinds')
+    TYPECODES = ('q', 'q', 'q', 'q', 'q', 'b')
+    __slots__ = COLUMNS
+
+    def __init__(self):
+        for column, typecode in zip(self.COLUMNS, self.TYPECODES):
+            setattr(self, column, array(typecode))
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def spill(self, path: Path):
+        with open(path, 'wb') as f:
+            f.write(len(self).to_bytes(8, 'little'))
+            for column in self.COLUMNS:
+                getattr(self, column).tofile(f)
+
+    @classmethod
+    def map(cls, path: Path) -> '_Segment':
+        # Columns become read-only views of the mapped file, the page cache holds what is read
+        segment = cls.__new__(cls)
+        with open(path, 'rb') as f:
+            view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        entries = int.from_bytes(view[:8], 'little')
+        offset = 8
+        for column, typecode in zip(cls.COLUMNS, cls.TYPECODES):
+            size = array(typecode).itemsize * entries
+            setattr(segment, column, view[offset:offset + size].cast(typecode))
+            offset += size
+        return segment
+
+
+class Ledger:
+    # Append-only history of balance changes. Entries get consecutive sequence numbers and fill
+    # fixed-size segments; every account keeps the sequence numbers of its entries, so a statement
+    # costs a binary search plus one lookup per returned entry. When more than
+    # max_segments_in_memory segments are full, the oldest is spilled to spill_path and mapped back
+    # read-only, or dropped when there is no spill_path. Amounts and balances are kept in minor units.
+    def __init__(self,
+                 scale: int = MINOR_UNIT_SCALE,
+                 segment_size: int = 65536,
+                 max_segments_in_memory: Optional[int] = 16,
+                 spill_path: Optional[Path] = None):
+        self.scale = scale
+        self.segment_size = segment_size
+        self.max_segments_in_memory = max_segments_in_memory
+        self.spill_path = spill_path
+        self.next_sequence = 0
+        # Entries before it were compacted away
+        self.first_sequence = 0
+        self._segments: Dict[int, _Segment] = {}
+        self._spilled: Dict[int, Path] = {}
+        self._mapped: Dict[int, _Segment] = {}
+        self._account_keys: Dict[str, int] = {}
+        self._account_ids: List[str] = []
+        self._sequences_by_account: Dict[int, array] = {}
+        self._last_timestamp = 0
+        self._lock = threading.Lock()
+        if spill_path is not None:
+            spill_path.mkdir(parents=True, exist_ok=True)
+
+    def to_units(self, amount: Decimal) -> int:
+        return to_minor_units(amount, self.scale)
+
+    def record(self,
+               account_id: str,
+               kind: str,
+               amount_units: int,
+               balance_units: int,
+               counterparty: Optional[str] = None) -> int:
+        with self._lock:
+            sequence = self.next_sequence
+            segment_number, offset = divmod(sequence, self.segment_size)
+            segment = self._segments.get(segment_number)
+            if segment is None:
+                segment = self._segments[segment_number] = _Segment()
+                self._evict_segments()
+            # Timestamps never go backwards, so they are sorted like the sequence numbers
+            timestamp = max(time.time_ns() // 1000, self._last_timestamp)
+            self._last_timestamp = timestamp
+            account_key = self._account_key(account_id)
+            segment.accounts.append(account_key)
+            segment.counterparties.append(NO_COUNTERPARTY if counterparty is None
+                                          else self._account_key(counterparty))
+            segment.timestamps.append(timestamp)
+            segment.amounts.append(amount_units)
+            segment.balances.append(balance_units)
+            segment.kinds.append(KIND_CODES[kind])
+            sequences = self._sequences_by_account.get(account_key)
+            if sequences is None:
+                sequences = self._sequences_by_account[account_key] = array('q')
+            sequences.append(sequence)
+            self.next_sequence = sequence + 1
+            return sequence
+
+    def statement(self,
+                  account_id: str,
+                  since: Optional[datetime] = None,
+                  until: Optional[datetime] = None,
+                  limit: Optional[int] = None,
+                  newest_first: bool = False) -> List[LedgerEntry]:
+        # Entries of the account from since (inclusive) to until (exclusive), oldest first unless
+        # newest_first, in which case the limit keeps the newest entries
+        with self._lock:
+            account_key = self._account_keys.get(account_id)
+            if account_key is None:
+                return []
+            sequences = self._sequences_by_account[account_key]
+            start = 0 if since is None else self._first_at_or_after(sequences, self._to_timestamp(since))
+            end = len(sequences) if until is None else self._first_at_or_after(sequences, self._to_timestamp(until))
+            if newest_first:
+                if limit is not None:
+                    start = max(start, end - limit)
+                return [self._entry(sequence) for sequence in reversed(sequences[start:end])]
+            if limit is not None:
+                end = min(end, start + limit)
+            return [self._entry(sequence) for sequence in sequences[start:end]]
+
+    def compact(self, before_sequence: int):
+        # Drops the entries before the segment holding before_sequence, in memory and on disk
+        with self._lock:
+            first_segment = min(before_sequence, self.next_sequence) // self.segment_size
+            for segment_number in [number for number in self._segments if number < first_segment]:
+                del self._segments[segment_number]
+            for segment_number in [number for number in self._spilled if number < first_segment]:
+                self._spilled.pop(segment_number).unlink()
+                del self._mapped[segment_number]
+            self._drop_before(first_segment * self.segment_size)
+
+    def _evict_segments(self):
+        # Called when a segment was started, every older segment is full
+        if self.max_segments_in_memory is None or len(self._segments) <= self.max_segments_in_memory:
+            return
+        oldest = min(self._segments)
+        if self.spill_path is None:
+            logger.info(f'Dropping ledger entries before sequence {(oldest + 1) * self.segment_size}')
+            del self._segments[oldest]
+            self._drop_before((oldest + 1) * self.segment_size)
+            return
+        path = self.spill_path / f'segment-{oldest}.bin'
+        self._segments.pop(oldest).spill(path)
+        self._spilled[oldest] = path
+        self._mapped[oldest] = _Segment.map(path)
+
+    def _drop_before(self, sequence: int):
+        if sequence <= self.first_sequence:
+            return
+        self.first_sequence = sequence
+        for sequences in self._sequences_by_account.values():
+            del sequences[:bisect_left(sequences, sequence)]
+
+    def _segment(self, segment_number: int) -> _Segment:
+        segment = self._segments.get(segment_number)
+        return self._mapped[segment_number] if segment is None else segment
+
+    def _timestamp(self, sequence: int) -> int:
+        segment_number, offset = divmod(sequence, self.segment_size)
+        return self._segment(segment_number).timestamps[offset]
+
+    def _first_at_or_after(self, sequences: array, timestamp: int) -> int:
+        low, high = 0, len(sequences)
+        while low < high:
+            middle = (low + high) // 2
+            if self._timestamp(sequences[middle]) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _entry(self, sequence: int) -> LedgerEntry:
+        segment_number, offset = divmod(sequence, self.segment_size)
+        segment = self._segment(segment_number)
+        counterparty = segment.counterparties[offset]
+        return LedgerEntry(sequence=sequence,
+                           timestamp=EPOCH + segment.timestamps[offset] * MICROSECOND,
+                           account_id=self._account_ids[segment.accounts[offset]],
+                           kind=KINDS[segment.kinds[offset]],
+                           amount=from_minor_units(segment.amounts[offset], self.scale),
+                           balance=from_minor_units(segment.balances[offset], self.scale),
+                           counterparty=None if counterparty == NO_COUNTERPARTY else self._account_ids[counterparty])
+
+    def _account_key(self, account_id: str) -> int:
+        account_key = self._account_keys.get(account_id)
+        if account_key is None:
+            account_key = self._account_keys[account_id] = len(self._account_ids)
+            self._account_ids.append(account_id)
+        return account_key
+
+    @staticmethod
+    def _to_timestamp(moment: datetime) -> int:
+        # Naive datetimes are local time, like datetime.timestamp() takes them
+        if moment.tzinfo is None:
+            moment = moment.astimezone()
+        return (moment - EPOCH) // MICROSECOND
@@ -0,0 +1,69 @@
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, Optional
+
+from src.account_helper import AccountKey
+
+_NO_LOCK = nullcontext()
+
+
+class NoLocks:
+    # Used when the bank is not shared between threads, so every lock is a no-op
+    contended = 0
+
+    def hold(self, *account_ids: Optional[str]):
+        return _NO_LOCK
+
+    def hold_for_insert(self, *account_ids: Optional[str]):
+        return _NO_LOCK
+
+    def hold_all(self):
+        return _NO_LOCK
+
+
+class StripedLocks:
+    # Accounts are spread over a fixed number of locks by the hash of their id. Locks are
+    # always taken in stripe order, so two transfers in opposite directions cannot deadlock.
+    def __init__(self, stripes: int = 1024):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        # Serializes changes to the shape of the accounts mapping; always taken after a stripe
+        self._insert_lock = threading.Lock()
+        # Holds that had to wait for a stripe, approximate as it is not counted under a lock
+        self.contended = 0
+
+    def stripe_of(self, account_id: str) -> int:
+        # An AccountKey and its uuid string are the same account and must share a stripe
+        if type(account_id) is AccountKey:
+            account_id = str(account_id)
+        return hash(account_id) % len(self._locks)
+
+    @contextmanager
+    def hold(self, *account_ids: Optional[str]) -> Iterator[None]:
+        # None is skipped, e.g. an absent idempotency key
+        stripes = sorted({self.stripe_of(account_id) for account_id in account_ids if account_id is not None})
+        for stripe in stripes:
+            lock = self._locks[stripe]
+            if not lock.acquire(blocking=False):
+                self.contended += 1
+                lock.acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._locks[stripe].release()
+
+    @contextmanager
+    def hold_for_insert(self, *account_ids: Optional[str]) -> Iterator[None]:
+        with self.hold(*account_ids), self._insert_lock:
+            yield
+
+    @contextmanager
+    def hold_all(self) -> Iterator[None]:
+        # Inserts hold a stripe too, so holding every stripe also keeps the mapping still
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
@@ -0,0 +1,27 @@
+from decimal import Decimal
+
+from src.account import InvalidAccountOperationException
+
+# Balances kept as integers count cents
+MINOR_UNIT_SCALE = 2
+
+
+def to_minor_units(amount: Decimal, scale: int = MINOR_UNIT_SCALE) -> int:
+    if not amount.is_finite():
+        raise InvalidAccountOperationException(f'Invalid amount {amount}')
+    units = amount.scaleb(scale)
+    if units != units.to_integral_value():
+        raise InvalidAccountOperationException(f'Amount {amount} has more than {scale} decimal places')
+    return int(units)
+
+
+def check_amount(amount: Decimal, scale: int = MINOR_UNIT_SCALE):
+    # An amount to move between balances: a whole number of minor units, and more than nothing
+    to_minor_units(amount, scale)
+    if not amount > 0:
+        raise InvalidAccountOperationException(f'Amount {amount} must be positive')
+
+
+def from_minor_units(units: int, scale: int = MINOR_UNIT_SCALE) -> Decimal:
+    # Division keeps the smallest exponent, e.g. 10010 -> 100.1 and 0 -> 0
+    return Decimal(units) / (10 ** scale)
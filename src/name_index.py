@@ -0,0 +1,54 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def normalize_name(name: str) -> str:
+    return name.casefold()
+
+
+class NameIndex:
+    # Account ids by normalized name, plus the distinct names in sorted order so a prefix
+    # is one contiguous range found by bisection
+    def __init__(self):
+        self._ids_by_name: Dict[str, List[str]] = {}
+        self._sorted_names: List[str] = []
+
+    @classmethod
+    def build(cls, accounts: Iterable[Tuple[str, str]]) -> 'NameIndex':
+        # Built from (account_id, name) pairs with one sort instead of an insort per name
+        index = cls()
+        ids_by_name = index._ids_by_name
+        for account_id, name in accounts:
+            ids_by_name.setdefault(normalize_name(name), []).append(account_id)
+        index._sorted_names = sorted(ids_by_name)
+        return index
+
+    def add(self, account_id: str, name: str):
+        name = normalize_name(name)
+        account_ids = self._ids_by_name.get(name)
+        if account_ids is None:
+            insort(self._sorted_names, name)
+            self._ids_by_name[name] = [account_id]
+        else:
+            account_ids.append(account_id)
+
+    def find(self, name: str) -> List[str]:
+        return list(self._ids_by_name.get(normalize_name(name), ()))
+
+    def find_prefix(self, prefix: str, limit: Optional[int] = None) -> List[str]:
+        account_ids = []
+        for name in self._names_with_prefix(normalize_name(prefix)):
+            account_ids.extend(self._ids_by_name[name])
+            if limit is not None and len(account_ids) >= limit:
+                return account_ids[:limit]
+        return account_ids
+
+    def _names_with_prefix(self, prefix: str) -> Iterator[str]:
+        names = self._sorted_names
+        for position in range(bisect_left(names, prefix), len(names)):
+            if not names[position].startswith(prefix):
+                break
+            yield names[position]
+
+    def __len__(self) -> int:
+        return sum(map(len, self._ids_by_name.values()))
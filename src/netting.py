@@ -0,0 +1,120 @@
+import math
+from decimal import Decimal
+from itertools import repeat
+from operator import eq, itemgetter
+from typing import Callable, List, MutableMapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.account import Account
+from src.batch import TRANSFER, BatchStatus, _to_units
+from src.money import MINOR_UNIT_SCALE, from_minor_units
+
+# Stands in for rows that are not a transfer of four fields
+MALFORMED_TRANSFER = (None, None, None, None)
+
+
+class NettingResult(NamedTuple):
+    # The ('transfer', from_account_id, to_account_id, amount) rows of the window, in the order they came
+    transfers: Sequence[Sequence]
+    # BatchStatus of every transfer of the window, APPLIED for the ones covered by the settlement
+    statuses: np.ndarray
+    # Balances written, one per account whose net position is not zero
+    balance_writes: int
+
+    @property
+    def covered_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.statuses == BatchStatus.APPLIED)
+
+    @property
+    def rejected_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.statuses != BatchStatus.APPLIED)
+
+    @property
+    def gross_writes(self) -> int:
+        # Balances the covered transfers would have written one by one
+        return 2 * self.covered_rows.size
+
+    def __str__(self):
+        return (f'Settled {self.covered_rows.size} of {self.statuses.size} transfers with {self.balance_writes} '
+                f'balance writes instead of {self.gross_writes}')
+
+
+def net_transfers(accounts: MutableMapping[str, Account],
+                  transfers: Sequence[Sequence],
+                  before_write: Optional[Callable[..., None]] = None) -> Tuple[NettingResult, List[Account]]:
+    # Settles a window of ('transfer', from_account_id, to_account_id, amount) rows at once: every account
+    # gets a single balance write with its net position, and accounts that net to zero are not written.
+    # Only the final balances must not be negative, so a transfer can be covered by money the account
+    # receives later in the window. When an account would still end up overdrawn, its latest outgoing
+    # transfers are left out until it is not, which can in turn overdraw the accounts they paid; that
+    # repeats until every position is covered.
+    scale = getattr(accounts, 'scale', MINOR_UNIT_SCALE)
+    rows = len(transfers)
+    # Split into columns at C speed, as for batches
+    well_formed = np.fromiter(map(len, transfers), dtype=np.int64, count=rows) == 4
+    if not well_formed.all():
+        transfers = [transfer if shape else MALFORMED_TRANSFER for transfer, shape in zip(transfers, well_formed)]
+    well_formed &= np.fromiter(map(eq, repeat(TRANSFER), map(itemgetter(0), transfers)), dtype=bool, count=rows)
+    debit_ids = list(map(itemgetter(1), transfers))
+    credit_ids = list(map(itemgetter(2), transfers))
+    amounts = _to_units(list(map(itemgetter(3), transfers)), scale)
+
+    # Accounts touched by the window get a dense slot number, unknown ids get -1
+    slots = dict.fromkeys(set(debit_ids).union(credit_ids), -1)
+    account_ids = [account_id for account_id in slots if account_id is not None and account_id in accounts]
+    slots.update(zip(account_ids, range(len(account_ids))))
+    debits = np.fromiter(map(slots.__getitem__, debit_ids), dtype=np.int64, count=rows)
+    credits = np.fromiter(map(slots.__getitem__, credit_ids), dtype=np.int64, count=rows)
+
+    statuses = np.zeros(rows, dtype=np.uint8)
+    statuses[amounts <= 0] = BatchStatus.INVALID_AMOUNT
+    statuses[(debits == -1) | (credits == -1)] = BatchStatus.ACCOUNT_NOT_FOUND
+    statuses[~well_formed] = BatchStatus.INVALID_OPERATION
+
+    stored = [accounts[account_id] for account_id in account_ids]
+    current = [account.balance for account in stored]
+    # Floor keeps the overdraft check exact for balances finer than the minor unit
+    balances = np.fromiter(map(math.floor, map(Decimal.scaleb, current, repeat(scale))), dtype=np.int64,
+                           count=len(current))
+    while True:
+        valid = statuses == BatchStatus.APPLIED
+        nets = _net_positions(len(account_ids), debits[valid], credits[valid], amounts[valid])
+        deficits = -(balances + nets)
+        if not (deficits > 0).any():
+            break
+        statuses[_latest_debits_covering(deficits, debits, amounts, valid)] = BatchStatus.INSUFFICIENT_BALANCE
+
+    changed_slots = np.flatnonzero(nets).tolist()
+    changed = [stored[slot] for slot in changed_slots]
+    if before_write is not None:
+        before_write(*changed)
+    nets = nets.tolist()
+    for slot, account in zip(changed_slots, changed):
+        account.balance = current[slot] + from_minor_units(nets[slot], scale)
+    return NettingResult(transfers=transfers, statuses=statuses, balance_writes=len(changed)), changed
+
+
+def _net_positions(accounts: int, debits: np.ndarray, credits: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+    nets = np.zeros(accounts, dtype=np.int64)
+    np.subtract.at(nets, debits, amounts)
+    np.add.at(nets, credits, amounts)
+    return nets
+
+
+def _latest_debits_covering(deficits: np.ndarray,
+                            debits: np.ndarray,
+                            amounts: np.ndarray,
+                            valid: np.ndarray) -> np.ndarray:
+    # Rows of the latest outgoing transfers of every overdrawn account that together cover its deficit,
+    # found for all accounts at once by sorting their transfers by (account, latest first)
+    rows = np.flatnonzero(valid & (deficits[debits] > 0))
+    slots = debits[rows]
+    order = np.lexsort((-rows, slots))
+    rows, slots = rows[order], slots[order]
+    running = np.cumsum(amounts[rows])
+    group_starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, slots.size])
+    # Amount of the transfers of the same account left out before this one
+    before = running - amounts[rows] - np.repeat(running[group_starts] - amounts[rows[group_starts]], group_sizes)
+    return rows[before < deficits[slots]]
@@ -0,0 +1,103 @@
+import logging
+import os
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, MutableMapping, Optional
+
+from src.account import Account, InvalidAccountOperationException
+from src.money import MINOR_UNIT_SCALE
+
+logger = logging.getLogger(__name__)
+
+PARQUET_SUFFIX = '.parquet'
+# Accounts per row group. Saving and loading hold one row group at a time, not the whole state.
+ROW_GROUP_SIZE = 65536
+# Parquet stores decimals of up to 18 digits as 64-bit integers
+BALANCE_PRECISION = 18
+
+
+class ParquetRepository:
+    # Repository for a columnar Parquet state file, which analytics tools read directly and with only the
+    # columns they need. Balances are decimal(18, scale) columns, so they must fit the minor units of the
+    # scale like in a binary snapshot. pyarrow is only imported by this repository.
+    def __init__(self, parquet_path: Path, scale: int = MINOR_UNIT_SCALE, compression: str = 'zstd'):
+        self.parquet_path = parquet_path
+        self.scale = scale
+        self.compression = compression
+
+    def save_state(self, accounts: MutableMapping[str, Account]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        logger.info(f'Saving bank state to {self.parquet_path}')
+        schema = pa.schema([('account_id', pa.string()),
+                            ('name', pa.string()),
+                            ('balance', pa.decimal128(BALANCE_PRECISION, self.scale))])
+        # Written next to the state file and renamed into place, like the csv state
+        tmp_path = self.parquet_path.with_name(self.parquet_path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            with pq.ParquetWriter(f, schema, compression=self.compression) as writer:
+                for chunk in _chunks(accounts.values(), ROW_GROUP_SIZE):
+                    writer.write_table(pa.Table.from_arrays(
+                        [pa.array([str(account.account_id) for account in chunk], pa.string()),
+                         pa.array([account.name for account in chunk], pa.string()),
+                         self._balance_array(chunk)],
+                        schema=schema))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.parquet_path)
+
+    def _balance_array(self, chunk: List[Account]):
+        import pyarrow as pa
+
+        # Parsed by Arrow from the decimal strings, which is faster than converting a Decimal object per
+        # account and rejects balances that do not fit the column
+        balances = pa.array([str(account.balance) for account in chunk], pa.string())
+        try:
+            return balances.cast(pa.decimal128(BALANCE_PRECISION, self.scale))
+        except pa.ArrowInvalid as e:
+            raise InvalidAccountOperationException(
+                f'Balance does not fit decimal({BALANCE_PRECISION}, {self.scale}): {e}')
+
+    def load_state(self, accounts: Optional[MutableMapping[str, Account]] = None) -> MutableMapping[str, Account]:
+        # Accounts are loaded into the given mapping, e.g. an AccountStore, or into a new dict
+        if accounts is None:
+            accounts = dict()
+        if self.parquet_path.is_file():
+            print(f'Loading state from {self.parquet_path}')
+            for account in self.iter_accounts():
+                accounts[account.account_id] = account
+        else:
+            print(f'Unable to find state init file from {self.parquet_path}, start a fresh state')
+        return accounts
+
+    def iter_accounts(self) -> Iterator[Account]:
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(self.parquet_path)
+        try:
+            batches = parquet_file.iter_batches(batch_size=ROW_GROUP_SIZE, columns=['account_id', 'name', 'balance'])
+            for batch in batches:
+                account_ids, names, balances = batch.columns
+                for account_id, name, balance in zip(account_ids.to_pylist(), names.to_pylist(),
+                                                     _decimals(balances)):
+                    yield Account(account_id=account_id, name=name, balance=balance)
+        finally:
+            parquet_file.close()
+
+
+def _chunks(accounts: Iterable[Account], size: int) -> Iterator[List[Account]]:
+    accounts = iter(accounts)
+    while True:
+        chunk = list(islice(accounts, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _decimals(balances) -> Iterator[Decimal]:
+    import pyarrow as pa
+
+    # Formatted by Arrow, as for saving. Also reads decimal columns of other precisions and scales.
+    return map(Decimal, balances.cast(pa.string()).to_pylist())
@@ -0,0 +1,140 @@
+import threading
+import weakref
+from collections.abc import Mapping
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, MutableMapping, Optional
+
+from src.account import Account
+from src.exception import BankException
+
+# Kept for accounts created after the view was taken, which the view does not have
+_ABSENT = None
+
+
+class ClosedReadViewException(BankException):
+    def __str__(self):
+        return 'The read view is closed'
+
+
+class ReadView(Mapping):
+    # Immutable point-in-time view of the accounts of a bank, read while writers go on. Nothing is
+    # copied up front: reads go to the live accounts, and a writer keeps the balance an account had
+    # when the view was taken just before it first changes it (multi-version concurrency control with
+    # one old version per view). Old versions go away with the view, when it is closed or no longer
+    # referenced. Accounts come out as new Account objects that later changes do not touch.
+    def __init__(self, accounts: MutableMapping[str, Account], account_ids: List[str], views: 'ReadViews',
+                 length: Optional[int] = None):
+        self._accounts = accounts
+        # Of accounts read on demand, only the ones in memory when the view was taken. The others have not
+        # changed since and are listed from storage when the view is iterated.
+        self._account_ids = account_ids
+        self._length = len(account_ids) if length is None else length
+        self._views = views
+        # Balance at the time of the view of every account changed since, by the id it is stored under
+        self._kept: Dict[str, Optional[Decimal]] = {}
+        self.closed = False
+
+    def keep(self, accounts: Iterable[Account]):
+        # Called with the account locks held, before the balances change. The first balance kept wins.
+        kept = self._kept
+        if self.closed:
+            return
+        for account in accounts:
+            if account.account_id not in kept:
+                kept[account.account_id] = account.balance
+
+    def keep_absent(self, account_id: str):
+        # Called before an account is created
+        self._kept.setdefault(account_id, _ABSENT)
+
+    def __getitem__(self, account_id: str) -> Account:
+        if self.closed:
+            raise ClosedReadViewException()
+        account = self._accounts[account_id]
+        balance = account.balance
+        # Looked up after reading the live balance: a writer keeps the old balance before changing it,
+        # so a balance changed since the view was taken is always found here
+        kept = self._kept.get(account.account_id, balance)
+        if kept is _ABSENT:
+            raise KeyError(account_id)
+        return Account(account.account_id, account.name, kept)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._length == len(self._account_ids):
+            # Every account is listed
+            return iter(self._account_ids)
+        return self._iter_stored()
+
+    def _iter_stored(self) -> Iterator[str]:
+        yield from self._account_ids
+        listed = set(self._account_ids)
+        kept = self._kept
+        for account_id in self._accounts.stored_ids():
+            # Skips the accounts created and saved after the view was taken
+            if account_id not in listed and kept.get(account_id, account_id) is not _ABSENT:
+                yield account_id
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def accounts(self) -> MutableMapping[str, Account]:
+        # The live accounts the view reads
+        return self._accounts
+
+    @property
+    def versions(self) -> int:
+        # Old balances kept so far
+        return len(self._kept)
+
+    def close(self):
+        self.closed = True
+        self._views.discard(self)
+        self._kept = {}
+
+    def __enter__(self) -> 'ReadView':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReadViews:
+    # The open views of a bank, held weakly so a view nobody references is dropped without being closed.
+    # Writers only read the tuple, which is replaced rather than changed, so they never wait for a view
+    # to be opened or closed elsewhere.
+    def __init__(self):
+        self._refs = ()
+        # Reentrant, the garbage collector may drop a view while the lock is held
+        self._lock = threading.RLock()
+
+    def open(self, accounts: MutableMapping[str, Account]) -> ReadView:
+        # Callers hold all locks, so no change is half done. Of accounts read on demand from storage with
+        # stored_ids, e.g. SqliteAccounts, only the ones in their overlay are listed while the locks are held.
+        if getattr(accounts, 'stored_ids', None) is None:
+            view = ReadView(accounts, list(accounts), self)
+        else:
+            view = ReadView(accounts, list(accounts.overlay), self, len(accounts))
+        with self._lock:
+            self._refs = self._refs + (weakref.ref(view, self._drop),)
+        return view
+
+    def discard(self, view: ReadView):
+        with self._lock:
+            self._refs = tuple(ref for ref in self._refs if ref() is not view and ref() is not None)
+
+    def _drop(self, dead_ref: weakref.ref):
+        with self._lock:
+            self._refs = tuple(ref for ref in self._refs if ref is not dead_ref)
+
+    def __bool__(self) -> bool:
+        return bool(self._refs)
+
+    def __iter__(self) -> Iterator[ReadView]:
+        for ref in self._refs:
+            view = ref()
+            if view is not None:
+                yield view
+
+    def __len__(self) -> int:
+        return len(self._refs)
@@ -1,37 +1,101 @@
+import csv
 import logging
+import os
 from decimal import Decimal
 from pathlib import Path
-from typing import Dict
-
-import pandas as pd
+from typing import Iterator, MutableMapping, Optional, Union
 
 from src.account import Account
 
 logger = logging.getLogger(__name__)
 
+FIELDNAMES = ['account_id', 'name', 'balance']
+ENGINES = ('csv', 'pandas')
+
 
 class Repository:
 
-    def __init__(self, csv_path: Path):
+    def __init__(self, csv_path: Path, engine: str = 'csv'):
+        # 'csv' streams rows with the standard library; 'pandas' goes through a DataFrame and
+        # is the only path that imports pandas
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown repository engine {engine}, expected one of {", ".join(ENGINES)}')
         self.csv_path = csv_path
+        self.engine = engine
 
-    def save_state(self, accounts: Dict[str, Account]):
+    def save_state(self, accounts: MutableMapping[str, Account]):
         logger.info(f'Saving bank state to {self.csv_path}')
-        data = [{'account_id': account.account_id, 'name': account.name, 'balance': str(account.balance)}
-                for account in accounts.values()]
-        pd.DataFrame.from_records(data).to_csv(self.csv_path, index=False)
+        # Write to a temporary file and rename it into place, so a crash mid-write never
+        # leaves a truncated state file behind
+        tmp_path = self.csv_path.with_name(self.csv_path.name + '.tmp')
+        with open(tmp_path, 'w', newline='') as f:
+            if self.engine == 'pandas':
+                self._write_dataframe(f, accounts)
+            else:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerow(FIELDNAMES)
+                writer.writerows((account.account_id, account.name, str(account.balance))
+                                 for account in accounts.values())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.csv_path)
 
-    def load_state(self) -> Dict[str, Account]:
+    def load_state(self, accounts: Optional[MutableMapping[str, Account]] = None) -> MutableMapping[str, Account]:
+        # Accounts are loaded into the given mapping, e.g. an AccountStore, or into a new dict
+        if accounts is None:
+            accounts = dict()
         if self.csv_path.is_file():
             print(f'Loading state from {self.csv_path}')
-            state_df = pd.read_csv(self.csv_path, converters={'account_id': str,
-                                                              'balance': str})
-            return {
-                account['account_id']: Account(account_id=account['account_id'],
-                                               name=account['name'],
-                                               balance=Decimal(account['balance']))
-                for account in state_df.to_dict(orient='records')
-            }
+            for account in (self._read_dataframe() if self.engine == 'pandas' else self.iter_accounts()):
+                accounts[account.account_id] = account
         else:
             print(f'Unable to find state init file from {self.csv_path}, start a fresh state')
-            return dict()
+        return accounts
+
+    def iter_accounts(self) -> Iterator[Account]:
+        with open(self.csv_path, 'r', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return
+            id_column, name_column, balance_column = (header.index(field) for field in FIELDNAMES)
+            for row in reader:
+                yield Account(account_id=row[id_column],
+                              name=row[name_column],
+                              balance=Decimal(row[balance_column]))
+
+    @staticmethod
+    def _write_dataframe(f, accounts: MutableMapping[str, Account]):
+        import pandas as pd
+
+        data = [{'account_id': str(account.account_id), 'name': account.name, 'balance': str(account.balance)}
+                for account in accounts.values()]
+        pd.DataFrame.from_records(data, columns=FIELDNAMES).to_csv(f, index=False)
+
+    def _read_dataframe(self) -> Iterator[Account]:
+        import pandas as pd
+
+        state_df = pd.read_csv(self.csv_path, converters={'account_id': str,
+                                                          'balance': str})
+        for account in state_df.to_dict(orient='records'):
+            yield Account(account_id=account['account_id'],
+                          name=account['name'],
+                          balance=Decimal(account['balance']))
+
+
+def create_repository(path: Path,
+                      engine: str = 'csv') -> Union[Repository, 'SnapshotRepository', 'ParquetRepository',
+                                                    'SqliteRepository']:
+    # The file extension picks the format, anything but a binary snapshot, a Parquet file or a SQLite
+    # database is a csv
+    from src.parquet import PARQUET_SUFFIX, ParquetRepository
+    from src.snapshot import SNAPSHOT_SUFFIX, SnapshotRepository
+    from src.sqlite import SQLITE_SUFFIXES, SqliteRepository
+
+    if path.suffix == SNAPSHOT_SUFFIX:
+        return SnapshotRepository(path)
+    if path.suffix == PARQUET_SUFFIX:
+        return ParquetRepository(path)
+    if path.suffix in SQLITE_SUFFIXES:
+        return SqliteRepository(path)
+    return Repository(path, engine=engine)
@@ -0,0 +1,282 @@
+import csv
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from operator import attrgetter
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from uuid import uuid4
+
+from src.exception import BankException
+
+logger = logging.getLogger(__name__)
+
+# What happens to the runs of a recurring transfer that fell due while the bank was down: it runs
+# once for all of them, or once for each
+MISFIRE_ONCE = 'once'
+MISFIRE_ALL = 'all'
+MISFIRES = (MISFIRE_ONCE, MISFIRE_ALL)
+
+FIELDNAMES = ['schedule_id', 'from_account_id', 'to_account_id', 'amount', 'due', 'every']
+
+
+class SchedulerNotEnabledException(BankException):
+    def __str__(self):
+        return 'Scheduled transfers are not enabled for this bank'
+
+
+class ScheduleNotFoundException(BankException):
+    def __init__(self, schedule_id: str):
+        self.schedule_id = schedule_id
+
+    def __str__(self):
+        return f'Unable to find scheduled transfer {self.schedule_id}'
+
+
+class InvalidScheduleException(BankException):
+    pass
+
+
+class ScheduledTransfer(NamedTuple):
+    schedule_id: str
+    from_account_id: str
+    to_account_id: str
+    amount: Decimal
+    # Wall clock time of the next run, in seconds since the epoch
+    due: float
+    # Seconds between the runs of a recurring transfer, None for a one-off
+    every: Optional[float] = None
+
+    def to_row(self) -> List[str]:
+        return [self.schedule_id, str(self.from_account_id), str(self.to_account_id), str(self.amount),
+                repr(self.due), '' if self.every is None else repr(self.every)]
+
+    @classmethod
+    def from_row(cls, row: Sequence[str]) -> 'ScheduledTransfer':
+        schedule_id, from_account_id, to_account_id, amount, due, every = row
+        return cls(schedule_id, from_account_id, to_account_id, Decimal(amount), float(due),
+                   float(every) if every else None)
+
+    def __str__(self):
+        text = (f'{self.schedule_id}: {self.amount} from account {self.from_account_id} to account '
+                f'{self.to_account_id} at {datetime.fromtimestamp(self.due):%Y-%m-%d %H:%M:%S}')
+        if self.every is not None:
+            text += f', every {timedelta(seconds=self.every)}'
+        return text
+
+
+class ScheduleRun(NamedTuple):
+    # One row per run, with the time it was due, in the order they fell due
+    transfers: List[ScheduledTransfer]
+    # BatchStatus of every run, APPLIED for the ones that moved money
+    statuses: List[int]
+
+    @property
+    def rejected_rows(self) -> List[int]:
+        return [row for row, status in enumerate(self.statuses) if status]
+
+    def __str__(self):
+        return f'Ran {len(self.transfers) - len(self.rejected_rows)} of {len(self.transfers)} due transfers'
+
+
+class TransferScheduler:
+    # Future-dated and recurring transfers, kept in a binary heap by due time: adding one and taking
+    # a due one out cost O(log n). A cancelled transfer stays in the heap until it comes up, or until
+    # cancelled entries make up half of it and it is rebuilt. Saved with the bank state, changes
+    # since then are in the journal.
+    def __init__(self,
+                 path: Optional[Path] = None,
+                 misfire: str = MISFIRE_ONCE,
+                 clock: Callable[[], float] = time.time):
+        if misfire not in MISFIRES:
+            raise ValueError(f'Unknown misfire policy {misfire}, expected one of {", ".join(MISFIRES)}')
+        self.path = path
+        self.misfire = misfire
+        # Wall clock time, due times outlive the process
+        self.clock = clock
+        self._schedules: Dict[str, ScheduledTransfer] = {}
+        # (due, sequence, schedule_id), the sequence keeps transfers due at the same time in the order
+        # they were added. Entries whose schedule is gone or due at another time are stale.
+        self._heap: List[Tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._stale = 0
+        # The bank holds it across a change and its journal record, so records are in the order of the
+        # changes. Taken before any account lock.
+        self.lock = threading.RLock()
+
+    def add(self,
+            from_account_id: str,
+            to_account_id: str,
+            amount: Decimal,
+            due: float,
+            every: Optional[float] = None) -> ScheduledTransfer:
+        if not amount > 0:
+            raise InvalidScheduleException(f'Scheduled amount {amount} must be positive')
+        if every is not None and not every > 0:
+            raise InvalidScheduleException(f'Interval of {every} seconds must be positive')
+        transfer = ScheduledTransfer(str(uuid4()), from_account_id, to_account_id, amount, due, every)
+        self.put(transfer)
+        return transfer
+
+    def put(self, transfer: ScheduledTransfer):
+        with self.lock:
+            previous = self._schedules.get(transfer.schedule_id)
+            self._schedules[transfer.schedule_id] = transfer
+            if previous is not None:
+                if previous.due == transfer.due:
+                    # Its heap entry still stands
+                    return
+                self._stale += 1
+            heapq.heappush(self._heap, (transfer.due, next(self._sequence), transfer.schedule_id))
+
+    def get(self, schedule_id: str) -> ScheduledTransfer:
+        try:
+            return self._schedules[schedule_id]
+        except KeyError:
+            raise ScheduleNotFoundException(schedule_id) from None
+
+    def cancel(self, schedule_id: str) -> ScheduledTransfer:
+        with self.lock:
+            transfer = self.get(schedule_id)
+            self._remove(schedule_id)
+        return transfer
+
+    def _remove(self, schedule_id: str):
+        del self._schedules[schedule_id]
+        self._stale += 1
+        if self._stale > len(self._schedules):
+            self._rebuild()
+
+    def _rebuild(self):
+        self._heap = [(transfer.due, next(self._sequence), schedule_id)
+                      for schedule_id, transfer in self._schedules.items()]
+        heapq.heapify(self._heap)
+        self._stale = 0
+
+    def release_due(self, now: Optional[float] = None) -> Tuple[List[ScheduledTransfer],
+                                                                List[Tuple[str, Optional[ScheduledTransfer]]]]:
+        # Takes out every transfer due by now. Returns the runs, in due order and each with the time it
+        # was due, and the transfers released with what became of them: the next run of a recurring
+        # transfer, None for a one-off.
+        now = self.clock() if now is None else now
+        runs = []
+        released: Dict[str, Optional[ScheduledTransfer]] = {}
+        with self.lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                due, _, schedule_id = heapq.heappop(heap)
+                transfer = self._schedules.get(schedule_id)
+                if transfer is None or transfer.due != due:
+                    self._stale -= 1
+                    continue
+                if transfer.every is None:
+                    del self._schedules[schedule_id]
+                    runs.append(transfer)
+                    released[schedule_id] = None
+                    continue
+                # Runs missed while the bank was down, besides this one
+                missed = math.floor((now - due) / transfer.every)
+                if self.misfire == MISFIRE_ALL:
+                    runs.extend(transfer._replace(due=due + run * transfer.every) for run in range(missed + 1))
+                else:
+                    runs.append(transfer)
+                following = transfer._replace(due=due + (missed + 1) * transfer.every)
+                self._schedules[schedule_id] = following
+                heapq.heappush(heap, (following.due, next(self._sequence), schedule_id))
+                released[schedule_id] = following
+        if self.misfire == MISFIRE_ALL:
+            runs.sort(key=attrgetter('due'))
+        return runs, list(released.items())
+
+    def replay(self, changes: Sequence[Tuple[str, Optional[ScheduledTransfer]]]):
+        # Changes found in the journal, in order: a transfer as it was left, or None once it is gone
+        with self.lock:
+            for schedule_id, transfer in changes:
+                if transfer is not None:
+                    self.put(transfer)
+                elif schedule_id in self._schedules:
+                    self._remove(schedule_id)
+
+    def upcoming(self, limit: Optional[int] = None) -> List[ScheduledTransfer]:
+        with self.lock:
+            transfers = list(self._schedules.values())
+        if limit is None:
+            return sorted(transfers, key=attrgetter('due'))
+        return heapq.nsmallest(limit, transfers, key=attrgetter('due'))
+
+    @property
+    def next_due(self) -> Optional[float]:
+        with self.lock:
+            while self._heap:
+                due, _, schedule_id = self._heap[0]
+                transfer = self._schedules.get(schedule_id)
+                if transfer is not None and transfer.due == due:
+                    return due
+                heapq.heappop(self._heap)
+                self._stale -= 1
+        return None
+
+    def copy(self) -> 'TransferScheduler':
+        scheduler = TransferScheduler(self.path, self.misfire, self.clock)
+        with self.lock:
+            scheduler._schedules = self._schedules.copy()
+        return scheduler
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            transfers = list(self._schedules.values())
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(FIELDNAMES)
+            writer.writerows(transfer.to_row() for transfer in transfers)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        with self.lock:
+            self._schedules = {}
+            if self.path is not None and self.path.is_file():
+                with open(self.path, newline='') as f:
+                    rows = csv.reader(f)
+                    next(rows, None)
+                    for row in rows:
+                        transfer = ScheduledTransfer.from_row(row)
+                        self._schedules[transfer.schedule_id] = transfer
+                logger.info(f'Loaded {len(self._schedules)} scheduled transfers from {self.path}')
+            # One heapify of all of them, O(n) instead of n pushes
+            self._rebuild()
+
+    def __len__(self) -> int:
+        return len(self._schedules)
+
+
+class ScheduleTicker:
+    # Runs the due transfers of a bank every interval seconds on a daemon thread
+    def __init__(self, run_due: Callable[[], object], interval: float = 1.0):
+        self.run_due = run_due
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._tick, name='schedule-ticker', daemon=True)
+        self._thread.start()
+
+    def _tick(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_due()
+            except Exception:
+                logger.exception('Running due transfers failed')
+
+    def close(self):
+        # Waits for a tick in progress, so nothing is journaled after the bank is closed
+        self._stop.set()
+        self._thread.join()
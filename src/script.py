@@ -0,0 +1,137 @@
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, TextIO, Tuple
+
+from src.bank import Bank
+from src.commands import InvalidCommandException, commands, execute_command, parse_args
+from src.exception import BankException
+
+logger = logging.getLogger(__name__)
+
+# Output lines collected before they are written out in one go
+OUTPUT_BUFFER_LINES = 4096
+# Failures kept in the summary, the rest are only counted
+MAX_REPORTED_FAILURES = 100
+
+
+class ScriptSummary(NamedTuple):
+    commands: int
+    failed: int
+    elapsed: float
+    # (line number, message) of the first failures
+    failures: List[Tuple[int, str]]
+    # Whether the script stopped at a failure before its end
+    aborted: bool
+
+    @property
+    def ops_per_second(self) -> float:
+        return self.commands / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        lines = [f'Executed {self.commands} commands in {self.elapsed:.2f}s ({self.ops_per_second:.0f} ops/sec), '
+                 f'{self.failed} failed']
+        lines.extend(f'- line {line_number}: {message}' for line_number, message in self.failures)
+        if self.failed > len(self.failures):
+            lines.append(f'- and {self.failed - len(self.failures)} more')
+        if self.aborted:
+            lines.append('Stopped at the first failure')
+        return '\n'.join(lines)
+
+
+class _CommandSpec(NamedTuple):
+    arity: int
+    # Positions of the arguments converted to Decimal
+    numeric_positions: Tuple[int, ...]
+    # Arguments that need more than that, e.g. dates or optional arguments, are parsed like in the CLI
+    parsed: bool
+
+
+# Kinds of arguments that make a command go through parse_args
+PARSED_ARGS = ('optional_args', 'integer_args', 'datetime_args', 'duration_args')
+# The commands table resolved once into arity and numeric positions, so a line costs one dict lookup
+COMMAND_SPECS: Dict[str, _CommandSpec] = {
+    command: _CommandSpec(arity=len(details['args']),
+                          numeric_positions=tuple(position for position, arg in enumerate(details['args'])
+                                                  if arg in details.get('numeric_args', [])),
+                          parsed=any(key in details for key in PARSED_ARGS))
+    for command, details in commands.items()
+}
+
+
+def run_script(bank: Bank,
+               lines: Iterable[str],
+               output: Optional[TextIO] = None,
+               continue_on_error: bool = False,
+               checkpoint_every: Optional[int] = None) -> ScriptSummary:
+    # Runs one command per line without the interactive banners. Command output is only formatted
+    # when an output stream is given. Blank lines are skipped and "exit" ends the script.
+    buffer: List[str] = []
+    # Commands named after a bank method call it directly when there is no output to format
+    methods: Dict[str, Callable] = {command: getattr(bank, command) for command, spec in COMMAND_SPECS.items()
+                                    if command != 'exit' and not spec.parsed
+                                    and callable(getattr(bank, command, None))}
+    executed = failed = 0
+    failures = []
+    aborted = False
+    started = time.perf_counter()
+
+    for line_number, line in enumerate(lines, start=1):
+        parts = line.split()
+        if not parts:
+            continue
+        command = parts[0]
+        if command == 'exit':
+            break
+        executed += 1
+        try:
+            spec = COMMAND_SPECS.get(command)
+            if spec is not None and spec.parsed:
+                command_output = execute_command(bank, command, parse_args(command, parts[1:]))
+                if output is not None:
+                    buffer.extend(command_output)
+            else:
+                args = _parse_args(command, parts)
+                if output is None and command in methods:
+                    methods[command](*args)
+                else:
+                    command_output = execute_command(bank, command, dict(zip(commands[command]['args'], args)))
+                    if output is not None:
+                        buffer.extend(command_output)
+        except BankException as e:
+            failed += 1
+            if len(failures) < MAX_REPORTED_FAILURES:
+                failures.append((line_number, str(e)))
+            if output is not None:
+                buffer.append(f'line {line_number}: {e}')
+            if not continue_on_error:
+                aborted = True
+                break
+
+        if checkpoint_every and executed % checkpoint_every == 0:
+            logger.info(f'Checkpointing bank state after {executed} commands')
+            bank.save_state()
+        if len(buffer) >= OUTPUT_BUFFER_LINES:
+            output.write('\n'.join(buffer) + '\n')
+            buffer.clear()
+
+    if buffer:
+        output.write('\n'.join(buffer) + '\n')
+    return ScriptSummary(commands=executed, failed=failed, elapsed=time.perf_counter() - started,
+                         failures=failures, aborted=aborted)
+
+
+def _parse_args(command: str, parts: List[str]) -> list:
+    spec = COMMAND_SPECS.get(command)
+    if spec is None:
+        raise InvalidCommandException('Invalid command. Please try again.')
+    args = parts[1:]
+    if len(args) != spec.arity:
+        raise InvalidCommandException('Invalid number of arguments. Please try again.')
+    for position in spec.numeric_positions:
+        try:
+            args[position] = Decimal(args[position])
+        except InvalidOperation:
+            raise InvalidCommandException(f'{commands[command]["args"][position]} should be in numerical format. '
+                                          f'Please try again.')
+    return args
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from typing import Optional, Tuple
+
+from src.bank import Bank
+from src.commands import execute_command, parse_command
+from src.exception import BankException
+
+logger = logging.getLogger(__name__)
+
+# Separates the output lines of a command within its single response line
+LINE_SEPARATOR = ' | '
+
+
+class BankServer:
+    # Serves the CLI commands over TCP, one command per line. Clients may pipeline any number of
+    # requests; responses come back in request order as "OK <output>" or "ERR <message>". A request
+    # line starting with "#<tag> " gets its response prefixed with the same tag.
+    #
+    # All connections feed one bounded queue that a single worker drains against the bank, so the
+    # bank needs no locking and a full queue stops the server from reading more requests.
+    def __init__(self, bank: Bank, host: str = '127.0.0.1', port: int = 8765, max_queue: int = 1024):
+        self.bank = bank
+        self.host = host
+        self.port = port
+        self.max_queue = max_queue
+        self._requests: Optional[asyncio.Queue] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._requests = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._execute_requests())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Port 0 binds a free port, report the one actually used
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f'Serving the Banking CLI commands on {self.host}:{self.port}')
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._worker.cancel()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        responses = asyncio.Queue()
+        responder = asyncio.create_task(self._write_responses(responses, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                tag, user_input = self._split_tag(line.decode().strip())
+                if user_input.split()[:1] == ['exit']:
+                    break
+                response = asyncio.get_running_loop().create_future()
+                await responses.put((tag, response))
+                # Waits while the queue is full, which leaves further requests unread in the socket
+                await self._requests.put((user_input, response))
+        except ConnectionError:
+            pass
+        finally:
+            await responses.put(None)
+            await responder
+
+    @staticmethod
+    def _split_tag(line: str) -> Tuple[str, str]:
+        if line.startswith('#'):
+            tag, _, user_input = line.partition(' ')
+            return tag + ' ', user_input
+        return '', line
+
+    @staticmethod
+    async def _write_responses(responses: asyncio.Queue, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                item = await responses.get()
+                if item is None:
+                    break
+                tag, response = item
+                writer.write(f'{tag}{await response}\n'.encode())
+                if responses.empty():
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _execute_requests(self):
+        while True:
+            user_input, response = await self._requests.get()
+            try:
+                command, command_args = parse_command(user_input)
+                if command == 'save_state':
+                    # Writing the state file would stall every connection's IO, run it in a thread.
+                    # The worker still waits for it, so no other command runs meanwhile.
+                    lines = await asyncio.to_thread(execute_command, self.bank, command, command_args)
+                else:
+                    lines = execute_command(self.bank, command, command_args)
+                response.set_result('OK ' + LINE_SEPARATOR.join(lines))
+            except BankException as e:
+                response.set_result(f'ERR {e}')
+            except Exception as e:
+                logger.exception(f'Failed to execute {user_input}')
+                response.set_result(f'ERR {type(e).__name__}: {e}')
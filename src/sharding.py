@@ -0,0 +1,520 @@
+import csv
+import heapq
+import logging
+import multiprocessing
+import os
+import threading
+import zlib
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, List, Optional, Sequence, Set, Tuple
+from uuid import uuid4
+
+from src.account import Account
+from src.account_helper import AccountHelper
+from src.aggregates import BalanceSummary
+from src.bank import Bank
+from src.exception import BankException
+from src.journal import ABORTED, COMMITTED, PREPARED, Journal
+from src.ledger import LedgerEntry, LedgerNotEnabledException
+from src.money import check_amount
+from src.repository import create_repository
+from src.scheduler import ScheduledTransfer, ScheduleRun, SchedulerNotEnabledException
+from src.stats import Stats, StatsNotEnabledException
+
+logger = logging.getLogger(__name__)
+
+DEBIT = 'debit'
+CREDIT = 'credit'
+# Shard methods that change transaction state, their reply waits for the journal to be on disk
+DURABLE_METHODS = ('prepare_debit', 'prepare_credit', 'commit', 'abort', 'run_many')
+CLOSE = 'close'
+
+COMMIT_RECORD = 'C'
+DONE_RECORD = 'D'
+
+
+class ShardUnavailableException(BankException):
+    def __init__(self, shard: int):
+        self.shard = shard
+
+    def __str__(self):
+        return f'Shard {self.shard} is unavailable'
+
+
+class ShardedOperationNotSupportedException(BankException):
+    def __init__(self, operation: str):
+        self.operation = operation
+
+    def __str__(self):
+        return f'{self.operation} is not supported with --shards'
+
+
+def shard_of(account_id: str, shards: int) -> int:
+    # crc32 rather than hash(), which differs between processes
+    return zlib.crc32(account_id.encode()) % shards
+
+
+def shard_paths(state_path: Path, shard: int) -> Tuple[Path, Path]:
+    # state.csv -> state.shard0.csv and state.shard0.journal
+    name = f'{state_path.stem}.shard{shard}'
+    return state_path.with_name(name + state_path.suffix), state_path.with_name(name + '.journal')
+
+
+class ShardAccountHelper(AccountHelper):
+    # Draws ids until one hashes to this shard, so accounts can be routed by id alone
+    def __init__(self, shard: int, shards: int):
+        super().__init__()
+        self.shard = shard
+        self.shards = shards
+
+    def create_account_id(self) -> str:
+        while True:
+            account_id = super().create_account_id()
+            if shard_of(account_id, self.shards) == self.shard:
+                return account_id
+
+
+class Shard:
+    # The accounts of one shard, with the participant side of two-phase commit. A prepared
+    # debit takes the money out of the account right away, so nothing can spend it twice; a
+    # prepared credit only deposits on commit. Prepared transactions live in the journal.
+    def __init__(self, bank: Bank):
+        if bank.journal is None:
+            raise ValueError('A shard needs a journal to keep prepared transactions')
+        self.bank = bank
+        self.journal = bank.journal
+
+    def create_account(self, name: str, balance: Decimal) -> Account:
+        return self._copy(self.bank.create_account(name, balance))
+
+    def get_account(self, account_id: str) -> Account:
+        return self._copy(self.bank.get_account(account_id))
+
+    def deposit(self, account_id: str, amount: Decimal) -> Account:
+        return self._copy(self.bank.deposit(account_id, amount))
+
+    def withdraw(self, account_id: str, amount: Decimal) -> Account:
+        return self._copy(self.bank.withdraw(account_id, amount))
+
+    def transfer(self, from_account_id: str, to_account_id: str, amount: Decimal) -> Tuple[Account, Account]:
+        from_account, to_account = self.bank.transfer(from_account_id, to_account_id, amount)
+        return self._copy(from_account), self._copy(to_account)
+
+    def find_accounts_by_name(self, name: str) -> List[Account]:
+        return [self._copy(account) for account in self.bank.find_accounts_by_name(name)]
+
+    def find_accounts_by_name_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Account]:
+        return [self._copy(account) for account in self.bank.find_accounts_by_name_prefix(prefix, limit)]
+
+    def summary(self) -> BalanceSummary:
+        return self.bank.summary()
+
+    def top_accounts(self, n: int) -> List[Account]:
+        return [self._copy(account) for account in self.bank.top_accounts(n)]
+
+    def save_state(self):
+        self.bank.save_state()
+
+    def prepare_debit(self, transaction_id: str, account_id: str, amount: Decimal):
+        check_amount(amount, self.bank.scale)
+        with self.bank.locks.hold(account_id):
+            account = self.bank.get_account(account_id)
+            self.bank.balances_changing(account)
+            account.withdraw(amount)
+            self.journal.append_transaction(transaction_id, PREPARED, [DEBIT, account_id, str(amount)], [account])
+            self.bank.balances_changed(account)
+
+    def prepare_credit(self, transaction_id: str, account_id: str, amount: Decimal):
+        # Votes yes only if the deposit on commit cannot fail, the coordinator may already have decided by then
+        check_amount(amount, self.bank.scale)
+        self.bank.get_account(account_id)
+        self.journal.append_transaction(transaction_id, PREPARED, [CREDIT, account_id, str(amount)])
+
+    def commit(self, transaction_id: str) -> Optional[Account]:
+        # Committing twice is harmless, the second time the transaction is no longer known
+        return self._finish(transaction_id, COMMITTED, deposit_on=CREDIT)
+
+    def abort(self, transaction_id: str) -> Optional[Account]:
+        return self._finish(transaction_id, ABORTED, deposit_on=DEBIT)
+
+    def _finish(self, transaction_id: str, state: str, deposit_on: str) -> Optional[Account]:
+        details = self.journal.transactions.get(transaction_id)
+        if details is None:
+            return None
+        kind, account_id, amount = details
+        with self.bank.locks.hold(account_id):
+            account = self.bank.get_account(account_id)
+            if kind == deposit_on:
+                self.bank.balances_changing(account)
+                account.deposit(Decimal(amount))
+                self.journal.append_transaction(transaction_id, state, accounts=[account])
+                self.bank.balances_changed(account)
+            else:
+                self.journal.append_transaction(transaction_id, state)
+        return self._copy(account)
+
+    def pending_transactions(self) -> List[str]:
+        return list(self.journal.transactions)
+
+    def run_many(self, requests: Sequence[Tuple[str, tuple]]) -> List[Optional[BankException]]:
+        # Runs the requests in order, returning None or the exception of every request
+        results = []
+        for method, args in requests:
+            try:
+                getattr(self, method)(*args)
+                results.append(None)
+            except BankException as e:
+                results.append(e)
+            except Exception as e:
+                # e.g. an amount that is not a Decimal, which must not fail the other requests
+                results.append(BankException(f'{type(e).__name__}: {e}'))
+        return results
+
+    @staticmethod
+    def _copy(account: Account) -> Account:
+        # Accounts are sent to the coordinator, and views would drag their whole store along
+        return Account(account.account_id, account.name, account.balance)
+
+
+def _run_shard(shard: int, shards: int, state_path: Path, journal_path: Path, connection):
+    bank = Bank(account_helper=ShardAccountHelper(shard, shards),
+                repository=create_repository(state_path),
+                journal=Journal(journal_path))
+    participant = Shard(bank)
+    # Tells the coordinator the state is loaded
+    connection.send((True, None))
+    while True:
+        try:
+            method, args = connection.recv()
+        except EOFError:
+            break
+        if method == CLOSE:
+            break
+        try:
+            reply = (True, getattr(participant, method)(*args))
+        except BankException as e:
+            reply = (False, e)
+        except Exception as e:
+            logger.exception(f'Shard {shard} failed to run {method}')
+            reply = (False, BankException(f'{type(e).__name__}: {e}'))
+        if method in DURABLE_METHODS:
+            # Votes and outcomes must not be lost once the coordinator has seen them
+            bank.journal.sync()
+        connection.send(reply)
+    bank.close()
+    connection.close()
+
+
+class CoordinatorLog:
+    # Commit decisions of cross-shard transfers. A transfer is committed once its decision is on
+    # disk, until then it is presumed aborted. Decisions stay until every shard has applied them.
+    def __init__(self, log_path: Path):
+        self.log_path = log_path
+        self.committed: Set[str] = set()
+        if log_path.is_file():
+            with open(log_path, 'r', newline='') as f:
+                for row in csv.reader(f):
+                    if row and row[0] == COMMIT_RECORD:
+                        self.committed.add(row[1])
+                    elif row and row[0] == DONE_RECORD:
+                        self.committed.discard(row[1])
+        self._file = open(log_path, 'a', newline='')
+        self._lock = threading.Lock()
+
+    def commit(self, transaction_ids: Sequence[str]):
+        with self._lock:
+            self._file.writelines(f'{COMMIT_RECORD},{transaction_id}\n' for transaction_id in transaction_ids)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.committed.update(transaction_ids)
+
+    def done(self, transaction_ids: Sequence[str]):
+        # Not synced: a lost done record only makes recovery commit the transaction again
+        with self._lock:
+            self._file.writelines(f'{DONE_RECORD},{transaction_id}\n' for transaction_id in transaction_ids)
+            self._file.flush()
+            self.committed.difference_update(transaction_ids)
+
+    def compact(self):
+        with self._lock:
+            self._file.close()
+            tmp_path = self.log_path.with_name(self.log_path.name + '.tmp')
+            with open(tmp_path, 'w', newline='') as f:
+                f.writelines(f'{COMMIT_RECORD},{transaction_id}\n' for transaction_id in self.committed)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.log_path)
+            self._file = open(self.log_path, 'a', newline='')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ShardedBank:
+    # Coordinator of a bank partitioned over worker processes by a hash of the account id. Every
+    # shard owns its state file and journal, deposits and withdrawals go to the owning shard and
+    # transfers between shards run as two-phase commit. The number of shards of a state must not change.
+    def __init__(self, state_path: Path, shards: int):
+        self.shards = shards
+        self.coordinator_log = CoordinatorLog(state_path.with_name(f'{state_path.stem}.coordinator'))
+        # fork, as spawn would run main.py again in every worker
+        context = multiprocessing.get_context('fork')
+        self._connections = []
+        self._processes = []
+        for shard in range(shards):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=_run_shard, args=(shard, shards, *shard_paths(state_path, shard),
+                                                                worker_connection), daemon=True)
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._next_shard = 0
+        for shard, connection in enumerate(self._connections):
+            self._receive(shard, connection)
+        self.recover()
+
+    def recover(self):
+        # Finishes the transfers interrupted by a crash: committed ones are committed on every shard,
+        # everything else prepared is aborted
+        for shard in range(self.shards):
+            for transaction_id in self._call(shard, 'pending_transactions'):
+                if transaction_id in self.coordinator_log.committed:
+                    logger.info(f'Recovering committed transfer {transaction_id} on shard {shard}')
+                    self._call(shard, 'commit', transaction_id)
+                else:
+                    logger.info(f'Aborting transfer {transaction_id} prepared on shard {shard}')
+                    self._call(shard, 'abort', transaction_id)
+        self.coordinator_log.committed.clear()
+        self.coordinator_log.compact()
+
+    def create_account(self, name: str, balance: Decimal = Decimal('0')) -> Account:
+        shard = self._next_shard
+        self._next_shard = (shard + 1) % self.shards
+        return self._call(shard, 'create_account', name, balance)
+
+    def get_account(self, account_id: str) -> Account:
+        return self._call(shard_of(account_id, self.shards), 'get_account', account_id)
+
+    def deposit(self, account_id: str, amount: Decimal) -> Account:
+        return self._call(shard_of(account_id, self.shards), 'deposit', account_id, amount)
+
+    def withdraw(self, account_id: str, amount: Decimal) -> Account:
+        return self._call(shard_of(account_id, self.shards), 'withdraw', account_id, amount)
+
+    def transfer(self, from_account_id: str, to_account_id: str, amount: Decimal) -> Tuple[Account, Account]:
+        source, target = shard_of(from_account_id, self.shards), shard_of(to_account_id, self.shards)
+        if source == target:
+            return self._call(source, 'transfer', from_account_id, to_account_id, amount)
+
+        # Nothing is prepared for an amount either shard would refuse
+        check_amount(amount)
+        transaction_id = uuid4().hex
+        self._call(source, 'prepare_debit', transaction_id, from_account_id, amount)
+        try:
+            self._call(target, 'prepare_credit', transaction_id, to_account_id, amount)
+        except BankException:
+            self._call(source, 'abort', transaction_id)
+            raise
+        self.coordinator_log.commit([transaction_id])
+        from_account = self._call(source, 'commit', transaction_id)
+        to_account = self._call(target, 'commit', transaction_id)
+        self.coordinator_log.done([transaction_id])
+        return from_account, to_account
+
+    def find_accounts_by_name(self, name: str) -> List[Account]:
+        return [account for shard in range(self.shards)
+                for account in self._call(shard, 'find_accounts_by_name', name)]
+
+    def find_accounts_by_name_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Account]:
+        accounts = [account for shard in range(self.shards)
+                    for account in self._call(shard, 'find_accounts_by_name_prefix', prefix, limit)]
+        return accounts[:limit]
+
+    def summary(self) -> BalanceSummary:
+        # Money of a transfer between shards that is prepared but not committed is not counted
+        summaries = [self._call(shard, 'summary') for shard in range(self.shards)]
+        histogram = [(bound, sum(summary.histogram[bucket][1] for summary in summaries))
+                     for bucket, (bound, _) in enumerate(summaries[0].histogram)]
+        return BalanceSummary(accounts=sum(summary.accounts for summary in summaries),
+                              total=sum((summary.total for summary in summaries), Decimal('0')),
+                              histogram=histogram)
+
+    def top_accounts(self, n: int) -> List[Account]:
+        # The n richest of every shard, merged
+        accounts = [account for shard in range(self.shards) for account in self._call(shard, 'top_accounts', n)]
+        return heapq.nsmallest(n, accounts, key=lambda account: (-account.balance, account.account_id))
+
+    def queue_transfer(self, from_account_id: str, to_account_id: str, amount: Decimal) -> int:
+        # Netting a window moves money between shards without a two-phase commit per transfer
+        raise ShardedOperationNotSupportedException('queue_transfer')
+
+    @property
+    def pending_transfers(self) -> int:
+        return 0
+
+    def settle(self):
+        raise ShardedOperationNotSupportedException('settle')
+
+    def schedule_transfer(self,
+                          from_account_id: str,
+                          to_account_id: str,
+                          amount: Decimal,
+                          at: datetime,
+                          every: Optional[timedelta] = None) -> ScheduledTransfer:
+        # The shards keep no schedules
+        raise SchedulerNotEnabledException()
+
+    def cancel_schedule(self, schedule_id: str) -> ScheduledTransfer:
+        raise SchedulerNotEnabledException()
+
+    def get_schedules(self, limit: Optional[int] = None) -> List[ScheduledTransfer]:
+        raise SchedulerNotEnabledException()
+
+    def run_due_transfers(self, now: Optional[datetime] = None) -> ScheduleRun:
+        raise SchedulerNotEnabledException()
+
+    def get_statement(self,
+                      account_id: str,
+                      since: Optional[datetime] = None,
+                      until: Optional[datetime] = None,
+                      limit: Optional[int] = None,
+                      newest_first: bool = False) -> List[LedgerEntry]:
+        # The shards keep no ledger
+        raise LedgerNotEnabledException()
+
+    def get_stats(self) -> Stats:
+        # Operations run in the shard processes, which are not instrumented
+        raise StatsNotEnabledException()
+
+    def save_state(self):
+        for shard in range(self.shards):
+            self._call(shard, 'save_state')
+
+    def run_many(self, operations: Sequence[Sequence]) -> List[Optional[BankException]]:
+        # Operations are ('deposit', account_id, amount), ('withdraw', account_id, amount) or
+        # ('transfer', from_account_id, to_account_id, amount). Every shard gets its part of the
+        # operations as one message and the shards run them in parallel, in order per shard.
+        # Transfers between shards are prepared in that order and committed together afterwards,
+        # so a deposit they make is not seen by later operations of the same call.
+        requests: List[List[Tuple[str, tuple]]] = [[] for _ in range(self.shards)]
+        # Where the result of every operation comes from, as (shard, request number) pairs
+        result_slots: List[List[Tuple[int, int]]] = []
+        transactions: List[Tuple[str, int, int]] = []
+        for operation in operations:
+            if operation[0] == 'transfer':
+                source, target = shard_of(operation[1], self.shards), shard_of(operation[2], self.shards)
+                if source != target:
+                    transaction_id = uuid4().hex
+                    requests[source].append(('prepare_debit', (transaction_id, operation[1], operation[3])))
+                    requests[target].append(('prepare_credit', (transaction_id, operation[2], operation[3])))
+                    result_slots.append([(source, len(requests[source]) - 1), (target, len(requests[target]) - 1)])
+                    transactions.append((transaction_id, source, target))
+                    continue
+            shard = shard_of(operation[1], self.shards)
+            requests[shard].append((operation[0], tuple(operation[1:])))
+            result_slots.append([(shard, len(requests[shard]) - 1)])
+
+        try:
+            results = self._call_all('run_many', requests)
+        except BankException:
+            # Nothing is committed, every transfer this call prepared is rolled back. A shard that did not
+            # answer rolls its transfers back when the bank starts again.
+            if transactions:
+                self._abort_all(transactions)
+            raise
+        votes = {transaction_id: (results[source][number], results[target][number_])
+                 for (transaction_id, source, target), ((_, number), (_, number_))
+                 in zip(transactions, (slots for slots in result_slots if len(slots) == 2))}
+        committed = [transaction_id for transaction_id, (debit, credit) in votes.items()
+                     if debit is None and credit is None]
+        if committed:
+            self.coordinator_log.commit(committed)
+        outcomes: List[List[Tuple[str, tuple]]] = [[] for _ in range(self.shards)]
+        for transaction_id, source, target in transactions:
+            debit, credit = votes[transaction_id]
+            if debit is None and credit is None:
+                outcomes[source].append(('commit', (transaction_id,)))
+                outcomes[target].append(('commit', (transaction_id,)))
+            elif debit is None:
+                outcomes[source].append(('abort', (transaction_id,)))
+            elif credit is None:
+                outcomes[target].append(('abort', (transaction_id,)))
+        if transactions:
+            self._call_all('run_many', outcomes)
+        if committed:
+            self.coordinator_log.done(committed)
+
+        return [next((results[shard][number] for shard, number in slots if results[shard][number] is not None), None)
+                for slots in result_slots]
+
+    def _abort_all(self, transactions: List[Tuple[str, int, int]]):
+        outcomes: List[List[Tuple[str, tuple]]] = [[] for _ in range(self.shards)]
+        for transaction_id, source, target in transactions:
+            outcomes[source].append(('abort', (transaction_id,)))
+            outcomes[target].append(('abort', (transaction_id,)))
+        try:
+            self._call_all('run_many', outcomes)
+        except BankException:
+            logger.exception('Unable to abort the transfers of a failed call on every shard')
+
+    def close(self):
+        for shard, connection in enumerate(self._connections):
+            with self._locks[shard]:
+                try:
+                    connection.send((CLOSE, ()))
+                except OSError:
+                    pass
+                connection.close()
+        for process in self._processes:
+            process.join()
+        self.coordinator_log.close()
+
+    def _call(self, shard: int, method: str, *args) -> Any:
+        with self._locks[shard]:
+            connection = self._connections[shard]
+            try:
+                connection.send((method, args))
+            except OSError:
+                raise ShardUnavailableException(shard)
+            return self._receive(shard, connection)
+
+    def _call_all(self, method: str, args_by_shard: List[Any]) -> List[Any]:
+        # Sends to every shard before waiting for any, locking in shard order like StripedLocks
+        shards = [shard for shard, args in enumerate(args_by_shard) if args]
+        results = [[] for _ in range(self.shards)]
+        errors: List[BankException] = []
+        with ExitStack() as stack:
+            for shard in shards:
+                stack.enter_context(self._locks[shard])
+            sent = []
+            for shard in shards:
+                try:
+                    self._connections[shard].send((method, (args_by_shard[shard],)))
+                    sent.append(shard)
+                except OSError:
+                    errors.append(ShardUnavailableException(shard))
+            # Every reply is read before failing, so none is left behind for the next call to a shard
+            for shard in sent:
+                try:
+                    results[shard] = self._receive(shard, self._connections[shard])
+                except BankException as e:
+                    errors.append(e)
+        if errors:
+            raise errors[0]
+        return results
+
+    @staticmethod
+    def _receive(shard: int, connection) -> Any:
+        try:
+            ok, result = connection.recv()
+        except (EOFError, OSError):
+            raise ShardUnavailableException(shard)
+        if not ok:
+            raise result
+        return result
@@ -0,0 +1,247 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+import zlib
+from argparse import ArgumentParser
+from array import array
+from collections.abc import MutableMapping
+from decimal import Decimal
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Set
+
+from src.account import Account, InvalidAccountOperationException
+from src.money import MINOR_UNIT_SCALE, from_minor_units, to_minor_units
+from src.repository import Repository
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIX = '.bin'
+MAGIC = b'BANKSNAP'
+VERSION = 1
+# magic, version, scale, id width, name width, record count, hash table slots
+HEADER = struct.Struct('<8sIIIIQQ')
+HEADER_SIZE = 64
+SLOT = struct.Struct('<I')
+EMPTY_SLOT = 0
+
+
+# Layout, all little-endian:
+#   header, padded to HEADER_SIZE bytes
+#   records: account id and name as NUL padded utf-8 of the widths in the header, balance as int64 minor units
+#   hash table: open addressing with linear probing on crc32 of the account id, every slot holds
+#               record number + 1 or EMPTY_SLOT, and at least half of the slots are empty
+def write_snapshot(snapshot_path: Path, accounts: Iterable[Account], scale: int = MINOR_UNIT_SCALE):
+    rows = [(account.account_id.encode(), account.name.encode(), to_minor_units(account.balance, scale))
+            for account in accounts]
+    id_width = max((len(row[0]) for row in rows), default=0)
+    name_width = max((len(row[1]) for row in rows), default=0)
+    record = struct.Struct(f'<{id_width}s{name_width}sq')
+    slots = 2
+    while slots < 2 * len(rows):
+        slots *= 2
+
+    table = array('I', bytes(SLOT.size * slots))
+    mask = slots - 1
+    for number, (account_id, _, _) in enumerate(rows):
+        slot = zlib.crc32(account_id) & mask
+        while table[slot] != EMPTY_SLOT:
+            slot = (slot + 1) & mask
+        table[slot] = number + 1
+    if sys.byteorder == 'big':
+        table.byteswap()
+
+    # Written next to the snapshot and renamed into place, like the csv state
+    tmp_path = snapshot_path.with_name(snapshot_path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, scale, id_width, name_width, len(rows), slots).ljust(HEADER_SIZE, b'\0'))
+        for start in range(0, len(rows), 65536):
+            f.write(b''.join(record.pack(*row) for row in rows[start:start + 65536]))
+        table.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, snapshot_path)
+
+
+class MappedSnapshot:
+    # Read-only access to a snapshot file through mmap: opening it reads only the header and
+    # every lookup touches one hash table slot and one record on average
+    def __init__(self, snapshot_path: Path):
+        with open(snapshot_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER_SIZE:
+            raise ValueError(f'{snapshot_path} is not a bank snapshot')
+        magic, version, self.scale, self.id_width, name_width, self.count, slots = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{snapshot_path} is not a version {VERSION} bank snapshot')
+        self._record = struct.Struct(f'<{self.id_width}s{name_width}sq')
+        self._table_offset = HEADER_SIZE + self._record.size * self.count
+        self._mask = slots - 1
+        if len(self._mmap) != self._table_offset + SLOT.size * slots:
+            raise ValueError(f'{snapshot_path} is truncated')
+
+    def find(self, account_id: str) -> Optional[int]:
+        encoded = account_id.encode()
+        if len(encoded) > self.id_width:
+            return None
+        padded = encoded.ljust(self.id_width, b'\0')
+        slot = zlib.crc32(encoded) & self._mask
+        while True:
+            value = SLOT.unpack_from(self._mmap, self._table_offset + slot * SLOT.size)[0]
+            if value == EMPTY_SLOT:
+                return None
+            number = value - 1
+            offset = HEADER_SIZE + number * self._record.size
+            if self._mmap[offset:offset + self.id_width] == padded:
+                return number
+            slot = (slot + 1) & self._mask
+
+    def read(self, number: int):
+        account_id, name, units = self._record.unpack_from(self._mmap, HEADER_SIZE + number * self._record.size)
+        return account_id.rstrip(b'\0').decode(), name.rstrip(b'\0').decode(), units
+
+    def account_ids(self) -> Iterator[str]:
+        for number in range(self.count):
+            yield self.read(number)[0]
+
+    def close(self):
+        self._mmap.close()
+
+
+class MappedAccounts(MutableMapping):
+    # Accounts served straight from a mapped snapshot. Accounts created or changed since the
+    # snapshot was written live in the overlay mapping, e.g. a dict or an AccountStore, and
+    # their snapshot records are hidden from then on.
+    def __init__(self, snapshot: MappedSnapshot, overlay: MutableMapping[str, Account]):
+        self.snapshot = snapshot
+        self.scale = snapshot.scale
+        self.overlay = overlay
+        self._hidden: Set[str] = set()
+
+    def __getitem__(self, account_id: str) -> Account:
+        if account_id in self.overlay:
+            return self.overlay[account_id]
+        number = self._find(account_id)
+        if number is None:
+            raise KeyError(account_id)
+        return MappedAccount(self, number)
+
+    def __setitem__(self, account_id: str, account: Account):
+        self.overlay[account_id] = account
+        if self.snapshot.find(account_id) is not None:
+            self._hidden.add(account_id)
+
+    def __delitem__(self, account_id: str):
+        if account_id in self.overlay:
+            del self.overlay[account_id]
+        elif self._find(account_id) is not None:
+            self._hidden.add(account_id)
+        else:
+            raise KeyError(account_id)
+
+    def __contains__(self, account_id) -> bool:
+        return account_id in self.overlay or self._find(account_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        hidden = self._hidden
+        for account_id in self.snapshot.account_ids():
+            if account_id not in hidden:
+                yield account_id
+        yield from self.overlay
+
+    def __len__(self) -> int:
+        return self.snapshot.count - len(self._hidden) + len(self.overlay)
+
+    def get_balance(self, account_id: str, number: int) -> Decimal:
+        if account_id in self.overlay:
+            return self.overlay[account_id].balance
+        return from_minor_units(self.snapshot.read(number)[2], self.scale)
+
+    def set_balance(self, account_id: str, name: str, value: Decimal):
+        if account_id in self.overlay:
+            self.overlay[account_id].balance = value
+        else:
+            # First change to a mapped account, it moves into memory
+            self[account_id] = Account(account_id=account_id, name=name, balance=value)
+
+    def _find(self, account_id: str) -> Optional[int]:
+        if account_id in self._hidden:
+            return None
+        return self.snapshot.find(account_id)
+
+
+class MappedAccount(Account):
+    __slots__ = ('_accounts', '_number')
+
+    def __init__(self, accounts: MappedAccounts, number: int):
+        self._accounts = accounts
+        self._number = number
+        self.account_id, self.name, _ = accounts.snapshot.read(number)
+
+    @property
+    def balance(self) -> Decimal:
+        return self._accounts.get_balance(self.account_id, self._number)
+
+    @balance.setter
+    def balance(self, value: Decimal):
+        if value < 0:
+            raise InvalidAccountOperationException('Insufficient balance')
+        self._accounts.set_balance(self.account_id, self.name, value)
+
+
+class SnapshotRepository:
+    # Repository for binary snapshots. The state is not loaded but mapped, so startup does not
+    # depend on the number of accounts. Balances must fit the minor units of the snapshot.
+    def __init__(self, snapshot_path: Path, scale: int = MINOR_UNIT_SCALE):
+        self.snapshot_path = snapshot_path
+        self.scale = scale
+
+    def save_state(self, accounts: MutableMapping[str, Account]):
+        logger.info(f'Saving bank state to {self.snapshot_path}')
+        # A mapping served from the previous snapshot keeps reading it, the rename leaves the old file mapped
+        write_snapshot(self.snapshot_path, accounts.values(), self.scale)
+
+    def load_state(self, accounts: Optional[MutableMapping[str, Account]] = None) -> MutableMapping[str, Account]:
+        # The given mapping becomes the overlay for accounts created or changed after startup
+        if accounts is None:
+            accounts = dict()
+        if self.snapshot_path.is_file():
+            print(f'Mapping state from {self.snapshot_path}')
+            return MappedAccounts(MappedSnapshot(self.snapshot_path), accounts)
+        print(f'Unable to find state init file from {self.snapshot_path}, start a fresh state')
+        return accounts
+
+    def iter_accounts(self) -> Iterator[Account]:
+        snapshot = MappedSnapshot(self.snapshot_path)
+        try:
+            for number in range(snapshot.count):
+                account_id, name, units = snapshot.read(number)
+                yield Account(account_id=account_id, name=name, balance=from_minor_units(units, snapshot.scale))
+        finally:
+            snapshot.close()
+
+
+def csv_to_snapshot(csv_path: Path, snapshot_path: Path, scale: int = MINOR_UNIT_SCALE):
+    write_snapshot(snapshot_path, Repository(csv_path).iter_accounts(), scale)
+
+
+def snapshot_to_csv(snapshot_path: Path, csv_path: Path):
+    accounts = {account.account_id: account for account in SnapshotRepository(snapshot_path).iter_accounts()}
+    Repository(csv_path).save_state(accounts)
+
+
+def main():
+    parser = ArgumentParser(prog='python -m src.snapshot', description='Convert between csv and binary bank state')
+    parser.add_argument('direction', choices=('to-binary', 'to-csv'))
+    parser.add_argument('source', type=Path)
+    parser.add_argument('target', type=Path)
+    args = parser.parse_args()
+    if args.direction == 'to-binary':
+        csv_to_snapshot(args.source, args.target)
+    else:
+        snapshot_to_csv(args.source, args.target)
+
+
+if __name__ == '__main__':
+    main()
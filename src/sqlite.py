@@ -0,0 +1,281 @@
+import logging
+import sqlite3
+import threading
+from collections.abc import Mapping, MutableMapping, ValuesView
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from src.account import Account
+from src.read_view import ReadView
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SUFFIXES = ('.db', '.sqlite')
+# Rows read at a time when every account is read
+FETCH_SIZE = 65536
+# Page cache of each connection, in KiB. Account ids are random, so lookups and saves touch pages all over
+# the table.
+CACHE_SIZE = 65536
+# Bytes of the database the reader maps instead of reading pages through system calls
+MMAP_SIZE = 1 << 30
+
+# The primary key is the index lookups go through, and without a rowid the rows are stored in it.
+# Balances are decimal text like in the csv state, so any balance round-trips exactly.
+CREATE_TABLE = ('CREATE TABLE IF NOT EXISTS accounts '
+                '(account_id TEXT PRIMARY KEY, name TEXT NOT NULL, balance TEXT NOT NULL) WITHOUT ROWID')
+# Constant statements, so the connection prepares each once and reuses it from its statement cache
+SELECT_ACCOUNT = 'SELECT name, balance FROM accounts WHERE account_id = ?'
+SELECT_ACCOUNTS = 'SELECT account_id, name, balance FROM accounts'
+SELECT_ACCOUNT_IDS = 'SELECT account_id FROM accounts'
+COUNT_ACCOUNTS = 'SELECT count(*) FROM accounts'
+UPSERT_ACCOUNT = ('INSERT INTO accounts (account_id, name, balance) VALUES (?, ?, ?) '
+                  'ON CONFLICT (account_id) DO UPDATE SET name = excluded.name, balance = excluded.balance')
+DELETE_ACCOUNT = 'DELETE FROM accounts WHERE account_id = ?'
+DELETE_ACCOUNTS = 'DELETE FROM accounts'
+
+
+class SqliteAccounts(MutableMapping):
+    # Accounts read from the database on first access and kept in the overlay mapping, e.g. a dict or an
+    # AccountStore, from then on. The balance each of them has in the database is remembered, so a save
+    # only writes the accounts whose balance differs and the ones created since. Iterating reads every
+    # account id from the database, and values() every account in one query.
+    def __init__(self, repository: 'SqliteRepository', overlay: MutableMapping[str, Account], stored_count: int):
+        self.repository = repository
+        self.overlay = overlay
+        # Balance in the database of every overlay account that is in it, None when the account was
+        # replaced since. Keyed by the id as it is in the database.
+        self._stored: Dict[str, Optional[Decimal]] = {}
+        # Deleted since the last save and still in the database
+        self._deleted: Set[str] = set()
+        self._stored_count = stored_count
+        # Held while an account moves into the overlay, so threads missing it at the same time read it once
+        self._lock = threading.Lock()
+
+    def __getitem__(self, account_id: str) -> Account:
+        try:
+            return self.overlay[account_id]
+        except KeyError:
+            pass
+        with self._lock:
+            if account_id in self.overlay:
+                return self.overlay[account_id]
+            key = str(account_id)
+            row = None if key in self._deleted else self.repository.fetch(key)
+            if row is None:
+                raise KeyError(account_id)
+            name, balance = row
+            self.overlay[account_id] = Account(account_id=account_id, name=name, balance=balance)
+            self._stored[key] = balance
+            # The mapping may keep its own representation
+            return self.overlay[account_id]
+
+    def __setitem__(self, account_id: str, account: Account):
+        key = str(account_id)
+        with self._lock:
+            if (key in self._stored or key in self._deleted
+                    or (account_id not in self.overlay and self.repository.fetch(key) is not None)):
+                # Replaces an account in the database, the next save writes it whatever its balance
+                self._stored[key] = None
+                self._deleted.discard(key)
+            self.overlay[account_id] = account
+
+    def __delitem__(self, account_id: str):
+        key = str(account_id)
+        with self._lock:
+            in_overlay = account_id in self.overlay
+            stored = key in self._stored or (not in_overlay and key not in self._deleted
+                                             and self.repository.fetch(key) is not None)
+            if not in_overlay and not stored:
+                raise KeyError(account_id)
+            if in_overlay:
+                del self.overlay[account_id]
+            if stored:
+                self._stored.pop(key, None)
+                self._deleted.add(key)
+
+    def __contains__(self, account_id) -> bool:
+        if account_id in self.overlay:
+            return True
+        key = str(account_id)
+        return key not in self._deleted and self.repository.fetch(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        overlay = self.overlay
+        for account_id in self.stored_ids():
+            if account_id not in overlay:
+                yield account_id
+        yield from overlay
+
+    def stored_ids(self) -> Iterator[str]:
+        # Ids in the database, without the ones deleted since the last save
+        deleted = self._deleted
+        return (account_id for account_id in self.repository.account_ids() if account_id not in deleted)
+
+    def __len__(self) -> int:
+        # Overlay accounts that are not in the database were created since the last save
+        return self._stored_count - len(self._deleted) + len(self.overlay) - len(self._stored)
+
+    def values(self) -> ValuesView:
+        return SqliteValues(self)
+
+    def iter_values(self) -> Iterator[Account]:
+        # Every account in one query instead of one per account, and without keeping them in the overlay
+        overlay, deleted = self.overlay, self._deleted
+        for account in self.repository.iter_accounts():
+            if account.account_id not in deleted and account.account_id not in overlay:
+                yield account
+        yield from overlay.values()
+
+    @property
+    def loaded(self) -> int:
+        # Accounts in memory
+        return len(self.overlay)
+
+    def preload(self, accounts: Iterable[Account]):
+        # Accounts just read from the database
+        for account in accounts:
+            self.overlay[account.account_id] = account
+            self._stored[str(account.account_id)] = account.balance
+
+    def changes(self, accounts: Mapping[str, Account]) -> Tuple[List[Tuple[str, str, Decimal]], List[str]]:
+        # Rows to upsert and ids to delete to bring the database to the given accounts, these or a read view
+        # of them. Accounts never read are as they are in the database, only overlay accounts can differ.
+        stored = self._stored
+        if accounts is self:
+            accounts = self.overlay
+        rows = []
+        for account_id in list(self.overlay):
+            account = accounts.get(account_id)
+            if account is None:
+                # Created after the read view was taken
+                continue
+            key = str(account_id)
+            balance = account.balance
+            if stored.get(key) != balance:
+                rows.append((key, account.name, balance))
+        return rows, list(self._deleted)
+
+    def saved(self, rows: List[Tuple[str, str, Decimal]], deleted: List[str]):
+        # Called once the changes are committed
+        created = 0
+        for key, _, balance in rows:
+            if key not in self._stored:
+                created += 1
+            self._stored[key] = balance
+        self._deleted.difference_update(deleted)
+        self._stored_count += created - len(deleted)
+
+
+class SqliteValues(ValuesView):
+    def __iter__(self) -> Iterator[Account]:
+        return self._mapping.iter_values()
+
+
+class SqliteRepository:
+    # Repository for a SQLite database with one row per account. The state is not read at startup:
+    # load_state returns SqliteAccounts, which reads an account the first time it is asked for, and
+    # save_state upserts the accounts changed since in a single transaction. In WAL mode a save never
+    # blocks lookups, which go through their own connection.
+    def __init__(self, db_path: Path, lazy: bool = True):
+        self.db_path = db_path
+        # Without lazy, load_state reads every account up front like the other repositories
+        self.lazy = lazy
+        self._reader: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        # The connections are shared by the threads of a concurrent bank and the checkpoint thread
+        self._reader_lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+
+    def save_state(self, accounts: MutableMapping[str, Account]):
+        logger.info(f'Saving bank state to {self.db_path}')
+        self._connect()
+        stored = accounts.accounts if isinstance(accounts, ReadView) else accounts
+        if not isinstance(stored, SqliteAccounts) or stored.repository is not self:
+            # Accounts that did not come from this database replace all of it
+            self._write(((str(account.account_id), account.name, str(account.balance))
+                         for account in accounts.values()), replace=True)
+            return
+        rows, deleted = stored.changes(accounts)
+        # In key order, the upserts then walk the primary key index once instead of jumping around it
+        rows.sort()
+        self._write(((key, name, str(balance)) for key, name, balance in rows), deleted)
+        stored.saved(rows, deleted)
+        logger.info(f'Saved {len(rows)} changed and {len(deleted)} deleted accounts')
+
+    def load_state(self, accounts: Optional[MutableMapping[str, Account]] = None) -> MutableMapping[str, Account]:
+        # The given mapping becomes the overlay that accounts are kept in once read
+        if accounts is None:
+            accounts = dict()
+        if self.db_path.is_file():
+            print(f'Opening state from {self.db_path}')
+        else:
+            print(f'Unable to find state init file from {self.db_path}, start a fresh state')
+        self._connect()
+        with self._reader_lock:
+            count = self._reader.execute(COUNT_ACCOUNTS).fetchone()[0]
+        stored = SqliteAccounts(self, accounts, count)
+        if not self.lazy:
+            stored.preload(self.iter_accounts())
+        return stored
+
+    def iter_accounts(self) -> Iterator[Account]:
+        self._connect()
+        with self._reader_lock:
+            cursor = self._reader.execute(SELECT_ACCOUNTS)
+        while True:
+            with self._reader_lock:
+                rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            for account_id, name, balance in rows:
+                yield Account(account_id=account_id, name=name, balance=Decimal(balance))
+
+    def fetch(self, account_id: str) -> Optional[Tuple[str, Decimal]]:
+        # Name and balance of one account, None if it is not in the database
+        with self._reader_lock:
+            row = self._reader.execute(SELECT_ACCOUNT, (account_id,)).fetchone()
+        return None if row is None else (row[0], Decimal(row[1]))
+
+    def account_ids(self) -> List[str]:
+        with self._reader_lock:
+            return [row[0] for row in self._reader.execute(SELECT_ACCOUNT_IDS).fetchall()]
+
+    def close(self):
+        for connection in (self._reader, self._writer):
+            if connection is not None:
+                connection.close()
+        self._reader = self._writer = None
+
+    def _connect(self):
+        if self._writer is not None:
+            return
+        # Transactions are begun and committed explicitly
+        writer = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        # Kept in the database file. Commits append to the write-ahead log, and readers go on reading the
+        # last commit meanwhile.
+        writer.execute('PRAGMA journal_mode=WAL')
+        # Every commit is synced: the bank journal is truncated once a save returns
+        writer.execute('PRAGMA synchronous=FULL')
+        writer.execute(f'PRAGMA cache_size=-{CACHE_SIZE}')
+        writer.execute(CREATE_TABLE)
+        reader = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        reader.execute(f'PRAGMA cache_size=-{CACHE_SIZE}')
+        reader.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        self._reader = reader
+        self._writer = writer
+
+    def _write(self, rows: Iterable[Tuple[str, str, str]], deleted: Iterable[str] = (), replace: bool = False):
+        # One transaction, with a single executemany per statement
+        with self._writer_lock:
+            writer = self._writer
+            writer.execute('BEGIN IMMEDIATE')
+            try:
+                if replace:
+                    writer.execute(DELETE_ACCOUNTS)
+                writer.executemany(DELETE_ACCOUNT, ((key,) for key in deleted))
+                writer.executemany(UPSERT_ACCOUNT, rows)
+                writer.execute('COMMIT')
+            except BaseException:
+                writer.execute('ROLLBACK')
+                raise
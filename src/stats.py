@@ -0,0 +1,131 @@
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from src.exception import BankException
+
+# Upper bounds of the latency buckets in microseconds, four per power of two from 1us to about 67s,
+# so a percentile is off by at most 19%
+BUCKET_BOUNDS = [2 ** (step / 4) for step in range(4 * 26 + 1)]
+
+
+class StatsNotEnabledException(BankException):
+    def __str__(self):
+        return 'Stats are not enabled for this bank'
+
+
+class OperationStats:
+    # Call and error counts and a latency histogram of one operation
+    def __init__(self):
+        self.count = 0
+        self.errors: Counter = Counter()
+        self.total = 0.0
+        self.max = 0.0
+        # One more bucket for latencies above the last bound
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._lock = threading.Lock()
+
+    def observe(self, micros: float, error: Optional[Exception] = None):
+        with self._lock:
+            self.observe_unlocked(micros, error)
+
+    def observe_unlocked(self, micros: float, error: Optional[Exception] = None):
+        # For operations that never run in parallel, the lock would be most of the cost
+        self.count += 1
+        self.total += micros
+        if micros > self.max:
+            self.max = micros
+        self.buckets[bisect_left(BUCKET_BOUNDS, micros)] += 1
+        if error is not None:
+            self.errors[type(error).__name__] += 1
+
+    def percentile(self, fraction: float) -> float:
+        # The upper bound of the bucket holding the rank, never more than the slowest call
+        rank = math.ceil(fraction * self.count)
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(BUCKET_BOUNDS[bucket], self.max) if bucket < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'count': self.count,
+                'errors': dict(self.errors),
+                'latency_us': {
+                    'mean': round(self.total / self.count, 1) if self.count else 0.0,
+                    'p50': round(self.percentile(0.5), 1),
+                    'p99': round(self.percentile(0.99), 1),
+                    'max': round(self.max, 1),
+                },
+            }
+
+
+class Stats:
+    # Per-operation stats of the methods handed to instrument(). Instrumenting replaces the methods
+    # on the instance, so an object that is not instrumented runs its methods as they are.
+    def __init__(self):
+        self.started = time.time()
+        self.operations: Dict[str, OperationStats] = {}
+
+    def instrument(self, target: object, methods: Iterable[str], prefix: str = '', concurrent: bool = False):
+        for method in methods:
+            setattr(target, method, self.timed(prefix + method, getattr(target, method), concurrent))
+
+    def timed(self, operation: str, function: Callable, concurrent: bool = False) -> Callable:
+        # concurrent when the function may be called from several threads at once
+        stats = self.operations.setdefault(operation, OperationStats())
+        observe = stats.observe if concurrent else stats.observe_unlocked
+        perf_counter = time.perf_counter
+
+        def call(*args, **kwargs):
+            start = perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                observe((perf_counter() - start) * 1e6, e)
+                raise
+            observe((perf_counter() - start) * 1e6)
+            return result
+
+        return call
+
+    def observe(self, operation: str, micros: float):
+        # For operations timed by their owner rather than through instrument()
+        self.operations.setdefault(operation, OperationStats()).observe(micros)
+
+    def snapshot(self) -> dict:
+        return {
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'operations': {operation: stats.snapshot() for operation, stats in sorted(self.operations.items())
+                           if stats.count},
+        }
+
+    def dump(self, path: Path):
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def format(self) -> List[str]:
+        snapshot = self.snapshot()
+        if not snapshot['operations']:
+            return ['No operations recorded yet']
+        lines = []
+        for operation, stats in snapshot['operations'].items():
+            latency = stats['latency_us']
+            line = (f'{operation}: {stats["count"]} calls, p50 {latency["p50"]}us, p99 {latency["p99"]}us, '
+                    f'max {latency["max"]}us')
+            if stats['errors']:
+                errors = ', '.join(f'{error} {count}' for error, count in sorted(stats['errors'].items()))
+                line += f', errors: {errors}'
+            lines.append(line)
+        return lines
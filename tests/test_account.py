@@ -33,3 +33,8 @@ class TestAccount(TestCase):
         with self.assertRaises(InvalidAccountOperationException):
             account.withdraw(Decimal('123.5'))
         self.assertEqual(Decimal('123.4'), account.balance)
+
+    def test_account_has_no_instance_dict(self):
+        account = Account(account_id='account-1', name='Tom', balance=Decimal('123.4'))
+        with self.assertRaises(AttributeError):
+            account.nickname = 'Tommy'
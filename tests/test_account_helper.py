@@ -1,7 +1,8 @@
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
+from uuid import UUID
 
-from src.account_helper import AccountHelper
+from src.account_helper import AccountHelper, AccountKey, to_account_key
 
 
 class TestAccountHelperCreationAccountId(TestCase):
@@ -16,3 +17,40 @@ class TestAccountHelperCreationAccountId(TestCase):
         mock_uuid4.side_effect = [mock_uuid_1, mock_uuid_2]
         self.assertEqual('uuid_1', account_helper.create_account_id())
         self.assertEqual('uuid_2', account_helper.create_account_id())
+
+
+class TestAccountHelperBulkIds(TestCase):
+
+    def test_create_account_ids_in_bulk(self):
+        account_ids = AccountHelper().create_account_ids(100)
+        self.assertEqual(100, len(set(account_ids)))
+        for account_id in account_ids:
+            self.assertEqual(4, UUID(account_id).version)
+            self.assertEqual(account_id, str(UUID(account_id)))
+
+    def test_preallocated_ids_are_used_first(self):
+        account_helper = AccountHelper()
+        account_helper.preallocate(2)
+        account_ids = {account_helper.create_account_id(), account_helper.create_account_id()}
+        self.assertEqual(2, len(account_ids))
+        self.assertEqual(36, len(account_helper.create_account_id()))
+
+
+class TestAccountHelperIntegerIds(TestCase):
+
+    def test_create_integer_ids(self):
+        account_helper = AccountHelper(integer_ids=True)
+        account_ids = [account_helper.create_account_id()] + account_helper.create_account_ids(10)
+        for account_id in account_ids:
+            self.assertIsInstance(account_id, AccountKey)
+            self.assertEqual(4, UUID(int=account_id).version)
+            self.assertEqual(str(UUID(int=account_id)), str(account_id))
+
+    def test_to_account_key(self):
+        account_id = '6fbc4eb7-5f18-414e-bdbd-d2c5addfbb66'
+        key = to_account_key(account_id)
+        self.assertEqual(UUID(account_id).int, key)
+        self.assertEqual(account_id, str(key))
+        self.assertIs(key, to_account_key(key))
+        for other_id in ('mock-account-1', account_id.upper(), '0x' + account_id[2:], account_id[:-1] + '_'):
+            self.assertEqual(other_id, to_account_key(other_id))
@@ -0,0 +1,95 @@
+from decimal import Decimal
+from unittest import TestCase
+
+from src.account import Account, InvalidAccountOperationException
+from src.account_helper import AccountKey, to_account_key
+from src.account_store import AccountStore
+
+
+class TestAccountStore(TestCase):
+    def setUp(self):
+        self.store = AccountStore()
+        self.store['account-1'] = Account('account-1', 'Tom', Decimal('123.4'))
+        self.store['account-2'] = Account('account-2', 'May', Decimal('0'))
+
+    def test_get_account_view(self):
+        account = self.store['account-1']
+        self.assertEqual('account-1', account.account_id)
+        self.assertEqual('Tom', account.name)
+        self.assertEqual(Decimal('123.4'), account.balance)
+        self.assertEqual('<Account account_id=account-1, name=Tom, balance=123.4>', repr(account))
+
+    def test_balance_change_is_written_to_store(self):
+        account = self.store['account-1']
+        account.deposit(Decimal('1.1'))
+        self.assertEqual(Decimal('124.5'), self.store['account-1'].balance)
+        self.assertEqual(Decimal('124.5'), account.balance)
+
+    def test_raise_invalid_account_operation_with_overdraft(self):
+        account = self.store['account-1']
+        with self.assertRaises(InvalidAccountOperationException):
+            account.withdraw(Decimal('123.5'))
+        self.assertEqual(Decimal('123.4'), account.balance)
+
+    def test_raise_invalid_account_operation_with_amount_smaller_than_minor_unit(self):
+        account = self.store['account-1']
+        with self.assertRaises(InvalidAccountOperationException):
+            account.deposit(Decimal('0.001'))
+        self.assertEqual(Decimal('123.4'), account.balance)
+
+    def test_replace_account(self):
+        self.store['account-1'] = Account('account-1', 'Tommy', Decimal('1'))
+        self.assertEqual(2, len(self.store))
+        self.assertEqual('Tommy', self.store['account-1'].name)
+        self.assertEqual(Decimal('1'), self.store['account-1'].balance)
+
+    def test_mapping_interface(self):
+        self.assertEqual(['account-1', 'account-2'], list(self.store))
+        self.assertIn('account-2', self.store)
+        self.assertNotIn('account-3', self.store)
+        with self.assertRaises(KeyError):
+            self.store['account-3']
+        self.assertEqual([Decimal('123.4'), Decimal('0')], [account.balance for account in self.store.values()])
+
+    def test_delete_account(self):
+        del self.store['account-1']
+        self.assertEqual(['account-2'], list(self.store))
+        self.store['account-3'] = Account('account-3', 'Ann', Decimal('5'))
+        self.assertEqual(Decimal('0'), self.store['account-2'].balance)
+        self.assertEqual(Decimal('5'), self.store['account-3'].balance)
+
+
+class TestAccountStoreIntegerKeys(TestCase):
+    def setUp(self):
+        self.store = AccountStore(integer_keys=True)
+        self.account_id = '6fbc4eb7-5f18-414e-bdbd-d2c5addfbb66'
+        self.store[self.account_id] = Account(self.account_id, 'Tom', Decimal('1'))
+
+    def test_uuid_ids_are_stored_as_integers(self):
+        account = self.store[self.account_id]
+        self.assertIsInstance(account.account_id, AccountKey)
+        self.assertEqual(self.account_id, str(account.account_id))
+        self.assertEqual(f'<Account account_id={self.account_id}, name=Tom, balance=1>', repr(account))
+        self.assertEqual([account.account_id], list(self.store))
+
+    def test_find_account_by_string_or_key(self):
+        key = to_account_key(self.account_id)
+        self.assertIn(self.account_id, self.store)
+        self.assertIn(key, self.store)
+        self.assertEqual(Decimal('1'), self.store[key].balance)
+        self.assertNotIn(self.account_id.upper(), self.store)
+
+    def test_other_ids_stay_strings(self):
+        self.store['account-1'] = Account('account-1', 'May', Decimal('2'))
+        self.assertEqual('account-1', self.store['account-1'].account_id)
+        del self.store[self.account_id]
+        self.assertEqual(['account-1'], list(self.store))
+
+    def test_copy_is_not_changed_by_the_store(self):
+        store = AccountStore()
+        store['account-1'] = Account('account-1', 'Tom', Decimal('1'))
+        copy = store.copy()
+        store['account-1'].deposit(Decimal('1'))
+        store['account-2'] = Account('account-2', 'May', Decimal('2'))
+        self.assertEqual(Decimal('1'), copy['account-1'].balance)
+        self.assertEqual(['account-1'], list(copy))
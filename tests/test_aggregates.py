@@ -0,0 +1,89 @@
+import random
+from bisect import bisect_right
+from decimal import Decimal
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.aggregates import BALANCE_BUCKET_BOUNDS, BalanceAggregates, RankedBalances
+
+
+def recompute(balances):
+    buckets = [0] * (len(BALANCE_BUCKET_BOUNDS) + 1)
+    for balance in balances.values():
+        buckets[bisect_right(BALANCE_BUCKET_BOUNDS, balance)] += 1
+    ranking = sorted(balances.items(), key=lambda item: (-item[1], item[0]))
+    return len(balances), sum(balances.values(), Decimal('0')), buckets, ranking
+
+
+class TestRankedBalances(TestCase):
+
+    @patch('src.aggregates.BLOCK_SIZE', 4)
+    def test_keys_stay_sorted_across_block_splits_and_removals(self):
+        rng = random.Random(0)
+        ranked = RankedBalances.build((rng.randint(0, 50), i) for i in range(10))
+        keys = sorted(ranked)
+        for i in range(10, 500):
+            if keys and rng.random() < 0.4:
+                key = keys.pop(rng.randrange(len(keys)))
+                ranked.remove(key)
+            else:
+                key = (rng.randint(0, 50), i)
+                keys.append(key)
+                keys.sort()
+                ranked.add(key)
+            self.assertEqual(keys, list(ranked))
+            self.assertEqual(len(keys), len(ranked))
+
+    def test_remove_unknown_key(self):
+        ranked = RankedBalances.build([(1, 'a'), (3, 'b')])
+        for key in ((2, 'a'), (4, 'a'), (0, 'a')):
+            with self.assertRaises(KeyError):
+                ranked.remove(key)
+        self.assertEqual([(1, 'a'), (3, 'b')], list(ranked))
+
+
+class TestBalanceAggregates(TestCase):
+
+    def assert_matches_recomputation(self, aggregates, balances):
+        accounts, total, buckets, ranking = recompute(balances)
+        summary = aggregates.summary()
+        self.assertEqual(accounts, summary.accounts)
+        self.assertEqual(total, summary.total)
+        self.assertEqual(buckets, [count for _, count in summary.histogram])
+        self.assertEqual(ranking[:10], aggregates.top(10))
+        self.assertEqual(ranking, aggregates.top(len(balances) + 1))
+
+    @patch('src.aggregates.BLOCK_SIZE', 8)
+    def test_random_changes_match_recomputation(self):
+        for seed in range(5):
+            rng = random.Random(seed)
+            balances = {f'account-{i}': Decimal(rng.randint(0, 10 ** 6)) / 100 for i in range(50)}
+            aggregates = BalanceAggregates.build(balances.items())
+            self.assert_matches_recomputation(aggregates, balances)
+            for step in range(300):
+                if rng.random() < 0.1:
+                    # A new account
+                    changes = {f'new-{seed}-{step}': Decimal(rng.randint(0, 10 ** 12)) / 100}
+                else:
+                    # A deposit, withdrawal or transfer, sometimes to a balance that is already taken
+                    changes = {account_id: rng.choice([Decimal(rng.randint(0, 10 ** 8)) / 100,
+                                                       rng.choice(list(balances.values()))])
+                               for account_id in rng.sample(list(balances), rng.randint(1, 2))}
+                balances.update(changes)
+                aggregates.update(changes.items())
+                self.assert_matches_recomputation(aggregates, balances)
+
+    def test_histogram_bucket_bounds(self):
+        aggregates = BalanceAggregates()
+        aggregates.update([('a', Decimal('0')), ('b', Decimal('0.99')), ('c', Decimal('1')), ('d', Decimal('10')),
+                           ('e', Decimal('1e12'))])
+        histogram = aggregates.summary().histogram
+        self.assertEqual((Decimal('0'), 2), histogram[0])
+        self.assertEqual((Decimal('1'), 1), histogram[1])
+        self.assertEqual((Decimal('10'), 1), histogram[2])
+        self.assertEqual((Decimal('1000000000'), 1), histogram[-1])
+
+    def test_top_breaks_ties_by_account_id(self):
+        aggregates = BalanceAggregates.build([('b', Decimal('5')), ('a', Decimal('5.00')), ('c', Decimal('7'))])
+        self.assertEqual(['c', 'a', 'b'], [account_id for account_id, _ in aggregates.top(3)])
+        self.assertEqual([], aggregates.top(0))
@@ -1,11 +1,27 @@
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import partial
 from decimal import Decimal
+from pathlib import Path
 from unittest import TestCase
 from unittest.mock import create_autospec
 
 from src.account import Account, AccountNotFoundException, AccountIdExistsException, InvalidAccountOperationException
-from src.account_helper import AccountHelper
+from src.account_helper import AccountHelper, AccountKey
+from src.account_store import AccountStore
 from src.bank import Bank
+from src.batch import BatchStatus
+from src.idempotency import IdempotencyCache, IdempotencyKeyReusedException, IdempotencyNotEnabledException
+from src.journal import Journal
+from src.ledger import DEPOSIT, OPEN, TRANSFER_IN, TRANSFER_OUT, WITHDRAW, Ledger, LedgerNotEnabledException
+from src.read_view import ClosedReadViewException
 from src.repository import Repository
+from src.scheduler import ScheduleNotFoundException, SchedulerNotEnabledException, TransferScheduler
+from src.stats import Stats, StatsNotEnabledException
 
 
 class BaseBankTestCase(TestCase):
@@ -166,6 +182,74 @@ class TestBankTransfer(BaseBankTestCase):
         self.assertEqual(Decimal('100.1'), from_account.balance)
         self.assertEqual(Decimal('1'), to_account.balance)
 
+    def test_raise_account_not_found_exception_without_withdrawing(self):
+        # GIVEN an account is created
+        from_account = self.bank.create_account('Andy', Decimal('100.1'))
+
+        # WHEN there is a transfer to a non-existent account
+        # THEN an account not found exception is raised
+        with self.assertRaises(AccountNotFoundException):
+            self.bank.transfer(from_account_id=from_account.account_id,
+                               to_account_id='some-account-id',
+                               amount=Decimal('10'))
+
+        # AND from account's balance remains the same
+        self.assertEqual(Decimal('100.1'), from_account.balance)
+
+    def test_reject_invalid_amounts_without_changing_balances(self):
+        # GIVEN accounts are created
+        from_account = self.bank.create_account('Andy', Decimal('100.1'))
+        to_account = self.bank.create_account('Tom', Decimal('1'))
+
+        # WHEN a negative, a zero and a sub-cent amount are transferred
+        # THEN an invalid account operation exception is raised for each
+        for amount in (Decimal('-5'), Decimal('0'), Decimal('0.001')):
+            with self.assertRaises(InvalidAccountOperationException):
+                self.bank.transfer(from_account_id=from_account.account_id,
+                                   to_account_id=to_account.account_id,
+                                   amount=amount)
+        with self.assertRaises(InvalidAccountOperationException):
+            self.bank.deposit(to_account.account_id, Decimal('-1'))
+
+        # AND neither balance has changed
+        self.assertEqual(Decimal('100.1'), from_account.balance)
+        self.assertEqual(Decimal('1'), to_account.balance)
+
+
+class TestBankFindAccountsByName(BaseBankTestCase):
+    __test__ = True
+
+    def test_find_accounts_by_name_and_prefix(self):
+        # GIVEN accounts with similar names, some created after the first search
+        self.mock_account_helper.create_account_id.side_effect = ['account-1', 'account-2', 'account-3', 'account-4']
+        self.bank.create_account('Tom')
+        self.bank.create_account('Tomas')
+        self.assertEqual(['account-1'], [account.account_id for account in self.bank.find_accounts_by_name('tom')])
+        self.bank.create_account('tom')
+        self.bank.create_account('May')
+
+        # WHEN accounts are searched by name and by prefix
+        by_name = self.bank.find_accounts_by_name('TOM')
+        by_prefix = self.bank.find_accounts_by_name_prefix('to')
+
+        # THEN accounts created before and after the index was built are found
+        self.assertEqual(['account-1', 'account-3'], [account.account_id for account in by_name])
+        self.assertEqual(['account-1', 'account-3', 'account-2'], [account.account_id for account in by_prefix])
+
+    def test_index_is_rebuilt_on_load_state(self):
+        # GIVEN a searched bank
+        self.mock_account_helper.create_account_id.return_value = 'account-1'
+        self.bank.create_account('Tom')
+        self.bank.find_accounts_by_name('Tom')
+
+        # WHEN state is loaded again
+        self.mock_repository.load_state.return_value = {'account-2': Account('account-2', 'May', Decimal('1'))}
+        self.bank.load_state()
+
+        # THEN only the loaded accounts are found
+        self.assertEqual([], self.bank.find_accounts_by_name('Tom'))
+        self.assertEqual(['account-2'], [account.account_id for account in self.bank.find_accounts_by_name('may')])
+
 
 class TestBankLoadState(BaseBankTestCase):
     __test__ = True
@@ -191,3 +275,901 @@ class TestBankSaveState(BaseBankTestCase):
         self.bank.accounts = state
         self.bank.save_state()
         self.mock_repository.save_state.assert_called_once_with(state)
+
+
+class TestBankApplyBatch(BaseBankTestCase):
+    __test__ = True
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.mock_account_helper.create_account_id.side_effect = [
+            'mock-account-1',
+            'mock-account-2'
+        ]
+
+    def test_apply_batch(self):
+        # GIVEN accounts are created
+        from_account = self.bank.create_account('Andy', Decimal('100.1'))
+        to_account = self.bank.create_account('Tom', Decimal('1'))
+
+        # WHEN a batch of transfers is applied
+        result = self.bank.apply_batch([
+            ('transfer', from_account.account_id, to_account.account_id, Decimal('10.1')),
+            ('transfer', to_account.account_id, from_account.account_id, Decimal('1')),
+        ])
+
+        # THEN both transfers are applied
+        self.assertTrue(result.committed)
+        self.assertEqual(Decimal('91'), from_account.balance)
+        self.assertEqual(Decimal('10.1'), to_account.balance)
+
+    def test_reject_whole_atomic_batch(self):
+        # GIVEN accounts are created
+        from_account = self.bank.create_account('Andy', Decimal('100.1'))
+        to_account = self.bank.create_account('Tom', Decimal('1'))
+
+        # WHEN an atomic batch with a transfer to a non-existent account is applied
+        result = self.bank.apply_batch([
+            ('transfer', from_account.account_id, to_account.account_id, Decimal('10.1')),
+            ('transfer', from_account.account_id, 'some-account-id', Decimal('1')),
+        ], atomic=True)
+
+        # THEN no transfer is applied
+        self.assertFalse(result.committed)
+        self.assertEqual([BatchStatus.ABORTED, BatchStatus.ACCOUNT_NOT_FOUND], result.statuses.tolist())
+        self.assertEqual(Decimal('100.1'), from_account.balance)
+        self.assertEqual(Decimal('1'), to_account.balance)
+
+
+class TestBankSettle(BaseBankTestCase):
+    __test__ = True
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.mock_account_helper.create_account_id.side_effect = (f'mock-account-{i}' for i in range(1000))
+
+    def test_queued_transfers_are_applied_by_settle(self):
+        # GIVEN transfers are queued that one by one would overdraw Tom
+        andy = self.bank.create_account('Andy', Decimal('100'))
+        tom = self.bank.create_account('Tom', Decimal('0'))
+        self.assertEqual(0, self.bank.queue_transfer(tom.account_id, andy.account_id, Decimal('5')))
+        self.assertEqual(1, self.bank.queue_transfer(andy.account_id, tom.account_id, Decimal('20')))
+        self.assertEqual(Decimal('0'), tom.balance)
+        self.assertEqual(2, self.bank.pending_transfers)
+
+        # WHEN the window is settled
+        result = self.bank.settle()
+
+        # THEN both are covered by the net amounts and the window is empty again
+        self.assertEqual([BatchStatus.APPLIED] * 2, result.statuses.tolist())
+        self.assertEqual((Decimal('85'), Decimal('15')), (andy.balance, tom.balance))
+        self.assertEqual(0, self.bank.pending_transfers)
+        self.assertEqual(0, self.bank.settle().statuses.size)
+
+    def test_raise_account_not_found_exception_when_queueing(self):
+        andy = self.bank.create_account('Andy', Decimal('100'))
+        with self.assertRaises(AccountNotFoundException):
+            self.bank.queue_transfer(andy.account_id, 'some-account-id', Decimal('1'))
+        self.assertEqual(0, self.bank.pending_transfers)
+
+    def test_raise_invalid_account_operation_exception_when_queueing(self):
+        andy = self.bank.create_account('Andy', Decimal('100'))
+        tom = self.bank.create_account('Tom', Decimal('0'))
+        for amount in (Decimal('-5'), Decimal('0'), Decimal('0.001')):
+            with self.assertRaises(InvalidAccountOperationException):
+                self.bank.queue_transfer(andy.account_id, tom.account_id, amount)
+        self.assertEqual(0, self.bank.pending_transfers)
+
+    def test_settle_is_recorded_per_transfer_in_the_ledger(self):
+        self.bank.ledger = Ledger()
+        andy = self.bank.create_account('Andy', Decimal('100'))
+        tom = self.bank.create_account('Tom', Decimal('0'))
+        self.bank.queue_transfer(tom.account_id, andy.account_id, Decimal('5'))
+        self.bank.queue_transfer(andy.account_id, tom.account_id, Decimal('20'))
+        self.bank.settle()
+        self.assertEqual([(OPEN, Decimal('0'), Decimal('0')),
+                          (TRANSFER_OUT, Decimal('-5'), Decimal('-5')),
+                          (TRANSFER_IN, Decimal('20'), Decimal('15'))],
+                         [(entry.kind, entry.amount, entry.balance)
+                          for entry in self.bank.get_statement(tom.account_id)])
+
+
+class TestBankStatement(BaseBankTestCase):
+    __test__ = True
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.bank.ledger = Ledger()
+        self.mock_account_helper.create_account_id.side_effect = [
+            'mock-account-1',
+            'mock-account-2'
+        ]
+
+    def test_statement_lists_every_balance_change(self):
+        # GIVEN accounts with deposits, withdrawals and a transfer
+        from_account = self.bank.create_account('Andy', Decimal('100'))
+        to_account = self.bank.create_account('Tom', Decimal('1'))
+        self.bank.deposit(from_account.account_id, Decimal('5.5'))
+        self.bank.withdraw(from_account.account_id, Decimal('0.5'))
+        self.bank.transfer(from_account.account_id, to_account.account_id, Decimal('10'))
+
+        # WHEN the statements are queried
+        from_entries = self.bank.get_statement(from_account.account_id)
+        to_entries = self.bank.get_statement(to_account.account_id)
+
+        # THEN every change is listed in order with the balance after it
+        self.assertEqual([(OPEN, Decimal('100'), Decimal('100')),
+                          (DEPOSIT, Decimal('5.5'), Decimal('105.5')),
+                          (WITHDRAW, Decimal('-0.5'), Decimal('105')),
+                          (TRANSFER_OUT, Decimal('-10'), Decimal('95'))],
+                         [(entry.kind, entry.amount, entry.balance) for entry in from_entries])
+        last_entry = to_entries[-1]
+        self.assertEqual((TRANSFER_IN, Decimal('10'), Decimal('11'), from_account.account_id),
+                         (last_entry.kind, last_entry.amount, last_entry.balance, last_entry.counterparty))
+
+    def test_failed_operation_is_not_recorded(self):
+        # GIVEN an account is created
+        account = self.bank.create_account('Andy', Decimal('1'))
+
+        # WHEN an overdraft and an amount finer than a cent are rejected
+        with self.assertRaises(InvalidAccountOperationException):
+            self.bank.withdraw(account.account_id, Decimal('2'))
+        with self.assertRaises(InvalidAccountOperationException):
+            self.bank.deposit(account.account_id, Decimal('0.001'))
+
+        # THEN the balance is unchanged and only the opening is recorded
+        self.assertEqual(Decimal('1'), account.balance)
+        self.assertEqual([OPEN], [entry.kind for entry in self.bank.get_statement(account.account_id)])
+
+    def test_batch_records_running_balances(self):
+        # GIVEN accounts are created
+        from_account = self.bank.create_account('Andy', Decimal('100'))
+        to_account = self.bank.create_account('Tom', Decimal('0'))
+
+        # WHEN a batch moves money back and forth
+        self.bank.apply_batch([
+            ('transfer', from_account.account_id, to_account.account_id, Decimal('30')),
+            ('withdraw', to_account.account_id, Decimal('50')),
+            ('withdraw', to_account.account_id, Decimal('30')),
+            ('deposit', from_account.account_id, Decimal('1')),
+        ], atomic=False)
+
+        # THEN the applied rows are recorded with the balance after each
+        from_entries = self.bank.get_statement(from_account.account_id)[1:]
+        to_entries = self.bank.get_statement(to_account.account_id)[1:]
+        self.assertEqual([(TRANSFER_OUT, Decimal('70')), (DEPOSIT, Decimal('71'))],
+                         [(entry.kind, entry.balance) for entry in from_entries])
+        self.assertEqual([(TRANSFER_IN, Decimal('30')), (WITHDRAW, Decimal('0'))],
+                         [(entry.kind, entry.balance) for entry in to_entries])
+
+    def test_raise_exceptions_for_unknown_account_or_missing_ledger(self):
+        with self.assertRaises(AccountNotFoundException):
+            self.bank.get_statement('some-account-id')
+        self.bank.ledger = None
+        with self.assertRaises(LedgerNotEnabledException):
+            self.bank.get_statement('some-account-id')
+
+
+class TestBankAggregates(BaseBankTestCase):
+    __test__ = True
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.mock_account_helper.create_account_id.side_effect = (f'mock-account-{i}' for i in range(1000))
+
+    def assert_matches_accounts(self):
+        balances = [account.balance for account in self.bank.accounts.values()]
+        summary = self.bank.summary()
+        self.assertEqual((len(balances), sum(balances, Decimal('0'))), (summary.accounts, summary.total))
+        self.assertEqual(len(balances), sum(count for _, count in summary.histogram))
+        ranking = sorted(self.bank.accounts.values(), key=lambda account: (-account.balance, account.account_id))
+        self.assertEqual([(account.account_id, account.balance) for account in ranking[:5]],
+                         [(account.account_id, account.balance) for account in self.bank.top_accounts(5)])
+
+    def test_summary_and_top_accounts_follow_every_change(self):
+        # GIVEN accounts exist before the first query
+        accounts = [self.bank.create_account(f'name{i}', Decimal(i)) for i in range(20)]
+        self.assert_matches_accounts()
+        rng = random.Random(0)
+
+        # WHEN random operations run, some of them failing, and accounts are created
+        for step in range(500):
+            from_account, to_account = rng.sample(accounts, 2)
+            amount = Decimal(rng.randint(1, 1500)) / 100
+            try:
+                operation = rng.choice(['deposit', 'withdraw', 'transfer', 'batch', 'create'])
+                if operation == 'deposit':
+                    self.bank.deposit(from_account.account_id, amount)
+                elif operation == 'withdraw':
+                    self.bank.withdraw(from_account.account_id, amount)
+                elif operation == 'transfer':
+                    self.bank.transfer(from_account.account_id, to_account.account_id, amount)
+                elif operation == 'batch':
+                    self.bank.apply_batch([('transfer', from_account.account_id, to_account.account_id, amount),
+                                           ('withdraw', to_account.account_id, amount * 2)], atomic=False)
+                elif step % 10 == 0:
+                    accounts.append(self.bank.create_account('late', amount))
+            except InvalidAccountOperationException:
+                pass
+
+            # THEN the aggregates always match a recomputation over all accounts
+            self.assert_matches_accounts()
+
+    def test_load_state_drops_aggregates(self):
+        self.bank.create_account('Andy', Decimal('1'))
+        self.assertEqual(1, self.bank.summary().accounts)
+        self.mock_repository.load_state.return_value = {}
+        self.bank.load_state()
+        self.assertEqual(0, self.bank.summary().accounts)
+        self.assertEqual([], self.bank.top_accounts(3))
+
+
+class TestBankSnapshot(BaseBankTestCase):
+    __test__ = True
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.mock_account_helper.create_account_id.side_effect = (f'mock-account-{i}' for i in range(1000))
+
+    def create_accounts(self):
+        self.andy = self.bank.create_account('Andy', Decimal('100'))
+        self.tom = self.bank.create_account('Tom', Decimal('10'))
+
+    def balances(self, accounts):
+        return {str(account.account_id): account.balance for account in accounts.values()}
+
+    def test_snapshot_is_not_changed_by_later_operations(self):
+        # GIVEN a snapshot of two accounts
+        self.create_accounts()
+        snapshot = self.bank.snapshot()
+
+        # WHEN every kind of change happens after it
+        self.bank.deposit(self.andy.account_id, Decimal('1'))
+        self.bank.transfer(self.andy.account_id, self.tom.account_id, Decimal('50'))
+        self.bank.apply_batch([('withdraw', self.tom.account_id, Decimal('5'))])
+        late = self.bank.create_account('Late', Decimal('7'))
+
+        # THEN the snapshot still shows the accounts as they were
+        self.assertEqual({'mock-account-0': Decimal('100'), 'mock-account-1': Decimal('10')}, self.balances(snapshot))
+        self.assertEqual(Decimal('10'), snapshot[self.tom.account_id].balance)
+        self.assertNotIn(late.account_id, snapshot)
+        # AND a new snapshot shows them as they are now
+        self.assertEqual({'mock-account-0': Decimal('51'), 'mock-account-1': Decimal('55'),
+                          'mock-account-2': Decimal('7')}, self.balances(self.bank.snapshot()))
+
+    def test_accounts_of_a_snapshot_are_copies(self):
+        self.create_accounts()
+        snapshot = self.bank.snapshot()
+        account = snapshot[self.andy.account_id]
+        account.deposit(Decimal('1'))
+        self.assertEqual(Decimal('100'), self.bank.get_account(self.andy.account_id).balance)
+        self.assertEqual(Decimal('100'), snapshot[self.andy.account_id].balance)
+
+    def test_old_balances_are_dropped_with_the_snapshot(self):
+        # GIVEN two snapshots taken at different times
+        self.create_accounts()
+        first = self.bank.snapshot()
+        self.bank.deposit(self.andy.account_id, Decimal('1'))
+        second = self.bank.snapshot()
+
+        # WHEN both accounts change, then the first snapshot is closed and the second dropped
+        self.bank.transfer(self.andy.account_id, self.tom.account_id, Decimal('1'))
+        self.assertEqual((2, 2), (first.versions, second.versions))
+        first.close()
+        del second
+
+        # THEN no old balance is kept any more
+        self.assertEqual(0, len(self.bank._read_views))
+        with self.assertRaises(ClosedReadViewException):
+            first[self.andy.account_id]
+
+    def test_save_state_of_a_snapshot(self):
+        self.create_accounts()
+        saved = {}
+        self.mock_repository.save_state.side_effect = lambda accounts: saved.update(self.balances(accounts))
+        with self.bank.snapshot() as snapshot:
+            self.bank.deposit(self.andy.account_id, Decimal('1'))
+            self.bank.repository.save_state(snapshot)
+        self.assertEqual({'mock-account-0': Decimal('100'), 'mock-account-1': Decimal('10')}, saved)
+
+
+class TestBankStats(TestCase):
+
+    def test_operations_and_repository_are_timed(self):
+        # GIVEN a bank with stats
+        mock_account_helper = create_autospec(AccountHelper)
+        mock_account_helper.create_account_id.return_value = 'mock-account-1'
+        mock_repository = create_autospec(Repository)
+        mock_repository.load_state.return_value = {}
+        bank = Bank(account_helper=mock_account_helper, repository=mock_repository, stats=Stats())
+
+        # WHEN operations succeed and fail
+        account = bank.create_account('Andy', Decimal('1'))
+        bank.withdraw(account.account_id, Decimal('1'))
+        with self.assertRaises(InvalidAccountOperationException):
+            bank.withdraw(account.account_id, Decimal('1'))
+        with self.assertRaises(AccountNotFoundException):
+            bank.deposit('some-account-id', Decimal('1'))
+        bank.save_state()
+
+        # THEN every call is counted, with its error
+        operations = bank.get_stats().snapshot()['operations']
+        self.assertEqual({'create_account', 'withdraw', 'deposit', 'save_state', 'load_state',
+                          'repository.save_state', 'repository.load_state'}, set(operations))
+        self.assertEqual(2, operations['withdraw']['count'])
+        self.assertEqual({'InvalidAccountOperationException': 1}, operations['withdraw']['errors'])
+        self.assertEqual({'AccountNotFoundException': 1}, operations['deposit']['errors'])
+
+    def test_raise_stats_not_enabled_exception_without_stats(self):
+        mock_repository = create_autospec(Repository)
+        mock_repository.load_state.return_value = {}
+        bank = Bank(account_helper=create_autospec(AccountHelper), repository=mock_repository)
+        self.assertNotIn('transfer', vars(bank))
+        with self.assertRaises(StatsNotEnabledException):
+            bank.get_stats()
+
+
+class AccountStoreBankTestCase:
+    # Runs a bank test case again with accounts kept in an AccountStore
+    def setUp(self) -> None:
+        super().setUp()
+        self.mock_repository.load_state.return_value = AccountStore()
+        self.bank.load_state()
+
+
+class TestAccountStoreBankCreateAccount(AccountStoreBankTestCase, TestBankCreateAccount):
+    pass
+
+
+class TestAccountStoreBankGetAccount(AccountStoreBankTestCase, TestBankGetAccount):
+    pass
+
+
+class TestAccountStoreBankDeposit(AccountStoreBankTestCase, TestBankDeposit):
+    pass
+
+
+class TestAccountStoreBankWithdraw(AccountStoreBankTestCase, TestBankWithdraw):
+    pass
+
+
+class TestAccountStoreBankFindAccountsByName(AccountStoreBankTestCase, TestBankFindAccountsByName):
+    pass
+
+
+class TestAccountStoreBankTransfer(AccountStoreBankTestCase, TestBankTransfer):
+    pass
+
+
+class TestAccountStoreBankStatement(AccountStoreBankTestCase, TestBankStatement):
+    pass
+
+
+class TestAccountStoreBankAggregates(AccountStoreBankTestCase, TestBankAggregates):
+    pass
+
+
+class TestAccountStoreBankSnapshot(AccountStoreBankTestCase, TestBankSnapshot):
+    pass
+
+
+class TestAccountStoreBankSettle(AccountStoreBankTestCase, TestBankSettle):
+    pass
+
+
+class TestBankJournal(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = Path(self.tmp_dir.name) / 'state.csv'
+        self.journal_path = Path(self.tmp_dir.name) / 'state.journal'
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def create_bank(self, compact_every=None, accounts_factory=dict, integer_ids=False) -> Bank:
+        return Bank(account_helper=AccountHelper(integer_ids=integer_ids),
+                    repository=Repository(csv_path=self.csv_path),
+                    journal=Journal(self.journal_path, sync_interval=None, compact_every=compact_every),
+                    accounts_factory=accounts_factory)
+
+    def test_recover_unsaved_changes_from_journal(self):
+        # GIVEN changes are made after the last save
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('100.1'))
+        bank.save_state()
+        tom = bank.create_account('Tom', Decimal('1'))
+        bank.deposit(andy.account_id, Decimal('5'))
+        bank.withdraw(tom.account_id, Decimal('0.5'))
+        bank.transfer(andy.account_id, tom.account_id, Decimal('10'))
+        bank.close()
+
+        # WHEN the bank is restarted
+        recovered_bank = self.create_bank()
+
+        # THEN the snapshot and the journal tail are both recovered
+        self.assertEqual(Decimal('95.1'), recovered_bank.get_account(andy.account_id).balance)
+        self.assertEqual(Decimal('10.5'), recovered_bank.get_account(tom.account_id).balance)
+        self.assertEqual('Tom', recovered_bank.get_account(tom.account_id).name)
+        recovered_bank.close()
+
+    def test_recover_settled_transfers_from_journal(self):
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('100'))
+        tom = bank.create_account('Tom', Decimal('0'))
+        bank.queue_transfer(andy.account_id, tom.account_id, Decimal('20'))
+        bank.queue_transfer(tom.account_id, andy.account_id, Decimal('5'))
+        bank.settle()
+        bank.close()
+
+        recovered_bank = self.create_bank()
+        self.assertEqual(Decimal('85'), recovered_bank.get_account(andy.account_id).balance)
+        self.assertEqual(Decimal('15'), recovered_bank.get_account(tom.account_id).balance)
+        recovered_bank.close()
+
+    def test_failed_operation_is_not_journaled(self):
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('1'))
+        with self.assertRaises(AccountNotFoundException):
+            bank.transfer(andy.account_id, 'some-account-id', Decimal('1'))
+        with self.assertRaises(InvalidAccountOperationException):
+            bank.withdraw(andy.account_id, Decimal('2'))
+        bank.close()
+
+        recovered_bank = self.create_bank()
+        self.assertEqual(Decimal('1'), recovered_bank.get_account(andy.account_id).balance)
+        recovered_bank.close()
+
+    def test_save_state_compacts_journal(self):
+        bank = self.create_bank()
+        bank.create_account('Andy', Decimal('1'))
+        bank.save_state()
+        self.assertEqual(0, bank.journal.records_since_compaction)
+        self.assertEqual(0, self.journal_path.stat().st_size)
+        bank.close()
+
+    def test_compact_journal_periodically(self):
+        # GIVEN a journal that is compacted every 3 records
+        bank = self.create_bank(compact_every=3)
+        andy = bank.create_account('Andy', Decimal('1'))
+        bank.deposit(andy.account_id, Decimal('1'))
+        self.assertFalse(self.csv_path.exists())
+
+        # WHEN the third record is written
+        bank.deposit(andy.account_id, Decimal('1'))
+
+        # THEN the journal is folded into a new snapshot
+        self.assertTrue(self.csv_path.exists())
+        self.assertEqual(0, bank.journal.records_since_compaction)
+        bank.close()
+        self.assertEqual(Decimal('3'), self.create_bank().get_account(andy.account_id).balance)
+
+    def test_recover_into_account_store(self):
+        bank = self.create_bank(accounts_factory=AccountStore)
+        andy = bank.create_account('Andy', Decimal('100.1'))
+        bank.save_state()
+        bank.withdraw(andy.account_id, Decimal('0.1'))
+        bank.close()
+
+        recovered_bank = self.create_bank(accounts_factory=AccountStore)
+        self.assertIsInstance(recovered_bank.accounts, AccountStore)
+        self.assertEqual(Decimal('100'), recovered_bank.get_account(andy.account_id).balance)
+        recovered_bank.close()
+
+    def test_journal_batch_as_one_record(self):
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('100'))
+        tom = bank.create_account('Tom', Decimal('0'))
+        bank.apply_batch([('transfer', andy.account_id, tom.account_id, Decimal('1'))] * 3)
+        self.assertEqual(3, bank.journal.records_since_compaction)
+        bank.close()
+
+        recovered_bank = self.create_bank()
+        self.assertEqual(Decimal('97'), recovered_bank.get_account(andy.account_id).balance)
+        self.assertEqual(Decimal('3'), recovered_bank.get_account(tom.account_id).balance)
+        recovered_bank.close()
+
+    def test_recover_integer_ids_by_uuid_string(self):
+        accounts_factory = partial(AccountStore, integer_keys=True)
+        bank = self.create_bank(accounts_factory=accounts_factory, integer_ids=True)
+        andy = bank.create_account('Andy', Decimal('100'))
+        tom = bank.create_account('Tom', Decimal('0'))
+        bank.save_state()
+        bank.transfer(str(andy.account_id), str(tom.account_id), Decimal('1'))
+        bank.close()
+
+        recovered_bank = self.create_bank(accounts_factory=accounts_factory, integer_ids=True)
+        recovered_andy = recovered_bank.get_account(str(andy.account_id))
+        self.assertEqual(andy.account_id, recovered_andy.account_id)
+        self.assertIsInstance(recovered_andy.account_id, AccountKey)
+        self.assertEqual(Decimal('1'), recovered_bank.get_account(tom.account_id).balance)
+        recovered_bank.close()
+
+
+class TestBankIdempotency(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = Path(self.tmp_dir.name) / 'state.csv'
+        self.journal_path = Path(self.tmp_dir.name) / 'state.journal'
+        self.idempotency_path = Path(self.tmp_dir.name) / 'state.csv.idempotency'
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def create_bank(self, concurrent=False) -> Bank:
+        return Bank(account_helper=AccountHelper(),
+                    repository=Repository(csv_path=self.csv_path),
+                    journal=Journal(self.journal_path, sync_interval=None),
+                    concurrent=concurrent,
+                    idempotency=IdempotencyCache(self.idempotency_path))
+
+    def test_retried_requests_return_the_first_result(self):
+        # GIVEN requests made with idempotency keys
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('100'), idempotency_key='create-1')
+        tom = bank.create_account('Tom', Decimal('0'))
+        deposited = bank.deposit(andy.account_id, Decimal('10'), idempotency_key='deposit-1')
+        bank.withdraw(andy.account_id, Decimal('5'), idempotency_key='withdraw-1')
+        bank.transfer(andy.account_id, tom.account_id, Decimal('50'), idempotency_key='transfer-1')
+
+        # WHEN they are retried
+        retried_create = bank.create_account('Andy', Decimal('100'), idempotency_key='create-1')
+        retried_deposit = bank.deposit(andy.account_id, Decimal('10'), idempotency_key='deposit-1')
+        bank.withdraw(andy.account_id, Decimal('5'), idempotency_key='withdraw-1')
+        from_account, to_account = bank.transfer(andy.account_id, tom.account_id, Decimal('50'),
+                                                 idempotency_key='transfer-1')
+
+        # THEN nothing is applied twice and the results are those of the first requests
+        self.assertEqual(2, len(bank.accounts))
+        self.assertEqual((andy.account_id, Decimal('100')), (retried_create.account_id, retried_create.balance))
+        self.assertEqual(Decimal('110'), retried_deposit.balance)
+        self.assertIsNot(deposited, retried_deposit)
+        self.assertEqual((Decimal('55'), Decimal('50')), (from_account.balance, to_account.balance))
+        self.assertEqual(Decimal('55'), bank.get_account(andy.account_id).balance)
+        bank.close()
+
+    def test_raise_exception_for_key_reused_with_other_request(self):
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('100'))
+        bank.deposit(andy.account_id, Decimal('10'), idempotency_key='key-1')
+        with self.assertRaises(IdempotencyKeyReusedException):
+            bank.withdraw(andy.account_id, Decimal('10'), idempotency_key='key-1')
+        self.assertEqual(Decimal('110'), andy.balance)
+        bank.close()
+
+    def test_failed_request_runs_again_when_retried(self):
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('1'))
+        with self.assertRaises(InvalidAccountOperationException):
+            bank.withdraw(andy.account_id, Decimal('2'), idempotency_key='key-1')
+        bank.deposit(andy.account_id, Decimal('1'))
+        self.assertEqual(Decimal('0'), bank.withdraw(andy.account_id, Decimal('2'), idempotency_key='key-1').balance)
+        bank.close()
+
+    def test_keys_survive_restart_from_journal_and_saved_state(self):
+        # GIVEN one keyed request before the last save and one after it
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('100'))
+        bank.deposit(andy.account_id, Decimal('10'), idempotency_key='saved')
+        bank.save_state()
+        bank.deposit(andy.account_id, Decimal('1'), idempotency_key='journaled')
+        bank.deposit(andy.account_id, Decimal('2'))
+        bank.close()
+
+        # WHEN the bank is restarted and both are retried
+        recovered_bank = self.create_bank()
+        saved = recovered_bank.deposit(andy.account_id, Decimal('10'), idempotency_key='saved')
+        journaled = recovered_bank.deposit(andy.account_id, Decimal('1'), idempotency_key='journaled')
+
+        # THEN neither is applied again
+        self.assertEqual((Decimal('110'), Decimal('111')), (saved.balance, journaled.balance))
+        self.assertEqual(Decimal('113'), recovered_bank.get_account(andy.account_id).balance)
+        recovered_bank.close()
+
+    def test_concurrent_retries_are_applied_once(self):
+        bank = self.create_bank(concurrent=True)
+        andy = bank.create_account('Andy', Decimal('0'))
+        threads = [threading.Thread(target=bank.deposit, args=(andy.account_id, Decimal('1')),
+                                    kwargs={'idempotency_key': f'key-{i % 10}'}) for i in range(100)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(Decimal('10'), andy.balance)
+        bank.close()
+
+    def test_raise_idempotency_not_enabled_exception_without_cache(self):
+        mock_repository = create_autospec(Repository)
+        mock_repository.load_state.return_value = {'a': Account('a', 'Tom', Decimal('1'))}
+        bank = Bank(account_helper=create_autospec(AccountHelper), repository=mock_repository)
+        with self.assertRaises(IdempotencyNotEnabledException):
+            bank.deposit('a', Decimal('1'), idempotency_key='key-1')
+        self.assertEqual(Decimal('1'), bank.get_account('a').balance)
+
+
+class TestBankSchedules(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = Path(self.tmp_dir.name) / 'state.csv'
+        self.journal_path = Path(self.tmp_dir.name) / 'state.journal'
+        self.schedules_path = Path(self.tmp_dir.name) / 'state.csv.schedules'
+        self.now = datetime(2026, 1, 31, 9, 0)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def create_bank(self) -> Bank:
+        return Bank(account_helper=AccountHelper(),
+                    repository=Repository(csv_path=self.csv_path),
+                    journal=Journal(self.journal_path, sync_interval=None),
+                    scheduler=TransferScheduler(self.schedules_path, clock=lambda: self.now.timestamp()))
+
+    def test_due_transfers_run_in_one_tick(self):
+        # GIVEN a one-off transfer, a daily one and one that is not due yet
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('100'))
+        tom = bank.create_account('Tom', Decimal('0'))
+        one_off = bank.schedule_transfer(andy.account_id, tom.account_id, Decimal('10'), self.now)
+        daily = bank.schedule_transfer(andy.account_id, tom.account_id, Decimal('1'), self.now, every=timedelta(days=1))
+        later = bank.schedule_transfer(tom.account_id, andy.account_id, Decimal('5'), self.now + timedelta(hours=1))
+
+        # WHEN the due transfers are run twice
+        run = bank.run_due_transfers()
+        self.assertEqual([], bank.run_due_transfers().transfers)
+
+        # THEN the due ones ran once and the daily one waits for the next day
+        self.assertEqual([one_off, daily], run.transfers)
+        self.assertEqual([BatchStatus.APPLIED] * 2, run.statuses)
+        self.assertEqual((Decimal('89'), Decimal('11')), (andy.balance, tom.balance))
+        self.assertEqual([later, daily._replace(due=(self.now + timedelta(days=1)).timestamp())],
+                         bank.get_schedules())
+        bank.close()
+
+    def test_run_that_would_overdraw_is_rejected(self):
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('5'))
+        tom = bank.create_account('Tom', Decimal('0'))
+        bank.schedule_transfer(andy.account_id, tom.account_id, Decimal('10'), self.now, every=timedelta(days=1))
+
+        run = bank.run_due_transfers()
+
+        self.assertEqual([BatchStatus.INSUFFICIENT_BALANCE], run.statuses)
+        self.assertEqual('Ran 0 of 1 due transfers', str(run))
+        self.assertEqual(Decimal('5'), andy.balance)
+        self.assertEqual(1, len(bank.get_schedules()))
+        bank.close()
+
+    def test_raise_exceptions_for_unknown_account_or_schedule(self):
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('5'))
+        with self.assertRaises(AccountNotFoundException):
+            bank.schedule_transfer(andy.account_id, 'some-account-id', Decimal('1'), self.now)
+        with self.assertRaises(ScheduleNotFoundException):
+            bank.cancel_schedule('some-schedule-id')
+        self.assertEqual([], bank.get_schedules())
+        bank.close()
+
+    def test_raise_invalid_account_operation_exception_for_invalid_amounts(self):
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('5'))
+        tom = bank.create_account('Tom', Decimal('0'))
+        for amount in (Decimal('-1'), Decimal('0'), Decimal('0.001')):
+            with self.assertRaises(InvalidAccountOperationException):
+                bank.schedule_transfer(andy.account_id, tom.account_id, amount, self.now, every=timedelta(days=1))
+        self.assertEqual([], bank.get_schedules())
+        bank.close()
+
+    def test_raise_scheduler_not_enabled_exception_without_scheduler(self):
+        bank = Bank(account_helper=AccountHelper(), repository=Repository(csv_path=self.csv_path))
+        andy = bank.create_account('Andy', Decimal('5'))
+        with self.assertRaises(SchedulerNotEnabledException):
+            bank.schedule_transfer(andy.account_id, andy.account_id, Decimal('1'), self.now)
+        with self.assertRaises(SchedulerNotEnabledException):
+            bank.run_due_transfers()
+
+    def test_recover_schedules_and_runs_from_journal(self):
+        # GIVEN transfers scheduled, run and cancelled after the last save
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('100'))
+        tom = bank.create_account('Tom', Decimal('0'))
+        bank.save_state()
+        daily = bank.schedule_transfer(andy.account_id, tom.account_id, Decimal('1'), self.now, every=timedelta(days=1))
+        cancelled = bank.schedule_transfer(andy.account_id, tom.account_id, Decimal('2'), self.now + timedelta(hours=1))
+        bank.run_due_transfers()
+        bank.cancel_schedule(cancelled.schedule_id)
+        bank.close()
+
+        # WHEN the bank restarts
+        recovered_bank = self.create_bank()
+
+        # THEN the run is not repeated and only the next run of the daily transfer is left
+        self.assertEqual([], recovered_bank.run_due_transfers().transfers)
+        self.assertEqual(Decimal('99'), recovered_bank.get_account(andy.account_id).balance)
+        self.assertEqual([daily._replace(due=(self.now + timedelta(days=1)).timestamp())],
+                         recovered_bank.get_schedules())
+        recovered_bank.close()
+
+    def test_save_state_saves_schedules(self):
+        bank = self.create_bank()
+        andy = bank.create_account('Andy', Decimal('100'))
+        transfer = bank.schedule_transfer(andy.account_id, andy.account_id, Decimal('1'), self.now + timedelta(days=1))
+        bank.save_state()
+        bank.close()
+        self.assertEqual(0, self.journal_path.stat().st_size)
+
+        recovered_bank = self.create_bank()
+        self.assertEqual([transfer], recovered_bank.get_schedules())
+        recovered_bank.close()
+
+    def test_runs_are_recorded_in_the_ledger(self):
+        bank = self.create_bank()
+        bank.ledger = Ledger()
+        andy = bank.create_account('Andy', Decimal('100'))
+        tom = bank.create_account('Tom', Decimal('0'))
+        bank.schedule_transfer(andy.account_id, tom.account_id, Decimal('10'), self.now)
+        bank.run_due_transfers()
+        self.assertEqual([(OPEN, Decimal('0')), (TRANSFER_IN, Decimal('10'))],
+                         [(entry.kind, entry.amount) for entry in bank.get_statement(tom.account_id)])
+        bank.close()
+
+
+class TestConcurrentBank(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = Path(self.tmp_dir.name) / 'state.csv'
+        # Switch threads often so that unprotected read-modify-writes would interleave
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+
+    def tearDown(self) -> None:
+        sys.setswitchinterval(self.switch_interval)
+        self.tmp_dir.cleanup()
+
+    def run_stress_test(self, accounts_factory):
+        # GIVEN a concurrent bank with a few accounts
+        bank = Bank(account_helper=AccountHelper(),
+                    repository=Repository(csv_path=self.csv_path),
+                    accounts_factory=accounts_factory,
+                    concurrent=True)
+        account_ids = [bank.create_account(f'name{i}', Decimal('100')).account_id for i in range(20)]
+        errors = []
+
+        def transfer_randomly(seed):
+            rng = random.Random(seed)
+            for _ in range(2000):
+                from_account_id, to_account_id = rng.choice(account_ids), rng.choice(account_ids)
+                try:
+                    bank.transfer(from_account_id, to_account_id, Decimal(rng.randint(1, 5000)) / 100)
+                except InvalidAccountOperationException:
+                    pass
+                except Exception as e:
+                    errors.append(e)
+
+        def create_and_save():
+            for i in range(50):
+                bank.create_account(f'late{i}', Decimal('0'))
+                if i % 10 == 0:
+                    bank.save_state()
+
+        # WHEN transfers in both directions, account creations and saves run in parallel
+        threads = [threading.Thread(target=transfer_randomly, args=(seed,)) for seed in range(8)]
+        threads.append(threading.Thread(target=create_and_save))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # THEN no money is created or lost and no account is overdrawn
+        self.assertEqual([], errors)
+        self.assertEqual(70, len(bank.accounts))
+        balances = [account.balance for account in bank.accounts.values()]
+        self.assertEqual(Decimal('2000'), sum(balances))
+        self.assertTrue(all(balance >= 0 for balance in balances))
+        # AND a saved state is consistent too
+        bank.save_state()
+        saved = Repository(csv_path=self.csv_path).load_state()
+        self.assertEqual(Decimal('2000'), sum(account.balance for account in saved.values()))
+
+    def test_money_is_conserved(self):
+        self.run_stress_test(dict)
+
+    def test_money_is_conserved_with_account_store(self):
+        self.run_stress_test(AccountStore)
+
+    def create_bank(self, accounts_factory=dict) -> Bank:
+        return Bank(account_helper=AccountHelper(),
+                    repository=Repository(csv_path=self.csv_path),
+                    accounts_factory=accounts_factory,
+                    concurrent=True)
+
+    def run_snapshot_test(self, accounts_factory):
+        # GIVEN a concurrent bank with transfers going on
+        bank = self.create_bank(accounts_factory)
+        account_ids = [bank.create_account(f'name{i}', Decimal('100')).account_id for i in range(50)]
+        stop = threading.Event()
+
+        def transfer_randomly(seed):
+            rng = random.Random(seed)
+            while not stop.is_set():
+                try:
+                    bank.transfer(*rng.sample(account_ids, 2), Decimal(rng.randint(1, 5000)) / 100)
+                except InvalidAccountOperationException:
+                    pass
+
+        threads = [threading.Thread(target=transfer_randomly, args=(seed,)) for seed in range(4)]
+        for thread in threads:
+            thread.start()
+
+        # WHEN snapshots are read slowly while the transfers go on
+        totals = []
+        for _ in range(10):
+            with bank.snapshot() as snapshot:
+                total = Decimal('0')
+                for account in snapshot.values():
+                    total += account.balance
+                    time.sleep(0)
+                totals.append((len(snapshot), total))
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        # THEN every snapshot holds all the money, none is seen in the middle of a transfer
+        self.assertEqual([(50, Decimal('5000'))] * 10, totals)
+        self.assertEqual(0, len(bank._read_views))
+
+    def test_snapshots_are_consistent(self):
+        self.run_snapshot_test(dict)
+
+    def test_snapshots_are_consistent_with_account_store(self):
+        self.run_snapshot_test(AccountStore)
+
+    def test_long_reads_do_not_hold_off_writers(self):
+        # GIVEN a concurrent bank and a writer that counts its deposits
+        bank = self.create_bank()
+        account_ids = [bank.create_account(f'name{i}', Decimal('100')).account_id for i in range(100)]
+        # Real thread switching, a throughput comparison
+        sys.setswitchinterval(self.switch_interval)
+        deposits = [0]
+        stop = threading.Event()
+
+        def deposit_repeatedly():
+            while not stop.is_set():
+                bank.deposit(account_ids[deposits[0] % len(account_ids)], Decimal('1'))
+                deposits[0] += 1
+
+        def deposits_per_second_during(read):
+            stop.clear()
+            deposits[0] = 0
+            writer = threading.Thread(target=deposit_repeatedly)
+            started = time.perf_counter()
+            writer.start()
+            read()
+            stop.set()
+            writer.join()
+            return deposits[0] / (time.perf_counter() - started)
+
+        def read_slowly(accounts):
+            # A report that spends most of its time waiting on something else
+            for account in accounts.values():
+                account.balance
+                time.sleep(0.001)
+
+        def read_snapshot():
+            with bank.snapshot() as snapshot:
+                read_slowly(snapshot)
+
+        def read_holding_locks():
+            with bank.locks.hold_all():
+                read_slowly(bank.accounts)
+
+        # WHEN the same slow read runs over a snapshot and with all locks held
+        idle = deposits_per_second_during(lambda: time.sleep(0.1))
+        with_snapshot = deposits_per_second_during(read_snapshot)
+        with_locks = deposits_per_second_during(read_holding_locks)
+
+        # THEN writers keep most of their throughput during the snapshot read, and none while holding the locks
+        self.assertGreater(with_snapshot, idle / 2)
+        self.assertLess(with_locks, with_snapshot / 10)
@@ -0,0 +1,151 @@
+import random
+from decimal import Decimal
+from unittest import TestCase
+
+from src.account import Account, InvalidAccountOperationException
+from src.account_store import AccountStore
+from src.batch import BatchStatus, apply_batch
+
+
+class TestApplyBatch(TestCase):
+    accounts_factory = dict
+
+    def setUp(self):
+        self.accounts = self.accounts_factory()
+        self.accounts['account-1'] = Account('account-1', 'Tom', Decimal('100'))
+        self.accounts['account-2'] = Account('account-2', 'May', Decimal('10'))
+        self.accounts['account-3'] = Account('account-3', 'Ann', Decimal('0'))
+
+    def balances(self):
+        return [self.accounts[account_id].balance for account_id in ('account-1', 'account-2', 'account-3')]
+
+    def test_apply_valid_batch(self):
+        # GIVEN a batch of valid operations
+        operations = [
+            ('deposit', 'account-3', Decimal('5')),
+            ('transfer', 'account-1', 'account-2', Decimal('50.5')),
+            ('withdraw', 'account-2', '60'),
+            ('transfer', 'account-3', 'account-1', 5),
+        ]
+
+        # WHEN the batch is applied
+        result, changed = apply_batch(self.accounts, operations)
+
+        # THEN every operation is applied
+        self.assertTrue(result.committed)
+        self.assertEqual([BatchStatus.APPLIED] * 4, result.statuses.tolist())
+        self.assertEqual(0, result.rejected_rows.size)
+        self.assertEqual([Decimal('54.5'), Decimal('0.5'), Decimal('0')], self.balances())
+        # AND each changed account is reported once
+        self.assertEqual(['account-1', 'account-2'], sorted(account.account_id for account in changed))
+
+    def test_reject_atomic_batch_with_overdraft(self):
+        # GIVEN a batch where a withdrawal happens before the deposit that would cover it
+        operations = [
+            ('transfer', 'account-1', 'account-2', Decimal('1')),
+            ('withdraw', 'account-3', Decimal('5')),
+            ('deposit', 'account-3', Decimal('5')),
+        ]
+
+        # WHEN the batch is applied atomically
+        result, changed = apply_batch(self.accounts, operations, atomic=True)
+
+        # THEN nothing is applied and the overdraft row is reported
+        self.assertFalse(result.committed)
+        self.assertEqual([BatchStatus.ABORTED, BatchStatus.INSUFFICIENT_BALANCE, BatchStatus.ABORTED],
+                         result.statuses.tolist())
+        self.assertEqual([], changed)
+        self.assertEqual([Decimal('100'), Decimal('10'), Decimal('0')], self.balances())
+
+    def test_reject_atomic_batch_with_invalid_rows(self):
+        operations = [
+            ('deposit', 'account-1', Decimal('1')),
+            ('deposit', 'account-4', Decimal('1')),
+            ('withdraw', 'account-1', Decimal('-1')),
+            ('withdraw', 'account-1', Decimal('0.001')),
+            ('refund', 'account-1', Decimal('1')),
+        ]
+        result, _ = apply_batch(self.accounts, operations, atomic=True)
+        self.assertFalse(result.committed)
+        self.assertEqual([BatchStatus.ABORTED, BatchStatus.ACCOUNT_NOT_FOUND, BatchStatus.INVALID_AMOUNT,
+                          BatchStatus.INVALID_AMOUNT, BatchStatus.INVALID_OPERATION], result.statuses.tolist())
+        self.assertEqual([0, 1, 2, 3, 4], result.rejected_rows.tolist())
+        self.assertEqual(Decimal('100'), self.accounts['account-1'].balance)
+
+    def test_apply_non_atomic_batch_in_order(self):
+        # GIVEN a batch where rejecting a row makes a later row succeed
+        operations = [
+            ('withdraw', 'account-2', Decimal('20')),
+            ('transfer', 'account-2', 'account-3', Decimal('10')),
+            ('withdraw', 'account-3', Decimal('10')),
+            ('withdraw', 'account-3', Decimal('1')),
+            ('transfer', 'account-1', 'account-4', Decimal('1')),
+        ]
+
+        # WHEN the batch is applied non-atomically
+        result, _ = apply_batch(self.accounts, operations, atomic=False)
+
+        # THEN rows are accepted and rejected as if applied one by one
+        self.assertTrue(result.committed)
+        self.assertEqual([BatchStatus.INSUFFICIENT_BALANCE, BatchStatus.APPLIED, BatchStatus.APPLIED,
+                          BatchStatus.INSUFFICIENT_BALANCE, BatchStatus.ACCOUNT_NOT_FOUND], result.statuses.tolist())
+        self.assertEqual([Decimal('100'), Decimal('0'), Decimal('0')], self.balances())
+
+    def test_transfer_to_same_account_needs_balance(self):
+        result, _ = apply_batch(self.accounts, [('transfer', 'account-3', 'account-3', Decimal('1'))], atomic=False)
+        self.assertEqual([BatchStatus.INSUFFICIENT_BALANCE], result.statuses.tolist())
+
+    def test_apply_empty_batch(self):
+        result, changed = apply_batch(self.accounts, [])
+        self.assertTrue(result.committed)
+        self.assertEqual(0, result.statuses.size)
+        self.assertEqual([], changed)
+
+    def test_before_write_sees_balances_before_the_batch(self):
+        seen = []
+        apply_batch(self.accounts, [('transfer', 'account-1', 'account-2', Decimal('1')),
+                                    ('transfer', 'account-1', 'account-4', Decimal('1'))], atomic=False,
+                    before_write=lambda *accounts: seen.extend((account.account_id, account.balance)
+                                                               for account in accounts))
+        self.assertEqual([('account-1', Decimal('100')), ('account-2', Decimal('10'))], sorted(seen))
+
+    def test_non_atomic_batch_matches_applying_operations_one_by_one(self):
+        # GIVEN random operations, including overdrafts and unknown accounts
+        rng = random.Random(7)
+        account_ids = ['account-1', 'account-2', 'account-3', 'account-4']
+        operations = []
+        for _ in range(500):
+            kind = rng.choice(['deposit', 'withdraw', 'transfer'])
+            amount = Decimal(rng.randint(1, 3000)) / 100
+            if kind == 'transfer':
+                operations.append((kind, rng.choice(account_ids), rng.choice(account_ids), amount))
+            else:
+                operations.append((kind, rng.choice(account_ids), amount))
+        expected = {account_id: account.balance for account_id, account in self.accounts.items()}
+        expected_statuses = []
+        for operation in operations:
+            touched = [account_id for account_id in operation[1:-1] if account_id in expected]
+            if len(touched) != len(operation) - 2:
+                expected_statuses.append(BatchStatus.ACCOUNT_NOT_FOUND)
+                continue
+            try:
+                if operation[0] != 'deposit':
+                    if expected[operation[1]] < operation[-1]:
+                        raise InvalidAccountOperationException('Insufficient balance')
+                    expected[operation[1]] -= operation[-1]
+                if operation[0] != 'withdraw':
+                    expected[operation[-2]] += operation[-1]
+                expected_statuses.append(BatchStatus.APPLIED)
+            except InvalidAccountOperationException:
+                expected_statuses.append(BatchStatus.INSUFFICIENT_BALANCE)
+
+        # WHEN they are applied as a non-atomic batch
+        result, _ = apply_batch(self.accounts, operations, atomic=False)
+
+        # THEN statuses and balances are the same as applying them one by one
+        self.assertEqual(expected_statuses, result.statuses.tolist())
+        self.assertEqual(expected, {account_id: account.balance for account_id, account in self.accounts.items()})
+
+
+class TestApplyBatchWithAccountStore(TestApplyBatch):
+    accounts_factory = AccountStore
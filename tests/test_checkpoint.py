@@ -0,0 +1,187 @@
+import tempfile
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from unittest import TestCase
+
+from src.account_helper import AccountHelper
+from src.account_store import AccountStore
+from src.bank import Bank
+from src.checkpoint import Checkpointer
+from src.commands import execute_command, parse_command
+from src.idempotency import IdempotencyCache
+from src.journal import Journal
+from src.repository import Repository
+from src.scheduler import TransferScheduler
+
+
+class FailingRepository(Repository):
+
+    def save_state(self, accounts):
+        raise OSError('Disk full')
+
+
+class TestCheckpointer(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = Path(self.tmp_dir.name) / 'state.csv'
+        self.journal_path = Path(self.tmp_dir.name) / 'state.journal'
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def create_bank(self, repository=None, accounts_factory=dict, concurrent=False) -> Bank:
+        return Bank(account_helper=AccountHelper(),
+                    repository=repository or Repository(csv_path=self.csv_path),
+                    journal=Journal(self.journal_path, sync_interval=None),
+                    accounts_factory=accounts_factory,
+                    concurrent=concurrent)
+
+    def test_checkpoint_writes_state_and_drops_rotated_journal(self):
+        # GIVEN a bank with a checkpointer
+        bank = self.create_bank(accounts_factory=AccountStore)
+        checkpointer = Checkpointer(bank)
+        andy = bank.create_account('Andy', Decimal('10'))
+
+        # WHEN a checkpoint is taken and the bank changes while it is written
+        bank.save_state()
+        bank.deposit(andy.account_id, Decimal('5'))
+        checkpointer.wait()
+
+        # THEN the state file holds the accounts as they were and the rotated journal is gone
+        saved = Repository(csv_path=self.csv_path).load_state()
+        self.assertEqual(Decimal('10'), saved[andy.account_id].balance)
+        self.assertFalse(bank.journal.rotated_path.exists())
+        self.assertEqual(1, checkpointer.last_report.accounts)
+        # AND a restarted bank has the later change from the journal
+        bank.close()
+        recovered_bank = self.create_bank()
+        self.assertEqual(Decimal('15'), recovered_bank.get_account(andy.account_id).balance)
+        recovered_bank.close()
+
+    def test_checkpoint_saves_idempotency_keys(self):
+        idempotency_path = Path(self.tmp_dir.name) / 'state.csv.idempotency'
+        bank = self.create_bank()
+        bank.idempotency = IdempotencyCache(idempotency_path)
+        checkpointer = Checkpointer(bank)
+        andy = bank.create_account('Andy', Decimal('10'), idempotency_key='key-1')
+
+        bank.save_state()
+        checkpointer.wait()
+
+        cache = IdempotencyCache(idempotency_path)
+        cache.load()
+        self.assertEqual(andy.account_id, cache.get('key-1', ('create_account', 'Andy', '10'))[0].account_id)
+        bank.close()
+
+    def test_checkpoint_saves_schedules(self):
+        schedules_path = Path(self.tmp_dir.name) / 'state.csv.schedules'
+        bank = self.create_bank()
+        bank.scheduler = TransferScheduler(schedules_path)
+        checkpointer = Checkpointer(bank)
+        andy = bank.create_account('Andy', Decimal('10'))
+        transfer = bank.schedule_transfer(andy.account_id, andy.account_id, Decimal('1'), datetime(2099, 1, 1))
+
+        bank.save_state()
+        checkpointer.wait()
+
+        scheduler = TransferScheduler(schedules_path)
+        scheduler.load()
+        self.assertEqual([transfer], scheduler.upcoming())
+        bank.close()
+
+    def test_failed_checkpoint_keeps_rotated_journal(self):
+        # GIVEN a bank whose state file cannot be written
+        bank = self.create_bank(repository=FailingRepository(csv_path=self.csv_path))
+        checkpointer = Checkpointer(bank)
+        andy = bank.create_account('Andy', Decimal('10'))
+
+        # WHEN checkpoints fail
+        with self.assertLogs('src.checkpoint', level='ERROR'):
+            bank.save_state()
+            checkpointer.wait()
+        bank.deposit(andy.account_id, Decimal('5'))
+        with self.assertLogs('src.checkpoint', level='ERROR'):
+            bank.save_state()
+            checkpointer.wait()
+        bank.close()
+
+        # THEN no record is lost
+        self.assertEqual(2, checkpointer.failures)
+        self.assertIsNone(checkpointer.last_report)
+        self.assertTrue(bank.journal.rotated_path.exists())
+        recovered_bank = self.create_bank()
+        self.assertEqual(Decimal('15'), recovered_bank.get_account(andy.account_id).balance)
+        recovered_bank.close()
+
+    def test_checkpoint_every_operations(self):
+        bank = self.create_bank()
+        checkpointer = Checkpointer(bank, every_operations=3)
+        andy = bank.create_account('Andy', Decimal('10'))
+        bank.deposit(andy.account_id, Decimal('1'))
+        self.assertFalse(self.csv_path.exists())
+
+        bank.deposit(andy.account_id, Decimal('1'))
+        checkpointer.wait()
+
+        self.assertEqual(Decimal('12'), Repository(csv_path=self.csv_path).load_state()[andy.account_id].balance)
+        self.assertEqual(0, checkpointer.operations_since_checkpoint)
+        bank.close()
+
+    def test_checkpoint_every_seconds(self):
+        bank = self.create_bank()
+        checkpointer = Checkpointer(bank, every_seconds=60)
+        andy = bank.create_account('Andy', Decimal('10'))
+        self.assertFalse(self.csv_path.exists())
+
+        checkpointer.last_started -= 60
+        bank.deposit(andy.account_id, Decimal('1'))
+        checkpointer.wait()
+
+        self.assertEqual(Decimal('11'), Repository(csv_path=self.csv_path).load_state()[andy.account_id].balance)
+        bank.close()
+
+    def test_report_counts_operations_blocked_by_the_pause(self):
+        # GIVEN a concurrent bank whose read views take a while to open
+        bank = self.create_bank(concurrent=True)
+        checkpointer = Checkpointer(bank)
+        andy = bank.create_account('Andy', Decimal('10'))
+        opening = threading.Event()
+        read_view = bank.read_view
+
+        def slow_read_view():
+            opening.set()
+            time.sleep(0.1)
+            return read_view()
+
+        bank.read_view = slow_read_view
+
+        # WHEN a deposit comes in while the view is opened
+        depositor = threading.Thread(target=lambda: opening.wait() and bank.deposit(andy.account_id, Decimal('1')))
+        depositor.start()
+        bank.save_state()
+        depositor.join()
+        checkpointer.wait()
+
+        # THEN the report shows the pause and the blocked deposit
+        report = checkpointer.last_report
+        self.assertEqual(1, report.blocked_operations)
+        self.assertGreaterEqual(report.pause, 0.1)
+        self.assertGreaterEqual(report.duration, report.pause)
+        bank.close()
+
+    def test_save_state_command_reports_last_checkpoint(self):
+        bank = self.create_bank()
+        checkpointer = Checkpointer(bank)
+        bank.create_account('Andy', Decimal('10'))
+
+        self.assertEqual(['Saving bank state in the background'], execute_command(bank, *parse_command('save_state')))
+        checkpointer.wait()
+        lines = execute_command(bank, *parse_command('save_state'))
+
+        self.assertEqual('Saving bank state in the background', lines[0])
+        self.assertRegex(lines[1], r'^Last checkpoint: Checkpointed 1 accounts in .*, 0 operations blocked$')
+        bank.close()
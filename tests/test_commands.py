@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import TestCase
+from unittest.mock import create_autospec
+
+import numpy as np
+
+from src.account import Account
+from src.aggregates import BALANCE_BUCKET_BOUNDS, BalanceSummary
+from src.bank import Bank
+from src.batch import BatchStatus
+from src.commands import InvalidCommandException, execute_command, parse_command
+from src.ledger import DEPOSIT, TRANSFER_IN, LedgerEntry
+from src.netting import NettingResult
+from src.scheduler import ScheduledTransfer, ScheduleRun
+
+
+class TestParseCommand(TestCase):
+    def test_parse_command_with_numeric_args(self):
+        self.assertEqual(('transfer', {'from_account_id': 'a', 'to_account_id': 'b', 'amount': Decimal('1.5')}),
+                         parse_command('transfer a b 1.5'))
+
+    def test_parse_command_without_args(self):
+        self.assertEqual(('save_state', {}), parse_command('  save_state  '))
+
+    def test_raise_invalid_command_exception_for_unknown_or_empty_command(self):
+        for user_input in ('withdraw_all a', '', '   '):
+            with self.assertRaisesRegex(InvalidCommandException, 'Invalid command'):
+                parse_command(user_input)
+
+    def test_raise_invalid_command_exception_for_wrong_number_of_arguments(self):
+        with self.assertRaisesRegex(InvalidCommandException, 'Invalid number of arguments'):
+            parse_command('deposit a')
+
+    def test_parse_integer_argument(self):
+        self.assertEqual(('top_accounts', {'count': 5}), parse_command('top_accounts 5'))
+
+    def test_raise_invalid_command_exception_for_non_positive_integer_argument(self):
+        for user_input in ('top_accounts 0', 'top_accounts -1', 'top_accounts 1.5', 'top_accounts x'):
+            with self.assertRaisesRegex(InvalidCommandException, 'count should be a positive whole number'):
+                parse_command(user_input)
+
+    def test_parse_optional_argument(self):
+        self.assertEqual(('schedule_transfer', {'from_account_id': 'a', 'to_account_id': 'b', 'amount': Decimal('1'),
+                                                'at': datetime(2026, 1, 31, 9, 0)}),
+                         parse_command('schedule_transfer a b 1 2026-01-31T09:00'))
+        self.assertEqual(timedelta(days=1, hours=12),
+                         parse_command('schedule_transfer a b 1 2026-01-31T09:00 1d12h')[1]['every'])
+        with self.assertRaisesRegex(InvalidCommandException, 'Invalid number of arguments'):
+            parse_command('schedule_transfer a b 1 2026-01-31T09:00 1d 2d')
+
+    def test_raise_invalid_command_exception_for_invalid_date_or_duration(self):
+        with self.assertRaisesRegex(InvalidCommandException, 'at should be a date and time'):
+            parse_command('schedule_transfer a b 1 tomorrow')
+        for every in ('1', 'd', '1x', '1d-', '0h'):
+            with self.assertRaisesRegex(InvalidCommandException, 'every should be'):
+                parse_command(f'schedule_transfer a b 1 2026-01-31T09:00 {every}')
+
+    def test_raise_invalid_command_exception_for_non_numeric_amount(self):
+        with self.assertRaisesRegex(InvalidCommandException, 'amount should be in numerical format'):
+            parse_command('deposit a ten')
+
+
+class TestExecuteCommand(TestCase):
+    def setUp(self):
+        self.bank = create_autospec(Bank)
+
+    def test_execute_transfer(self):
+        self.bank.transfer.return_value = (Account('a', 'Tom', Decimal('1')), Account('b', 'May', Decimal('2')))
+        lines = execute_command(self.bank, *parse_command('transfer a b 1.5'))
+        self.bank.transfer.assert_called_once_with(from_account_id='a', to_account_id='b', amount=Decimal('1.5'))
+        self.assertEqual(['Transferred 1.5 from account a to account b',
+                          'From account state after transfer: <Account account_id=a, name=Tom, balance=1>',
+                          'To account state after transfer: <Account account_id=b, name=May, balance=2>'], lines)
+
+    def test_execute_queue_transfer(self):
+        self.bank.queue_transfer.return_value = 3
+        self.assertEqual(['Queued transfer #3 of 1.5 from account a to account b'],
+                         execute_command(self.bank, *parse_command('queue_transfer a b 1.5')))
+        self.bank.queue_transfer.assert_called_once_with(from_account_id='a', to_account_id='b',
+                                                         amount=Decimal('1.5'))
+
+    def test_execute_settle(self):
+        transfers = [('transfer', 'a', 'b', Decimal('1')), ('transfer', 'b', 'a', Decimal('2')),
+                     ('transfer', 'b', 'c', Decimal('5'))]
+        statuses = np.array([BatchStatus.APPLIED, BatchStatus.APPLIED, BatchStatus.INSUFFICIENT_BALANCE],
+                            dtype=np.uint8)
+        self.bank.settle.return_value = NettingResult(transfers, statuses, balance_writes=2)
+        self.assertEqual(['Settled 2 of 3 transfers with 2 balance writes instead of 4',
+                          'Transfer #2 of 5 from account b to account c not settled: insufficient balance'],
+                         execute_command(self.bank, *parse_command('settle')))
+
+    def test_execute_schedule_commands(self):
+        transfer = ScheduledTransfer('s1', 'a', 'b', Decimal('1.5'), datetime(2026, 1, 31, 9, 0).timestamp(),
+                                     timedelta(days=7).total_seconds())
+        self.bank.schedule_transfer.return_value = transfer
+        self.bank.get_schedules.return_value = [transfer]
+        self.bank.cancel_schedule.return_value = transfer
+
+        self.assertEqual(['Scheduled transfer s1: 1.5 from account a to account b at 2026-01-31 09:00:00, '
+                          'every 7 days, 0:00:00'],
+                         execute_command(self.bank, *parse_command('schedule_transfer a b 1.5 2026-01-31T09:00 1w')))
+        self.bank.schedule_transfer.assert_called_once_with(from_account_id='a', to_account_id='b',
+                                                            amount=Decimal('1.5'), at=datetime(2026, 1, 31, 9, 0),
+                                                            every=timedelta(weeks=1))
+        self.assertEqual(1, len(execute_command(self.bank, *parse_command('list_schedules'))))
+        self.assertEqual([f'Cancelled scheduled transfer {transfer}'],
+                         execute_command(self.bank, *parse_command('cancel_schedule s1')))
+        self.bank.get_schedules.return_value = []
+        self.assertEqual(['No scheduled transfers'], execute_command(self.bank, *parse_command('list_schedules')))
+
+    def test_execute_run_due(self):
+        transfer = ScheduledTransfer('s1', 'a', 'b', Decimal('5'), 0.0)
+        self.bank.run_due_transfers.return_value = ScheduleRun(
+            [transfer, transfer], [BatchStatus.APPLIED, BatchStatus.INSUFFICIENT_BALANCE])
+        self.assertEqual(['Ran 1 of 2 due transfers',
+                          'Scheduled transfer s1 of 5 from account a to account b not run: insufficient balance'],
+                         execute_command(self.bank, *parse_command('run_due')))
+
+    def test_execute_save_state(self):
+        self.assertEqual(['Saved current bank state'], execute_command(self.bank, *parse_command('save_state')))
+        self.bank.save_state.assert_called_once_with()
+
+    def test_execute_find_account_by_name(self):
+        self.bank.find_accounts_by_name.return_value = [Account('a', 'Tom', Decimal('1'))]
+        self.assertEqual(['Found account: <Account account_id=a, name=Tom, balance=1>'],
+                         execute_command(self.bank, *parse_command('find_account tom')))
+        self.bank.find_accounts_by_name.assert_called_once_with('tom')
+
+    def test_execute_find_account_by_prefix(self):
+        self.bank.find_accounts_by_name_prefix.return_value = [Account(str(i), 'Tom', Decimal('1')) for i in range(101)]
+        lines = execute_command(self.bank, *parse_command('find_account to*'))
+        self.bank.find_accounts_by_name_prefix.assert_called_once_with('to', limit=101)
+        self.assertEqual(101, len(lines))
+        self.assertEqual('Showing the first 100 accounts only', lines[-1])
+
+    def test_execute_find_account_without_match(self):
+        self.bank.find_accounts_by_name.return_value = []
+        self.assertEqual(['No account found for Tom'], execute_command(self.bank, *parse_command('find_account Tom')))
+
+    def test_execute_statement(self):
+        timestamp = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        self.bank.get_statement.return_value = [
+            LedgerEntry(7, timestamp, 'a', TRANSFER_IN, Decimal('2.00'), Decimal('3.00'), 'b'),
+            LedgerEntry(3, timestamp, 'a', DEPOSIT, Decimal('1.00'), Decimal('1.00'), None),
+        ]
+        self.assertEqual(['2024-01-02 03:04:05 #7 transfer_in 2.00 balance 3.00 (b)',
+                          '2024-01-02 03:04:05 #3 deposit 1.00 balance 1.00'],
+                         execute_command(self.bank, *parse_command('statement a')))
+        self.bank.get_statement.assert_called_once_with('a', limit=20, newest_first=True)
+
+    def test_execute_stats(self):
+        self.bank.get_stats.return_value.format.return_value = ['transfer: 1 calls']
+        self.assertEqual(['transfer: 1 calls'], execute_command(self.bank, *parse_command('stats')))
+
+    def test_execute_summary(self):
+        histogram = [(bound, 0) for bound in [Decimal('0')] + BALANCE_BUCKET_BOUNDS]
+        histogram[0] = (Decimal('0'), 1)
+        histogram[3] = (Decimal('100'), 2)
+        histogram[-1] = (BALANCE_BUCKET_BOUNDS[-1], 1)
+        self.bank.summary.return_value = BalanceSummary(4, Decimal('1000000300.5'), histogram)
+        self.assertEqual(['4 accounts holding 1000000300.5 in total',
+                          '0 <= balance < 1: 1 accounts',
+                          '100 <= balance < 1000: 2 accounts',
+                          'balance >= 1000000000: 1 accounts'],
+                         execute_command(self.bank, *parse_command('summary')))
+
+    def test_execute_top_accounts(self):
+        self.bank.top_accounts.return_value = [Account('b', 'May', Decimal('2')), Account('a', 'Tom', Decimal('1'))]
+        self.assertEqual(['#1 <Account account_id=b, name=May, balance=2>',
+                          '#2 <Account account_id=a, name=Tom, balance=1>'],
+                         execute_command(self.bank, *parse_command('top_accounts 2')))
+        self.bank.top_accounts.assert_called_once_with(2)
@@ -0,0 +1,77 @@
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import TestCase
+
+from src.account import Account
+from src.idempotency import IdempotencyCache, IdempotencyKeyReusedException
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestIdempotencyCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / 'state.csv.idempotency'
+        self.clock = FakeClock()
+        self.cache = IdempotencyCache(self.path, max_entries=2, ttl=60, clock=self.clock)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def put(self, key: str, balance: str = '1'):
+        self.cache.put(key, ('deposit', 'a', '1'), [Account('a', 'Tom', Decimal(balance))], self.cache.expiry())
+
+    def test_get_returns_copies_of_the_remembered_accounts(self):
+        self.put('key-1', '5')
+        accounts = self.cache.get('key-1', ('deposit', 'a', '1'))
+        self.assertEqual([('a', 'Tom', Decimal('5'))],
+                         [(account.account_id, account.name, account.balance) for account in accounts])
+        self.assertIsNone(self.cache.get('key-2', ('deposit', 'a', '1')))
+
+    def test_raise_exception_for_key_reused_with_other_request(self):
+        self.put('key-1')
+        with self.assertRaisesRegex(IdempotencyKeyReusedException, 'key-1 was already used'):
+            self.cache.get('key-1', ('deposit', 'a', '2'))
+
+    def test_entries_expire_after_ttl(self):
+        self.put('key-1')
+        self.clock.now += 59
+        self.assertIsNotNone(self.cache.get('key-1', ('deposit', 'a', '1')))
+        self.clock.now += 1
+        self.assertIsNone(self.cache.get('key-1', ('deposit', 'a', '1')))
+        self.assertEqual(0, len(self.cache))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.put('key-1')
+        self.put('key-2')
+        self.cache.get('key-1', ('deposit', 'a', '1'))
+        self.put('key-3')
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNone(self.cache.get('key-2', ('deposit', 'a', '1')))
+        self.assertIsNotNone(self.cache.get('key-1', ('deposit', 'a', '1')))
+
+    def test_save_and_load_keep_unexpired_entries_in_order(self):
+        self.put('key-1', '1')
+        self.clock.now += 30
+        self.put('key-2', '2')
+        self.cache.save()
+
+        cache = IdempotencyCache(self.path, max_entries=2, ttl=60, clock=self.clock)
+        self.clock.now += 31
+        cache.load()
+
+        self.assertEqual(1, len(cache))
+        self.assertEqual(Decimal('2'), cache.get('key-2', ('deposit', 'a', '1'))[0].balance)
+
+    def test_copy_is_not_changed_by_the_cache(self):
+        self.put('key-1')
+        copy = self.cache.copy()
+        self.put('key-2')
+        self.assertEqual(1, len(copy))
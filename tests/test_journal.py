@@ -0,0 +1,245 @@
+import tempfile
+import unittest
+from decimal import Decimal
+from pathlib import Path
+
+from src.account import Account
+from src.journal import COMMITTED, PREPARED, Journal
+from src.scheduler import ScheduledTransfer
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.journal_path = Path(self.tmp_dir.name) / 'bank.journal'
+        self.journal = Journal(self.journal_path, sync_interval=None)
+
+    def tearDown(self):
+        self.journal.close()
+        self.tmp_dir.cleanup()
+
+    def test_append_records(self):
+        account_1 = Account('account-1', 'A', Decimal('1'))
+        account_2 = Account('account-2', 'B', Decimal('2.2'))
+        self.journal.append_create(account_1)
+        self.journal.append_create(account_2)
+        account_1.balance = Decimal('0.5')
+        account_2.balance = Decimal('2.7')
+        self.journal.append_balances([account_1, account_2])
+        self.journal.close()
+
+        expected_journal_data = b'''C,account-1,A,1
+C,account-2,B,2.2
+U,account-1,0.5,account-2,2.7
+'''
+        with open(self.journal_path, 'rb') as f:
+            self.assertEqual(expected_journal_data, f.read())
+        self.assertEqual(3, self.journal.records_since_compaction)
+
+    def test_replay_records_over_snapshot(self):
+        # GIVEN a snapshot and a journal written after it
+        accounts = {'account-1': Account('account-1', 'A', Decimal('1'))}
+        with open(self.journal_path, 'wb') as f:
+            f.write(b'''C,account-2,B,2.2
+U,account-1,0.5,account-2,2.7
+''')
+
+        # WHEN the journal is replayed
+        replayed = self.journal.replay(accounts)
+
+        # THEN the accounts reflect every journaled change
+        self.assertEqual(2, replayed)
+        self.assertEqual(['account-1', 'account-2'], list(accounts.keys()))
+        self.assertEqual(Decimal('0.5'), accounts['account-1'].balance)
+        self.assertEqual('B', accounts['account-2'].name)
+        self.assertEqual(Decimal('2.7'), accounts['account-2'].balance)
+
+    def test_replay_is_idempotent(self):
+        with open(self.journal_path, 'wb') as f:
+            f.write(b'''C,account-1,A,1
+U,account-1,0.5
+''')
+        accounts = {}
+        self.journal.replay(accounts)
+        self.journal.replay(accounts)
+        self.assertEqual(Decimal('0.5'), accounts['account-1'].balance)
+
+    def test_discard_torn_record(self):
+        # GIVEN the last record was cut short by a crash
+        with open(self.journal_path, 'wb') as f:
+            f.write(b'''C,account-1,A,1
+U,account-1,0.''')
+
+        # WHEN the journal is replayed and appended to
+        accounts = {}
+        replayed = self.journal.replay(accounts)
+        self.assertEqual(1, replayed)
+        self.assertEqual(Decimal('1'), accounts['account-1'].balance)
+        accounts['account-1'].balance = Decimal('3')
+        self.journal.append_balances([accounts['account-1']])
+        self.journal.close()
+
+        # THEN the torn record is dropped and new records start on a fresh line
+        with open(self.journal_path, 'rb') as f:
+            self.assertEqual(b'C,account-1,A,1\nU,account-1,3\n', f.read())
+
+    def test_replay_names_with_line_breaks(self):
+        # GIVEN accounts whose names contain line breaks, followed by more records
+        names = ['Ann\nSmith', 'Ann\r\nSmith', 'Ann\u2028Smith', 'Ann\x1cSmith']
+        accounts = [Account(f'account-{i}', name, Decimal('1')) for i, name in enumerate(names)]
+        for account in accounts:
+            self.journal.append_create(account)
+        accounts[0].balance = Decimal('2')
+        self.journal.append_balances([accounts[0]])
+        self.journal.close()
+
+        # WHEN the journal is replayed
+        replayed_accounts = {}
+        replayed = self.journal.replay(replayed_accounts)
+
+        # THEN every record is replayed with the names as written
+        self.assertEqual(5, replayed)
+        self.assertEqual(names, [account.name for account in replayed_accounts.values()])
+        self.assertEqual(Decimal('2'), replayed_accounts['account-0'].balance)
+
+    def test_discard_torn_record_within_quoted_name(self):
+        # GIVEN the last record was cut short by a crash after a line break in a quoted name
+        with open(self.journal_path, 'wb') as f:
+            f.write(b'C,account-1,A,1\nC,account-2,"Ann\n')
+
+        # WHEN the journal is replayed and appended to
+        accounts = {}
+        self.assertEqual(1, self.journal.replay(accounts))
+        self.journal.append_create(Account('account-3', 'B', Decimal('1')))
+        self.journal.close()
+
+        # THEN the torn record is dropped and the new one is replayed after a restart
+        accounts = {}
+        journal = Journal(self.journal_path, sync_interval=None)
+        self.assertEqual(2, journal.replay(accounts))
+        journal.close()
+        self.assertEqual(['account-1', 'account-3'], list(accounts))
+
+    def test_reset_truncates_journal(self):
+        self.journal.append_create(Account('account-1', 'A', Decimal('1')))
+        self.journal.reset()
+        self.assertEqual(0, self.journal.records_since_compaction)
+        self.assertEqual(0, self.journal.replay({}))
+
+    def test_needs_compaction(self):
+        journal = Journal(self.journal_path, sync_interval=None, compact_every=2)
+        account = Account('account-1', 'A', Decimal('1'))
+        journal.append_create(account)
+        self.assertFalse(journal.needs_compaction)
+        journal.append_balances([account])
+        self.assertTrue(journal.needs_compaction)
+        journal.close()
+
+    def test_replay_prepared_transactions(self):
+        # GIVEN one transaction prepared and committed and one only prepared
+        account = Account('account-1', 'A', Decimal('10'))
+        self.journal.append_create(account)
+        account.balance = Decimal('7')
+        self.journal.append_transaction('tx-1', PREPARED, ['debit', 'account-1', '3'], [account])
+        self.journal.append_transaction('tx-1', COMMITTED)
+        account.balance = Decimal('5')
+        self.journal.append_transaction('tx-2', PREPARED, ['debit', 'account-1', '2'], [account])
+        self.journal.close()
+
+        # WHEN the journal is replayed
+        accounts = {}
+        journal = Journal(self.journal_path, sync_interval=None)
+        self.assertEqual(4, journal.replay(accounts))
+
+        # THEN balances are restored and only the open transaction is remembered
+        self.assertEqual(Decimal('5'), accounts['account-1'].balance)
+        self.assertEqual({'tx-2': ['debit', 'account-1', '2']}, journal.transactions)
+
+    def test_reset_keeps_prepared_transactions(self):
+        self.journal.append_transaction('tx-1', PREPARED, ['credit', 'account-1', '3'])
+        self.journal.append_transaction('tx-2', PREPARED, ['credit', 'account-1', '4'])
+        self.journal.append_transaction('tx-1', COMMITTED)
+
+        self.journal.reset()
+
+        journal = Journal(self.journal_path, sync_interval=None)
+        journal.replay({})
+        self.assertEqual({'tx-2': ['credit', 'account-1', '4']}, journal.transactions)
+        self.assertEqual(1, self.journal.records_since_compaction)
+
+    def test_replay_missing_journal(self):
+        self.assertEqual(0, self.journal.replay({}))
+
+    def test_rotated_records_are_replayed_first(self):
+        # GIVEN records before and after a rotation
+        account = Account('account-1', 'A', Decimal('1'))
+        self.journal.append_create(account)
+        self.journal.append_transaction('tx-1', PREPARED, ['credit', 'account-1', '3'])
+        self.journal.rotate()
+        account.balance = Decimal('2')
+        self.journal.append_balances([account])
+        self.journal.close()
+
+        # WHEN the journal is replayed
+        journal = Journal(self.journal_path, sync_interval=None)
+        accounts = {}
+        replayed = journal.replay(accounts)
+
+        # THEN the rotated records come first and the prepared transaction is carried over
+        self.assertEqual(Decimal('2'), accounts['account-1'].balance)
+        self.assertEqual({'tx-1': ['credit', 'account-1', '3']}, journal.transactions)
+        self.assertEqual(4, replayed)
+
+    def test_rotate_again_before_drop_keeps_records(self):
+        account = Account('account-1', 'A', Decimal('1'))
+        self.journal.append_create(account)
+        self.journal.rotate()
+        account.balance = Decimal('2')
+        self.journal.append_balances([account])
+        self.journal.rotate()
+        self.assertEqual('C,account-1,A,1\nU,account-1,2\n', self.journal.rotated_path.read_text())
+        self.assertEqual('', self.journal_path.read_text())
+
+        self.journal.drop_rotated()
+        self.assertFalse(self.journal.rotated_path.exists())
+
+    def test_reset_drops_rotated_records(self):
+        self.journal.append_create(Account('account-1', 'A', Decimal('1')))
+        self.journal.rotate()
+        self.journal.reset()
+        self.assertFalse(self.journal.rotated_path.exists())
+
+    def test_idempotent_records_are_applied_and_collected(self):
+        account = Account('account-1', 'A', Decimal('1'))
+        self.journal.append_create(account, ('key-1', 1000.5, ('create_account', 'A', '1')))
+        account.balance = Decimal('3')
+        self.journal.append_balances([account], ('key-2', 2000.0, ('deposit', 'account-1', '2')))
+        self.journal.close()
+
+        journal = Journal(self.journal_path, sync_interval=None)
+        accounts = {}
+        self.assertEqual(2, journal.replay(accounts))
+
+        self.assertEqual(Decimal('3'), accounts['account-1'].balance)
+        self.assertEqual([('key-1', 1000.5, ['create_account', 'A', '1'], [('account-1', Decimal('1'))]),
+                          ('key-2', 2000.0, ['deposit', 'account-1', '2'], [('account-1', Decimal('3'))])],
+                         journal.idempotent_requests)
+
+    def test_schedule_records_are_applied_and_collected(self):
+        # GIVEN a transfer scheduled, then run together with its balances, and one cancelled
+        accounts = {'a': Account('a', 'A', Decimal('10')), 'b': Account('b', 'B', Decimal('0'))}
+        scheduled = ScheduledTransfer('s1', 'a', 'b', Decimal('2.5'), 1000.0, 60.0)
+        self.journal.append_schedules([('s1', scheduled)])
+        accounts['a'].balance, accounts['b'].balance = Decimal('7.5'), Decimal('2.5')
+        self.journal.append_schedules([('s1', scheduled._replace(due=1060.0)), ('s2', None)], accounts.values())
+        self.journal.close()
+
+        # WHEN the journal is replayed
+        journal = Journal(self.journal_path, sync_interval=None)
+        replayed = {'a': Account('a', 'A', Decimal('10')), 'b': Account('b', 'B', Decimal('0'))}
+        self.assertEqual(2, journal.replay(replayed))
+
+        # THEN the balances are set and the schedule changes are collected in order
+        self.assertEqual((Decimal('7.5'), Decimal('2.5')), (replayed['a'].balance, replayed['b'].balance))
+        self.assertEqual([('s1', scheduled), ('s1', scheduled._replace(due=1060.0)), ('s2', None)],
+                         journal.schedule_changes)
@@ -0,0 +1,81 @@
+import tempfile
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.account import InvalidAccountOperationException
+from src.ledger import DEPOSIT, OPEN, TRANSFER_IN, WITHDRAW, Ledger
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class TestLedger(TestCase):
+    def setUp(self):
+        self.ledger = Ledger(segment_size=4, max_segments_in_memory=None)
+
+    def record_at(self, seconds: int, account_id: str, kind: str, amount_units: int, balance_units: int,
+                  counterparty=None) -> int:
+        moment = START + timedelta(seconds=seconds)
+        with patch('src.ledger.time.time_ns', return_value=int(moment.timestamp()) * 10 ** 9):
+            return self.ledger.record(account_id, kind, amount_units, balance_units, counterparty)
+
+    def test_statement_of_one_account(self):
+        self.record_at(0, 'a', OPEN, 1000, 1000)
+        self.record_at(1, 'b', OPEN, 0, 0)
+        self.record_at(2, 'a', DEPOSIT, 250, 1250)
+        self.record_at(3, 'b', TRANSFER_IN, 50, 50, counterparty='a')
+
+        entries = self.ledger.statement('a')
+
+        self.assertEqual([0, 2], [entry.sequence for entry in entries])
+        self.assertEqual([Decimal('10.00'), Decimal('12.50')], [entry.balance for entry in entries])
+        self.assertEqual(START + timedelta(seconds=2), entries[1].timestamp)
+        self.assertEqual('a', self.ledger.statement('b')[1].counterparty)
+        self.assertEqual([], self.ledger.statement('c'))
+
+    def test_statement_between_timestamps_and_limit(self):
+        for second in range(10):
+            self.record_at(second, 'a', DEPOSIT, 1, second + 1)
+
+        entries = self.ledger.statement('a', since=START + timedelta(seconds=3), until=START + timedelta(seconds=7))
+        self.assertEqual([3, 4, 5, 6], [entry.sequence for entry in entries])
+        entries = self.ledger.statement('a', since=START + timedelta(seconds=3), limit=2)
+        self.assertEqual([3, 4], [entry.sequence for entry in entries])
+        entries = self.ledger.statement('a', limit=2, newest_first=True)
+        self.assertEqual([9, 8], [entry.sequence for entry in entries])
+
+    def test_reject_amount_finer_than_minor_unit(self):
+        with self.assertRaises(InvalidAccountOperationException):
+            self.ledger.to_units(Decimal('0.001'))
+
+    def test_compact_drops_whole_segments(self):
+        for second in range(10):
+            self.record_at(second, 'a', WITHDRAW, -1, 10 - second)
+
+        self.ledger.compact(before_sequence=6)
+
+        self.assertEqual(4, self.ledger.first_sequence)
+        self.assertEqual(list(range(4, 10)), [entry.sequence for entry in self.ledger.statement('a')])
+
+    def test_drop_oldest_segments_without_spill_path(self):
+        ledger = Ledger(segment_size=4, max_segments_in_memory=2)
+        for _ in range(10):
+            ledger.record('a', DEPOSIT, 1, 1)
+
+        self.assertEqual(list(range(4, 10)), [entry.sequence for entry in ledger.statement('a')])
+
+    def test_spilled_segments_are_read_back(self):
+        with tempfile.TemporaryDirectory() as spill_path:
+            ledger = Ledger(segment_size=4, max_segments_in_memory=1, spill_path=Path(spill_path))
+            for units in range(10):
+                ledger.record('a' if units % 2 else 'b', DEPOSIT, units, units)
+
+            self.assertEqual(2, len(list(Path(spill_path).iterdir())))
+            self.assertEqual([Decimal(units).scaleb(-2) for units in range(1, 10, 2)],
+                             [entry.amount for entry in ledger.statement('a')])
+
+            ledger.compact(before_sequence=8)
+            self.assertEqual([], list(Path(spill_path).iterdir()))
+            self.assertEqual([9], [entry.sequence for entry in ledger.statement('a')])
@@ -0,0 +1,28 @@
+from decimal import Decimal
+from unittest import TestCase
+
+from src.account import InvalidAccountOperationException
+from src.money import from_minor_units, to_minor_units
+
+
+class TestMoney(TestCase):
+    def test_to_minor_units(self):
+        self.assertEqual(12345, to_minor_units(Decimal('123.45')))
+        self.assertEqual(12340, to_minor_units(Decimal('123.4')))
+        self.assertEqual(100000, to_minor_units(Decimal('1E+3')))
+        self.assertEqual(-5, to_minor_units(Decimal('-0.05')))
+        self.assertEqual(1234, to_minor_units(Decimal('1.234'), scale=3))
+
+    def test_raise_invalid_account_operation_with_too_many_decimal_places(self):
+        with self.assertRaises(InvalidAccountOperationException):
+            to_minor_units(Decimal('0.001'))
+
+    def test_raise_invalid_account_operation_with_non_finite_amount(self):
+        with self.assertRaises(InvalidAccountOperationException):
+            to_minor_units(Decimal('Infinity'))
+
+    def test_from_minor_units(self):
+        self.assertEqual('123.45', str(from_minor_units(12345)))
+        self.assertEqual('100.1', str(from_minor_units(10010)))
+        self.assertEqual('1', str(from_minor_units(100)))
+        self.assertEqual('0', str(from_minor_units(0)))
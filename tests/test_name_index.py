@@ -0,0 +1,30 @@
+from unittest import TestCase
+
+from src.name_index import NameIndex
+
+
+class TestNameIndex(TestCase):
+    def setUp(self):
+        self.index = NameIndex.build([('1', 'Tom'), ('2', 'tommy'), ('3', 'May'), ('4', 'TOM'), ('5', 'Tomas')])
+
+    def test_find_exact_name_case_insensitively(self):
+        self.assertEqual(['1', '4'], self.index.find('tom'))
+        self.assertEqual([], self.index.find('to'))
+
+    def test_find_prefix(self):
+        self.assertEqual(['1', '4', '5', '2'], self.index.find_prefix('TO'))
+        self.assertEqual(['1', '4', '5'], self.index.find_prefix('tom', limit=3))
+        self.assertEqual(['3'], self.index.find_prefix('m'))
+        self.assertEqual([], self.index.find_prefix('z'))
+
+    def test_add_keeps_names_sorted(self):
+        self.index.add('6', 'Tomb')
+        self.index.add('7', 'Adam')
+        self.index.add('8', 'may')
+        self.assertEqual(['1', '4', '5', '6', '2'], self.index.find_prefix('tom'))
+        self.assertEqual(['7'], self.index.find_prefix('a'))
+        self.assertEqual(['3', '8'], self.index.find('MAY'))
+        self.assertEqual(8, len(self.index))
+
+    def test_empty_prefix_finds_everything(self):
+        self.assertEqual(5, len(self.index.find_prefix('')))
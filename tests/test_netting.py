@@ -0,0 +1,118 @@
+import random
+from decimal import Decimal
+from unittest import TestCase
+
+from src.account import Account
+from src.account_store import AccountStore
+from src.batch import BatchStatus
+from src.netting import net_transfers
+
+
+class TestNetTransfers(TestCase):
+    accounts_factory = dict
+
+    def setUp(self):
+        self.accounts = self.accounts_factory()
+        self.accounts['account-1'] = Account('account-1', 'Tom', Decimal('100'))
+        self.accounts['account-2'] = Account('account-2', 'May', Decimal('10'))
+        self.accounts['account-3'] = Account('account-3', 'Ann', Decimal('0'))
+
+    def balances(self):
+        return [self.accounts[account_id].balance for account_id in ('account-1', 'account-2', 'account-3')]
+
+    def test_transfers_back_and_forth_settle_with_one_write_per_account(self):
+        # GIVEN transfers going back and forth, some of them only covered by money received later
+        transfers = [
+            ('transfer', 'account-3', 'account-2', Decimal('5')),
+            ('transfer', 'account-1', 'account-2', Decimal('50')),
+            ('transfer', 'account-2', 'account-1', Decimal('60')),
+            ('transfer', 'account-1', 'account-3', Decimal('5')),
+            ('transfer', 'account-2', 'account-3', Decimal('1.5')),
+        ]
+
+        # WHEN they are netted
+        result, changed = net_transfers(self.accounts, transfers)
+
+        # THEN all of them are covered
+        self.assertEqual([BatchStatus.APPLIED] * 5, result.statuses.tolist())
+        self.assertEqual([Decimal('105'), Decimal('3.5'), Decimal('1.5')], self.balances())
+        # AND each account is written once instead of twice per transfer
+        self.assertEqual((3, 10), (result.balance_writes, result.gross_writes))
+        self.assertEqual(['account-1', 'account-2', 'account-3'], sorted(account.account_id for account in changed))
+        self.assertEqual('Settled 5 of 5 transfers with 3 balance writes instead of 10', str(result))
+
+    def test_accounts_that_net_to_zero_are_not_written(self):
+        result, changed = net_transfers(self.accounts, [('transfer', 'account-1', 'account-2', Decimal('7')),
+                                                        ('transfer', 'account-2', 'account-1', Decimal('7'))])
+        self.assertEqual(2, result.covered_rows.size)
+        self.assertEqual((0, []), (result.balance_writes, changed))
+        self.assertEqual([Decimal('100'), Decimal('10'), Decimal('0')], self.balances())
+
+    def test_latest_transfers_of_an_overdrawn_account_are_left_out(self):
+        # GIVEN an account paying out more than it has, and a payee passing the money on
+        transfers = [
+            ('transfer', 'account-2', 'account-1', Decimal('4')),
+            ('transfer', 'account-2', 'account-3', Decimal('5')),
+            ('transfer', 'account-2', 'account-1', Decimal('3')),
+            ('transfer', 'account-3', 'account-1', Decimal('5')),
+        ]
+
+        # WHEN they are netted
+        result, _ = net_transfers(self.accounts, transfers)
+
+        # THEN only the latest payment of the overdrawn account is left out
+        self.assertEqual([BatchStatus.APPLIED, BatchStatus.APPLIED, BatchStatus.INSUFFICIENT_BALANCE,
+                          BatchStatus.APPLIED], result.statuses.tolist())
+        self.assertEqual([Decimal('109'), Decimal('1'), Decimal('0')], self.balances())
+
+    def test_leaving_out_a_transfer_can_overdraw_its_payee(self):
+        transfers = [
+            ('transfer', 'account-3', 'account-1', Decimal('20')),
+            ('transfer', 'account-2', 'account-3', Decimal('20')),
+        ]
+        result, changed = net_transfers(self.accounts, transfers)
+        self.assertEqual([BatchStatus.INSUFFICIENT_BALANCE] * 2, result.statuses.tolist())
+        self.assertEqual([], changed)
+
+    def test_invalid_transfers_are_rejected(self):
+        result, _ = net_transfers(self.accounts, [
+            ('transfer', 'account-1', 'some-account-id', Decimal('1')),
+            ('transfer', 'account-1', 'account-2', Decimal('0')),
+            ('transfer', 'account-1', 'account-2', Decimal('0.001')),
+            ('deposit', 'account-1', 'account-2', Decimal('1')),
+            ('transfer', 'account-1'),
+            ('transfer', 'account-1', 'account-2', Decimal('1')),
+        ])
+        self.assertEqual([BatchStatus.ACCOUNT_NOT_FOUND, BatchStatus.INVALID_AMOUNT, BatchStatus.INVALID_AMOUNT,
+                          BatchStatus.INVALID_OPERATION, BatchStatus.INVALID_OPERATION, BatchStatus.APPLIED],
+                         result.statuses.tolist())
+        self.assertEqual([Decimal('99'), Decimal('11'), Decimal('0')], self.balances())
+
+    def test_empty_window(self):
+        result, changed = net_transfers(self.accounts, [])
+        self.assertEqual((0, 0, []), (result.statuses.size, result.balance_writes, changed))
+
+    def test_covered_transfers_account_for_every_balance(self):
+        for seed in range(5):
+            # GIVEN a random window over a few accounts
+            rng = random.Random(seed)
+            self.setUp()
+            before = dict(zip(['account-1', 'account-2', 'account-3'], self.balances()))
+            transfers = [('transfer', *rng.sample(list(before), 2), Decimal(rng.randint(1, 5000)) / 100)
+                         for _ in range(50)]
+
+            # WHEN it is netted
+            result, _ = net_transfers(self.accounts, transfers)
+
+            # THEN the balances are what the covered transfers add up to, and none is negative
+            expected = dict(before)
+            for row in result.covered_rows.tolist():
+                _, from_account_id, to_account_id, amount = transfers[row]
+                expected[from_account_id] -= amount
+                expected[to_account_id] += amount
+            self.assertEqual(list(expected.values()), self.balances())
+            self.assertTrue(all(balance >= 0 for balance in self.balances()))
+
+
+class TestNetTransfersWithAccountStore(TestNetTransfers):
+    accounts_factory = AccountStore
@@ -0,0 +1,171 @@
+import subprocess
+import sys
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import create_autospec, patch
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.account import Account, InvalidAccountOperationException
+from src.account_helper import AccountHelper
+from src.account_store import AccountStore
+from src.bank import Bank
+from src.journal import Journal
+from src.parquet import ParquetRepository
+from src.repository import create_repository
+
+
+class TestParquetRepository(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.parquet_path = Path(self.tmp_dir.name) / 'state.parquet'
+        self.repository = ParquetRepository(self.parquet_path)
+        self.accounts = {f'account-{i}': Account(f'account-{i}', f'name-{i % 7}', Decimal(i) / 4)
+                         for i in range(1000)}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assert_accounts_equal(self, expected, accounts):
+        self.assertEqual([(account.account_id, account.name, account.balance) for account in expected.values()],
+                         [(account.account_id, account.name, account.balance) for account in accounts.values()])
+
+    def test_save_and_load_state(self):
+        self.repository.save_state(self.accounts)
+        self.assert_accounts_equal(self.accounts, self.repository.load_state())
+
+    def test_load_state_into_account_store(self):
+        self.repository.save_state(self.accounts)
+
+        accounts = self.repository.load_state(AccountStore())
+
+        self.assertIsInstance(accounts, AccountStore)
+        self.assert_accounts_equal(self.accounts, accounts)
+
+    def test_load_empty_state_if_file_does_not_exist(self):
+        self.assertDictEqual({}, self.repository.load_state())
+
+    def test_save_and_load_empty_state(self):
+        self.repository.save_state({})
+        self.assertDictEqual({}, self.repository.load_state())
+
+    def test_save_state_in_row_groups(self):
+        # GIVEN row groups much smaller than the state
+        with patch('src.parquet.ROW_GROUP_SIZE', 64):
+            # WHEN the state is saved and loaded
+            self.repository.save_state(self.accounts)
+            accounts = self.repository.load_state()
+
+        # THEN it is written one row group at a time and loads back whole
+        self.assertEqual(16, pq.ParquetFile(self.parquet_path).metadata.num_row_groups)
+        self.assert_accounts_equal(self.accounts, accounts)
+
+    def test_balances_are_decimal_columns(self):
+        self.repository.save_state(self.accounts)
+
+        table = pq.read_table(self.parquet_path, columns=['balance'])
+
+        self.assertEqual(pa.decimal128(18, 2), table.schema.field('balance').type)
+        self.assertEqual(Decimal('249.75'), table.column('balance')[999].as_py())
+
+    def test_load_balances_written_by_other_tools(self):
+        # GIVEN a file with a wider decimal column than the repository writes
+        table = pa.table({'account_id': ['account-1', 'account-2'],
+                          'name': ['Tom', 'May'],
+                          'balance': pa.array([Decimal('1.5000'), Decimal('0.0025')], pa.decimal128(38, 4))})
+        pq.write_table(table, self.parquet_path)
+
+        # WHEN it is loaded THEN the balances are the same
+        self.assertEqual({'account-1': Decimal('1.5'), 'account-2': Decimal('0.0025')},
+                         {account_id: account.balance
+                          for account_id, account in self.repository.load_state().items()})
+
+    def test_balances_must_fit_minor_units(self):
+        with self.assertRaises(InvalidAccountOperationException):
+            self.repository.save_state({'a': Account('a', 'Tom', Decimal('0.001'))})
+        with self.assertRaises(InvalidAccountOperationException):
+            self.repository.save_state({'a': Account('a', 'Tom', Decimal('1E+16'))})
+        self.assertFalse(self.parquet_path.exists())
+
+    def test_create_repository_by_extension(self):
+        self.assertIsInstance(create_repository(self.parquet_path), ParquetRepository)
+
+    def test_csv_repository_does_not_import_pyarrow(self):
+        code = ('import sys; from pathlib import Path; from src.repository import create_repository; '
+                'create_repository(Path("state.csv")); print("pyarrow" in sys.modules)')
+        self.assertEqual('False', subprocess.check_output([sys.executable, '-c', code], text=True).strip())
+
+
+class TestBankOnParquet(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.parquet_path = Path(self.tmp_dir.name) / 'state.parquet'
+        ParquetRepository(self.parquet_path).save_state({'account-1': Account('account-1', 'Tom', Decimal('10')),
+                                                         'account-2': Account('account-2', 'May', Decimal('0'))})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_bank(self, journal=None) -> Bank:
+        account_helper = create_autospec(AccountHelper)
+        account_helper.create_account_id.return_value = 'account-3'
+        return Bank(account_helper=account_helper, repository=ParquetRepository(self.parquet_path), journal=journal)
+
+    def test_bank_loads_and_saves_parquet_state(self):
+        # GIVEN a bank started on a Parquet state file
+        bank = self.create_bank()
+
+        # WHEN money is moved and an account is created
+        bank.transfer('account-1', 'account-2', Decimal('2.5'))
+        bank.create_account('Ann', Decimal('1'))
+        bank.save_state()
+
+        # THEN a bank started on the saved file sees all of it
+        accounts = self.create_bank().accounts
+        self.assertEqual({'account-1': Decimal('7.5'), 'account-2': Decimal('2.5'), 'account-3': Decimal('1')},
+                         {account_id: account.balance for account_id, account in accounts.items()})
+
+    def test_reject_amounts_finer_than_the_parquet_scale(self):
+        # GIVEN a journaled bank on a Parquet state file of cents
+        journal_path = Path(self.tmp_dir.name) / 'journal'
+        bank = self.create_bank(Journal(journal_path))
+
+        # WHEN amounts with more decimal places are opened with or deposited
+        # THEN they are rejected before anything is journaled
+        with self.assertRaises(InvalidAccountOperationException):
+            bank.create_account('Ann', Decimal('10.005'))
+        with self.assertRaises(InvalidAccountOperationException):
+            bank.deposit('account-1', Decimal('0.005'))
+
+        # AND the state can still be saved
+        bank.save_state()
+        bank.close()
+        self.assertEqual(Decimal('10'), self.create_bank().get_account('account-1').balance)
+        self.assertNotIn('account-3', self.create_bank().accounts)
+
+    def test_amounts_follow_the_scale_of_the_parquet_repository(self):
+        bank = Bank(account_helper=create_autospec(AccountHelper),
+                    repository=ParquetRepository(self.parquet_path, scale=3))
+
+        bank.deposit('account-1', Decimal('0.005'))
+        bank.save_state()
+
+        self.assertEqual(Decimal('10.005'), self.create_bank().get_account('account-1').balance)
+
+    def test_journal_replays_over_parquet_state(self):
+        # GIVEN a journaled bank on a Parquet state file that is not saved again
+        journal_path = Path(self.tmp_dir.name) / 'journal'
+        bank = self.create_bank(Journal(journal_path))
+        bank.deposit('account-2', Decimal('3'))
+        bank.close()
+
+        # WHEN the bank restarts
+        bank = self.create_bank(Journal(journal_path))
+
+        # THEN the journal is replayed over the loaded state
+        self.assertEqual(Decimal('3'), bank.get_account('account-2').balance)
+        self.assertEqual(Decimal('10'), bank.get_account('account-1').balance)
+        bank.close()
@@ -0,0 +1,53 @@
+import gc
+from decimal import Decimal
+from unittest import TestCase
+
+from src.account import Account
+from src.read_view import ClosedReadViewException, ReadViews
+
+
+class TestReadView(TestCase):
+    def setUp(self):
+        self.accounts = {
+            'account-1': Account('account-1', 'Tom', Decimal('100')),
+            'account-2': Account('account-2', 'May', Decimal('10')),
+        }
+        self.views = ReadViews()
+        self.view = self.views.open(self.accounts)
+
+    def change(self, account_id: str, balance: str):
+        # As a bank does it: open views keep the balance first
+        for view in self.views:
+            view.keep([self.accounts[account_id]])
+        self.accounts[account_id].balance = Decimal(balance)
+
+    def test_view_keeps_the_first_balance_after_it_was_opened(self):
+        self.change('account-1', '50')
+        self.change('account-1', '20')
+        later = self.views.open(self.accounts)
+        self.change('account-1', '5')
+        self.assertEqual(Decimal('100'), self.view['account-1'].balance)
+        self.assertEqual(Decimal('20'), later['account-1'].balance)
+        self.assertEqual(Decimal('10'), self.view['account-2'].balance)
+        self.assertEqual(1, self.view.versions)
+
+    def test_accounts_created_after_the_view_are_absent(self):
+        self.view.keep_absent('account-3')
+        self.accounts['account-3'] = Account('account-3', 'Ann', Decimal('1'))
+        self.assertNotIn('account-3', self.view)
+        self.assertEqual(['account-1', 'account-2'], list(self.view))
+        with self.assertRaises(KeyError):
+            self.view['account-3']
+
+    def test_closed_view_is_forgotten(self):
+        self.view.close()
+        self.change('account-1', '50')
+        self.assertEqual(0, len(self.views))
+        self.assertEqual(0, self.view.versions)
+        with self.assertRaises(ClosedReadViewException):
+            self.view['account-1']
+
+    def test_unreferenced_view_is_forgotten(self):
+        self.view = None
+        gc.collect()
+        self.assertFalse(self.views)
@@ -1,5 +1,7 @@
-import unittest
 import os
+import subprocess
+import sys
+import unittest
 from decimal import Decimal
 from pathlib import Path
 
@@ -8,9 +10,11 @@ from src.repository import Repository
 
 
 class TestRepository(unittest.TestCase):
+    engine = 'csv'
+
     def setUp(self):
         self.test_csv_file = Path('test_bank.csv')
-        self.repository = Repository(self.test_csv_file)
+        self.repository = Repository(self.test_csv_file, engine=self.engine)
 
     def tearDown(self):
         if os.path.exists(self.test_csv_file):
@@ -53,4 +57,41 @@ account-2,B,2.2
             self.assertEqual(expected_account.balance, result_account.balance)
 
     def test_load_empty_state_if_csv_does_not_exist(self):
-        self.assertDictEqual({}, self.repository.load_state())
\ No newline at end of file
+        self.assertDictEqual({}, self.repository.load_state())
+
+    def test_save_and_load_round_trip(self):
+        accounts = {
+            'account-1': Account('account-1', 'A, "Junior"', Decimal('1.10')),
+            'account-2': Account('account-2', 'B', Decimal('0'))
+        }
+        self.repository.save_state(accounts)
+        result = self.repository.load_state()
+        self.assertEqual(result.keys(), accounts.keys())
+        for account_id, expected_account in accounts.items():
+            self.assertEqual(expected_account.name, result[account_id].name)
+            self.assertEqual(str(expected_account.balance), str(result[account_id].balance))
+
+    def test_save_empty_state(self):
+        self.repository.save_state({})
+        with open(self.test_csv_file, 'rb') as f:
+            self.assertEqual(b'account_id,name,balance\n', f.read())
+        self.assertDictEqual({}, self.repository.load_state())
+
+
+class TestPandasRepository(TestRepository):
+    engine = 'pandas'
+
+
+class TestRepositoryEngine(unittest.TestCase):
+    def test_raise_value_error_for_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            Repository(Path('test_bank.csv'), engine='excel')
+
+    def test_csv_engine_does_not_import_pandas(self):
+        code = ('import sys\n'
+                'from pathlib import Path\n'
+                'from src.repository import Repository\n'
+                'Repository(Path("missing.csv")).load_state()\n'
+                'print("pandas" in sys.modules)')
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual('False', output.splitlines()[-1])
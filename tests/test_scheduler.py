@@ -0,0 +1,131 @@
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import TestCase
+
+from src.scheduler import (MISFIRE_ALL, InvalidScheduleException, ScheduledTransfer, ScheduleNotFoundException,
+                           TransferScheduler)
+
+DAY = 24 * 60 * 60.0
+
+
+class TestTransferScheduler(TestCase):
+    def setUp(self):
+        self.now = 1_000_000.0
+        self.scheduler = TransferScheduler(clock=lambda: self.now)
+
+    def test_release_transfers_in_due_order(self):
+        # GIVEN transfers added out of due order, two of them due at the same time
+        late = self.scheduler.add('a', 'b', Decimal('3'), self.now + 30)
+        first = self.scheduler.add('a', 'b', Decimal('1'), self.now + 10)
+        second = self.scheduler.add('b', 'a', Decimal('2'), self.now + 10)
+
+        # WHEN the clock passes two of the due times
+        self.assertEqual(([], []), self.scheduler.release_due())
+        self.now += 20
+        runs, released = self.scheduler.release_due()
+
+        # THEN the ones due are released once, in due and then insertion order
+        self.assertEqual([first, second], runs)
+        self.assertEqual([(first.schedule_id, None), (second.schedule_id, None)], released)
+        self.assertEqual([late], self.scheduler.upcoming())
+        self.assertEqual(([], []), self.scheduler.release_due())
+
+    def test_recurring_transfer_moves_to_its_next_run(self):
+        transfer = self.scheduler.add('a', 'b', Decimal('1'), self.now, every=DAY)
+
+        runs, released = self.scheduler.release_due()
+
+        following = transfer._replace(due=self.now + DAY)
+        self.assertEqual([transfer], runs)
+        self.assertEqual([(transfer.schedule_id, following)], released)
+        self.assertEqual([following], self.scheduler.upcoming())
+        self.assertEqual(self.now + DAY, self.scheduler.next_due)
+
+    def test_missed_runs_are_run_once_by_default(self):
+        # GIVEN a daily transfer whose last three runs were missed
+        transfer = self.scheduler.add('a', 'b', Decimal('1'), self.now - 2.5 * DAY, every=DAY)
+
+        # WHEN it is released
+        runs, _ = self.scheduler.release_due()
+
+        # THEN it runs once and carries on with its next run after now
+        self.assertEqual([transfer], runs)
+        self.assertEqual(self.now + 0.5 * DAY, self.scheduler.next_due)
+
+    def test_missed_runs_are_all_run_with_misfire_all(self):
+        scheduler = TransferScheduler(misfire=MISFIRE_ALL, clock=lambda: self.now)
+        transfer = scheduler.add('a', 'b', Decimal('1'), self.now - 2.5 * DAY, every=DAY)
+        one_off = scheduler.add('c', 'd', Decimal('2'), self.now - 2 * DAY)
+
+        runs, _ = scheduler.release_due()
+
+        self.assertEqual([transfer, one_off, transfer._replace(due=self.now - 1.5 * DAY),
+                          transfer._replace(due=self.now - 0.5 * DAY)], runs)
+        self.assertEqual(self.now + 0.5 * DAY, scheduler.next_due)
+
+    def test_cancelled_transfer_is_not_released(self):
+        transfer = self.scheduler.add('a', 'b', Decimal('1'), self.now)
+
+        self.assertEqual(transfer, self.scheduler.cancel(transfer.schedule_id))
+
+        self.assertEqual(([], []), self.scheduler.release_due())
+        self.assertIsNone(self.scheduler.next_due)
+        with self.assertRaises(ScheduleNotFoundException):
+            self.scheduler.cancel(transfer.schedule_id)
+
+    def test_heap_is_rebuilt_once_mostly_cancelled(self):
+        transfers = [self.scheduler.add('a', 'b', Decimal('1'), self.now + i) for i in range(10)]
+        for transfer in transfers[:6]:
+            self.scheduler.cancel(transfer.schedule_id)
+
+        self.assertEqual(4, len(self.scheduler._heap))
+        self.assertEqual(transfers[6:], self.scheduler.upcoming())
+
+    def test_reject_invalid_schedules(self):
+        with self.assertRaisesRegex(InvalidScheduleException, 'must be positive'):
+            self.scheduler.add('a', 'b', Decimal('0'), self.now)
+        with self.assertRaisesRegex(InvalidScheduleException, 'must be positive'):
+            self.scheduler.add('a', 'b', Decimal('1'), self.now, every=0)
+        with self.assertRaises(ValueError):
+            TransferScheduler(misfire='never')
+
+    def test_upcoming_is_limited_to_the_soonest(self):
+        transfers = [self.scheduler.add('a', 'b', Decimal('1'), self.now + due) for due in (5, 1, 3, 2)]
+        self.assertEqual([transfers[1], transfers[3]], self.scheduler.upcoming(limit=2))
+
+    def test_replay_journaled_changes(self):
+        # GIVEN a transfer added, one released to its next run and one cancelled
+        added = ScheduledTransfer('s1', 'a', 'b', Decimal('1'), self.now + 5)
+        moved = ScheduledTransfer('s2', 'a', 'b', Decimal('2'), self.now - 1, DAY)
+        self.scheduler.put(moved)
+
+        # WHEN the changes are replayed
+        self.scheduler.replay([('s1', added), ('s2', moved._replace(due=self.now + DAY)), ('s3', None)])
+
+        # THEN the scheduler holds them as they were left, with no stale run of the moved one
+        self.assertEqual([added, moved._replace(due=self.now + DAY)], self.scheduler.upcoming())
+        self.assertEqual(([], []), self.scheduler.release_due())
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'state.csv.schedules'
+            scheduler = TransferScheduler(path, clock=lambda: self.now)
+            transfers = [scheduler.add('a', 'b', Decimal('1.25'), self.now + 10, every=DAY),
+                         scheduler.add('b', 'a', Decimal('2'), self.now + 5)]
+            scheduler.save()
+
+            loaded = TransferScheduler(path, clock=lambda: self.now)
+            loaded.load()
+
+            self.assertEqual([transfers[1], transfers[0]], loaded.upcoming())
+            self.now += 20
+            self.assertEqual([transfers[1], transfers[0]], loaded.release_due()[0])
+
+    def test_copy_is_not_changed_by_later_changes(self):
+        transfer = self.scheduler.add('a', 'b', Decimal('1'), self.now)
+        copy = self.scheduler.copy()
+
+        self.scheduler.cancel(transfer.schedule_id)
+
+        self.assertEqual([transfer], copy.upcoming())
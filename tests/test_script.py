@@ -0,0 +1,94 @@
+import io
+from decimal import Decimal
+from unittest import TestCase
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.repository import Repository
+from src.scheduler import TransferScheduler
+from src.script import run_script
+
+
+class TestRunScript(TestCase):
+    def setUp(self) -> None:
+        self.mock_account_helper = create_autospec(AccountHelper)
+        self.mock_account_helper.create_account_id.side_effect = ['account-1', 'account-2']
+        self.mock_repository = create_autospec(Repository)
+        self.mock_repository.load_state.return_value = {}
+        self.bank = Bank(account_helper=self.mock_account_helper, repository=self.mock_repository)
+
+    def test_run_script_applies_every_command(self):
+        # GIVEN a script creating two accounts and moving money between them
+        script = ['create_account Tom 100', 'create_account May 0', '', 'transfer account-1 account-2 30.5',
+                  'withdraw account-2 0.5', 'deposit account-1 1']
+
+        # WHEN the script is run
+        summary = run_script(self.bank, script)
+
+        # THEN all commands are applied
+        self.assertEqual((5, 0, False), (summary.commands, summary.failed, summary.aborted))
+        self.assertEqual(Decimal('70.5'), self.bank.get_account('account-1').balance)
+        self.assertEqual(Decimal('30'), self.bank.get_account('account-2').balance)
+
+    def test_run_script_parses_dates_and_optional_arguments(self):
+        self.bank.scheduler = TransferScheduler()
+        script = ['create_account Tom 100', 'create_account May 0',
+                  'schedule_transfer account-1 account-2 10 2020-01-01T00:00 1d', 'run_due', 'top_accounts 1']
+
+        summary = run_script(self.bank, script)
+
+        self.assertEqual((5, 0), (summary.commands, summary.failed))
+        self.assertEqual(Decimal('10'), self.bank.get_account('account-2').balance)
+        self.assertEqual(1, len(self.bank.get_schedules()))
+
+    def test_run_script_stops_at_first_failure(self):
+        # GIVEN a script with an overdraft in the middle
+        script = ['create_account Tom 10', 'withdraw account-1 20', 'deposit account-1 1']
+
+        # WHEN the script is run without continue_on_error
+        summary = run_script(self.bank, script)
+
+        # THEN the script stops at the failing line
+        self.assertTrue(summary.aborted)
+        self.assertEqual([(2, 'Insufficient balance')], summary.failures)
+        self.assertEqual(Decimal('10'), self.bank.get_account('account-1').balance)
+
+    def test_run_script_continues_on_error(self):
+        # GIVEN a script with invalid lines
+        script = ['create_account Tom 10', 'withdraw account-1 20', 'deposit account-1', 'deposit account-1 x',
+                  'unknown', 'deposit account-1 1']
+
+        # WHEN the script is run with continue_on_error
+        summary = run_script(self.bank, script, continue_on_error=True)
+
+        # THEN every failure is reported with its line number and the valid lines are applied
+        self.assertEqual([(2, 'Insufficient balance'),
+                          (3, 'Invalid number of arguments. Please try again.'),
+                          (4, 'amount should be in numerical format. Please try again.'),
+                          (5, 'Invalid command. Please try again.')], summary.failures)
+        self.assertEqual((6, 4, False), (summary.commands, summary.failed, summary.aborted))
+        self.assertEqual(Decimal('11'), self.bank.get_account('account-1').balance)
+
+    def test_run_script_writes_output_only_when_asked(self):
+        # GIVEN an output stream
+        output = io.StringIO()
+
+        # WHEN a script is run with output
+        run_script(self.bank, ['create_account Tom 10', 'deposit account-2 1'], output=output, continue_on_error=True)
+
+        # THEN the command output and failures are written
+        self.assertEqual('Created new account: <Account account_id=account-1, name=Tom, balance=10>\n'
+                         'line 2: Unable to find account account-2\n', output.getvalue())
+
+    def test_run_script_checkpoints_and_stops_at_exit(self):
+        # GIVEN a script with an exit before its end
+        script = ['create_account Tom 10'] + ['deposit account-1 1'] * 4 + ['exit', 'deposit account-1 1']
+
+        # WHEN the script is run with a checkpoint every 2 commands
+        summary = run_script(self.bank, script, checkpoint_every=2)
+
+        # THEN the state is saved twice and nothing after exit is run
+        self.assertEqual(5, summary.commands)
+        self.assertEqual(2, self.mock_repository.save_state.call_count)
+        self.assertEqual(Decimal('14'), self.bank.get_account('account-1').balance)
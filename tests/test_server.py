@@ -0,0 +1,78 @@
+import asyncio
+from decimal import Decimal
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import create_autospec
+
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.repository import Repository
+from src.server import BankServer
+
+
+class TestBankServer(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        account_helper = create_autospec(AccountHelper)
+        account_helper.create_account_id.side_effect = ['account-1', 'account-2']
+        repository = create_autospec(Repository)
+        repository.load_state.return_value = {}
+        self.bank = Bank(account_helper=account_helper, repository=repository)
+        self.server = BankServer(self.bank, port=0, max_queue=2)
+        await self.server.start()
+        self.reader, self.writer = await asyncio.open_connection(self.server.host, self.server.port)
+
+    async def asyncTearDown(self) -> None:
+        self.writer.close()
+        await self.server.stop()
+
+    async def request_lines(self, *lines: str):
+        # All requests are sent before any response is read
+        self.writer.write(''.join(f'{line}\n' for line in lines).encode())
+        await self.writer.drain()
+        return [(await self.reader.readline()).decode().rstrip('\n') for _ in lines]
+
+    async def test_pipelined_requests_are_answered_in_order(self):
+        responses = await self.request_lines(
+            'create_account Tom 10',
+            'create_account May 0',
+            'transfer account-1 account-2 2.5',
+            'withdraw account-2 3',
+            'deposit account-3 1',
+            'deposit account-1 ten',
+            'save_state',
+        )
+
+        self.assertEqual([
+            'OK Created new account: <Account account_id=account-1, name=Tom, balance=10>',
+            'OK Created new account: <Account account_id=account-2, name=May, balance=0>',
+            'OK Transferred 2.5 from account account-1 to account account-2'
+            ' | From account state after transfer: <Account account_id=account-1, name=Tom, balance=7.5>'
+            ' | To account state after transfer: <Account account_id=account-2, name=May, balance=2.5>',
+            'ERR Insufficient balance',
+            'ERR Unable to find account account-3',
+            'ERR amount should be in numerical format. Please try again.',
+            'OK Saved current bank state',
+        ], responses)
+        self.assertEqual(Decimal('7.5'), self.bank.get_account('account-1').balance)
+
+    async def test_tagged_requests_get_tagged_responses(self):
+        responses = await self.request_lines('#7 create_account Tom 10', '#8 unknown', 'save_state')
+        self.assertEqual(['#7 OK Created new account: <Account account_id=account-1, name=Tom, balance=10>',
+                          '#8 ERR Invalid command. Please try again.',
+                          'OK Saved current bank state'], responses)
+
+    async def test_many_connections_share_one_bank(self):
+        await self.request_lines('create_account Tom 0')
+        connections = [await asyncio.open_connection(self.server.host, self.server.port) for _ in range(5)]
+        for _, writer in connections:
+            writer.write(b'deposit account-1 1\n' * 20)
+        for reader, writer in connections:
+            for _ in range(20):
+                self.assertTrue((await reader.readline()).startswith(b'OK Deposited 1'))
+            writer.close()
+        self.assertEqual(Decimal('100'), self.bank.get_account('account-1').balance)
+
+    async def test_exit_closes_connection(self):
+        self.writer.write(b'exit\n')
+        await self.writer.drain()
+        self.assertEqual(b'', await self.reader.readline())
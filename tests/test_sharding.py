@@ -0,0 +1,298 @@
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from unittest import TestCase
+
+from src.account import AccountNotFoundException, InvalidAccountOperationException
+from src.account_helper import AccountHelper
+from src.bank import Bank
+from src.exception import BankException
+from src.journal import Journal
+from src.ledger import LedgerNotEnabledException
+from src.repository import Repository
+from src.scheduler import SchedulerNotEnabledException
+from src.sharding import (CoordinatorLog, Shard, ShardAccountHelper, ShardedBank, ShardedOperationNotSupportedException,
+                          ShardUnavailableException, shard_of, shard_paths)
+from src.stats import StatsNotEnabledException
+
+
+class TestShardRouting(TestCase):
+    def test_shard_of_is_stable_and_in_range(self):
+        self.assertEqual([shard_of('account-1', 4)] * 2, [shard_of('account-1', 4), shard_of('account-1', 4)])
+        self.assertEqual({0, 1, 2, 3}, {shard_of(f'account-{i}', 4) for i in range(100)})
+
+    def test_account_ids_belong_to_their_shard(self):
+        account_helper = ShardAccountHelper(shard=2, shards=3)
+        self.assertEqual({2}, {shard_of(account_helper.create_account_id(), 3) for _ in range(20)})
+
+    def test_shard_paths(self):
+        self.assertEqual((Path('data/state.shard1.csv'), Path('data/state.shard1.journal')),
+                         shard_paths(Path('data/state.csv'), 1))
+
+
+class TestShard(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.shard = self.open_shard()
+        self.account = self.shard.bank.create_account('Tom', Decimal('100'))
+
+    def tearDown(self):
+        self.shard.bank.close()
+        self.tmp_dir.cleanup()
+
+    def open_shard(self) -> Shard:
+        return Shard(Bank(account_helper=AccountHelper(),
+                          repository=Repository(Path(self.tmp_dir.name) / 'state.csv'),
+                          journal=Journal(Path(self.tmp_dir.name) / 'state.journal', sync_interval=None)))
+
+    def reopen_shard(self):
+        self.shard.bank.close()
+        self.shard = self.open_shard()
+
+    def balance(self) -> Decimal:
+        return self.shard.get_account(self.account.account_id).balance
+
+    def test_prepared_debit_holds_money_until_commit(self):
+        # GIVEN a prepared debit
+        self.shard.prepare_debit('tx-1', self.account.account_id, Decimal('30'))
+        self.assertEqual(Decimal('70'), self.balance())
+        self.assertEqual(['tx-1'], self.shard.pending_transactions())
+
+        # WHEN it is committed, twice
+        self.shard.commit('tx-1')
+        self.shard.commit('tx-1')
+
+        # THEN the money is gone once
+        self.assertEqual(Decimal('70'), self.balance())
+        self.assertEqual([], self.shard.pending_transactions())
+
+    def test_prepared_and_finished_transactions_update_summary(self):
+        self.assertEqual(Decimal('100'), self.shard.summary().total)
+        self.shard.prepare_debit('tx-1', self.account.account_id, Decimal('30'))
+        self.assertEqual(Decimal('70'), self.shard.summary().total)
+        self.shard.abort('tx-1')
+        self.shard.prepare_credit('tx-2', self.account.account_id, Decimal('5'))
+        self.shard.commit('tx-2')
+        self.assertEqual(Decimal('105'), self.shard.summary().total)
+        self.assertEqual([Decimal('105')], [account.balance for account in self.shard.top_accounts(1)])
+
+    def test_aborted_debit_returns_money(self):
+        self.shard.prepare_debit('tx-1', self.account.account_id, Decimal('30'))
+        self.shard.abort('tx-1')
+        self.shard.abort('tx-1')
+        self.assertEqual(Decimal('100'), self.balance())
+
+    def test_prepared_credit_deposits_on_commit_only(self):
+        self.shard.prepare_credit('tx-1', self.account.account_id, Decimal('30'))
+        self.shard.prepare_credit('tx-2', self.account.account_id, Decimal('5'))
+        self.assertEqual(Decimal('100'), self.balance())
+
+        self.shard.commit('tx-1')
+        self.shard.abort('tx-2')
+
+        self.assertEqual(Decimal('130'), self.balance())
+
+    def test_prepare_fails_without_account_or_money(self):
+        with self.assertRaises(InvalidAccountOperationException):
+            self.shard.prepare_debit('tx-1', self.account.account_id, Decimal('101'))
+        with self.assertRaises(AccountNotFoundException):
+            self.shard.prepare_credit('tx-2', 'unknown', Decimal('1'))
+        self.assertEqual([], self.shard.pending_transactions())
+
+    def test_prepared_transactions_survive_restart_and_compaction(self):
+        # GIVEN prepared transactions
+        self.shard.prepare_debit('tx-1', self.account.account_id, Decimal('30'))
+        self.shard.prepare_credit('tx-2', self.account.account_id, Decimal('5'))
+
+        # WHEN the shard restarts, compacts its journal and restarts again
+        self.reopen_shard()
+        self.shard.save_state()
+        self.reopen_shard()
+
+        # THEN both transactions can still be finished
+        self.assertEqual(['tx-1', 'tx-2'], self.shard.pending_transactions())
+        self.shard.abort('tx-1')
+        self.shard.commit('tx-2')
+        self.assertEqual(Decimal('105'), self.balance())
+
+    def test_shard_needs_a_journal(self):
+        with self.assertRaises(ValueError):
+            Shard(Bank(account_helper=AccountHelper(), repository=Repository(Path(self.tmp_dir.name) / 'other.csv')))
+
+
+class TestCoordinatorLog(TestCase):
+    def test_committed_transactions_are_kept_until_done(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_path = Path(tmp_dir) / 'state.coordinator'
+            log = CoordinatorLog(log_path)
+            log.commit(['tx-1', 'tx-2'])
+            log.done(['tx-1'])
+            log.close()
+
+            log = CoordinatorLog(log_path)
+            self.assertEqual({'tx-2'}, log.committed)
+            log.compact()
+            log.close()
+            self.assertEqual('C,tx-2\n', log_path.read_text())
+
+
+class TestShardedBank(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_path = Path(self.tmp_dir.name) / 'state.csv'
+        self.bank = ShardedBank(self.state_path, shards=2)
+        # Accounts are created on the shards in turn
+        self.account_1 = self.bank.create_account('Tom', Decimal('100'))
+        self.account_2 = self.bank.create_account('May', Decimal('50'))
+        self.account_3 = self.bank.create_account('Ann', Decimal('10'))
+
+    def tearDown(self):
+        self.bank.close()
+        self.tmp_dir.cleanup()
+
+    def balances(self):
+        return [self.bank.get_account(account.account_id).balance
+                for account in (self.account_1, self.account_2, self.account_3)]
+
+    def test_accounts_are_spread_over_shards(self):
+        self.assertEqual([0, 1, 0], [shard_of(account.account_id, 2)
+                                     for account in (self.account_1, self.account_2, self.account_3)])
+
+    def test_transfer_within_and_between_shards(self):
+        from_account, to_account = self.bank.transfer(self.account_1.account_id, self.account_2.account_id,
+                                                      Decimal('30'))
+        self.bank.transfer(self.account_1.account_id, self.account_3.account_id, Decimal('20'))
+
+        self.assertEqual((Decimal('70'), Decimal('80')), (from_account.balance, to_account.balance))
+        self.assertEqual([Decimal('50'), Decimal('80'), Decimal('30')], self.balances())
+
+    def test_failed_transfer_between_shards_changes_nothing(self):
+        with self.assertRaises(InvalidAccountOperationException):
+            self.bank.transfer(self.account_2.account_id, self.account_1.account_id, Decimal('51'))
+        with self.assertRaises(AccountNotFoundException):
+            self.bank.transfer(self.account_2.account_id, 'unknown', Decimal('1'))
+        self.assertEqual([Decimal('100'), Decimal('50'), Decimal('10')], self.balances())
+
+    def test_reject_invalid_amounts_between_shards(self):
+        # WHEN a negative and a sub-cent transfer between shards are attempted
+        for amount in (Decimal('-5'), Decimal('0.001')):
+            with self.assertRaises(InvalidAccountOperationException):
+                self.bank.transfer(self.account_1.account_id, self.account_2.account_id, amount)
+
+        # THEN nothing was prepared, and the bank still saves and starts again
+        self.assertEqual([Decimal('100'), Decimal('50'), Decimal('10')], self.balances())
+        self.bank.save_state()
+        self.bank.close()
+        self.bank = ShardedBank(self.state_path, shards=2)
+        self.assertEqual([Decimal('100'), Decimal('50'), Decimal('10')], self.balances())
+
+    def test_run_many(self):
+        results = self.bank.run_many([
+            ('transfer', self.account_1.account_id, self.account_2.account_id, Decimal('60')),
+            ('withdraw', self.account_3.account_id, Decimal('11')),
+            ('transfer', self.account_2.account_id, self.account_1.account_id, Decimal('60')),
+            ('deposit', self.account_3.account_id, Decimal('1')),
+            ('transfer', self.account_3.account_id, 'unknown', Decimal('1')),
+        ])
+
+        self.assertEqual([None, InvalidAccountOperationException, InvalidAccountOperationException, None,
+                          AccountNotFoundException], [result and type(result) for result in results])
+        self.assertEqual([Decimal('40'), Decimal('110'), Decimal('11')], self.balances())
+
+    def test_run_many_with_a_bad_row(self):
+        # WHEN a row fails with something else than a BankException next to a transfer between shards
+        results = self.bank.run_many([
+            ('deposit', self.account_1.account_id, 5),
+            ('transfer', self.account_1.account_id, self.account_2.account_id, Decimal('10')),
+        ])
+
+        # THEN only that row fails and the transfer is completed on both shards
+        self.assertEqual([BankException, None], [result and type(result) for result in results])
+        self.assertEqual([Decimal('90'), Decimal('60'), Decimal('10')], self.balances())
+
+    def test_run_many_aborts_prepared_transfers_when_a_shard_fails(self):
+        # GIVEN a shard that is gone
+        self.bank._processes[1].kill()
+        self.bank._processes[1].join()
+
+        # WHEN a transfer to it is prepared on the other shard
+        with self.assertRaises(ShardUnavailableException):
+            self.bank.run_many([('transfer', self.account_1.account_id, self.account_2.account_id, Decimal('10')),
+                                ('deposit', self.account_3.account_id, Decimal('1'))])
+
+        # THEN the debit is rolled back, and the other shard still answers every call
+        self.assertEqual(Decimal('100'), self.bank.get_account(self.account_1.account_id).balance)
+        self.assertEqual(Decimal('11'), self.bank.get_account(self.account_3.account_id).balance)
+
+    def test_summary_and_top_accounts_over_every_shard(self):
+        self.bank.summary()
+        self.bank.transfer(self.account_1.account_id, self.account_2.account_id, Decimal('60'))
+
+        summary = self.bank.summary()
+        self.assertEqual((3, Decimal('160')), (summary.accounts, summary.total))
+        self.assertEqual([0, 0, 2, 1], [count for _, count in summary.histogram[:4]])
+        self.assertEqual([self.account_2.account_id, self.account_1.account_id],
+                         [account.account_id for account in self.bank.top_accounts(2)])
+
+    def test_find_accounts_on_every_shard(self):
+        self.assertEqual(['Ann', 'May'], sorted(account.name for account in self.bank.find_accounts_by_name_prefix('')
+                                                if account.name != 'Tom'))
+        self.assertEqual([self.account_2.account_id],
+                         [account.account_id for account in self.bank.find_accounts_by_name('may')])
+
+    def test_settlement_is_not_supported(self):
+        with self.assertRaises(ShardedOperationNotSupportedException):
+            self.bank.queue_transfer(self.account_1.account_id, self.account_2.account_id, Decimal('30'))
+        with self.assertRaises(ShardedOperationNotSupportedException):
+            self.bank.settle()
+        self.assertEqual(0, self.bank.pending_transfers)
+        self.assertEqual([Decimal('100'), Decimal('50'), Decimal('10')], self.balances())
+
+    def test_schedules_are_not_enabled(self):
+        with self.assertRaises(SchedulerNotEnabledException):
+            self.bank.schedule_transfer(self.account_1.account_id, self.account_2.account_id, Decimal('30'),
+                                        datetime(2026, 1, 31, 9))
+        for method, args in (('cancel_schedule', ('schedule-1',)), ('get_schedules', ()), ('run_due_transfers', ())):
+            with self.assertRaises(SchedulerNotEnabledException):
+                getattr(self.bank, method)(*args)
+
+    def test_statement_is_not_enabled(self):
+        with self.assertRaises(LedgerNotEnabledException):
+            self.bank.get_statement(self.account_1.account_id)
+
+    def test_stats_are_not_enabled(self):
+        with self.assertRaises(StatsNotEnabledException):
+            self.bank.get_stats()
+
+    def test_recover_interrupted_transfers(self):
+        # GIVEN one transfer interrupted after its commit decision and one after a prepare only
+        self.bank.close()
+        shards = [Shard(Bank(account_helper=AccountHelper(),
+                             repository=Repository(shard_paths(self.state_path, shard)[0]),
+                             journal=Journal(shard_paths(self.state_path, shard)[1])))
+                  for shard in range(2)]
+        shards[0].prepare_debit('tx-1', self.account_1.account_id, Decimal('30'))
+        shards[1].prepare_credit('tx-1', self.account_2.account_id, Decimal('30'))
+        shards[0].prepare_debit('tx-2', self.account_3.account_id, Decimal('10'))
+        log = CoordinatorLog(self.state_path.with_name('state.coordinator'))
+        log.commit(['tx-1'])
+        log.close()
+        for shard in shards:
+            shard.bank.close()
+
+        # WHEN the sharded bank starts again
+        self.bank = ShardedBank(self.state_path, shards=2)
+
+        # THEN the committed transfer is completed and the other one rolled back
+        self.assertEqual([Decimal('70'), Decimal('80'), Decimal('10')], self.balances())
+
+    def test_state_survives_restart(self):
+        self.bank.transfer(self.account_1.account_id, self.account_2.account_id, Decimal('30'))
+        self.bank.save_state()
+        self.bank.deposit(self.account_3.account_id, Decimal('5'))
+        self.bank.close()
+
+        self.bank = ShardedBank(self.state_path, shards=2)
+
+        self.assertEqual([Decimal('70'), Decimal('80'), Decimal('15')], self.balances())
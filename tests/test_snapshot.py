@@ -0,0 +1,206 @@
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import create_autospec
+
+from src.account import Account, InvalidAccountOperationException
+from src.account_helper import AccountHelper
+from src.account_store import AccountStore
+from src.bank import Bank
+from src.journal import Journal
+from src.repository import Repository, create_repository
+from src.snapshot import (MappedAccounts, SnapshotRepository, csv_to_snapshot, snapshot_to_csv,
+                          write_snapshot)
+
+
+class TestSnapshotRepository(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = Path(self.tmp_dir.name) / 'state.bin'
+        self.repository = SnapshotRepository(self.snapshot_path)
+        self.accounts = {f'account-{i}': Account(f'account-{i}', f'name-{i % 7}', Decimal(i) / 4)
+                         for i in range(1000)}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_state_maps_saved_accounts(self):
+        self.repository.save_state(self.accounts)
+
+        accounts = self.repository.load_state()
+
+        self.assertIsInstance(accounts, MappedAccounts)
+        self.assertEqual(len(self.accounts), len(accounts))
+        self.assertEqual(list(self.accounts), list(accounts))
+        for account_id, expected in self.accounts.items():
+            account = accounts[account_id]
+            self.assertEqual((expected.account_id, expected.name, expected.balance),
+                             (account.account_id, account.name, account.balance))
+        self.assertNotIn('account-1000', accounts)
+        self.assertNotIn('account-1-with-a-longer-id', accounts)
+
+    def test_load_empty_state_if_snapshot_does_not_exist(self):
+        self.assertDictEqual({}, self.repository.load_state())
+
+    def test_save_and_load_empty_state(self):
+        self.repository.save_state({})
+        self.assertEqual([], list(self.repository.load_state()))
+
+    def test_changed_accounts_move_to_overlay(self):
+        # GIVEN accounts mapped from a snapshot
+        self.repository.save_state(self.accounts)
+        accounts = self.repository.load_state(AccountStore())
+
+        # WHEN one account changes and one is created
+        accounts['account-3'].deposit(Decimal('1.25'))
+        accounts['account-new'] = Account('account-new', 'Tom', Decimal('5'))
+
+        # THEN only those live in the overlay and the snapshot is unchanged
+        self.assertEqual(['account-3', 'account-new'], list(accounts.overlay))
+        self.assertEqual(Decimal('2'), accounts['account-3'].balance)
+        self.assertEqual(1001, len(accounts))
+        self.assertEqual(1, list(accounts).count('account-3'))
+        self.assertEqual(Decimal('0.75'), next(account.balance for account in self.repository.iter_accounts()
+                                               if account.account_id == 'account-3'))
+
+    def test_mapped_account_rejects_overdraft(self):
+        self.repository.save_state(self.accounts)
+        accounts = self.repository.load_state()
+
+        with self.assertRaises(InvalidAccountOperationException):
+            accounts['account-1'].withdraw(Decimal('1'))
+        self.assertEqual({}, accounts.overlay)
+
+    def test_delete_mapped_account(self):
+        self.repository.save_state(self.accounts)
+        accounts = self.repository.load_state()
+
+        del accounts['account-1']
+
+        self.assertNotIn('account-1', accounts)
+        self.assertEqual(999, len(accounts))
+        with self.assertRaises(KeyError):
+            del accounts['account-1']
+
+    def test_save_state_over_mapped_snapshot(self):
+        # GIVEN a changed mapping served from the snapshot it is saved over
+        self.repository.save_state(self.accounts)
+        accounts = self.repository.load_state()
+        accounts['account-1'].deposit(Decimal('1'))
+
+        # WHEN it is saved
+        self.repository.save_state(accounts)
+
+        # THEN the new snapshot holds the change and the mapping keeps working
+        self.assertEqual(Decimal('1.25'), self.repository.load_state()['account-1'].balance)
+        self.assertEqual(Decimal('1.25'), accounts['account-1'].balance)
+
+    def test_balances_must_fit_minor_units(self):
+        with self.assertRaises(InvalidAccountOperationException):
+            self.repository.save_state({'a': Account('a', 'Tom', Decimal('0.001'))})
+        self.assertFalse(self.snapshot_path.exists())
+
+    def test_reject_files_that_are_not_snapshots(self):
+        self.snapshot_path.write_bytes(b'account_id,name,balance\n' * 4)
+        with self.assertRaisesRegex(ValueError, 'not a version 1 bank snapshot'):
+            self.repository.load_state()
+
+    def test_convert_between_csv_and_snapshot(self):
+        csv_path = Path(self.tmp_dir.name) / 'state.csv'
+        Repository(csv_path).save_state(self.accounts)
+
+        csv_to_snapshot(csv_path, self.snapshot_path)
+        csv_path.unlink()
+        snapshot_to_csv(self.snapshot_path, csv_path)
+
+        self.assertEqual([(account.account_id, account.name, account.balance) for account in self.accounts.values()],
+                         [(account.account_id, account.name, account.balance)
+                          for account in Repository(csv_path).iter_accounts()])
+
+    def test_create_repository_by_extension(self):
+        self.assertIsInstance(create_repository(self.snapshot_path), SnapshotRepository)
+        self.assertIsInstance(create_repository(Path('state.csv')), Repository)
+
+
+class TestBankOnSnapshot(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = Path(self.tmp_dir.name) / 'state.bin'
+        write_snapshot(self.snapshot_path, [Account('account-1', 'Tom', Decimal('10')),
+                                            Account('account-2', 'May', Decimal('0'))])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_bank(self, journal=None) -> Bank:
+        account_helper = create_autospec(AccountHelper)
+        account_helper.create_account_id.return_value = 'account-3'
+        return Bank(account_helper=account_helper, repository=SnapshotRepository(self.snapshot_path),
+                    journal=journal)
+
+    def test_bank_serves_and_saves_mapped_accounts(self):
+        # GIVEN a bank started on a snapshot
+        bank = self.create_bank()
+
+        # WHEN money is moved and an account is created
+        bank.transfer('account-1', 'account-2', Decimal('2.5'))
+        bank.create_account('Ann', Decimal('1'))
+        bank.save_state()
+
+        # THEN a bank started on the saved snapshot sees all of it
+        accounts = self.create_bank().accounts
+        self.assertEqual({'account-1': Decimal('7.5'), 'account-2': Decimal('2.5'), 'account-3': Decimal('1')},
+                         {account_id: account.balance for account_id, account in accounts.items()})
+
+    def test_journal_replays_into_mapped_accounts(self):
+        # GIVEN a journaled bank on a snapshot that is not saved again
+        journal_path = Path(self.tmp_dir.name) / 'journal'
+        bank = self.create_bank(Journal(journal_path))
+        bank.deposit('account-2', Decimal('3'))
+        bank.create_account('Ann', Decimal('1'))
+        bank.close()
+
+        # WHEN the bank restarts
+        bank = self.create_bank(Journal(journal_path))
+
+        # THEN the journal is replayed over the snapshot
+        self.assertEqual(Decimal('3'), bank.get_account('account-2').balance)
+        self.assertEqual(Decimal('1'), bank.get_account('account-3').balance)
+        self.assertEqual(Decimal('10'), bank.get_account('account-1').balance)
+        bank.close()
+
+    def test_read_view_of_mapped_accounts(self):
+        bank = self.create_bank()
+        bank.deposit('account-1', Decimal('1'))
+
+        with bank.snapshot() as view:
+            bank.deposit('account-2', Decimal('5'))
+            self.assertEqual({'account-1': Decimal('11'), 'account-2': Decimal('0')},
+                             {account_id: account.balance for account_id, account in view.items()})
+
+    def test_reject_amounts_finer_than_the_snapshot_scale(self):
+        # GIVEN a journaled bank on a snapshot of cents
+        journal_path = Path(self.tmp_dir.name) / 'journal'
+        bank = self.create_bank(Journal(journal_path))
+
+        # WHEN amounts with more decimal places are deposited or opened with
+        # THEN they are rejected before anything is journaled
+        with self.assertRaises(InvalidAccountOperationException):
+            bank.deposit('account-1', Decimal('0.005'))
+        with self.assertRaises(InvalidAccountOperationException):
+            bank.create_account('Ann', Decimal('10.005'))
+
+        # AND the state can still be saved
+        bank.save_state()
+        bank.close()
+        self.assertEqual(Decimal('10'), self.create_bank().get_account('account-1').balance)
+
+    def test_amounts_follow_the_scale_of_the_snapshot_repository(self):
+        bank = Bank(account_helper=create_autospec(AccountHelper),
+                    repository=SnapshotRepository(self.snapshot_path, scale=3))
+
+        bank.deposit('account-1', Decimal('0.005'))
+        bank.save_state()
+
+        self.assertEqual(Decimal('10.005'), self.create_bank().get_account('account-1').balance)
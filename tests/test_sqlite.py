@@ -0,0 +1,277 @@
+import sqlite3
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import create_autospec, patch
+
+from src.account import Account, AccountNotFoundException
+from src.account_helper import AccountHelper
+from src.account_store import AccountStore
+from src.bank import Bank
+from src.checkpoint import Checkpointer
+from src.journal import Journal
+from src.repository import create_repository
+from src.sqlite import SqliteAccounts, SqliteRepository
+
+
+class TestSqliteRepository(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp_dir.name) / 'state.db'
+        self.repository = SqliteRepository(self.db_path)
+        self.accounts = {f'account-{i}': Account(f'account-{i}', f'name-{i % 7}', Decimal(i) / 4)
+                         for i in range(100)}
+
+    def tearDown(self):
+        self.repository.close()
+        self.tmp_dir.cleanup()
+
+    def balances(self, accounts):
+        return {account_id: account.balance for account_id, account in accounts.items()}
+
+    def rows_written(self, save) -> int:
+        before = self.repository._writer.total_changes
+        save()
+        return self.repository._writer.total_changes - before
+
+    def test_save_and_load_state(self):
+        self.repository.save_state(self.accounts)
+
+        accounts = self.repository.load_state()
+
+        self.assertEqual(100, len(accounts))
+        self.assertEqual(self.balances(self.accounts), self.balances(accounts))
+        self.assertEqual('name-3', accounts['account-3'].name)
+
+    def test_load_empty_state_if_file_does_not_exist(self):
+        accounts = self.repository.load_state()
+
+        self.assertEqual(0, len(accounts))
+        self.assertEqual([], list(accounts))
+        self.assertTrue(self.db_path.is_file())
+
+    def test_accounts_are_read_on_first_access(self):
+        # GIVEN a saved state
+        self.repository.save_state(self.accounts)
+
+        # WHEN it is loaded and one account is looked up
+        accounts = self.repository.load_state()
+        self.assertEqual(0, accounts.loaded)
+        account = accounts['account-5']
+
+        # THEN only that account is read, and the same account is returned from then on
+        self.assertEqual(Decimal(5) / 4, account.balance)
+        self.assertEqual(1, accounts.loaded)
+        self.assertIs(accounts['account-5'], account)
+        self.assertIn('account-6', accounts)
+        self.assertNotIn('account-100', accounts)
+        with self.assertRaises(KeyError):
+            accounts['account-100']
+
+    def test_save_writes_only_changed_accounts(self):
+        # GIVEN a loaded state where two accounts were read and one of them changed, and one was created
+        self.repository.save_state(self.accounts)
+        accounts = self.repository.load_state()
+        accounts['account-1'].deposit(Decimal('1'))
+        accounts['account-2'].balance
+        accounts['account-new'] = Account('account-new', 'Ann', Decimal('7'))
+
+        # WHEN the state is saved twice
+        # THEN the first save writes the changed and created accounts, the second nothing
+        self.assertEqual(2, self.rows_written(lambda: self.repository.save_state(accounts)))
+        self.assertEqual(0, self.rows_written(lambda: self.repository.save_state(accounts)))
+        self.assertEqual(101, len(accounts))
+        reloaded = SqliteRepository(self.db_path).load_state()
+        self.assertEqual(Decimal(1) / 4 + 1, reloaded['account-1'].balance)
+        self.assertEqual(Decimal('7'), reloaded['account-new'].balance)
+        self.assertEqual(101, len(reloaded))
+
+    def test_save_deleted_accounts(self):
+        self.repository.save_state(self.accounts)
+        accounts = self.repository.load_state()
+
+        del accounts['account-1']
+        accounts['account-2'].balance
+        del accounts['account-2']
+
+        self.assertEqual(98, len(accounts))
+        self.assertNotIn('account-1', accounts)
+        with self.assertRaises(KeyError):
+            del accounts['account-1']
+        self.assertEqual(2, self.rows_written(lambda: self.repository.save_state(accounts)))
+        self.assertEqual(98, len(SqliteRepository(self.db_path).load_state()))
+
+    def test_iterate_database_and_created_accounts_once(self):
+        self.repository.save_state(self.accounts)
+        accounts = self.repository.load_state()
+
+        accounts['account-1'].balance
+        accounts['account-new'] = Account('account-new', 'Ann', Decimal('7'))
+        accounts['account-3'] = Account('account-3', 'Tom', Decimal('1'))
+
+        self.assertEqual(sorted(list(self.accounts) + ['account-new']), sorted(accounts))
+        self.assertEqual(101, len(accounts))
+        self.assertEqual('Tom', accounts['account-3'].name)
+
+    def test_load_state_into_account_store(self):
+        self.repository.save_state(self.accounts)
+
+        accounts = self.repository.load_state(AccountStore())
+        accounts['account-1'].deposit(Decimal('1'))
+
+        self.assertIsInstance(accounts.overlay, AccountStore)
+        self.assertEqual(1, self.rows_written(lambda: self.repository.save_state(accounts)))
+
+    def test_load_every_account_without_lazy(self):
+        self.repository.save_state(self.accounts)
+
+        accounts = SqliteRepository(self.db_path, lazy=False).load_state()
+
+        self.assertEqual(100, accounts.loaded)
+        self.assertEqual(self.balances(self.accounts), self.balances(accounts.overlay))
+
+    def test_saving_other_accounts_replaces_the_state(self):
+        self.repository.save_state(self.accounts)
+
+        self.repository.save_state({'a': Account('a', 'Tom', Decimal('1'))})
+
+        self.assertEqual({'a': Decimal('1')}, self.balances(self.repository.load_state()))
+
+    def test_database_is_in_wal_mode(self):
+        self.repository.save_state(self.accounts)
+
+        with sqlite3.connect(self.db_path) as connection:
+            self.assertEqual(('wal',), connection.execute('PRAGMA journal_mode').fetchone())
+
+    def test_create_repository_by_extension(self):
+        self.assertIsInstance(create_repository(self.db_path), SqliteRepository)
+        self.assertIsInstance(create_repository(self.db_path.with_suffix('.sqlite')), SqliteRepository)
+
+
+class TestBankOnSqlite(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp_dir.name) / 'state.db'
+        repository = SqliteRepository(self.db_path)
+        repository.save_state({'account-1': Account('account-1', 'Tom', Decimal('10')),
+                               'account-2': Account('account-2', 'May', Decimal('0'))})
+        repository.close()
+        self.repositories = []
+
+    def tearDown(self):
+        for repository in self.repositories:
+            repository.close()
+        self.tmp_dir.cleanup()
+
+    def create_bank(self, journal=None, concurrent=False) -> Bank:
+        account_helper = create_autospec(AccountHelper)
+        account_helper.create_account_id.return_value = 'account-3'
+        repository = SqliteRepository(self.db_path)
+        self.repositories.append(repository)
+        return Bank(account_helper=account_helper, repository=repository, journal=journal, concurrent=concurrent)
+
+    def saved_balances(self):
+        repository = SqliteRepository(self.db_path)
+        self.repositories.append(repository)
+        return {account.account_id: account.balance for account in repository.iter_accounts()}
+
+    def test_bank_reads_accounts_on_demand_and_saves_them(self):
+        # GIVEN a bank started on a SQLite database
+        bank = self.create_bank()
+        self.assertIsInstance(bank.accounts, SqliteAccounts)
+
+        # WHEN money is moved and an account is created
+        bank.transfer('account-1', 'account-2', Decimal('2.5'))
+        bank.create_account('Ann', Decimal('1'))
+        with self.assertRaises(AccountNotFoundException):
+            bank.get_account('account-4')
+        bank.save_state()
+
+        # THEN the database has all of it
+        self.assertEqual({'account-1': Decimal('7.5'), 'account-2': Decimal('2.5'), 'account-3': Decimal('1')},
+                         self.saved_balances())
+
+    def test_journal_replays_over_sqlite_state(self):
+        # GIVEN a journaled bank on a SQLite database that is not saved again
+        journal_path = Path(self.tmp_dir.name) / 'journal'
+        bank = self.create_bank(Journal(journal_path))
+        bank.deposit('account-2', Decimal('3'))
+        bank.close()
+
+        # WHEN the bank restarts
+        bank = self.create_bank(Journal(journal_path))
+
+        # THEN the journal is replayed over the accounts it changed
+        self.assertEqual(Decimal('3'), bank.get_account('account-2').balance)
+        self.assertEqual(Decimal('10'), bank.get_account('account-1').balance)
+        bank.close()
+
+    def test_close_bank_closes_the_database(self):
+        bank = self.create_bank()
+        bank.get_account('account-1')
+        connection = bank.repository._reader
+
+        bank.close()
+
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connection.execute('SELECT 1')
+
+    def test_summaries_and_searches_read_every_account_in_one_query(self):
+        # GIVEN a bank that has read one account
+        bank = self.create_bank()
+        bank.deposit('account-1', Decimal('1'))
+
+        # WHEN every account is summed, ranked and searched
+        with patch.object(bank.repository, 'fetch', wraps=bank.repository.fetch) as fetch:
+            summary = bank.summary()
+            # THEN no account is read on its own or kept in memory
+            fetch.assert_not_called()
+            self.assertEqual(1, bank.accounts.loaded)
+            top_accounts = bank.top_accounts(1)
+            accounts = bank.find_accounts_by_name('may')
+
+        # AND only the accounts found are read on their own
+        self.assertEqual(['account-2'], [call.args[0] for call in fetch.call_args_list])
+        self.assertEqual((2, Decimal('11')), (summary.accounts, summary.total))
+        self.assertEqual(['account-1'], [account.account_id for account in top_accounts])
+        self.assertEqual(['account-2'], [account.account_id for account in accounts])
+
+    def test_read_view_lists_stored_accounts_when_iterated(self):
+        # GIVEN a read view of a bank that has read one account
+        bank = self.create_bank(concurrent=True)
+        bank.deposit('account-1', Decimal('1'))
+        with patch.object(bank.repository, 'account_ids', wraps=bank.repository.account_ids) as account_ids:
+            view = bank.snapshot()
+            # THEN taking it reads no account ids from the database
+            account_ids.assert_not_called()
+
+        # WHEN accounts change and one is created and saved after it was taken
+        bank.deposit('account-2', Decimal('5'))
+        bank.create_account('Ann', Decimal('1'))
+        bank.save_state()
+
+        # THEN the view still has the accounts and balances it was taken with
+        self.assertEqual(2, len(view))
+        self.assertEqual({'account-1': Decimal('11'), 'account-2': Decimal('0')},
+                         {account_id: account.balance for account_id, account in view.items()})
+        view.close()
+
+    def test_background_checkpoint_saves_the_read_view(self):
+        # GIVEN a checkpoint in progress of a concurrent bank
+        bank = self.create_bank(concurrent=True)
+        bank.deposit('account-1', Decimal('1'))
+        view = bank.snapshot()
+        bank.deposit('account-1', Decimal('5'))
+        bank.create_account('Ann', Decimal('1'))
+
+        # WHEN the view is saved
+        bank.repository.save_state(view)
+        view.close()
+
+        # THEN the database has the balances of the view, and the next save the later changes
+        self.assertEqual({'account-1': Decimal('11'), 'account-2': Decimal('0')}, self.saved_balances())
+        Checkpointer(bank).checkpoint()
+        bank.close()
+        self.assertEqual({'account-1': Decimal('16'), 'account-2': Decimal('0'), 'account-3': Decimal('1')},
+                         self.saved_balances())
@@ -0,0 +1,83 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.account import AccountNotFoundException
+from src.stats import OperationStats, Stats
+
+
+class TestOperationStats(TestCase):
+    def test_percentiles_from_buckets(self):
+        stats = OperationStats()
+        for micros in [10] * 98 + [1000, 5000]:
+            stats.observe(micros)
+
+        snapshot = stats.snapshot()
+
+        self.assertEqual(100, snapshot['count'])
+        # Bucket bounds are at most 19% above the latency
+        self.assertGreaterEqual(snapshot['latency_us']['p50'], 10)
+        self.assertLess(snapshot['latency_us']['p50'], 12)
+        self.assertGreaterEqual(snapshot['latency_us']['p99'], 1000)
+        self.assertLess(snapshot['latency_us']['p99'], 1200)
+        self.assertEqual(5000, snapshot['latency_us']['max'])
+
+    def test_percentile_is_capped_at_max(self):
+        stats = OperationStats()
+        stats.observe(3)
+        self.assertEqual(3, stats.percentile(0.5))
+        # Above the last bucket bound
+        stats.observe(10 ** 9)
+        self.assertEqual(10 ** 9, stats.percentile(0.99))
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def increment(self, fail: bool = False) -> int:
+        if fail:
+            raise AccountNotFoundException('some-account-id')
+        self.calls += 1
+        return self.calls
+
+
+class TestStats(TestCase):
+    def setUp(self):
+        self.stats = Stats()
+        self.counter = Counter()
+
+    def test_instrumented_method_is_counted_and_timed(self):
+        self.stats.instrument(self.counter, ['increment'], prefix='counter.')
+
+        self.assertEqual(1, self.counter.increment())
+        with self.assertRaises(AccountNotFoundException):
+            self.counter.increment(fail=True)
+
+        operation = self.stats.snapshot()['operations']['counter.increment']
+        self.assertEqual(2, operation['count'])
+        self.assertEqual({'AccountNotFoundException': 1}, operation['errors'])
+        self.assertEqual(1, self.counter.calls)
+
+    def test_other_instances_are_not_instrumented(self):
+        self.stats.instrument(self.counter, ['increment'])
+        Counter().increment()
+        self.assertNotIn('increment', Counter().__dict__)
+        self.assertEqual({}, self.stats.snapshot()['operations'])
+
+    def test_dump_and_format(self):
+        self.assertEqual(['No operations recorded yet'], self.stats.format())
+        with patch('src.stats.time.perf_counter', side_effect=[0, 0.000002, 0, 0.000004]):
+            self.stats.instrument(self.counter, ['increment'])
+            self.counter.increment()
+            with self.assertRaises(AccountNotFoundException):
+                self.counter.increment(fail=True)
+
+        self.assertEqual(['increment: 2 calls, p50 2.0us, p99 4.0us, max 4.0us, errors: AccountNotFoundException 1'],
+                         self.stats.format())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'stats.json'
+            self.stats.dump(path)
+            self.assertEqual(2, json.loads(path.read_text())['operations']['increment']['count'])